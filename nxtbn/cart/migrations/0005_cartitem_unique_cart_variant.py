@@ -0,0 +1,30 @@
+# Generated by Django 4.2.11 on 2026-10-19 08:45
+
+from django.db import migrations, models
+
+
+def merge_duplicate_cart_items(apps, schema_editor):
+    CartItem = apps.get_model('cart', 'CartItem')
+    duplicates = (
+        CartItem.objects.values('cart_id', 'variant_id')
+        .annotate(count=models.Count('id'), quantity=models.Sum('quantity'), keep=models.Min('id'))
+        .filter(count__gt=1)
+    )
+    for row in duplicates:
+        CartItem.objects.filter(id=row['keep']).update(quantity=row['quantity'])
+        CartItem.objects.filter(cart_id=row['cart_id'], variant_id=row['variant_id']).exclude(id=row['keep']).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cart', '0004_remove_cart_updated_at'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_cart_items, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='cartitem',
+            constraint=models.UniqueConstraint(fields=('cart', 'variant'), name='unique_cart_variant'),
+        ),
+    ]
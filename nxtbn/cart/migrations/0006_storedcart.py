@@ -0,0 +1,22 @@
+# Generated by Django 4.2.11 on 2026-10-19 10:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cart', '0005_cartitem_unique_cart_variant'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StoredCart',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=64, unique=True)),
+                ('items', models.JSONField(default=dict)),
+                ('expires_at', models.DateTimeField(db_index=True)),
+            ],
+        ),
+    ]
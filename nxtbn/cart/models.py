@@ -44,5 +44,22 @@ class CartItem(AbstractBaseUUIDModel):
         validators=[MinValueValidator(1)]
     )
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['cart', 'variant'], name='unique_cart_variant'),
+        ]
+
+    def __str__(self):
+        return f"{self.variant.name} in Cart {self.cart.id}"
+
+class StoredCart(models.Model):
+    """
+    The working copy of a cart for DatabaseCartStorage, used when redis isn't available:
+    `items` maps variant ids (as strings) to quantities.
+    """
+    key = models.CharField(max_length=64, unique=True)
+    items = models.JSONField(default=dict)
+    expires_at = models.DateTimeField(db_index=True)
+
     def __str__(self):
-        return f"{self.variant.name} in Cart {self.cart.id}"
\ No newline at end of file
+        return self.key
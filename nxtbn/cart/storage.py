@@ -0,0 +1,380 @@
+"""
+Cart storage backends.
+
+A cart is a hash of variant id -> quantity stored under a cart key ("user:<id>" or
+"guest:<token>"). Every write refreshes the cart TTL, so abandoned carts expire on
+their own. Customer carts are written through to the Cart/CartItem tables at checkout
+only (see nxtbn.cart.utils.persist_cart), the backend holds the working copy.
+"""
+
+import threading
+import time
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+
+# Marks a customer cart as loaded from the database, so that an emptied cart
+# is not reloaded from the last persisted snapshot
+LOADED_FIELD = '_loaded'
+
+
+class BaseCartStorage:
+    def __init__(self, timeout=None):
+        self.timeout = timeout or settings.CART_TTL
+
+    def is_loaded(self, cart_key):
+        raise NotImplementedError
+
+    def get_items(self, cart_key):
+        """Returns {variant_id: quantity}."""
+        raise NotImplementedError
+
+    def add(self, cart_key, variant_id, quantity):
+        """Atomically increments the quantity of a variant, returns the new quantity."""
+        raise NotImplementedError
+
+    def add_many(self, cart_key, items):
+        raise NotImplementedError
+
+    def set(self, cart_key, variant_id, quantity, only_existing=False):
+        """Sets the quantity of a variant. Returns False if only_existing and the variant is not in the cart."""
+        raise NotImplementedError
+
+    def load(self, cart_key, items):
+        """Replaces the cart with items and marks it as loaded."""
+        raise NotImplementedError
+
+    def remove(self, cart_key, *variant_ids):
+        """Removes variants from the cart, returns the number removed."""
+        raise NotImplementedError
+
+    def clear(self, cart_key):
+        raise NotImplementedError
+
+    def move(self, source_key, target_key):
+        """
+        Adds the items of the source cart to the target cart and deletes the source cart, in one
+        atomic step: an item added to the source meanwhile is either moved or kept, never lost.
+        Returns the number of variants moved.
+        """
+        raise NotImplementedError
+
+
+# HSET of a field already in the cart, with the TTL refresh, in one atomic step: a cart
+# cleared or expired in between is not brought back
+SET_EXISTING_SCRIPT = """
+if redis.call('HEXISTS', KEYS[1], ARGV[1]) == 0 then
+    return 0
+end
+redis.call('HSET', KEYS[1], ARGV[1], ARGV[2])
+redis.call('EXPIRE', KEYS[1], ARGV[3])
+return 1
+"""
+
+
+# HINCRBY of every item of the source cart into the target cart, then DEL of the source, in one
+# atomic step; ARGV[1] is LOADED_FIELD, which is not moved
+MOVE_SCRIPT = """
+local fields = redis.call('HGETALL', KEYS[1])
+local moved = 0
+for i = 1, #fields, 2 do
+    if fields[i] ~= ARGV[1] then
+        redis.call('HINCRBY', KEYS[2], fields[i], fields[i + 1])
+        moved = moved + 1
+    end
+end
+redis.call('DEL', KEYS[1])
+if moved > 0 then
+    redis.call('EXPIRE', KEYS[2], ARGV[2])
+end
+return moved
+"""
+
+
+class RedisCartStorage(BaseCartStorage):
+    """One redis hash per cart, quantities are changed with HINCRBY."""
+    key_prefix = 'cart:'
+
+    def __init__(self, timeout=None, url=None):
+        import redis
+
+        super().__init__(timeout)
+        self.client = redis.Redis.from_url(
+            url or settings.CART_REDIS_URL,
+            socket_connect_timeout=2,
+            socket_timeout=2,
+        )
+        self._set_existing = self.client.register_script(SET_EXISTING_SCRIPT)
+        self._move = self.client.register_script(MOVE_SCRIPT)
+
+    def _key(self, cart_key):
+        return f"{self.key_prefix}{cart_key}"
+
+    def is_loaded(self, cart_key):
+        return bool(self.client.hexists(self._key(cart_key), LOADED_FIELD))
+
+    def get_items(self, cart_key):
+        data = self.client.hgetall(self._key(cart_key))
+        return {
+            int(field): int(quantity)
+            for field, quantity in data.items()
+            if field.decode() != LOADED_FIELD
+        }
+
+    def add(self, cart_key, variant_id, quantity):
+        key = self._key(cart_key)
+        pipe = self.client.pipeline()
+        pipe.hincrby(key, variant_id, quantity)
+        pipe.expire(key, self.timeout)
+        new_quantity, _ = pipe.execute()
+        return new_quantity
+
+    def add_many(self, cart_key, items):
+        if not items:
+            return
+        key = self._key(cart_key)
+        pipe = self.client.pipeline()
+        for variant_id, quantity in items.items():
+            pipe.hincrby(key, variant_id, quantity)
+        pipe.expire(key, self.timeout)
+        pipe.execute()
+
+    def set(self, cart_key, variant_id, quantity, only_existing=False):
+        key = self._key(cart_key)
+        if only_existing:
+            return bool(self._set_existing(keys=[key], args=[variant_id, quantity, self.timeout]))
+        pipe = self.client.pipeline()
+        pipe.hset(key, variant_id, quantity)
+        pipe.expire(key, self.timeout)
+        pipe.execute()
+        return True
+
+    def load(self, cart_key, items):
+        key = self._key(cart_key)
+        pipe = self.client.pipeline()
+        pipe.delete(key)
+        pipe.hset(key, mapping={LOADED_FIELD: 1, **items})
+        pipe.expire(key, self.timeout)
+        pipe.execute()
+
+    def remove(self, cart_key, *variant_ids):
+        if not variant_ids:
+            return 0
+        return self.client.hdel(self._key(cart_key), *variant_ids)
+
+    def clear(self, cart_key):
+        self.client.delete(self._key(cart_key))
+
+    def move(self, source_key, target_key):
+        return self._move(keys=[self._key(source_key), self._key(target_key)], args=[LOADED_FIELD, self.timeout])
+
+
+class LocMemCartStorage(BaseCartStorage):
+    """
+    Process-local storage, for tests and single process development servers only (set with CART_STORAGE_BACKEND).
+    Carts are not shared between worker processes and are lost on restart.
+    """
+    _carts = {}
+    _lock = threading.Lock()
+
+    def _get(self, cart_key):
+        entry = self._carts.get(cart_key)
+        if entry is None or entry[0] <= time.monotonic():
+            return None
+        return entry[1]
+
+    def _get_or_create(self, cart_key):
+        fields = self._get(cart_key)
+        if fields is None:
+            fields = {}
+        self._carts[cart_key] = (time.monotonic() + self.timeout, fields)
+        return fields
+
+    def is_loaded(self, cart_key):
+        with self._lock:
+            return LOADED_FIELD in (self._get(cart_key) or {})
+
+    def get_items(self, cart_key):
+        with self._lock:
+            fields = self._get(cart_key) or {}
+            return {variant_id: quantity for variant_id, quantity in fields.items() if variant_id != LOADED_FIELD}
+
+    def add(self, cart_key, variant_id, quantity):
+        with self._lock:
+            fields = self._get_or_create(cart_key)
+            fields[int(variant_id)] = fields.get(int(variant_id), 0) + quantity
+            return fields[int(variant_id)]
+
+    def add_many(self, cart_key, items):
+        with self._lock:
+            fields = self._get_or_create(cart_key)
+            for variant_id, quantity in items.items():
+                fields[int(variant_id)] = fields.get(int(variant_id), 0) + quantity
+
+    def set(self, cart_key, variant_id, quantity, only_existing=False):
+        with self._lock:
+            if only_existing and int(variant_id) not in (self._get(cart_key) or {}):
+                return False
+            self._get_or_create(cart_key)[int(variant_id)] = quantity
+            return True
+
+    def load(self, cart_key, items):
+        with self._lock:
+            fields = {int(variant_id): quantity for variant_id, quantity in items.items()}
+            fields[LOADED_FIELD] = 1
+            self._carts[cart_key] = (time.monotonic() + self.timeout, fields)
+
+    def remove(self, cart_key, *variant_ids):
+        with self._lock:
+            fields = self._get(cart_key) or {}
+            return sum(1 for variant_id in variant_ids if fields.pop(int(variant_id), None) is not None)
+
+    def clear(self, cart_key):
+        with self._lock:
+            self._carts.pop(cart_key, None)
+
+    def move(self, source_key, target_key):
+        with self._lock:
+            items = {
+                variant_id: quantity
+                for variant_id, quantity in (self._get(source_key) or {}).items() if variant_id != LOADED_FIELD
+            }
+            self._carts.pop(source_key, None)
+            if items:
+                fields = self._get_or_create(target_key)
+                for variant_id, quantity in items.items():
+                    fields[variant_id] = fields.get(variant_id, 0) + quantity
+            return len(items)
+
+    @classmethod
+    def flush(cls):
+        with cls._lock:
+            cls._carts.clear()
+
+
+class DatabaseCartStorage(BaseCartStorage):
+    """
+    One StoredCart row per cart, for deployments without redis: unlike LocMemCartStorage the
+    carts are shared by the worker processes and survive restarts. Changes lock the row with
+    SELECT ... FOR UPDATE, expired rows are deleted by nxtbn.cart.tasks.purge_expired_carts.
+    """
+
+    def _fields(self, cart_key):
+        from nxtbn.cart.models import StoredCart
+
+        return StoredCart.objects.filter(key=cart_key, expires_at__gt=timezone.now()).values_list(
+            'items', flat=True
+        ).first() or {}
+
+    @contextmanager
+    def _change(self, cart_key):
+        from nxtbn.cart.models import StoredCart
+
+        now = timezone.now()
+        with transaction.atomic():
+            cart, created = StoredCart.objects.select_for_update().get_or_create(
+                key=cart_key, defaults={'expires_at': now},
+            )
+            if cart.expires_at <= now and not created:
+                cart.items = {}
+            yield cart.items
+            cart.expires_at = now + timedelta(seconds=self.timeout)
+            cart.save(update_fields=['items', 'expires_at'])
+
+    def is_loaded(self, cart_key):
+        return LOADED_FIELD in self._fields(cart_key)
+
+    def get_items(self, cart_key):
+        return {
+            int(variant_id): quantity
+            for variant_id, quantity in self._fields(cart_key).items()
+            if variant_id != LOADED_FIELD
+        }
+
+    def add(self, cart_key, variant_id, quantity):
+        with self._change(cart_key) as fields:
+            fields[str(variant_id)] = fields.get(str(variant_id), 0) + quantity
+            return fields[str(variant_id)]
+
+    def add_many(self, cart_key, items):
+        if not items:
+            return
+        with self._change(cart_key) as fields:
+            for variant_id, quantity in items.items():
+                fields[str(variant_id)] = fields.get(str(variant_id), 0) + quantity
+
+    def set(self, cart_key, variant_id, quantity, only_existing=False):
+        from nxtbn.cart.models import StoredCart
+
+        if not only_existing:
+            with self._change(cart_key) as fields:
+                fields[str(variant_id)] = quantity
+            return True
+
+        with transaction.atomic():
+            # checked under the row lock: a cart cleared or expired meanwhile is neither revived nor reset
+            cart = StoredCart.objects.select_for_update().filter(key=cart_key, expires_at__gt=timezone.now()).first()
+            if cart is None or str(variant_id) not in cart.items:
+                return False
+            cart.items[str(variant_id)] = quantity
+            cart.expires_at = timezone.now() + timedelta(seconds=self.timeout)
+            cart.save(update_fields=['items', 'expires_at'])
+        return True
+
+    def load(self, cart_key, items):
+        with self._change(cart_key) as fields:
+            fields.clear()
+            fields.update({str(variant_id): quantity for variant_id, quantity in items.items()})
+            fields[LOADED_FIELD] = 1
+
+    def remove(self, cart_key, *variant_ids):
+        if not variant_ids:
+            return 0
+        with self._change(cart_key) as fields:
+            return sum(1 for variant_id in variant_ids if fields.pop(str(variant_id), None) is not None)
+
+    def clear(self, cart_key):
+        from nxtbn.cart.models import StoredCart
+
+        StoredCart.objects.filter(key=cart_key).delete()
+
+    def move(self, source_key, target_key):
+        from nxtbn.cart.models import StoredCart
+
+        with transaction.atomic():
+            source = StoredCart.objects.select_for_update().filter(key=source_key).first()
+            if source is None:
+                return 0
+            items = {} if source.expires_at <= timezone.now() else {
+                variant_id: quantity for variant_id, quantity in source.items.items() if variant_id != LOADED_FIELD
+            }
+            StoredCart.objects.filter(pk=source.pk).delete()
+            if items:
+                with self._change(target_key) as fields:
+                    for variant_id, quantity in items.items():
+                        fields[variant_id] = fields.get(variant_id, 0) + quantity
+            return len(items)
+
+    @staticmethod
+    def purge_expired():
+        from nxtbn.cart.models import StoredCart
+
+        return StoredCart.objects.filter(expires_at__lte=timezone.now()).delete()[0]
+
+
+_storage = None
+_storage_lock = threading.Lock()
+
+
+def get_cart_storage():
+    global _storage
+    if _storage is None:
+        with _storage_lock:
+            if _storage is None:
+                _storage = import_string(settings.CART_STORAGE_BACKEND)()
+    return _storage
@@ -1,7 +1,6 @@
 from django.conf import settings
 import graphene
-from nxtbn.cart.utils import get_or_create_cart
-from nxtbn.core import PublishableStatus
+from nxtbn.cart.utils import get_cart_items
 from nxtbn.core.utils import apply_exchange_rate
 from nxtbn.cart.storefront_types import (
     CartItemType,
@@ -11,49 +10,37 @@ from nxtbn.product.models import ProductVariant
 from nxtbn.core.currency.backend import currency_Backend
 
 
+def build_cart(request):
+    """Builds the cart response for guests and authenticated users alike."""
+    cart_items = get_cart_items(request)
+
+    exchange_rate = 1.0
+    if settings.IS_MULTI_CURRENCY:
+        exchange_rate = currency_Backend().get_exchange_rate(request.currency)
+
+    request.exchange_rate = exchange_rate
+
+    items = []
+    total = 0
+
+    variants = ProductVariant.objects.in_bulk(list(cart_items))
+    for product_variant_id, quantity in cart_items.items():
+        product_variant = variants.get(product_variant_id)
+        if product_variant is None:
+            continue  # variant deleted since it was added to the cart
+        subtotal = product_variant.price * quantity
+        total += subtotal
+        items.append(CartItemType(
+            product_variant=product_variant,
+            quantity=quantity,
+            subtotal=apply_exchange_rate(subtotal, exchange_rate, request.currency, 'en_US')
+        ))
+
+    return CartType(items=items, total=apply_exchange_rate(total, exchange_rate, request.currency, 'en_US'))
+
 
 class CartQuery(graphene.ObjectType):
     cart = graphene.Field(CartType)
 
     def resolve_cart(self, info):
-        # Get the cart (for guest or authenticated user)
-        cart, is_guest = get_or_create_cart(info.context)
-
-        exchange_rate = 1.0
-        if settings.IS_MULTI_CURRENCY:
-            exchange_rate = currency_Backend().get_exchange_rate(info.context.currency)
-        
-        info.context.exchange_rate = exchange_rate
-
-        items = []
-        total = 0
-        
-        if is_guest:
-            # Handle guest cart
-            for product_variant_id, item in cart.items():
-                try:
-                    product_variant = ProductVariant.objects.get(id=product_variant_id)
-                    subtotal = product_variant.price * item['quantity']
-                    total += subtotal
-                    items.append(CartItemType(
-                        product_variant=product_variant,
-                        quantity=item['quantity'],
-                        subtotal=apply_exchange_rate(subtotal, exchange_rate, info.context.currency, 'en_US')
-                    ))
-                except ProductVariant.DoesNotExist:
-                    continue  # Optionally, handle missing product variants
-        else:
-            # Handle authenticated user's cart
-            cart_items = cart.items.all()  # Assuming cart has a reverse relation to CartItem
-            for cart_item in cart_items:
-                product_variant = cart_item.variant
-                subtotal = product_variant.price * cart_item.quantity
-                total += subtotal
-                items.append(CartItemType(
-                    product_variant=product_variant,
-                    quantity=cart_item.quantity,
-                    subtotal=apply_exchange_rate(subtotal, exchange_rate, info.context.currency, 'en_US')
-                ))
-
-        # Return the unified response for both guest and authenticated users
-        return CartType(items=items, total=apply_exchange_rate(total, exchange_rate, info.context.currency, 'en_US'))
\ No newline at end of file
+        return build_cart(info.context)
@@ -0,0 +1,9 @@
+from celery import shared_task
+
+from nxtbn.cart.storage import DatabaseCartStorage
+
+
+@shared_task
+def purge_expired_carts():
+    """Deletes the expired carts of DatabaseCartStorage, returns the number deleted."""
+    return DatabaseCartStorage.purge_expired()
@@ -1,3 +1,247 @@
-from django.test import TestCase
+from datetime import timedelta
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.contrib.sessions.middleware import SessionMiddleware
+from django.test import RequestFactory, TestCase
+from django.utils import timezone
+
+from nxtbn.cart.models import Cart, CartItem, StoredCart
+from nxtbn.cart.storage import DatabaseCartStorage, LocMemCartStorage, RedisCartStorage
+from nxtbn.cart.utils import (
+    add_to_cart,
+    get_cart_items,
+    merge_carts,
+    persist_cart,
+    remove_from_cart,
+    remove_ordered_items_from_cart,
+    update_cart_item,
+)
+from nxtbn.order.models import Order, OrderLineItem
+from nxtbn.product.tests import ProductFactory, ProductVariantFactory
+from nxtbn.users.tests import UserFactory
+
+
+class CartStorageTests:
+    """The behaviour shared by the cart storage backends, `self.storage` is set by the test case."""
+
+    def test_atomic_increments(self):
+        self.assertEqual(self.storage.add('guest:a', 1, 2), 2)
+        self.assertEqual(self.storage.add('guest:a', 1, 3), 5)
+        self.storage.add_many('guest:a', {1: 1, 2: 4})
+        self.assertEqual(self.storage.get_items('guest:a'), {1: 6, 2: 4})
+
+    def test_set_only_existing(self):
+        self.assertFalse(self.storage.set('guest:a', 1, 2, only_existing=True))
+        self.storage.add('guest:a', 1, 1)
+        self.assertTrue(self.storage.set('guest:a', 1, 7, only_existing=True))
+        self.assertEqual(self.storage.get_items('guest:a'), {1: 7})
+
+    def test_load_marks_cart_as_loaded(self):
+        self.assertFalse(self.storage.is_loaded('user:1'))
+        self.storage.load('user:1', {})
+        self.assertTrue(self.storage.is_loaded('user:1'))
+        self.assertEqual(self.storage.get_items('user:1'), {})
+
+    def test_move(self):
+        self.storage.add_many('guest:a', {1: 2, 2: 1})
+        self.storage.load('user:1', {1: 1})
+
+        self.assertEqual(self.storage.move('guest:a', 'user:1'), 2)
+
+        self.assertEqual(self.storage.get_items('user:1'), {1: 3, 2: 1})
+        self.assertTrue(self.storage.is_loaded('user:1'))
+        self.assertEqual(self.storage.get_items('guest:a'), {})
+        self.assertEqual(self.storage.move('guest:a', 'user:1'), 0)
+
+    def test_remove_and_clear(self):
+        self.storage.add_many('guest:a', {1: 1, 2: 2})
+        self.assertEqual(self.storage.remove('guest:a', 1, 3), 1)
+        self.assertEqual(self.storage.get_items('guest:a'), {2: 2})
+        self.storage.clear('guest:a')
+        self.assertEqual(self.storage.get_items('guest:a'), {})
+
+
+class LocMemCartStorageTestCase(CartStorageTests, TestCase):
+    def setUp(self):
+        LocMemCartStorage.flush()
+        self.storage = LocMemCartStorage(timeout=60)
+
+    def test_carts_expire(self):
+        self.storage.add('guest:a', 1, 1)
+        with mock.patch('nxtbn.cart.storage.time.monotonic', return_value=10 ** 12):
+            self.assertEqual(self.storage.get_items('guest:a'), {})
+
+
+@skipUnless(settings.REDIS_AVAILABLE, "redis is not reachable")
+class RedisCartStorageTestCase(CartStorageTests, TestCase):
+    def setUp(self):
+        self.storage = RedisCartStorage(timeout=60)
+        self.storage.key_prefix = 'test-cart:'
+        self.addCleanup(lambda: [self.storage.client.delete(key) for key in self.storage.client.keys('test-cart:*')])
+
+    def test_set_only_existing_does_not_revive_a_cleared_cart(self):
+        self.storage.add('guest:a', 1, 1)
+        self.storage.clear('guest:a')
+        self.assertFalse(self.storage.set('guest:a', 1, 3, only_existing=True))
+        self.assertFalse(self.storage.client.exists(self.storage._key('guest:a')))
+
+
+class DatabaseCartStorageTestCase(CartStorageTests, TestCase):
+    def setUp(self):
+        self.storage = DatabaseCartStorage(timeout=60)
+
+    def test_carts_are_shared_between_instances(self):
+        self.storage.add('guest:a', 1, 2)
+        self.assertEqual(DatabaseCartStorage(timeout=60).add('guest:a', 1, 1), 3)
+
+    def test_set_only_existing_does_not_revive_a_cleared_cart(self):
+        self.storage.add('guest:a', 1, 1)
+        self.storage.clear('guest:a')
+
+        self.assertFalse(self.storage.set('guest:a', 1, 3, only_existing=True))
+        self.assertFalse(StoredCart.objects.filter(key='guest:a').exists())
+
+    def test_set_only_existing_leaves_an_expired_cart_alone(self):
+        self.storage.add('guest:a', 1, 1)
+        expired = timezone.now() - timedelta(seconds=1)
+        StoredCart.objects.filter(key='guest:a').update(expires_at=expired)
+
+        self.assertFalse(self.storage.set('guest:a', 1, 3, only_existing=True))
+        self.assertEqual(
+            StoredCart.objects.values_list('items', 'expires_at').get(key='guest:a'), ({'1': 1}, expired),
+        )
+
+    def test_carts_expire(self):
+        self.storage.add('guest:a', 1, 1)
+        self.storage.add('guest:b', 1, 1)
+        StoredCart.objects.filter(key='guest:a').update(expires_at=timezone.now() - timedelta(seconds=1))
+
+        self.assertEqual(self.storage.get_items('guest:a'), {})
+        self.assertEqual(self.storage.add('guest:a', 2, 1), 1)  # an expired cart starts empty
+        self.assertEqual(self.storage.get_items('guest:a'), {2: 1})
+
+        StoredCart.objects.filter(key='guest:a').update(expires_at=timezone.now() - timedelta(seconds=1))
+        self.assertEqual(DatabaseCartStorage.purge_expired(), 1)
+        self.assertEqual(list(StoredCart.objects.values_list('key', flat=True)), ['guest:b'])
+
+
+class CartOperationsTestCase(TestCase):
+    def setUp(self):
+        LocMemCartStorage.flush()
+        patcher = mock.patch('nxtbn.cart.utils.get_cart_storage', return_value=LocMemCartStorage())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.user = UserFactory()
+        product = ProductFactory(images=[])
+        self.variants = [ProductVariantFactory(product=product) for _ in range(12)]
+
+    def get_request(self, user=None, session=None):
+        request = RequestFactory().get('/')
+        SessionMiddleware(lambda r: None).process_request(request)
+        request.session.update(session or {})
+        request.user = user or AnonymousUser()
+        return request
+
+    def test_guest_cart_does_not_touch_the_database(self):
+        request = self.get_request()
+        with self.assertNumQueries(0):
+            add_to_cart(request, self.variants[0].id, 1)
+            add_to_cart(request, self.variants[0].id, 2)
+            self.assertTrue(update_cart_item(request, self.variants[0].id, 4))
+            add_to_cart(request, self.variants[1].id, 1)
+            self.assertTrue(remove_from_cart(request, self.variants[1].id))
+
+        self.assertEqual(get_cart_items(request), {self.variants[0].id: 4})
+
+    def test_customer_cart_is_loaded_from_last_snapshot(self):
+        cart = Cart.objects.create(user=self.user)
+        CartItem.objects.create(cart=cart, variant=self.variants[0], quantity=3)
+        request = self.get_request(user=self.user)
+
+        with self.assertNumQueries(1):
+            add_to_cart(request, self.variants[0].id, 1)
+        with self.assertNumQueries(0):
+            self.assertEqual(get_cart_items(request), {self.variants[0].id: 4})
+
+        # changes are not written through before checkout
+        self.assertEqual(CartItem.objects.get(cart=cart).quantity, 3)
+
+    def test_merge_adds_to_existing_items(self):
+        cart = Cart.objects.create(user=self.user)
+        CartItem.objects.create(cart=cart, variant=self.variants[0], quantity=3)
+        guest_request = self.get_request()
+        add_to_cart(guest_request, self.variants[0].id, 2)
+        add_to_cart(guest_request, self.variants[1].id, 2)
+
+        merge_carts(guest_request, self.user)
+
+        self.assertEqual(
+            get_cart_items(self.get_request(user=self.user)),
+            {self.variants[0].id: 5, self.variants[1].id: 2}
+        )
+        self.assertEqual(get_cart_items(guest_request), {})
+
+    def test_merge_legacy_session_cart(self):
+        guest_request = self.get_request(session={
+            'cart': {str(self.variants[0].id): {'quantity': 2, 'price': '1.00'}},
+        })
+
+        merge_carts(guest_request, self.user)
+
+        self.assertEqual(get_cart_items(self.get_request(user=self.user)), {self.variants[0].id: 2})
+        self.assertNotIn('cart', guest_request.session)
+
+    def test_merge_query_count_is_independent_of_cart_size(self):
+        small = self.get_request()
+        large = self.get_request()
+        add_to_cart(small, self.variants[0].id, 1)
+        for variant in self.variants:
+            add_to_cart(large, variant.id, 1)
+
+        # loading the customer's persisted cart
+        with self.assertNumQueries(1):
+            merge_carts(small, self.user)
+        with self.assertNumQueries(0):
+            merge_carts(large, self.user)
+
+    def test_persist_cart_skips_unknown_variants(self):
+        persist_cart(self.user, {self.variants[0].id: 2, 999999: 1})
+
+        self.assertEqual(
+            list(CartItem.objects.filter(cart__user=self.user).values_list('variant_id', 'quantity')),
+            [(self.variants[0].id, 2)]
+        )
+
+    def test_checkout_removes_ordered_items_and_writes_through(self):
+        Cart.objects.create(user=self.user)
+        request = self.get_request(user=self.user)
+        for variant in self.variants:
+            add_to_cart(request, variant.id, 1)
+
+        order = Order.objects.create(
+            user=self.user, currency=settings.BASE_CURRENCY, customer_currency=settings.BASE_CURRENCY
+        )
+        for variant in self.variants[:10]:
+            OrderLineItem.objects.create(
+                order=order,
+                variant=variant,
+                quantity=1,
+                price_per_unit=variant.price,
+                total_price=100,
+                currency=settings.BASE_CURRENCY,
+                customer_currency=settings.BASE_CURRENCY,
+            )
+
+        # ordered variant ids, then cart lookup, variants, upsert and stale lines DELETE in a savepoint
+        with self.assertNumQueries(7):
+            remove_ordered_items_from_cart(order, request=request)
+
+        remaining = {variant.id: 1 for variant in self.variants[10:]}
+        self.assertEqual(get_cart_items(request), remaining)
+        self.assertEqual(
+            dict(CartItem.objects.filter(cart__user=self.user).values_list('variant_id', 'quantity')),
+            remaining
+        )
@@ -1,82 +1,144 @@
+import uuid
+
+from django.db import transaction
 
 from nxtbn.product.models import ProductVariant
 from nxtbn.cart.models import Cart, CartItem
+from nxtbn.cart.storage import get_cart_storage
+
+
+GUEST_CART_SESSION_KEY = 'cart_token'
+LEGACY_SESSION_CART_KEY = 'cart' # guest carts used to be stored in the session itself
 
-from django.shortcuts import get_object_or_404
 
-def get_or_create_cart(request):
+def get_customer_cart_key(user):
     """
-    Retrieves the cart for the authenticated user or creates a new guest cart.
-    Returns a tuple: (cart_object, is_guest)
+    Returns the storage key of the customer's cart, loading the last persisted
+    snapshot from the database the first time the cart is used.
     """
-    if request.user.is_authenticated:
-        cart, created = Cart.objects.get_or_create(user=request.user)
-        return cart, False
-    else:
-        # For guest users, retrieve the cart from the session
-        cart = request.session.get('cart', {})
-        return cart, True
-
-def save_guest_cart(request, cart):
+    cart_key = f"user:{user.pk}"
+    storage = get_cart_storage()
+    if not storage.is_loaded(cart_key):
+        storage.load(
+            cart_key,
+            dict(CartItem.objects.filter(cart__user=user).values_list('variant_id', 'quantity'))
+        )
+    return cart_key
+
+
+def get_guest_cart_key(request, create=False):
     """
-    Saves the guest cart back to the session.
+    Guest carts are identified by a token kept in the session. The session is written
+    once when the token is issued, not on every cart change.
     """
-    request.session['cart'] = cart
-    request.session.modified = True
+    token = request.session.get(GUEST_CART_SESSION_KEY)
+    if token is None and create:
+        token = uuid.uuid4().hex
+        request.session[GUEST_CART_SESSION_KEY] = token
+
+    legacy_cart = request.session.get(LEGACY_SESSION_CART_KEY)
+    if legacy_cart:
+        if token is None:
+            token = uuid.uuid4().hex
+            request.session[GUEST_CART_SESSION_KEY] = token
+        get_cart_storage().add_many(f"guest:{token}", _legacy_cart_items(legacy_cart))
+        del request.session[LEGACY_SESSION_CART_KEY]
+
+    return f"guest:{token}" if token else None
+
+
+def _legacy_cart_items(session_cart):
+    items = {}
+    for product_variant_id, item in session_cart.items():
+        try:
+            items[int(product_variant_id)] = int(item.get('quantity', 1))
+        except (TypeError, ValueError):
+            continue
+    return items
+
+
+def get_cart_key(request, create=False):
+    if request.user.is_authenticated:
+        return get_customer_cart_key(request.user)
+    return get_guest_cart_key(request, create=create)
+
+
+def get_cart_items(request):
+    """Returns the cart of the request as {variant_id: quantity}."""
+    cart_key = get_cart_key(request)
+    if cart_key is None:
+        return {}
+    return get_cart_storage().get_items(cart_key)
+
+
+def add_to_cart(request, variant_id, quantity):
+    """Atomically adds quantity to the variant line, returns the new quantity."""
+    return get_cart_storage().add(get_cart_key(request, create=True), variant_id, quantity)
+
+
+def update_cart_item(request, variant_id, quantity):
+    """Sets the quantity of a variant already in the cart, returns False if it is not."""
+    cart_key = get_cart_key(request)
+    if cart_key is None:
+        return False
+    return get_cart_storage().set(cart_key, variant_id, quantity, only_existing=True)
+
+
+def remove_from_cart(request, variant_id):
+    cart_key = get_cart_key(request)
+    if cart_key is None:
+        return False
+    return bool(get_cart_storage().remove(cart_key, variant_id))
+
 
 def merge_carts(request, user):
     """
-    Merges the guest cart stored in the session with the authenticated user's cart.
+    Merges the guest cart with the authenticated user's cart. The guest items are moved
+    in one atomic step of the cart storage, the database is not touched.
     """
-    session_cart = request.session.get('cart', {})
-    if not session_cart:
+    guest_cart_key = get_guest_cart_key(request)
+    if guest_cart_key is None:
         return
 
-    cart, created = Cart.objects.get_or_create(user=user)
+    get_cart_storage().move(guest_cart_key, get_customer_cart_key(user))
+    request.session.pop(GUEST_CART_SESSION_KEY, None)
 
-    for product_variant_id, item in session_cart.items():
-        product_variant = get_object_or_404(ProductVariant, id=product_variant_id)
-        cart_item, created = CartItem.objects.get_or_create(
-            cart=cart,
-            product_variant=product_variant
-        )
-        if not created:
-            cart_item.quantity += item.get('quantity', 1)
-            cart_item.save()
-        else:
-            cart_item.quantity = item.get('quantity', 1)
-            cart_item.save()
 
-    # Clear the session cart after merging
-    request.session['cart'] = {}
+def persist_cart(user, items):
+    """
+    Writes the customer's cart through to the Cart/CartItem tables: one query to resolve
+    the variants, one bulk upsert and one DELETE of the lines no longer in the cart.
+    """
+    with transaction.atomic():
+        cart, created = Cart.objects.get_or_create(user=user)
 
+        # Variants deleted since they were added to the cart are dropped
+        variant_ids = set(ProductVariant.objects.filter(id__in=items).order_by().values_list('id', flat=True))
+        CartItem.objects.bulk_create(
+            [CartItem(cart=cart, variant_id=variant_id, quantity=items[variant_id]) for variant_id in variant_ids],
+            update_conflicts=True,
+            unique_fields=['cart', 'variant'],
+            update_fields=['quantity', 'last_modified'],
+        )
+        if not created:
+            CartItem.objects.filter(cart=cart).exclude(variant_id__in=variant_ids).delete()
+    return cart
 
 
 def remove_ordered_items_from_cart(order, request=None):
     """
-    Remove items from the cart that have been ordered.
-    If is_guest is True, cart is from the session, and request is required to modify the session.
+    Remove items from the cart that have been ordered. Customer carts are then
+    written through to the database.
     """
-    if request is None: # If request is not provided, we can't modify the session cart
+    if request is None: # If request is not provided, we can't find the cart
         return
-    
-    cart, is_guest = get_or_create_cart(request)
-    if is_guest and request:
-        # Guest user: Handle session cart
-        for item in order.line_items.all():
-            product_variant_id = str(item.variant.id)
-            if product_variant_id in cart:
-                del cart[product_variant_id]  # Remove ordered item from session cart
-        
-        # Save updated guest cart back to the session
-        request.session['cart'] = cart
-        request.session.modified = True
-
-    else:
-        # Authenticated user: Handle cart stored in the database
-        for item in order.line_items.all():  # Assuming 'order.items' gives you the ordered items
-            try:
-                cart_item = CartItem.objects.get(cart=cart, variant=item.variant)
-                cart_item.delete()  # Remove the cart item corresponding to the ordered product
-            except CartItem.DoesNotExist:
-                continue  # Ignore if the item is not in the cart (already removed or wasn't added)
+
+    cart_key = get_cart_key(request)
+    if cart_key is None:
+        return
+
+    storage = get_cart_storage()
+    storage.remove(cart_key, *order.line_items.values_list('variant_id', flat=True))
+
+    if request.user.is_authenticated:
+        persist_cart(request.user, storage.get_items(cart_key))
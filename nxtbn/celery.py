@@ -18,6 +18,37 @@ app = Celery('nxtbn')
 app.config_from_object('django.conf:settings', namespace='CELERY')
 app.autodiscover_tasks()
 
+app.conf.beat_schedule = {
+    # Safety net for callbacks whose on-commit kick was lost (eg. broker restart)
+    'process-hubtel-callbacks': {
+        'task': 'nxtbn.hubtel_payments.tasks.process_hubtel_callbacks',
+        'schedule': timedelta(minutes=1),
+    },
+    'reconcile-pending-hubtel-transactions': {
+        'task': 'nxtbn.hubtel_payments.tasks.reconcile_pending_hubtel_transactions',
+        'schedule': timedelta(minutes=2),
+    },
+    # Safety net for queued orders whose on-commit kick was lost, see STOCK_RESERVATION_WORKER
+    'process-pending-stock-reservations': {
+        'task': 'nxtbn.warehouse.tasks.process_pending_reservations',
+        'schedule': timedelta(minutes=1),
+    },
+    'release-expired-stock-reservations': {
+        'task': 'nxtbn.warehouse.tasks.release_expired_stock_reservations',
+        'schedule': timedelta(minutes=5),
+    },
+    # Expired carts of the database cart storage (used when redis isn't available)
+    'purge-expired-carts': {
+        'task': 'nxtbn.cart.tasks.purge_expired_carts',
+        'schedule': timedelta(hours=6),
+    },
+    # Safety net for product listing columns changed outside the variant and stock write paths
+    'refresh-product-listings': {
+        'task': 'nxtbn.product.tasks.refresh_all_product_listings',
+        'schedule': timedelta(hours=24),
+    },
+}
+
 @app.task(bind=True)
 def log_task_request(self):
     """Logs the details of the current task request for debugging purposes."""
@@ -0,0 +1,421 @@
+"""
+Benchmark scenarios for the storefront, checkout and dashboard hot paths.
+
+Scenarios run in-process through the Django test client against the configured
+database, which should hold a dataset seeded by nxtbn.core.seeding. Every
+iteration runs in a transaction that is rolled back, so write scenarios
+(order create, stock reservation) leave the dataset unchanged and runs stay
+comparable. Celery tasks run eagerly, their cost is counted where they are queued.
+The catalog caches are invalidated before every iteration, so the storefront scenarios
+time the query and serialization path; the `_cached` scenarios time cache hits.
+
+A scenario is a function taking the BenchmarkContext and returning the
+callable to time; the preparation done before returning is not measured.
+
+Usage:
+    python manage.py run_benchmarks --seed-data --scale 10k --output baseline.json
+    python manage.py run_benchmarks --compare baseline.json
+"""
+
+import json
+import math
+import platform
+import random
+import statistics
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.test import Client, override_settings
+from django.utils import timezone
+
+from nxtbn.core import PublishableStatus
+from nxtbn.core.query_tracker import track_queries
+from nxtbn.core.user_agent import parse_user_agent_string
+from nxtbn.order import OrderStockReservationStatus
+from nxtbn.order.models import Order, OrderLineItem
+from nxtbn.product.models import Product, ProductVariant
+from nxtbn.product.utils import invalidate_catalog_caches, json_to_html
+from nxtbn.users import UserRole
+from nxtbn.users.models import User
+from nxtbn.warehouse.models import Stock
+from nxtbn.warehouse.utils import reserve_stock
+
+
+STOREFRONT_PRODUCTS_URL = '/product/storefront/api/products/'
+STOREFRONT_GRAPHQL_URL = '/graphql/'
+ADMIN_GRAPHQL_URL = '/admin-graphql/'
+
+PERCENTILES = (50, 90, 95, 99)
+
+# User agents of storefront visitors with their relative frequency, for the device metadata scenario
+USER_AGENT_CORPUS = [
+    ('Mozilla/5.0 (Linux; Android 10; K) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/124.0.0.0 Mobile Safari/537.36', 30),
+    ('Mozilla/5.0 (iPhone; CPU iPhone OS 17_4 like Mac OS X) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/17.4 Mobile/15E148 Safari/604.1', 14),
+    ('Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/124.0.0.0 Safari/537.36', 12),
+    ('Mozilla/5.0 (Linux; Android 13; SAMSUNG SM-A145F) AppleWebKit/537.36 (KHTML, like Gecko) SamsungBrowser/24.0 Chrome/117.0.0.0 Mobile Safari/537.36', 6),
+    ('Mozilla/5.0 (Linux; Android 12; TECNO KG5m) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/123.0.6312.118 Mobile Safari/537.36', 6),
+    ('Mozilla/5.0 (Linux; U; Android 11; en-US; Infinix X6511) AppleWebKit/537.36 (KHTML, like Gecko) Version/4.0 Chrome/100.0.4896.58 UCBrowser/13.4.2.1307 Mobile Safari/537.36', 3),
+    ('Opera/9.80 (Android; Opera Mini/7.6.40077/191.303; U; en) Presto/2.12.423 Version/12.16', 3),
+    ('Mozilla/5.0 (Linux; Android 10; K) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/124.0.0.0 Mobile Safari/537.36 OPR/81.1.4292.78446', 3),
+    ('Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/17.4.1 Safari/605.1.15', 4),
+    ('Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/124.0.0.0 Safari/537.36', 4),
+    ('Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/124.0.0.0 Safari/537.36 Edg/124.0.2478.51', 3),
+    ('Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:125.0) Gecko/20100101 Firefox/125.0', 2),
+    ('Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/124.0.0.0 Safari/537.36', 1),
+    ('Mozilla/5.0 (iPad; CPU OS 17_4 like Mac OS X) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/17.4 Mobile/15E148 Safari/604.1', 2),
+    ('Mozilla/5.0 (Linux; Android 11; SM-T225) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/124.0.0.0 Safari/537.36', 1),
+    ('Mozilla/5.0 (iPhone; CPU iPhone OS 17_4 like Mac OS X) AppleWebKit/605.1.15 (KHTML, like Gecko) CriOS/124.0.6367.88 Mobile/15E148 Safari/604.1', 2),
+    ('Mozilla/5.0 (iPhone; CPU iPhone OS 17_4 like Mac OS X) AppleWebKit/605.1.15 (KHTML, like Gecko) Mobile/15E148 Instagram 327.0.0.0', 1),
+    ('Mozilla/5.0 (X11; CrOS x86_64 14541.0.0) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/124.0.0.0 Safari/537.36', 1),
+    ('Mozilla/5.0 (compatible; Googlebot/2.1; +http://www.google.com/bot.html)', 1),
+    ('Mozilla/5.0 (Windows NT 6.1; WOW64; Trident/7.0; rv:11.0) like Gecko', 1),
+]
+
+SCENARIOS = {}
+
+
+def scenario(name, vendors=None, queries=True):
+    """
+    Registers a scenario, `vendors` restricts it to these database backends. Scenarios
+    which don't touch the database (pure CPU work, cache hits) are registered with `queries=False`.
+    """
+    def decorator(func):
+        func.vendors = vendors
+        func.queries = queries
+        SCENARIOS[name] = func
+        return func
+    return decorator
+
+
+class BenchmarkContext:
+    def __init__(self, seed=0, sample_size=200):
+        self.rng = random.Random(seed)
+        self.client = Client()
+        self.customer = User.objects.filter(role=UserRole.CUSTOMER, is_active=True).order_by('pk').first()
+        self.customer_client = Client()
+        if self.customer:
+            self.customer_client.force_login(self.customer)
+        self.admin = User.objects.filter(is_superuser=True, is_active=True).order_by('pk').first()
+        self.admin_client = Client()
+        if self.admin:
+            self.admin_client.force_login(self.admin)
+
+        self.product_slugs = list(
+            Product.objects.filter(status=PublishableStatus.PUBLISHED)
+            .order_by('pk').values_list('slug', flat=True)[:sample_size]
+        )
+        self.product_names = list(
+            Product.objects.filter(slug__in=self.product_slugs).values_list('name', flat=True)
+        )
+        self.variants = list(
+            ProductVariant.objects.filter(
+                pk__in=Stock.objects.filter(quantity__gt=50).values('product_variant')
+            ).order_by('pk').values_list('pk', 'alias', 'price')[:sample_size]
+        )
+
+    def choose_slug(self):
+        return self.rng.choice(self.product_slugs)
+
+    def choose_basket(self, size=3):
+        return self.rng.sample(self.variants, min(size, len(self.variants)))
+
+    def order_payload(self):
+        address = {
+            "country": "GH",
+            "state": "Greater Accra",
+            "street_address": "12 Ring Road",
+            "city": "Accra",
+            "postal_code": "GA-100",
+            "email": "benchmark@example.com",
+            "first_name": "Bench",
+            "last_name": "Mark",
+            "phone_number": "0240000000",
+        }
+        return {
+            "shipping_address": address,
+            "billing_address": address,
+            "variants": [
+                {"alias": str(alias), "quantity": self.rng.randint(1, 3)}
+                for _, alias, _ in self.choose_basket()
+            ],
+        }
+
+
+def _graphql(client, url, query, variables=None):
+    return client.post(url, data={'query': query, 'variables': variables or {}}, content_type='application/json')
+
+
+@scenario('product_list')
+def product_list(ctx):
+    page = ctx.rng.randint(1, max(len(ctx.product_slugs) // 20, 1))
+    return lambda: ctx.client.get(STOREFRONT_PRODUCTS_URL, {'page': page})
+
+
+@scenario('product_detail')
+def product_detail(ctx):
+    slug = ctx.choose_slug()
+    return lambda: ctx.client.get(f'{STOREFRONT_PRODUCTS_URL}{slug}/')
+
+
+@scenario('product_detail_cached', queries=False)
+def product_detail_cached(ctx):
+    slug = ctx.choose_slug()
+    ctx.client.get(f'{STOREFRONT_PRODUCTS_URL}{slug}/')  # fills the page cache
+    return lambda: ctx.client.get(f'{STOREFRONT_PRODUCTS_URL}{slug}/')
+
+
+@scenario('product_search')
+def product_search(ctx):
+    term = ctx.rng.choice(ctx.product_names).split()[1]
+    return lambda: ctx.client.get(STOREFRONT_PRODUCTS_URL, {'search': term})
+
+
+@scenario('product_recommendations', vendors=('postgresql',))  # trigram similarity
+def product_recommendations(ctx):
+    slug = ctx.choose_slug()
+    return lambda: ctx.client.get(f'{STOREFRONT_PRODUCTS_URL}{slug}/with_recommended/')
+
+
+@scenario('order_estimate')
+def order_estimate(ctx):
+    payload = ctx.order_payload()
+    return lambda: ctx.customer_client.post('/order/storefront/api/eastimate/', payload, content_type='application/json')
+
+
+@scenario('order_create')
+def order_create(ctx):
+    payload = ctx.order_payload()
+    return lambda: ctx.customer_client.post('/order/storefront/api/create/', payload, content_type='application/json')
+
+
+@scenario('stock_reservation')
+def stock_reservation(ctx):
+    order = Order.objects.create(
+        user=ctx.customer,
+        currency=settings.BASE_CURRENCY,
+        customer_currency=settings.BASE_CURRENCY,
+        reservation_status=OrderStockReservationStatus.NOT_REQUIRED,
+    )
+    for variant_id, _, price in ctx.choose_basket():
+        OrderLineItem.objects.create(
+            order=order,
+            variant_id=variant_id,
+            quantity=1,
+            price_per_unit=price,
+            total_price=1,
+            currency=settings.BASE_CURRENCY,
+            customer_currency=settings.BASE_CURRENCY,
+        )
+    return lambda: reserve_stock(order)
+
+
+@scenario('user_agent_parse', queries=False)
+def user_agent_parse(ctx):
+    """Device metadata of 1000 orders: the popular strings repeat, 5% are seen once (new builds, odd clients)."""
+    agents = ctx.rng.choices(
+        [agent for agent, _ in USER_AGENT_CORPUS], weights=[weight for _, weight in USER_AGENT_CORPUS], k=1000,
+    )
+    for index in range(0, len(agents), 20):
+        agents[index] = f'{agents[index]} Build/{ctx.rng.getrandbits(32):x}'
+    return lambda: [parse_user_agent_string(agent) for agent in agents]
+
+
+def _described_products(ctx):
+    return list(Product.objects.filter(slug__in=ctx.product_slugs).exclude(description_rendered=None))
+
+
+@scenario('product_description_render', queries=False)
+def product_description_render(ctx):
+    """Product descriptions rendered from the rich-text JSON on every read, the cost description_rendered saves."""
+    products = _described_products(ctx)
+    return lambda: [json_to_html(product.description) for product in products]
+
+
+@scenario('product_description_stored', queries=False)
+def product_description_stored(ctx):
+    """The same product descriptions read from the stored description_rendered."""
+    products = _described_products(ctx)
+    return lambda: [product.description_html() for product in products]
+
+
+def _last_30_days():
+    end = timezone.now().date()
+    return {'start_date': str(end - timedelta(days=30)), 'end_date': str(end)}
+
+
+@scenario('dashboard_stats')
+def dashboard_stats(ctx):
+    params = _last_30_days()
+    return lambda: ctx.admin_client.get('/order/dashboard/api/stats/', params)
+
+
+@scenario('dashboard_order_overview')
+def dashboard_order_overview(ctx):
+    params = _last_30_days()
+    return lambda: ctx.admin_client.get('/order/dashboard/api/stats/overview/', params)
+
+
+@scenario('storefront_graphql_products')
+def storefront_graphql_products(ctx):
+    query = """
+        query BenchmarkProducts {
+            products(first: 20) {
+                edges { node { id name slug price category { name } } }
+            }
+        }
+    """
+    return lambda: _graphql(ctx.client, STOREFRONT_GRAPHQL_URL, query)
+
+
+@scenario('admin_graphql_orders')
+def admin_graphql_orders(ctx):
+    query = """
+        query BenchmarkOrders {
+            orders(first: 20) {
+                edges { node { alias status humanizeTotalPrice paymentMethod lineItems { quantity } } }
+            }
+        }
+    """
+    return lambda: _graphql(ctx.admin_client, ADMIN_GRAPHQL_URL, query)
+
+
+def _is_error(result):
+    status_code = getattr(result, 'status_code', None)
+    if status_code is None:
+        return False
+    if status_code >= 400:
+        return True
+    if result.get('Content-Type', '').startswith('application/json') and b'"errors"' in result.content:
+        return True
+    return False
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of an already sorted list."""
+    if not values:
+        return None
+    rank = max(math.ceil(pct / 100 * len(values)), 1)
+    return values[rank - 1]
+
+
+def summarize(durations, query_counts, errors):
+    durations = sorted(duration * 1000 for duration in durations)
+    summary = {
+        'iterations': len(durations),
+        'errors': errors,
+        'latency_ms': {f'p{pct}': round(percentile(durations, pct), 3) for pct in PERCENTILES},
+        'queries': {'mean': round(statistics.mean(query_counts), 2), 'max': max(query_counts)},
+    }
+    summary['latency_ms']['mean'] = round(statistics.mean(durations), 3)
+    summary['latency_ms']['max'] = round(durations[-1], 3)
+    return summary
+
+
+def run_scenario(ctx, func, iterations=50, warmup=5):
+    durations, query_counts, errors = [], [], 0
+    for iteration in range(warmup + iterations):
+        invalidate_catalog_caches()  # a version bump, the other cache entries are kept
+        with transaction.atomic():
+            run = func(ctx)
+            with track_queries() as tracker:
+                start = time.perf_counter()
+                try:
+                    result = run()
+                    failed = _is_error(result)
+                except Exception:
+                    failed = True
+                duration = time.perf_counter() - start
+            transaction.set_rollback(True)
+
+        if iteration < warmup:
+            continue
+        durations.append(duration)
+        query_counts.append(tracker.count)
+        errors += failed
+    return summarize(durations, query_counts, errors)
+
+
+def run_benchmarks(names=None, iterations=50, warmup=5, seed=0, log=None):
+    """Runs the scenarios (all by default) and returns the report, ready to be written as the JSON baseline."""
+    log = log or (lambda message: None)
+    names = names or list(SCENARIOS)
+    unknown = set(names) - set(SCENARIOS)
+    if unknown:
+        raise ValueError(f"Unknown scenarios: {', '.join(sorted(unknown))}")
+
+    skipped = [name for name in names if SCENARIOS[name].vendors and connection.vendor not in SCENARIOS[name].vendors]
+    names = [name for name in names if name not in skipped]
+    for name in skipped:
+        log(f"{name:<30} skipped, not supported on {connection.vendor}")
+
+    ctx = BenchmarkContext(seed=seed)
+    results = {}
+    # celery reads its configuration from the CELERY_ settings (namespace='CELERY')
+    with override_settings(CELERY_TASK_ALWAYS_EAGER=True):
+        for name in names:
+            results[name] = run_scenario(ctx, SCENARIOS[name], iterations=iterations, warmup=warmup)
+            log(format_result(name, results[name]))
+
+    return {
+        'meta': {
+            'created_at': timezone.now().isoformat(),
+            'database': connection.vendor,
+            'python': platform.python_version(),
+            'iterations': iterations,
+            'seed': seed,
+            'dataset': {
+                'products': Product.objects.count(),
+                'variants': ProductVariant.objects.count(),
+                'orders': Order.objects.count(),
+            },
+        },
+        'scenarios': results,
+        'skipped': skipped,
+    }
+
+
+def format_result(name, result):
+    latency = result['latency_ms']
+    return (
+        f"{name:<30} p50 {latency['p50']:>9.2f}ms  p95 {latency['p95']:>9.2f}ms  p99 {latency['p99']:>9.2f}ms  "
+        f"queries {result['queries']['max']:>4}  errors {result['errors']}"
+    )
+
+
+def compare(baseline, report, threshold=0.2):
+    """
+    Compares a report with a baseline, scenario by scenario. A scenario regresses when its
+    p95 latency grows by more than `threshold` (a ratio) or it runs more queries than before.
+    """
+    rows = []
+    for name, result in report['scenarios'].items():
+        before = baseline['scenarios'].get(name)
+        if before is None:
+            rows.append({'scenario': name, 'status': 'new'})
+            continue
+        p95_before, p95_after = before['latency_ms']['p95'], result['latency_ms']['p95']
+        change = (p95_after - p95_before) / p95_before if p95_before else 0.0
+        queries_before, queries_after = before['queries']['max'], result['queries']['max']
+        regressed = change > threshold or queries_after > queries_before or result['errors'] > before['errors']
+        rows.append({
+            'scenario': name,
+            'status': 'regressed' if regressed else 'ok',
+            'p95_before': p95_before,
+            'p95_after': p95_after,
+            'p95_change': round(change, 4),
+            'queries_before': queries_before,
+            'queries_after': queries_after,
+        })
+    return rows
+
+
+def dump_report(report, path):
+    with open(path, 'w') as f:
+        json.dump(report, f, indent=2, sort_keys=True)
+
+
+def load_report(path):
+    with open(path) as f:
+        return json.load(f)
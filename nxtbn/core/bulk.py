@@ -0,0 +1,152 @@
+"""
+Set-based writes for imports, syncs and seeding.
+
+`insert_rows` and `bulk_upsert` write model instances in batches. On
+PostgreSQL they can use COPY: rows are streamed in the COPY text format,
+straight into the table for inserts, or into a temporary staging table merged
+with one `INSERT ... SELECT ... ON CONFLICT DO UPDATE` for upserts. Elsewhere
+they fall back to `bulk_create`. Either way `save()`, signals and per-row
+validation are skipped: callers validate the rows and compute the derived
+values themselves.
+"""
+
+import io
+import itertools
+import json
+from contextlib import contextmanager
+from datetime import date, datetime
+
+from django.db import connection, models, transaction
+
+
+def can_copy():
+    return connection.vendor == 'postgresql'
+
+
+@contextmanager
+def explicit_field_values(*fields):
+    """
+    Makes inserts keep the values set on the instances for `auto_now_add` dates and
+    AutoSlugFields, which otherwise replace them on insert (an AutoSlugField also runs a
+    uniqueness query per row).
+    """
+    patched = []
+    for model, name in fields:
+        field = model._meta.get_field(name)
+        for attr in ('auto_now_add', 'overwrite_on_add'):
+            if getattr(field, attr, False):
+                setattr(field, attr, False)
+                patched.append((field, attr))
+    try:
+        yield
+    finally:
+        for field, attr in patched:
+            setattr(field, attr, True)
+
+
+def _escape_copy(value):
+    return value.replace('\\', '\\\\').replace('\t', '\\t').replace('\n', '\\n').replace('\r', '\\r')
+
+
+def copy_value(field, obj):
+    """The value of a field in the COPY text format."""
+    value = field.pre_save(obj, True)
+    if value is None:
+        return r'\N'
+    if isinstance(field, models.JSONField):
+        return _escape_copy(json.dumps(value, cls=field.encoder))
+    value = field.get_db_prep_save(value, connection)
+    if value is None:
+        return r'\N'
+    if isinstance(value, bool):
+        return 't' if value else 'f'
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return _escape_copy(str(value))
+
+
+def _copy(cursor, table, fields, objs):
+    data = io.StringIO()
+    for obj in objs:
+        data.write('\t'.join(copy_value(field, obj) for field in fields))
+        data.write('\n')
+    data.seek(0)
+    columns = ', '.join(connection.ops.quote_name(field.column) for field in fields)
+    cursor.cursor.copy_expert(f'COPY {connection.ops.quote_name(table)} ({columns}) FROM STDIN', data)
+
+
+def copy_rows(model, objs):
+    """Writes the instances with COPY, taking their primary keys from the table sequence first."""
+    opts = model._meta
+    with connection.cursor() as cursor:
+        missing = [obj for obj in objs if obj.pk is None]
+        if missing:
+            cursor.execute(
+                'SELECT nextval(pg_get_serial_sequence(%s, %s)) FROM generate_series(1, %s)',
+                [opts.db_table, opts.pk.column, len(missing)],
+            )
+            for obj, (pk,) in zip(missing, cursor.fetchall()):
+                obj.pk = pk
+        _copy(cursor, opts.db_table, opts.concrete_fields, objs)
+
+    for obj in objs:
+        obj._state.adding = False
+        obj._state.db = connection.alias
+    return objs
+
+
+def insert_rows(model, objs, batch_size=2000, use_copy=False):
+    """Inserts the instances in batches, returns them with their primary keys set."""
+    created = []
+    objs = iter(objs)
+    while True:
+        batch = list(itertools.islice(objs, batch_size))
+        if not batch:
+            return created
+        if use_copy:
+            created.extend(copy_rows(model, batch))
+        else:
+            created.extend(model.objects.bulk_create(batch))
+
+
+def copy_upsert(model, objs, unique_fields, update_fields):
+    """COPYs the instances into a staging table and merges it into the model table."""
+    opts = model._meta
+    quote_name = connection.ops.quote_name
+    fields = [field for field in opts.concrete_fields if not field.primary_key]
+    columns = ', '.join(quote_name(field.column) for field in fields)
+    conflict = ', '.join(quote_name(opts.get_field(name).column) for name in unique_fields)
+    updates = ', '.join(
+        f'{quote_name(column)} = EXCLUDED.{quote_name(column)}'
+        for column in (opts.get_field(name).column for name in update_fields)
+    )
+    staging = quote_name(f'staging_{opts.db_table}')
+    table = quote_name(opts.db_table)
+
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(f'CREATE TEMPORARY TABLE {staging} AS SELECT {columns} FROM {table} WITH NO DATA')
+        _copy(cursor, f'staging_{opts.db_table}', fields, objs)
+        cursor.execute(
+            f'INSERT INTO {table} ({columns}) SELECT {columns} FROM {staging} '
+            f'ON CONFLICT ({conflict}) DO UPDATE SET {updates}'
+        )
+        cursor.execute(f'DROP TABLE {staging}')
+
+
+def bulk_upsert(model, objs, unique_fields, update_fields, batch_size=2000, use_copy=False):
+    """
+    Inserts the instances, or updates `update_fields` of the rows already holding their
+    `unique_fields` values. The instances must not repeat a unique key. Primary keys are not
+    set on the instances, look the rows up by their unique fields.
+    """
+    objs = iter(objs)
+    while True:
+        batch = list(itertools.islice(objs, batch_size))
+        if not batch:
+            return
+        if use_copy:
+            copy_upsert(model, batch, unique_fields, update_fields)
+        else:
+            model.objects.bulk_create(
+                batch, update_conflicts=True, unique_fields=unique_fields, update_fields=update_fields,
+            )
@@ -0,0 +1,61 @@
+"""
+Cache backends counting hits and misses into the metrics registry.
+
+Drop-in replacements for the Django backends used in settings.CACHES, the
+metrics label is taken from the METRICS_NAME entry of the cache settings.
+"""
+
+import threading
+
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.cache.backends.memcached import PyMemcacheCache
+from django.core.cache.backends.redis import RedisCache
+
+from nxtbn.core.metrics import cache_requests
+
+
+_MISSING = object()
+_state = threading.local()
+
+
+class InstrumentedCacheMixin:
+    def __init__(self, location, params):
+        super().__init__(location, params)
+        self.metrics_name = params.get('METRICS_NAME', 'default')
+
+    def get(self, key, default=None, version=None):
+        value = super().get(key, _MISSING, version=version)
+        if not getattr(_state, 'in_get_many', False):
+            cache_requests.inc(cache=self.metrics_name, result='miss' if value is _MISSING else 'hit')
+        return default if value is _MISSING else value
+
+    def get_many(self, keys, version=None):
+        keys = list(keys)
+        # the base implementation of get_many calls get() per key
+        _state.in_get_many = True
+        try:
+            values = super().get_many(keys, version=version)
+        finally:
+            _state.in_get_many = False
+        if values:
+            cache_requests.inc(len(values), cache=self.metrics_name, result='hit')
+        if len(keys) > len(values):
+            cache_requests.inc(len(keys) - len(values), cache=self.metrics_name, result='miss')
+        return values
+
+
+class LocMemCache(InstrumentedCacheMixin, LocMemCache):
+    pass
+
+
+class RedisCache(InstrumentedCacheMixin, RedisCache):
+    pass
+
+
+class PyMemcacheCache(InstrumentedCacheMixin, PyMemcacheCache):
+    pass
+
+
+class DummyCache(InstrumentedCacheMixin, DummyCache):
+    pass
@@ -0,0 +1,68 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from nxtbn.core.benchmark import SCENARIOS, compare, dump_report, load_report, run_benchmarks
+from nxtbn.core.seeding import SCALES, is_seeded, parse_scale, seed_dataset
+
+
+class Command(BaseCommand):
+    help = (
+        'Run the storefront, checkout and dashboard benchmark scenarios and record latency percentiles '
+        'and query counts. Use a dedicated database: --seed-data writes a large dataset into it.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seed-data', action='store_true', help='Seed the benchmark dataset first (skipped if already seeded)')
+        parser.add_argument('--scale', default='10k', help=f"Number of orders to seed, or a preset: {', '.join(SCALES)}")
+        parser.add_argument('--seed', type=int, default=0, help='Random seed of the dataset and of the scenario inputs')
+        parser.add_argument('--workers', type=int, default=1, help='Processes seeding the orders')
+        parser.add_argument('--scenario', action='append', dest='scenarios', choices=sorted(SCENARIOS), help='Run only this scenario (repeatable)')
+        parser.add_argument('--iterations', type=int, default=50)
+        parser.add_argument('--warmup', type=int, default=5)
+        parser.add_argument('--output', help='Write the report as JSON to this file, to be used as a baseline')
+        parser.add_argument('--compare', help='Baseline JSON report to compare the results with')
+        parser.add_argument('--threshold', type=float, default=0.2, help='Allowed p95 latency increase over the baseline, as a ratio')
+
+    def handle(self, *args, **options):
+        if options['seed_data']:
+            sizes = seed_dataset(
+                parse_scale(options['scale']), seed=options['seed'], workers=options['workers'], log=self.stdout.write,
+            )
+            if sizes is None:
+                self.stdout.write(self.style.WARNING('Benchmark dataset already seeded, reusing it'))
+            else:
+                self.stdout.write(self.style.SUCCESS(f"Seeded {sizes}"))
+        elif not is_seeded():
+            raise CommandError('No benchmark dataset in this database, run with --seed-data first')
+
+        report = run_benchmarks(
+            names=options['scenarios'],
+            iterations=options['iterations'],
+            warmup=options['warmup'],
+            seed=options['seed'],
+            log=self.stdout.write,
+        )
+
+        if options['output']:
+            dump_report(report, options['output'])
+            self.stdout.write(self.style.SUCCESS(f"Report written to {options['output']}"))
+
+        if options['compare']:
+            baseline = load_report(options['compare'])
+            if baseline['meta'].get('dataset') != report['meta']['dataset']:
+                self.stdout.write(self.style.WARNING(
+                    f"Baseline was recorded on another dataset: {baseline['meta'].get('dataset')}"
+                ))
+            rows = compare(baseline, report, threshold=options['threshold'])
+            for row in rows:
+                if row['status'] == 'new':
+                    self.stdout.write(f"{row['scenario']:<30} new")
+                    continue
+                line = (
+                    f"{row['scenario']:<30} p95 {row['p95_before']:>9.2f} -> {row['p95_after']:>9.2f}ms "
+                    f"({row['p95_change']:+.0%})  queries {row['queries_before']} -> {row['queries_after']}"
+                )
+                self.stdout.write(self.style.ERROR(line) if row['status'] == 'regressed' else line)
+
+            regressed = [row['scenario'] for row in rows if row['status'] == 'regressed']
+            if regressed:
+                raise CommandError(f"Regressions in: {', '.join(regressed)}")
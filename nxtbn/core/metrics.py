@@ -0,0 +1,285 @@
+"""
+In-process metrics registry with a Prometheus text exposition.
+
+Counters and fixed-bucket histograms are kept in memory per process. With
+METRICS_MULTIPROC_DIR set (gunicorn runs several workers), every process
+periodically writes a snapshot of its registry to `<dir>/metrics_<pid>.json`
+and the /metrics/ endpoint merges the snapshots of all processes, so the
+exposed values cover every worker. The directory should be emptied before the
+server starts; a new process reusing the pid of a dead worker overwrites its file.
+
+Usage:
+    from nxtbn.core.metrics import registry
+    registry.counter('orders_created_total', 'Orders created', ['source']).inc(source='storefront')
+"""
+
+import json
+import math
+import os
+import threading
+import time
+
+from django.conf import settings
+
+
+DEFAULT_LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+DEFAULT_COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+
+def _label_key(labelnames, labels):
+    if set(labels) != set(labelnames):
+        raise ValueError(f"Expected labels {labelnames}, got {sorted(labels)}")
+    return tuple(str(labels[name]) for name in labelnames)
+
+
+class Counter:
+    type = 'counter'
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = _label_key(self.labelnames, labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def snapshot(self):
+        with self._lock:
+            samples = [[list(key), value] for key, value in self._values.items()]
+        return {'type': self.type, 'help': self.documentation, 'labelnames': list(self.labelnames), 'samples': samples}
+
+
+class Histogram:
+    type = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = _label_key(self.labelnames, labels)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                # per bucket counts (not cumulative, +Inf last), sum, count
+                entry = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    break
+            else:
+                index = len(self.buckets)
+            entry[0][index] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    def snapshot(self):
+        with self._lock:
+            samples = [[list(key), [list(entry[0]), entry[1], entry[2]]] for key, entry in self._values.items()]
+        return {
+            'type': self.type,
+            'help': self.documentation,
+            'labelnames': list(self.labelnames),
+            'buckets': list(self.buckets),
+            'samples': samples,
+        }
+
+
+class MetricsRegistry:
+    def __init__(self, multiprocess_dir=None):
+        self.multiprocess_dir = multiprocess_dir
+        self._metrics = {}
+        self._lock = threading.Lock()
+        self._last_flush = 0.0
+
+    def _get_or_create(self, cls, name, *args, **kwargs):
+        metric = self._metrics.get(name)
+        if metric is None:
+            with self._lock:
+                metric = self._metrics.get(name)
+                if metric is None:
+                    metric = self._metrics[name] = cls(name, *args, **kwargs)
+        if not isinstance(metric, cls):
+            raise ValueError(f"Metric {name} is already registered as a {metric.type}")
+        return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self._get_or_create(Counter, name, documentation, labelnames)
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_LATENCY_BUCKETS):
+        return self._get_or_create(Histogram, name, documentation, labelnames, buckets=buckets)
+
+    def snapshot(self):
+        return {name: metric.snapshot() for name, metric in list(self._metrics.items())}
+
+    def reset(self):
+        """Zeroes every metric, keeping them registered."""
+        for metric in list(self._metrics.values()):
+            with metric._lock:
+                metric._values.clear()
+
+    # Multiprocess mode
+
+    def _snapshot_path(self, pid=None):
+        return os.path.join(self.multiprocess_dir, f"metrics_{pid or os.getpid()}.json")
+
+    def flush(self, force=False):
+        """Writes the snapshot of this process, at most once per METRICS_FLUSH_INTERVAL unless forced."""
+        if not self.multiprocess_dir:
+            return
+        now = time.monotonic()
+        if not force and now - self._last_flush < settings.METRICS_FLUSH_INTERVAL:
+            return
+        self._last_flush = now
+
+        os.makedirs(self.multiprocess_dir, exist_ok=True)
+        path = self._snapshot_path()
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(self.snapshot(), f)
+        os.replace(tmp_path, path) # readers never see a partial file
+
+    def collect(self):
+        """Returns the merged snapshot of every process, or of this process in single process mode."""
+        if not self.multiprocess_dir:
+            return self.snapshot()
+
+        self.flush(force=True)
+        snapshots = []
+        for filename in sorted(os.listdir(self.multiprocess_dir)):
+            if not (filename.startswith('metrics_') and filename.endswith('.json')):
+                continue
+            try:
+                with open(os.path.join(self.multiprocess_dir, filename)) as f:
+                    snapshots.append(json.load(f))
+            except (OSError, ValueError):
+                continue # removed or being replaced
+        return merge_snapshots(snapshots)
+
+
+def merge_snapshots(snapshots):
+    merged = {}
+    for snapshot in snapshots:
+        for name, metric in snapshot.items():
+            target = merged.setdefault(name, {**metric, 'samples': {}})
+            for labels, value in metric['samples']:
+                key = tuple(labels)
+                if metric['type'] == Histogram.type:
+                    current = target['samples'].get(key)
+                    if current is None:
+                        target['samples'][key] = [list(value[0]), value[1], value[2]]
+                    else:
+                        current[0] = [a + b for a, b in zip(current[0], value[0])]
+                        current[1] += value[1]
+                        current[2] += value[2]
+                else:
+                    target['samples'][key] = target['samples'].get(key, 0) + value
+    for metric in merged.values():
+        metric['samples'] = [[list(key), value] for key, value in metric['samples'].items()]
+    return merged
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(labelnames, labels, extra=None):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(labelnames, labels)]
+    if extra:
+        pairs.extend(f'{name}="{_escape(value)}"' for name, value in extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _format_value(value):
+    if isinstance(value, float):
+        if math.isinf(value):
+            return '+Inf' if value > 0 else '-Inf'
+        return repr(value)
+    return str(value)
+
+
+def render_text(snapshot):
+    """Renders a snapshot in the Prometheus text exposition format (version 0.0.4)."""
+    lines = []
+    for name in sorted(snapshot):
+        metric = snapshot[name]
+        labelnames = metric['labelnames']
+        lines.append(f"# HELP {name} {_escape(metric['help'])}")
+        lines.append(f"# TYPE {name} {metric['type']}")
+        for labels, value in sorted(metric['samples']):
+            if metric['type'] == Histogram.type:
+                bucket_counts, total, count = value
+                cumulative = 0
+                for bound, bucket_count in zip(metric['buckets'] + ['+Inf'], bucket_counts):
+                    cumulative += bucket_count
+                    le = bound if bound == '+Inf' else _format_value(float(bound))
+                    lines.append(f"{name}_bucket{_format_labels(labelnames, labels, [('le', le)])} {cumulative}")
+                lines.append(f"{name}_sum{_format_labels(labelnames, labels)} {_format_value(float(total))}")
+                lines.append(f"{name}_count{_format_labels(labelnames, labels)} {count}")
+            else:
+                lines.append(f"{name}{_format_labels(labelnames, labels)} {_format_value(value)}")
+    return '\n'.join(lines) + '\n'
+
+
+registry = MetricsRegistry(multiprocess_dir=getattr(settings, 'METRICS_MULTIPROC_DIR', None) or None)
+
+
+# Metrics recorded by the request middleware, the instrumented cache backends and the GraphQL views
+
+http_request_duration = registry.histogram(
+    'http_request_duration_seconds',
+    'Request latency by resolved route',
+    ['method', 'route', 'status'],
+)
+http_request_db_queries = registry.histogram(
+    'http_request_db_queries',
+    'Database queries executed per request',
+    ['method', 'route'],
+    buckets=DEFAULT_COUNT_BUCKETS,
+)
+http_request_db_duration = registry.histogram(
+    'http_request_db_duration_seconds',
+    'Time spent in database queries per request',
+    ['method', 'route'],
+)
+http_request_n_plus_one = registry.counter(
+    'http_request_n_plus_one_total',
+    'Requests repeating a query fingerprint at least QUERY_N_PLUS_ONE_THRESHOLD times',
+    ['method', 'route'],
+)
+cache_requests = registry.counter(
+    'cache_requests_total',
+    'Cache lookups by cache alias and result',
+    ['cache', 'result'],
+)
+graphql_operation_duration = registry.histogram(
+    'graphql_operation_duration_seconds',
+    'GraphQL operation latency by schema and operation name',
+    ['schema', 'operation'],
+)
+
+
+# Metrics recorded by the stock reservation sweeper (nxtbn.warehouse.tasks.release_expired_stock_reservations)
+
+stock_reservation_expired_orders = registry.counter(
+    'stock_reservation_expired_orders_total',
+    'Unpaid pending orders whose expired stock reservations were released, by order source',
+    ['source'],
+)
+stock_reservation_released_units = registry.counter(
+    'stock_reservation_released_units_total',
+    'Reserved stock units reclaimed from expired reservations, by order source',
+    ['source'],
+)
+stock_reservation_sweep_units = registry.histogram(
+    'stock_reservation_sweep_units',
+    'Reserved stock units reclaimed per sweeper run',
+    buckets=(0, 1, 10, 50, 100, 500, 1000, 5000, 10000),
+)
@@ -7,7 +7,18 @@ Add this to your MIDDLEWARE in settings.py:
 
 import time
 import logging
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db import connection
 from django.utils.deprecation import MiddlewareMixin
+from nxtbn.core.metrics import (
+    http_request_db_duration,
+    http_request_db_queries,
+    http_request_duration,
+    http_request_n_plus_one,
+    registry,
+)
+from nxtbn.core.query_tracker import QueryTracker
 from nxtbn.core.monitoring import (
     set_user_context,
     add_breadcrumb,
@@ -21,9 +32,96 @@ logger = logging.getLogger('nxtbn')
 
 class RequestMonitoringMiddleware(MiddlewareMixin):
     """
-    Middleware to automatically monitor all requests with Sentry
+    Middleware to automatically monitor all requests with Sentry, and to record
+    per-route latency, database and status metrics into the metrics registry.
+    Repeated query fingerprints (likely N+1) are logged, and in debug/staging
+    (QUERY_DEBUG_HEADERS) the query totals are returned as X-DB-* headers
     """
-    
+
+    def __call__(self, request):
+        # Exit out to async mode, if needed (same switch as MiddlewareMixin)
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not self._tracking_enabled():
+            return super().__call__(request)
+
+        tracker = QueryTracker()
+        start = time.perf_counter()
+        with connection.execute_wrapper(tracker):
+            response = super().__call__(request)
+        self._record(request, response, tracker, time.perf_counter() - start)
+        return response
+
+    async def __acall__(self, request):
+        if not self._tracking_enabled():
+            return await super().__acall__(request)
+
+        tracker = QueryTracker()
+        start = time.perf_counter()
+        # Connections are thread local: install the tracker on the thread that
+        # runs this request's sync code (views, ORM), not on the event loop.
+        await sync_to_async(self._install_tracker, thread_sensitive=True)(tracker)
+        try:
+            response = await super().__acall__(request)
+        finally:
+            await sync_to_async(self._uninstall_tracker, thread_sensitive=True)(tracker)
+        await sync_to_async(self._record, thread_sensitive=True)(
+            request, response, tracker, time.perf_counter() - start
+        )
+        return response
+
+    @staticmethod
+    def _tracking_enabled():
+        return settings.METRICS_ENABLED or settings.QUERY_DEBUG_HEADERS
+
+    @staticmethod
+    def _install_tracker(tracker):
+        connection.execute_wrappers.append(tracker)
+
+    @staticmethod
+    def _uninstall_tracker(tracker):
+        connection.execute_wrappers.remove(tracker)
+
+    def _record(self, request, response, tracker, duration):
+        route = self._get_route(request)
+        n_plus_one = tracker.n_plus_one()
+        if n_plus_one:
+            fingerprint, count = n_plus_one[0]
+            log_warning(
+                f"Possible N+1 queries: {request.method} {route}",
+                extra={
+                    'route': route,
+                    'query_count': tracker.count,
+                    'repeated': count,
+                    'sql': tracker.samples[fingerprint][:500],
+                }
+            )
+
+        if settings.QUERY_DEBUG_HEADERS:
+            response['X-DB-Query-Count'] = str(tracker.count)
+            response['X-DB-Query-Time-Ms'] = f"{tracker.duration * 1000:.1f}"
+            response['X-DB-N-Plus-One'] = str(len(n_plus_one))
+
+        if settings.METRICS_ENABLED:
+            http_request_duration.observe(
+                duration, method=request.method, route=route, status=f"{response.status_code // 100}xx"
+            )
+            http_request_db_queries.observe(tracker.count, method=request.method, route=route)
+            http_request_db_duration.observe(tracker.duration, method=request.method, route=route)
+            if n_plus_one:
+                http_request_n_plus_one.inc(method=request.method, route=route)
+            try:
+                registry.flush()
+            except OSError:  # a full or read-only metrics directory must not fail the request
+                logger.exception("Could not write the metrics snapshot to %s", settings.METRICS_MULTIPROC_DIR)
+
+    @staticmethod
+    def _get_route(request):
+        resolver_match = getattr(request, 'resolver_match', None)
+        if resolver_match is None:
+            return 'unmatched' # never use the raw path as label, it is unbounded
+        return resolver_match.route or resolver_match.view_name or 'unknown'
+
     def process_request(self, request):
         """Called before Django decides which view to execute"""
         # Store start time
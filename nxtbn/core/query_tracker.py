@@ -0,0 +1,88 @@
+"""
+Per-request database query instrumentation.
+
+`QueryTracker` is a `connection.execute_wrapper` counting the queries of a
+unit of work (a request, a task, a test block) and grouping them by
+fingerprint, the SQL with its literals and parameters stripped. A fingerprint
+repeated QUERY_N_PLUS_ONE_THRESHOLD times or more is reported as a likely N+1,
+the same query run once per row of a parent result.
+
+Usage:
+    with track_queries() as tracker:
+        ...
+    tracker.count, tracker.duration, tracker.n_plus_one()
+"""
+
+import re
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+
+_WHITESPACE_RE = re.compile(r'\s+')
+_STRING_RE = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_RE = re.compile(r'(?<![\w."])-?\d+(?:\.\d+)?\b')
+_PLACEHOLDER_RE = re.compile(r'%s|%\(\w+\)s|\?')
+_IN_LIST_RE = re.compile(r'\bIN \((?:\?, )*\?\)', re.IGNORECASE)
+_VALUES_LIST_RE = re.compile(r'\bVALUES (?:\((?:\?, )*\?\)(?:, )?)+', re.IGNORECASE)
+_SAVEPOINT_RE = re.compile(r'"s\d+_x\d+"')
+
+
+def fingerprint(sql):
+    """
+    Normalizes a statement so that queries differing only by their values share a fingerprint:
+    `WHERE id = 1` and `WHERE id = 2`, or `IN (1, 2)` and `IN (1, 2, 3)`.
+    """
+    sql = _WHITESPACE_RE.sub(' ', sql.strip())
+    sql = _STRING_RE.sub('?', sql)
+    sql = _NUMBER_RE.sub('?', sql)
+    sql = _PLACEHOLDER_RE.sub('?', sql)
+    sql = _IN_LIST_RE.sub('IN (...)', sql)
+    sql = _VALUES_LIST_RE.sub('VALUES (...)', sql)
+    return _SAVEPOINT_RE.sub('"savepoint"', sql)
+
+
+class QueryTracker:
+    """`connection.execute_wrapper` counting and fingerprinting the queries it sees."""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.fingerprints = Counter()
+        self.samples = {}  # fingerprint -> first raw statement, for reports
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - start
+            self.count += 1
+            key = fingerprint(sql)
+            self.fingerprints[key] += 1
+            self.samples.setdefault(key, sql)
+
+    def duplicates(self):
+        """Fingerprints executed more than once, most repeated first."""
+        return [(key, count) for key, count in self.fingerprints.most_common() if count > 1]
+
+    def n_plus_one(self, threshold=None):
+        """Fingerprints repeated at least `threshold` (QUERY_N_PLUS_ONE_THRESHOLD) times."""
+        threshold = threshold or settings.QUERY_N_PLUS_ONE_THRESHOLD
+        return [(key, count) for key, count in self.fingerprints.most_common() if count >= threshold]
+
+    def report(self, limit=5):
+        lines = [f"{self.count} queries in {self.duration * 1000:.1f}ms"]
+        for key, count in self.duplicates()[:limit]:
+            lines.append(f"  {count}x {key}")
+        return '\n'.join(lines)
+
+
+@contextmanager
+def track_queries(using=DEFAULT_DB_ALIAS):
+    tracker = QueryTracker()
+    with connections[using].execute_wrapper(tracker):
+        yield tracker
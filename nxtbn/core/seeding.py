@@ -0,0 +1,526 @@
+"""
+Deterministic bulk seeding of customers, a catalog and an order history, for
+benchmarks, load tests and demo data.
+
+The same `seed` always produces the same rows (names, prices, aliases, order
+dates, basket contents): every section, and every chunk of ORDERS_PER_CHUNK
+orders, draws from its own random generator derived from the seed, so the rows
+don't depend on the batch size or on the number of worker processes. Seeded by
+a single process into an empty database the primary keys are the same too.
+
+Rows are written in batches, with COPY on PostgreSQL and bulk_create elsewhere
+(or with use_copy=False). Either way signals and `save()` overrides don't run:
+denormalized values such as `description_rendered` are computed here. Orders
+can be seeded by several processes, each writing whole chunks of orders with
+their line items and payments in one transaction.
+
+For the benchmark dataset `scale` is the number of orders, the other tables
+are sized from it:
+
+    customers   scale / 10
+    products    scale / 20   (1 to 4 variants each, stock in every warehouse)
+    line items  ~1.8 per order, payments ~0.8 per order
+"""
+
+import bisect
+import itertools
+import json
+import math
+import random
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from datetime import timedelta
+from decimal import Decimal
+
+import django
+from babel.numbers import get_currency_precision
+from django.apps import apps
+from django.conf import settings
+from django.db import connections, transaction
+from django.utils import timezone
+from django.utils.text import slugify
+
+from nxtbn.core import PublishableStatus
+from nxtbn.core.bulk import can_copy, explicit_field_values, insert_rows
+from nxtbn.order import OrderChargeStatus, OrderStatus, OrderStockReservationStatus
+from nxtbn.order.models import Address, Order, OrderLineItem
+from nxtbn.payment import PaymentMethod, PaymentStatus
+from nxtbn.payment.models import Payment
+from nxtbn.product.category_tree import rebuild_category_paths
+from nxtbn.product.models import Category, Collection, Product, ProductType, ProductVariant
+from nxtbn.product.utils import json_to_html, refresh_product_listings
+from nxtbn.users import UserRole
+from nxtbn.users.models import User
+from nxtbn.warehouse.models import Stock, Warehouse
+
+
+SCALES = {'10k': 10_000, '100k': 100_000, '1m': 1_000_000}
+
+SEED_MARKER = 'seed-warehouse-1'  # name of the first warehouse of the benchmark dataset
+
+ORDERS_PER_CHUNK = 1000
+
+ADJECTIVES = (
+    'classic', 'modern', 'rustic', 'vivid', 'compact', 'premium', 'organic', 'urban', 'vintage', 'smart',
+    'silk', 'woven', 'leather', 'bamboo', 'ceramic', 'linen', 'matte', 'glossy', 'solar', 'nordic',
+)
+NOUNS = (
+    'shirt', 'lamp', 'kettle', 'sneaker', 'backpack', 'watch', 'blender', 'scarf', 'mug', 'jacket',
+    'speaker', 'candle', 'wallet', 'notebook', 'bottle', 'chair', 'pillow', 'headphones', 'sandal', 'teapot',
+)
+BRANDS = ('Asante', 'Kente Co', 'Volta', 'Sankofa', 'Adinkra', 'Akoma', 'Nyame', 'Ashanti Works', 'Osu', 'Labadi')
+CITIES = ('Accra', 'Kumasi', 'Tamale', 'Takoradi', 'Cape Coast', 'Tema', 'Ho', 'Koforidua')
+
+# share of orders by status, most of an order history is delivered
+ORDER_STATUS_WEIGHTS = (
+    (OrderStatus.DELIVERED, 55),
+    (OrderStatus.SHIPPED, 8),
+    (OrderStatus.PACKED, 4),
+    (OrderStatus.APPROVED, 6),
+    (OrderStatus.PENDING, 14),
+    (OrderStatus.CANCELLED, 9),
+    (OrderStatus.RETURNED, 4),
+)
+LINE_COUNT_WEIGHTS = ((1, 50), (2, 28), (3, 13), (4, 9))
+PAYMENT_METHOD_WEIGHTS = (
+    (PaymentMethod.MFS, 45),
+    (PaymentMethod.CREDIT_CARD, 25),
+    (PaymentMethod.CASH_ON_DELIVERY, 20),
+    (PaymentMethod.BANK_TRANSFER, 10),
+)
+STOCK_LEVELS = (0, 5, 20, 50, 100, 250, 500)
+
+
+def rich_text_description(length=5000):
+    """
+    A rich-text JSON description of at most `length` characters (Product.description's max_length),
+    shaped like an edited product page: headed sections of styled paragraphs with a link each.
+    """
+    blocks = []
+    while True:
+        section = len(blocks) // 4 + 1
+        sections = blocks + [
+            {"type": "h1", "children": [{"text": f"Details {section}"}]},
+            {"type": "paragraph", "align": "left", "children": [
+                {"text": "Soft cotton, relaxed fit. ", "bold": True},
+                {"text": "Machine washable at 30 degrees, tumble dry low. ", "color": "#333333"},
+                {"text": "Ships in recycled packaging.", "underline": True, "backgroundColor": "#ffffff"},
+            ]},
+            {"type": "paragraph", "children": [
+                {"text": "Made in small batches by local artisans, every piece varies slightly in colour and weave. "},
+                {"text": "Sizes run true, see the size guide.", "bold": True},
+            ]},
+            {"type": "link", "url": "https://example.com/care-guide", "children": [{"text": "Care guide"}]},
+        ]
+        if len(json.dumps(sections)) > length:
+            return json.dumps(blocks)
+        blocks = sections
+
+
+DESCRIPTION = rich_text_description()  # every seeded product, for the description rendering scenarios
+
+# fields replaced on insert unless patched, see explicit_field_values()
+EXPLICIT_FIELDS = (
+    (Category, 'slug'), (Collection, 'slug'), (Product, 'slug'),
+    (Product, 'created_at'), (Order, 'created_at'), (Payment, 'created_at'),
+)
+
+
+def parse_scale(value):
+    """Accepts a preset ('10k', '100k', '1m') or a number of orders."""
+    value = str(value).lower()
+    if value in SCALES:
+        return SCALES[value]
+    return int(value.replace('_', ''))
+
+
+def dataset_size(scale):
+    return {
+        'customers': max(scale // 10, 10),
+        'products': max(scale // 20, 20),
+        'categories': 24,
+        'collections': 12,
+        'warehouses': 3,
+        'orders': scale,
+    }
+
+
+def is_seeded():
+    return Warehouse.objects.filter(name=SEED_MARKER).exists()
+
+
+class WeightedChoice:
+    """rng.choices() with the cumulative weights computed once."""
+
+    def __init__(self, choices):
+        choices = list(choices)
+        self.values = [value for value, _ in choices]
+        self.cum_weights = list(itertools.accumulate(weight for _, weight in choices))
+
+    def pick(self, rng):
+        return self.values[bisect.bisect(self.cum_weights, rng.random() * self.cum_weights[-1])]
+
+
+def make_uuid(rng):
+    return uuid.UUID(int=rng.getrandbits(128), version=4)
+
+
+# Orders, seeded chunk by chunk in this process or in worker processes
+
+_order_state = None
+
+
+def _init_order_worker(state):
+    global _order_state
+    if not apps.ready:  # spawned rather than forked
+        django.setup()
+    _order_state = state
+
+
+def seed_order_chunk(chunk):
+    """Seeds one chunk of orders with their line items and payments, returns the row counts."""
+    index, count = chunk
+    state = _order_state
+    rng = random.Random(f"{state['seed']}:orders:{index}")
+    currency, subunits = state['currency'], state['subunits']
+    variants, customers = state['variants'], state['customers']
+    statuses = WeightedChoice(ORDER_STATUS_WEIGHTS)
+    line_counts = WeightedChoice(LINE_COUNT_WEIGHTS)
+    payment_methods = WeightedChoice(PAYMENT_METHOD_WEIGHTS)
+
+    orders, baskets = [], []
+    for _ in range(count):
+        user_id, address_id = customers[rng.randrange(len(customers))]
+        basket = {}
+        for _ in range(line_counts.pick(rng)):
+            # a few products sell most
+            position = bisect.bisect(state['popularity'], rng.random() * state['popularity'][-1])
+            basket[position] = rng.choice((1, 1, 1, 2, 3))
+        total = sum(int(variants[position][1] * subunits) * quantity for position, quantity in basket.items())
+        status = statuses.pick(rng)
+        orders.append(Order(
+            alias=make_uuid(rng),
+            user_id=user_id,
+            order_source='storefront',
+            shipping_address_id=address_id,
+            billing_address_id=address_id,
+            currency=currency,
+            customer_currency=currency,
+            total_price=total,
+            total_price_without_tax=total,
+            status=status,
+            charge_status=OrderChargeStatus.DUE if status in (
+                OrderStatus.PENDING, OrderStatus.CANCELLED
+            ) else OrderChargeStatus.FULL,
+            reservation_status=OrderStockReservationStatus.NOT_REQUIRED,
+            created_at=state['now'] - timedelta(minutes=rng.randint(0, 365 * 24 * 60)),
+        ))
+        baskets.append(basket)
+
+    use_copy = state['use_copy']
+    with explicit_field_values(*EXPLICIT_FIELDS), transaction.atomic():
+        orders = insert_rows(Order, orders, batch_size=count, use_copy=use_copy)
+        line_items, payments = [], []
+        for order, basket in zip(orders, baskets):
+            for position, quantity in basket.items():
+                variant_id, price = variants[position]
+                line_items.append(OrderLineItem(
+                    order_id=order.pk,
+                    variant_id=variant_id,
+                    quantity=quantity,
+                    price_per_unit=price,
+                    total_price=int(price * subunits) * quantity,
+                    currency=currency,
+                    customer_currency=currency,
+                ))
+            if order.charge_status == OrderChargeStatus.FULL:
+                payments.append(Payment(
+                    alias=make_uuid(rng),
+                    order_id=order.pk,
+                    user_id=order.user_id,
+                    payment_method=payment_methods.pick(rng),
+                    payment_status=PaymentStatus.CAPTURED,
+                    is_successful=True,
+                    currency=currency,
+                    payment_amount=order.total_price,
+                    paid_at=order.created_at,
+                    created_at=order.created_at,
+                ))
+        insert_rows(OrderLineItem, line_items, batch_size=len(line_items) or 1, use_copy=use_copy)
+        insert_rows(Payment, payments, batch_size=len(payments) or 1, use_copy=use_copy)
+    return len(orders), len(line_items), len(payments)
+
+
+class DatasetSeeder:
+    """
+    Seeds each kind of rows on its own, over what is already in the database: products go
+    into the existing categories, collections and warehouses, orders are placed by the
+    existing customers over the existing variants.
+    """
+
+    def __init__(self, seed=0, batch_size=2000, use_copy=True, workers=1, log=None):
+        self.seed = seed
+        self.batch_size = batch_size
+        self.use_copy = use_copy and can_copy()
+        self.workers = max(workers, 1)
+        self.log = log or (lambda message: None)
+        self.now = timezone.now().replace(hour=12, minute=0, second=0, microsecond=0)
+        self.currency = settings.BASE_CURRENCY
+        self.subunits = 10 ** get_currency_precision(self.currency)
+        self._admin = None
+
+    def rng(self, *key):
+        return random.Random(':'.join(map(str, (self.seed, *key))))
+
+    def insert(self, model, objs):
+        with explicit_field_values(*EXPLICIT_FIELDS):
+            return insert_rows(model, objs, batch_size=self.batch_size, use_copy=self.use_copy)
+
+    @property
+    def admin(self):
+        if self._admin is None:
+            self._admin = User.objects.filter(is_superuser=True).order_by('pk').first()
+        if self._admin is None:
+            self._admin = User.objects.create(
+                username='seed-admin', email='seed-admin@example.com', password='!',
+                role=UserRole.ADMIN, is_staff=True, is_superuser=True,
+            )
+        return self._admin
+
+    def seed_dataset(self, scale):
+        """The benchmark dataset, `scale` orders and the tables sized from it."""
+        size = dataset_size(scale)
+        self.seed_customers(size['customers'])
+        self.seed_categories(size['categories'])
+        self.seed_collections(size['collections'])
+        self.seed_warehouses(size['warehouses'])
+        self.seed_products(size['products'])
+        size.update(self.seed_orders(size['orders']))
+        return size
+
+    def seed_customers(self, count):
+        rng = self.rng('customers')
+        users = []
+        for i in range(1, count + 1):
+            users.append(User(
+                username=f'seed-{self.seed}-customer-{i}',
+                email=f'seed-{self.seed}-customer-{i}@example.com',
+                first_name=rng.choice(ADJECTIVES).title(),
+                last_name=rng.choice(NOUNS).title(),
+                password='!',  # unusable
+                role=UserRole.CUSTOMER,
+                date_joined=self.now - timedelta(days=rng.randint(0, 3 * 365)),
+            ))
+        users = self.insert(User, users)
+        self.insert(Address, (
+            Address(
+                user_id=user.pk,
+                first_name=user.first_name,
+                last_name=user.last_name,
+                email=user.email,
+                street_address=f'{rng.randint(1, 400)} {rng.choice(NOUNS).title()} Street',
+                city=rng.choice(CITIES),
+                state='Greater Accra',
+                postal_code=f'GA-{rng.randint(100, 999)}',
+                country='GH',
+            )
+            for user in users
+        ))
+        self.log(f"{len(users)} customers")
+        return len(users)
+
+    def seed_categories(self, count):
+        categories = []
+        for i in range(count):
+            noun = NOUNS[i % len(NOUNS)]
+            name = f'{noun.title()}s {self.seed}-{i + 1}'
+            categories.append(Category(name=name, slug=slugify(name), description=f'All {noun}s'))
+        categories = self.insert(Category, categories)
+        # the second half are subcategories of the first half
+        half = len(categories) // 2
+        for index, category in enumerate(categories[half:]):
+            category.parent = categories[index]
+        Category.objects.bulk_update(categories[half:], ['parent'], batch_size=self.batch_size)
+        rebuild_category_paths()
+        return len(categories)
+
+    def seed_collections(self, count):
+        rng = self.rng('collections')
+        collections = []
+        for i in range(count):
+            name = f'{rng.choice(ADJECTIVES).title()} Collection {self.seed}-{i + 1}'
+            collections.append(Collection(name=name, slug=slugify(name), created_by=self.admin))
+        return len(self.insert(Collection, collections))
+
+    def seed_warehouses(self, count):
+        return len(self.insert(Warehouse, (
+            Warehouse(name=f'seed-warehouse-{i}', location=CITIES[i % len(CITIES)], is_default=False)
+            for i in range(1, count + 1)
+        )))
+
+    def seed_products(self, count, images=()):
+        """
+        Seeds `count` products with 1 to 4 variants each, their collections, stock in every
+        warehouse and the given images (Image primary keys).
+        """
+        categories = list(Category.objects.order_by('pk').values_list('pk', flat=True))
+        if not categories:
+            self.seed_categories(10)
+            categories = list(Category.objects.order_by('pk').values_list('pk', flat=True))
+        collections = list(Collection.objects.order_by('pk').values_list('pk', flat=True))
+        warehouses = list(Warehouse.objects.order_by('pk').values_list('pk', flat=True))
+        if not warehouses:
+            warehouses = [Warehouse.objects.create(name='Main Warehouse', location=CITIES[0], is_default=True).pk]
+        product_type, _ = ProductType.objects.get_or_create(
+            name='Seeded', defaults={'physical_product': True, 'track_stock': True},
+        )
+        description_rendered = json_to_html(DESCRIPTION)
+        through = Product.collections.through
+        image_through = Product.images.through
+
+        variant_count = 0
+        for start in range(0, count, self.batch_size):
+            products, plans = [], []
+            for i in range(start + 1, min(start + self.batch_size, count) + 1):
+                # one generator per product, the rows don't depend on the batches
+                rng = self.rng('product', i)
+                name = f'{rng.choice(ADJECTIVES).title()} {rng.choice(NOUNS)} {self.seed}-{i}'
+                created_at = self.now - timedelta(days=rng.randint(0, 2 * 365))
+                products.append(Product(
+                    alias=make_uuid(rng),
+                    name=name,
+                    slug=slugify(name),
+                    summary=f'{name} by {rng.choice(BRANDS)}',
+                    description=DESCRIPTION,
+                    description_rendered=description_rendered,
+                    brand=rng.choice(BRANDS),
+                    category_id=rng.choice(categories),
+                    product_type=product_type,
+                    created_by=self.admin,
+                    status=PublishableStatus.PUBLISHED,
+                    is_live=True,
+                    published_date=created_at,
+                    created_at=created_at,
+                ))
+                # long tailed, most products are cheap
+                base_price = Decimal(max(1.0, rng.lognormvariate(3.6, 0.9))).quantize(Decimal('0.01'))
+                plans.append({
+                    'variants': [
+                        (make_uuid(rng), base_price + position * Decimal('5.00'), rng.randint(50, 990))
+                        for position in range(rng.choice((1, 1, 2, 3, 4)))
+                    ],
+                    'collections': rng.sample(collections, min(rng.randint(0, 2), len(collections))),
+                    'rng': rng,
+                })
+
+            with transaction.atomic():
+                products = self.insert(Product, products)
+                variants = []
+                for product, plan in zip(products, plans):
+                    for position, (alias, price, weight) in enumerate(plan['variants']):
+                        variants.append(ProductVariant(
+                            alias=alias,
+                            product_id=product.pk,
+                            name='Default' if position == 0 else f'Option {position + 1}',
+                            currency=self.currency,
+                            price=price,
+                            cost_per_unit=(price * Decimal('0.6')).quantize(Decimal('0.01')),
+                            sku=f'SEED-{product.pk}-{position + 1}',
+                            track_inventory=True,
+                            weight_value=weight,  # grams, the field holds up to 999.99
+                        ))
+                variants = self.insert(ProductVariant, variants)
+
+                variants_by_product = {}
+                for variant in variants:
+                    variants_by_product.setdefault(variant.product_id, []).append(variant.pk)
+                for product in products:
+                    product.default_variant_id = variants_by_product[product.pk][0]
+                Product.objects.bulk_update(products, ['default_variant'], batch_size=self.batch_size)
+
+                self.insert(through, (
+                    through(product_id=product.pk, collection_id=collection_id)
+                    for product, plan in zip(products, plans)
+                    for collection_id in plan['collections']
+                ))
+                self.insert(image_through, (
+                    image_through(product_id=product.pk, image_id=image_id)
+                    for product in products
+                    for image_id in images
+                ))
+                self.insert(Stock, (
+                    Stock(
+                        warehouse_id=warehouse_id,
+                        product_variant_id=variant_id,
+                        quantity=plan['rng'].choice(STOCK_LEVELS),
+                    )
+                    for product, plan in zip(products, plans)
+                    for variant_id in variants_by_product[product.pk]
+                    for warehouse_id in warehouses
+                ))
+                refresh_product_listings([product.pk for product in products])
+            variant_count += len(variants)
+            self.log(f"{start + len(products)}/{count} products")
+        return {'products': count, 'variants': variant_count}
+
+    def seed_orders(self, count):
+        """
+        Seeds `count` orders placed by the existing customers, at their first address, over the
+        existing variants. Chunks of orders are spread over `workers` processes.
+        """
+        variants = list(ProductVariant.objects.order_by('pk').values_list('pk', 'price'))
+        addresses = {}
+        for user_id, address_id in Address.objects.filter(
+            user__role=UserRole.CUSTOMER
+        ).order_by('-pk').values_list('user_id', 'pk'):
+            addresses[user_id] = address_id
+        customers = [
+            (user_id, addresses.get(user_id))
+            for user_id in User.objects.filter(role=UserRole.CUSTOMER).order_by('pk').values_list('pk', flat=True)
+        ]
+        if not variants or not customers:
+            raise ValueError('Seeding orders needs product variants and customers')
+
+        ranking = self.rng('popularity').sample(range(len(variants)), len(variants))
+        weights = [0.0] * len(variants)
+        for rank, position in enumerate(ranking):
+            weights[position] = 1 / (rank + 1) ** 0.9  # zipf like
+        state = {
+            'seed': self.seed,
+            'now': self.now,
+            'currency': self.currency,
+            'subunits': self.subunits,
+            'use_copy': self.use_copy,
+            'variants': variants,
+            'customers': customers,
+            'popularity': list(itertools.accumulate(weights)),
+        }
+        chunks = [
+            (index, min(ORDERS_PER_CHUNK, count - index * ORDERS_PER_CHUNK))
+            for index in range(math.ceil(count / ORDERS_PER_CHUNK))
+        ]
+
+        if self.workers > 1 and len(chunks) > 1:
+            connections.close_all()  # the workers open their own connections
+            with ProcessPoolExecutor(
+                min(self.workers, len(chunks)), initializer=_init_order_worker, initargs=(state,)
+            ) as pool:
+                return self._count_orders(pool.map(seed_order_chunk, chunks), count)
+        _init_order_worker(state)
+        return self._count_orders(map(seed_order_chunk, chunks), count)
+
+    def _count_orders(self, results, count):
+        totals = {'orders': 0, 'line_items': 0, 'payments': 0}
+        for result in results:
+            for key, value in zip(totals, result):
+                totals[key] += value
+            self.log(f"{totals['orders']}/{count} orders")
+        return totals
+
+
+def seed_dataset(scale, seed=0, batch_size=2000, use_copy=True, workers=1, log=None):
+    """Seeds the benchmark dataset unless it was seeded before, returns the sizes of the seeded tables."""
+    if is_seeded():
+        return None
+    seeder = DatasetSeeder(seed=seed, batch_size=batch_size, use_copy=use_copy, workers=workers, log=log)
+    return seeder.seed_dataset(parse_scale(scale))
@@ -1,3 +1,311 @@
-from django.test import TestCase
+import tempfile
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.core.cache import caches
+from django.core.management import call_command
+from django.db import transaction
+from django.test import RequestFactory, TestCase, override_settings
+from django.urls import reverse
+
+from nxtbn.core.benchmark import SCENARIOS, compare, run_benchmarks
+from nxtbn.core.bulk import copy_value
+from nxtbn.core.metrics import MetricsRegistry, registry, render_text
+from nxtbn.core.query_tracker import fingerprint, track_queries
+from nxtbn.core.seeding import DatasetSeeder, seed_dataset
+from nxtbn.core.user_agent import UserAgent, cache_info, parse_user_agent_string
+from nxtbn.home.base_tests import QueryBudgetMixin
+from nxtbn.order.models import Order, OrderLineItem
+from nxtbn.order.utils import parse_user_agent
+from nxtbn.product.models import Category, Product, ProductVariant
+from nxtbn.warehouse.models import Stock
+from nxtbn.users.models import User
+from nxtbn.users.tests import UserFactory
+
+
+class MetricsRegistryTestCase(TestCase):
+    def test_histogram_exposition(self):
+        metrics = MetricsRegistry()
+        histogram = metrics.histogram('latency_seconds', 'Latency', ['route'], buckets=(0.1, 1.0))
+        histogram.observe(0.05, route='a')
+        histogram.observe(0.5, route='a')
+        histogram.observe(5, route='a')
+
+        text = render_text(metrics.snapshot())
+
+        self.assertIn('# TYPE latency_seconds histogram', text)
+        self.assertIn('latency_seconds_bucket{route="a",le="0.1"} 1', text)
+        self.assertIn('latency_seconds_bucket{route="a",le="1.0"} 2', text)
+        self.assertIn('latency_seconds_bucket{route="a",le="+Inf"} 3', text)
+        self.assertIn('latency_seconds_count{route="a"} 3', text)
+        self.assertIn('latency_seconds_sum{route="a"} 5.55', text)
+
+    def test_label_values_are_escaped(self):
+        metrics = MetricsRegistry()
+        metrics.counter('events_total', 'Events', ['name']).inc(name='say "hi"\n')
+        self.assertIn('events_total{name="say \\"hi\\"\\n"} 1', render_text(metrics.snapshot()))
+
+    def test_labels_must_match(self):
+        counter = MetricsRegistry().counter('events_total', 'Events', ['name'])
+        with self.assertRaises(ValueError):
+            counter.inc(other='x')
+
+    def test_multiprocess_snapshots_are_merged(self):
+        with tempfile.TemporaryDirectory() as directory:
+            worker_a = MetricsRegistry(multiprocess_dir=directory)
+            worker_b = MetricsRegistry(multiprocess_dir=directory)
+            worker_a.counter('events_total', 'Events', ['name']).inc(2, name='x')
+            worker_a.histogram('latency_seconds', 'Latency', buckets=(1.0,)).observe(0.5)
+            worker_b.counter('events_total', 'Events', ['name']).inc(3, name='x')
+            worker_b.histogram('latency_seconds', 'Latency', buckets=(1.0,)).observe(2)
+
+            # two workers of the same test process, write them under distinct pids
+            worker_a._snapshot_path = lambda pid=None: f"{directory}/metrics_1.json"
+            worker_b._snapshot_path = lambda pid=None: f"{directory}/metrics_2.json"
+            worker_a.flush(force=True)
+
+            text = render_text(worker_b.collect())
+
+        self.assertIn('events_total{name="x"} 5', text)
+        self.assertIn('latency_seconds_bucket{le="1.0"} 1', text)
+        self.assertIn('latency_seconds_count 2', text)
+
+
+@override_settings(METRICS_AUTH_TOKEN='secret')
+class MetricsEndpointTestCase(TestCase):
+    def setUp(self):
+        registry.reset()
+
+    def get_metrics(self):
+        return self.client.get(reverse('metrics'), HTTP_AUTHORIZATION='Bearer secret')
+
+    def test_request_and_cache_metrics_are_exposed(self):
+        cache = caches['default']
+        cache.set('metrics-test', 1)
+        cache.get('metrics-test')
+        cache.get('metrics-test-missing')
+        self.client.get(reverse('health_check'))
+
+        response = self.get_metrics()
+        text = response.content.decode()
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain; version=0.0.4'))
+        self.assertIn('http_request_duration_seconds_count{method="GET",route="health/",status="2xx"} 1', text)
+        self.assertIn('http_request_db_queries_count{method="GET",route="health/"} 1', text)
+        self.assertIn('cache_requests_total{cache="default",result="miss"}', text)
+        self.assertIn('cache_requests_total{cache="default",result="hit"}', text)
+
+    def test_graphql_operations_are_labelled(self):
+        self.client.post(
+            '/graphql/',
+            data={'query': 'query ProductsForHome { __typename }'},
+            content_type='application/json',
+        )
+        text = self.get_metrics().content.decode()
+        self.assertIn('graphql_operation_duration_seconds_count{schema="storefront",operation="ProductsForHome"} 1', text)
+
+    def test_token_is_required(self):
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 403)
+        self.assertEqual(self.client.get(reverse('metrics'), HTTP_AUTHORIZATION='Bearer wrong').status_code, 403)
+        self.assertEqual(self.get_metrics().status_code, 200)
+
+        with override_settings(METRICS_AUTH_TOKEN=''):
+            self.assertEqual(self.client.get(reverse('metrics')).status_code, 403)
+            with override_settings(DEBUG=True):
+                self.assertEqual(self.client.get(reverse('metrics')).status_code, 200)
+
+    def test_snapshot_write_errors_do_not_fail_requests(self):
+        with mock.patch.object(registry, 'flush', side_effect=OSError('No space left on device')), \
+                self.assertLogs('nxtbn', level='ERROR'):
+            response = self.client.get(reverse('health_check'))
+        self.assertEqual(response.status_code, 200)
+
+
+class QueryTrackerTestCase(QueryBudgetMixin, TestCase):
+    def test_fingerprint_ignores_values(self):
+        self.assertEqual(
+            fingerprint('SELECT * FROM "a" WHERE "a"."id" = 1 AND "a"."name" = \'x\''),
+            fingerprint('SELECT *  FROM "a"\nWHERE "a"."id" = 25 AND "a"."name" = \'it\'\'s\''),
+        )
+        self.assertEqual(
+            fingerprint('SELECT * FROM "a" WHERE "a"."id" IN (%s, %s)'),
+            fingerprint('SELECT * FROM "a" WHERE "a"."id" IN (%s, %s, %s)'),
+        )
+        self.assertNotEqual(fingerprint('SELECT * FROM "a"'), fingerprint('SELECT * FROM "b"'))
+        self.assertEqual(fingerprint('SELECT "table_2"."col1" FROM "table_2"'), 'SELECT "table_2"."col1" FROM "table_2"')
+
+    def test_repeated_fingerprints_are_reported_as_n_plus_one(self):
+        users = UserFactory.create_batch(6)
+        with track_queries() as tracker:
+            for user in users:
+                User.objects.get(pk=user.pk)
+            User.objects.count()
+
+        self.assertEqual(tracker.count, 7)
+        self.assertEqual(len(tracker.n_plus_one(threshold=5)), 1)
+        self.assertEqual(tracker.n_plus_one(threshold=5)[0][1], 6)
+        self.assertEqual(tracker.n_plus_one(threshold=7), [])
+
+    def test_query_budget(self):
+        users = UserFactory.create_batch(3)
+        with self.assertQueryBudget(1):
+            list(User.objects.all())
+
+        with self.assertRaisesMessage(AssertionError, 'Query budget of 2 exceeded'):
+            with self.assertQueryBudget(2):
+                for user in users:
+                    User.objects.get(pk=user.pk)
+
+        with self.assertRaisesMessage(AssertionError, 'Query repeated 3 times (max 1)'):
+            with self.assertQueryBudget(10, max_repeats=1):
+                for user in users:
+                    User.objects.get(pk=user.pk)
+
+    @override_settings(QUERY_DEBUG_HEADERS=True)
+    def test_debug_headers(self):
+        response = self.client.get(reverse('health_check'))
+        self.assertEqual(response['X-DB-Query-Count'], '1')
+        self.assertIn('X-DB-Query-Time-Ms', response)
+        self.assertEqual(response['X-DB-N-Plus-One'], '0')
+
+    @override_settings(QUERY_DEBUG_HEADERS=True)
+    async def test_debug_headers_under_asgi(self):
+        response = await self.async_client.get(reverse('health_check'))
+        self.assertEqual(response['X-DB-Query-Count'], '1')
+        self.assertEqual(response['X-DB-N-Plus-One'], '0')
+
+    @override_settings(QUERY_DEBUG_HEADERS=False)
+    def test_no_debug_headers_in_production(self):
+        response = self.client.get(reverse('health_check'))
+        self.assertNotIn('X-DB-Query-Count', response)
+
+
+class BenchmarkTestCase(TestCase):
+    def test_seeding_is_deterministic(self):
+        def seed():
+            with transaction.atomic():
+                sizes = seed_dataset(60, seed=7, batch_size=25)
+                rows = (
+                    list(Product.objects.order_by('name').values_list('name', 'brand', 'category__name')),
+                    list(ProductVariant.objects.order_by('alias').values_list('alias', 'price', 'sku')),
+                    sorted(Order.objects.values_list('alias', 'total_price', 'status', 'created_at')),
+                )
+                transaction.set_rollback(True)
+            return sizes, rows
+
+        first, second = seed(), seed()
+        self.assertEqual(first, second)
+        sizes = first[0]
+        self.assertEqual(sizes['orders'], 60)
+        self.assertEqual(len(first[1][2]), 60)
+        self.assertGreater(sizes['line_items'], 60)
+
+    def test_rows_do_not_depend_on_batch_size(self):
+        def seed(batch_size):
+            with transaction.atomic():
+                seeder = DatasetSeeder(seed=3, batch_size=batch_size, use_copy=False)
+                seeder.seed_customers(8)
+                seeder.seed_products(15)
+                seeder.seed_orders(40)
+                rows = (
+                    list(ProductVariant.objects.order_by('alias').values_list('alias', 'price', 'product__name')),
+                    sorted(Order.objects.values_list('alias', 'total_price', 'status', 'user__username')),
+                )
+                transaction.set_rollback(True)
+            return rows
+
+        self.assertEqual(seed(4), seed(1000))
+
+    def test_copy_value(self):
+        category = Category(name='Tab\there\nand \\ back', slug='x', description=None)
+        fields = {field.name: field for field in Category._meta.concrete_fields}
+
+        self.assertEqual(copy_value(fields['name'], category), 'Tab\\there\\nand \\\\ back')
+        self.assertEqual(copy_value(fields['description'], category), '\\N')
+
+        category.name = 'Line\nbreak\tand tab'
+        self.assertEqual(copy_value(fields['name'], category), 'Line\\nbreak\\tand tab')
+
+    def test_fake_data_commands(self):
+        call_command('fake_populate_product', num_products=6, seed=1, no_images=True, stdout=StringIO())
+        self.assertEqual(Product.objects.count(), 6)
+        self.assertFalse(Product.objects.filter(default_variant__isnull=True).exists())
+        self.assertEqual(Stock.objects.count(), ProductVariant.objects.count())  # one warehouse created
+
+        call_command('populate_fake_order', num_orders=25, num_customers=4, seed=1, stdout=StringIO())
+        self.assertEqual(Order.objects.count(), 25)
+        self.assertGreaterEqual(OrderLineItem.objects.count(), 25)
+
+    def test_scenarios_run_without_errors(self):
+        seed_dataset(60, seed=7)
+        self.assertIsNone(seed_dataset(60, seed=7))  # already seeded
+        self.assertGreaterEqual(len(Product.objects.first().description), 4500)  # for the description scenarios
+
+        report = run_benchmarks(iterations=2, warmup=0)
+
+        self.assertEqual(set(report['scenarios']) | set(report['skipped']), set(SCENARIOS))
+        for name, result in report['scenarios'].items():
+            self.assertEqual(result['errors'], 0, name)
+            self.assertEqual(result['iterations'], 2)
+            if SCENARIOS[name].queries:
+                self.assertGreater(result['queries']['max'], 0, name)
+        # the catalog caches are invalidated between iterations, only the _cached scenario hits them
+        self.assertEqual(report['scenarios']['product_detail_cached']['queries']['max'], 0)
+        # write scenarios are rolled back
+        self.assertEqual(Order.objects.count(), 60)
+
+    def test_compare_flags_regressions(self):
+        def report(p95, queries):
+            return {'scenarios': {'product_list': {
+                'latency_ms': {'p95': p95}, 'queries': {'max': queries}, 'errors': 0,
+            }}}
+
+        self.assertEqual(compare(report(10, 5), report(11, 5))[0]['status'], 'ok')
+        self.assertEqual(compare(report(10, 5), report(13, 5))[0]['status'], 'regressed')
+        self.assertEqual(compare(report(10, 5), report(10, 6))[0]['status'], 'regressed')
+        self.assertEqual(compare({'scenarios': {}}, report(10, 5))[0]['status'], 'new')
+
+
+class UserAgentTestCase(TestCase):
+    def test_browser_os_and_device(self):
+        cases = {
+            'Mozilla/5.0 (Linux; Android 13; SAMSUNG SM-A145F) AppleWebKit/537.36 (KHTML, like Gecko) SamsungBrowser/24.0 '
+            'Chrome/117.0.0.0 Mobile Safari/537.36': ('Mobile', 'Samsung Internet', '24.0', 'Android'),
+            'Mozilla/5.0 (iPhone; CPU iPhone OS 17_4 like Mac OS X) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/17.4 '
+            'Mobile/15E148 Safari/604.1': ('Mobile', 'Safari', '17.4', 'iOS'),
+            'Mozilla/5.0 (iPad; CPU OS 17_4 like Mac OS X) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/17.4 '
+            'Mobile/15E148 Safari/604.1': ('Tablet', 'Safari', '17.4', 'iOS'),
+            'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/124.0.0.0 '
+            'Safari/537.36 Edg/124.0.2478.51': ('PC', 'Edge', '124.0', 'Windows'),
+            'Opera/9.80 (Android; Opera Mini/7.6.40077/191.303; U; en) Presto/2.12.423 Version/12.16':
+                ('Mobile', 'Opera Mini', '7.6', 'Android'),
+            'Mozilla/5.0 (compatible; Googlebot/2.1; +http://www.google.com/bot.html)': ('Bot', 'Unknown', '', 'Unknown'),
+            'Mozilla/5.0 (Linux; Android 12; CUBOT KINGKONG 7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 '
+            'Mobile Safari/537.36': ('Mobile', 'Chrome', '120.0', 'Android'),
+            '': ('PC', 'Unknown', '', 'Unknown'),
+        }
+        for user_agent, expected in cases.items():
+            self.assertEqual(parse_user_agent_string(user_agent), UserAgent(*expected), user_agent)
+
+    def test_results_are_memoized(self):
+        user_agent = 'Mozilla/5.0 (X11; Linux x86_64; rv:125.0) Gecko/20100101 Firefox/125.0 memoized'
+        parse_user_agent_string(user_agent)
+        hits = cache_info().hits
+
+        self.assertEqual(parse_user_agent_string(user_agent).browser, 'Firefox')
+        self.assertEqual(cache_info().hits, hits + 1)
+
+    def test_order_device_meta(self):
+        request = RequestFactory().post(
+            '/', HTTP_USER_AGENT='Mozilla/5.0 (X11; CrOS x86_64 14541.0.0) AppleWebKit/537.36 (KHTML, like Gecko) '
+            'Chrome/124.0.0.0 Safari/537.36', HTTP_X_FORWARDED_FOR='203.0.113.9, 10.0.0.1',
+        )
+
+        meta = parse_user_agent(request)
+
+        self.assertEqual(meta['ip_address'], '203.0.113.9')
+        self.assertEqual(
+            (meta['device_type'], meta['browser'], meta['browser_version'], meta['operating_system']),
+            ('PC', 'Chrome', '124.0', 'Chrome OS'),
+        )
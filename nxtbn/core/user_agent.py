@@ -0,0 +1,95 @@
+"""
+User-agent parsing for order device metadata and request analytics.
+
+The browser, operating system and device tables are lists of precompiled
+patterns tried in order, the first match wins: the specific browsers built on
+Chromium (Edge, Opera, Samsung Internet...) come before Chrome, and Chrome
+before Safari, whose token every WebKit browser carries. Results are memoized
+per user-agent string in a bounded LRU cache (USER_AGENT_CACHE_SIZE entries),
+as a store sees the same few hundred strings over and over.
+
+Usage:
+    parse_user_agent_string(request.META.get('HTTP_USER_AGENT', ''))
+    -> UserAgent(device_type='Mobile', browser='Chrome', browser_version='120.0', operating_system='Android')
+"""
+
+import re
+from functools import lru_cache
+from typing import NamedTuple
+
+from django.conf import settings
+
+
+MAX_USER_AGENT_LENGTH = 512  # longer strings are parsed and cached on their first 512 characters
+
+# 'bot' as a word or a crawler token like Googlebot/2.1, not a phone brand like Cubot
+BOT_RE = re.compile(r'\bbot\b|[a-z]bot/|crawl|spider|slurp|facebookexternalhit|headless', re.IGNORECASE)
+
+BROWSERS = [
+    (re.compile(r'Edg(?:e|A|iOS)?/(\d+(?:\.\d+)?)'), 'Edge'),
+    (re.compile(r'(?:OPR|OPiOS|OPT)/(\d+(?:\.\d+)?)'), 'Opera'),
+    (re.compile(r'Opera Mini/(\d+(?:\.\d+)?)'), 'Opera Mini'),
+    (re.compile(r'Opera/.*Version/(\d+(?:\.\d+)?)'), 'Opera'),
+    (re.compile(r'SamsungBrowser/(\d+(?:\.\d+)?)'), 'Samsung Internet'),
+    (re.compile(r'UCBrowser/(\d+(?:\.\d+)?)'), 'UC Browser'),
+    (re.compile(r'YaBrowser/(\d+(?:\.\d+)?)'), 'Yandex Browser'),
+    (re.compile(r'MiuiBrowser/(\d+(?:\.\d+)?)'), 'MIUI Browser'),
+    (re.compile(r'(?:Firefox|FxiOS)/(\d+(?:\.\d+)?)'), 'Firefox'),
+    (re.compile(r'(?:Chrome|CriOS)/(\d+(?:\.\d+)?)'), 'Chrome'),
+    (re.compile(r'MSIE (\d+(?:\.\d+)?)'), 'Internet Explorer'),
+    (re.compile(r'Trident/.*rv:(\d+(?:\.\d+)?)'), 'Internet Explorer'),
+    (re.compile(r'Version/(\d+(?:\.\d+)?).*Safari/'), 'Safari'),
+    (re.compile(r'AppleWebKit/.*Mobile/'), 'Safari'),  # in-app web views of iOS carry no version
+]
+
+OPERATING_SYSTEMS = [
+    (re.compile(r'Windows Phone'), 'Windows Phone'),
+    (re.compile(r'Windows'), 'Windows'),
+    (re.compile(r'Android'), 'Android'),
+    (re.compile(r'iPhone|iPad|iPod'), 'iOS'),
+    (re.compile(r'CrOS'), 'Chrome OS'),
+    (re.compile(r'Mac OS X|Macintosh'), 'Mac OS'),
+    (re.compile(r'Linux|X11'), 'Linux'),
+]
+
+DEVICE_TYPES = [
+    (re.compile(r'iPhone|iPod|Windows Phone|Opera Mini'), 'Mobile'),
+    (re.compile(r'iPad|Tablet|Kindle|Silk/|PlayBook|Android(?!.*Mobile)'), 'Tablet'),  # iPads say "Mobile" too
+    (re.compile(r'Mobi'), 'Mobile'),
+]
+
+
+class UserAgent(NamedTuple):
+    device_type: str
+    browser: str
+    browser_version: str
+    operating_system: str
+
+
+def _search(table, user_agent, default):
+    for pattern, name in table:
+        match = pattern.search(user_agent)
+        if match:
+            return name, match.group(1) if pattern.groups else ''
+    return default, ''
+
+
+@lru_cache(maxsize=settings.USER_AGENT_CACHE_SIZE)
+def _parse(user_agent):
+    browser, version = _search(BROWSERS, user_agent, 'Unknown')
+    operating_system, _ = _search(OPERATING_SYSTEMS, user_agent, 'Unknown')
+    if BOT_RE.search(user_agent):
+        device_type = 'Bot'
+    else:
+        device_type, _ = _search(DEVICE_TYPES, user_agent, 'PC')
+    return UserAgent(device_type, browser, version, operating_system)
+
+
+def parse_user_agent_string(user_agent):
+    """Returns the UserAgent of the string, memoized."""
+    return _parse((user_agent or '')[:MAX_USER_AGENT_LENGTH])
+
+
+def cache_info():
+    """Hits, misses and size of the parse cache, see functools.lru_cache."""
+    return _parse.cache_info()
@@ -1,3 +1,62 @@
-from django.shortcuts import render
+import re
+import time
 
-# Create your views here.
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseForbidden
+from graphene_django.views import GraphQLView
+
+from nxtbn.core.metrics import graphql_operation_duration, registry, render_text
+
+
+OPERATION_NAME_RE = re.compile(r'^\s*(?:query|mutation|subscription)\s+([_A-Za-z][_0-9A-Za-z]*)')
+
+
+class MetricsGraphQLView(GraphQLView):
+    """GraphQLView recording the latency of every operation by operation name."""
+    schema_name = 'storefront'
+
+    _seen_operations = set()
+
+    def __init__(self, schema_name=None, **kwargs):
+        super().__init__(**kwargs)
+        if schema_name:
+            self.schema_name = schema_name
+
+    def get_operation_label(self, query, operation_name):
+        if not operation_name and query:
+            match = OPERATION_NAME_RE.match(query)
+            operation_name = match.group(1) if match else None
+        if not operation_name:
+            return 'anonymous'
+        operation_name = operation_name[:100]
+        # operation names come from clients, bound the number of label values
+        if operation_name not in self._seen_operations:
+            if len(self._seen_operations) >= settings.METRICS_MAX_GRAPHQL_OPERATIONS:
+                return 'other'
+            self._seen_operations.add(operation_name)
+        return operation_name
+
+    def execute_graphql_request(self, request, data, query, variables, operation_name, show_graphiql=False):
+        if not settings.METRICS_ENABLED or not query:
+            return super().execute_graphql_request(request, data, query, variables, operation_name, show_graphiql)
+
+        start = time.perf_counter()
+        try:
+            return super().execute_graphql_request(request, data, query, variables, operation_name, show_graphiql)
+        finally:
+            graphql_operation_duration.observe(
+                time.perf_counter() - start,
+                schema=self.schema_name,
+                operation=self.get_operation_label(query, operation_name),
+            )
+
+
+def metrics(request):
+    """Exposes the metrics registry, merged across worker processes, in the Prometheus text format."""
+    token = settings.METRICS_AUTH_TOKEN
+    if not token:
+        if not settings.DEBUG:  # never exposed without a token outside development
+            return HttpResponseForbidden()
+    elif request.META.get('HTTP_AUTHORIZATION') != f"Bearer {token}":
+        return HttpResponseForbidden()
+    return HttpResponse(render_text(registry.collect()), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -0,0 +1,57 @@
+# Generated by Django 4.2.11 on 2026-10-19 08:43
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def backfill_redemption_counters(apps, schema_editor):
+    PromoCode = apps.get_model('discount', 'PromoCode')
+    PromoCodeUsage = apps.get_model('discount', 'PromoCodeUsage')
+    PromoCodeRedemption = apps.get_model('discount', 'PromoCodeRedemption')
+
+    totals = PromoCodeUsage.objects.values('promo_code').annotate(total=models.Count('id'))
+    for row in totals:
+        PromoCode.objects.filter(pk=row['promo_code']).update(redemption_count=row['total'])
+
+    per_customer = (
+        PromoCodeUsage.objects
+        .filter(user__isnull=False)
+        .values('promo_code', 'user')
+        .annotate(total=models.Count('id'))
+    )
+    PromoCodeRedemption.objects.bulk_create([
+        PromoCodeRedemption(promo_code_id=row['promo_code'], customer_id=row['user'], redemption_count=row['total'])
+        for row in per_customer
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('discount', '0005_promocodetranslation'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='promocode',
+            name='redemption_count',
+            field=models.PositiveIntegerField(default=0, editable=False, help_text='Number of orders holding a redemption of this promo code, maintained with conditional updates.'),
+        ),
+        migrations.CreateModel(
+            name='PromoCodeRedemption',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('redemption_count', models.PositiveIntegerField(default=0)),
+                ('customer', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='promo_code_redemptions', to=settings.AUTH_USER_MODEL)),
+                ('promo_code', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='redemptions', to='discount.promocode')),
+            ],
+            options={
+                'verbose_name': 'Promo Code Redemption',
+                'verbose_name_plural': 'Promo Code Redemptions',
+                'unique_together': {('promo_code', 'customer')},
+            },
+        ),
+        migrations.RunPython(backfill_redemption_counters, migrations.RunPython.noop),
+    ]
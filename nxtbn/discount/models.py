@@ -62,6 +62,11 @@ class PromoCode(AbstractBaseModel):
         default=1,
         help_text="Maximum number of times a single customer can redeem this promo code."
     )
+    redemption_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        help_text="Number of orders holding a redemption of this promo code, maintained with conditional updates."
+    )
     
     def save(self, *args, **kwargs):
         # Ensure the code is in uppercase
@@ -116,7 +121,7 @@ class PromoCode(AbstractBaseModel):
 
     
     def get_total_redemptions(self):
-        return PromoCodeUsage.objects.filter(promo_code=self).count()
+        return self.redemption_count
     
     def get_total_applicable_products(self):
         return self.applicable_products.count()
@@ -125,7 +130,11 @@ class PromoCode(AbstractBaseModel):
         return self.specific_customers.count()
     
     def get_user_redemptions(self, user):
-        return PromoCodeUsage.objects.filter(promo_code=self, user=user).count()
+        if user is None:
+            return 0
+        return PromoCodeRedemption.objects.filter(
+            promo_code=self, customer=user
+        ).values_list('redemption_count', flat=True).first() or 0
     
     def is_new_customer(self, user):
         # Define "new" as registered within the last 30 days
@@ -179,6 +188,24 @@ class PromoCodeUsage(AbstractBaseModel):
     applied_at = models.DateTimeField(auto_now_add=True, help_text="The timestamp when the promo code was applied.")
     
 
+class PromoCodeRedemption(models.Model):
+    """
+    Per-customer redemption counter of a promo code, reserved and released together
+    with PromoCode.redemption_count. Guest checkouts are only bound by the global limit.
+    """
+    promo_code = models.ForeignKey(PromoCode, on_delete=models.CASCADE, related_name='redemptions')
+    customer = models.ForeignKey(User, on_delete=models.CASCADE, related_name='promo_code_redemptions')
+    redemption_count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = ('promo_code', 'customer')
+        verbose_name = "Promo Code Redemption"
+        verbose_name_plural = "Promo Code Redemptions"
+
+    def __str__(self):
+        return f"{self.promo_code.code} - {self.customer.username}: {self.redemption_count}"
+
+
 class PromoCodeCustomer(models.Model):
     promo_code = models.ForeignKey(PromoCode, on_delete=models.CASCADE, help_text="The promo code that is restricted to specific customers.")
     customer = models.ForeignKey(User, on_delete=models.CASCADE, help_text="The customer who is eligible to use this promo code.")
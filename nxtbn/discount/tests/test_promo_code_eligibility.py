@@ -0,0 +1,206 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from nxtbn.discount.models import PromoCode, PromoCodeRedemption, PromoCodeUsage
+from nxtbn.discount.tests import PromoCodeCustomerFactory, PromoCodeFactory, PromoCodeProductFactory
+from nxtbn.discount.utils import (
+    PromoCodeRedemptionError,
+    PromoCodeRule,
+    check_promo_code,
+    release_promo_code_redemption,
+    reserve_promo_code_redemption,
+)
+from nxtbn.order import OrderStatus
+from nxtbn.order.models import Order
+from nxtbn.product.tests import ProductVariantFactory
+from nxtbn.users.tests import UserFactory
+
+
+class PromoCodeEligibilityTestCase(TestCase):
+    def setUp(self):
+        self.customer = UserFactory()
+        self.variant = ProductVariantFactory()
+        self.other_variant = ProductVariantFactory()
+        self.promo_code = PromoCodeFactory(
+            code='SAVE10',
+            is_active=True,
+            expiration_date=timezone.now() + timedelta(days=10),
+            min_purchase_amount=None,
+            min_purchase_period=None,
+            redemption_limit=None,
+            new_customers_only=False,
+            usage_limit_per_customer=1,
+        )
+
+    def create_order(self, **kwargs):
+        return Order.objects.create(
+            user=self.customer,
+            currency=settings.BASE_CURRENCY,
+            customer_currency=settings.BASE_CURRENCY,
+            **kwargs
+        )
+
+    def check(self, aliases=None, customer_id=None):
+        if aliases is None:
+            aliases = [self.variant.alias]
+        return check_promo_code('save10', customer_id or self.customer.id, aliases)
+
+    def test_valid_promo_code(self):
+        promo_code, failed = self.check()
+        self.assertEqual(promo_code, self.promo_code)
+        self.assertEqual(failed, [])
+
+    def test_unknown_promo_code(self):
+        self.assertEqual(check_promo_code('NOPE', self.customer.id, []), (None, []))
+
+    def test_all_failed_rules_are_returned(self):
+        self.promo_code.is_active = False
+        self.promo_code.expiration_date = timezone.now() - timedelta(days=1)
+        self.promo_code.redemption_limit = 1
+        self.promo_code.save()
+        PromoCodeCustomerFactory(promo_code=self.promo_code)
+        PromoCodeProductFactory(promo_code=self.promo_code, product=self.variant.product)
+        reserve_promo_code_redemption(self.promo_code, self.customer.id, self.create_order())
+
+        _, failed = self.check(aliases=[self.variant.alias, self.other_variant.alias])
+
+        self.assertEqual(failed, [
+            PromoCodeRule.ACTIVE,
+            PromoCodeRule.EXPIRED,
+            PromoCodeRule.CUSTOMER,
+            PromoCodeRule.PRODUCT,
+            PromoCodeRule.REDEMPTION_LIMIT,
+            PromoCodeRule.USAGE_LIMIT_PER_CUSTOMER,
+        ])
+
+    def test_whitelisted_customer_and_applicable_products(self):
+        PromoCodeCustomerFactory(promo_code=self.promo_code, customer=self.customer)
+        PromoCodeProductFactory(promo_code=self.promo_code, product=self.variant.product)
+        PromoCodeProductFactory(promo_code=self.promo_code, product=self.other_variant.product)
+
+        _, failed = self.check(aliases=[self.variant.alias, self.other_variant.alias])
+        self.assertEqual(failed, [])
+
+    def test_min_purchase(self):
+        self.promo_code.min_purchase_amount = 50
+        self.promo_code.min_purchase_period = timedelta(days=30)
+        self.promo_code.save()
+        self.create_order(status=OrderStatus.DELIVERED, total_price=4000)
+        self.create_order(status=OrderStatus.PENDING, total_price=9000) # not counted
+
+        self.assertEqual(self.check()[1], [PromoCodeRule.MIN_PURCHASE])
+
+        self.create_order(status=OrderStatus.SHIPPED, total_price=1000)
+        self.assertEqual(self.check()[1], [])
+
+    def test_new_customers_only(self):
+        self.promo_code.new_customers_only = True
+        self.promo_code.save()
+        self.assertEqual(self.check()[1], [])
+
+        self.customer.date_joined = timezone.now() - timedelta(days=60)
+        self.customer.save()
+        self.assertEqual(self.check()[1], [PromoCodeRule.NEW_CUSTOMER])
+
+    def test_query_count_does_not_grow_with_cart(self):
+        PromoCodeProductFactory(promo_code=self.promo_code, product=self.variant.product)
+        aliases = [ProductVariantFactory(product=self.variant.product).alias for _ in range(10)]
+
+        with self.assertNumQueries(1):
+            _, failed = self.check(aliases=aliases)
+        self.assertEqual(failed, [])
+
+        self.promo_code.new_customers_only = True
+        self.promo_code.min_purchase_amount = 10
+        self.promo_code.min_purchase_period = timedelta(days=30)
+        self.promo_code.save()
+        with self.assertNumQueries(2):
+            self.check(aliases=aliases)
+
+
+class PromoCodeRedemptionCounterTestCase(TestCase):
+    def setUp(self):
+        self.customer = UserFactory()
+        self.other_customer = UserFactory()
+        self.promo_code = PromoCodeFactory(
+            is_active=True,
+            min_purchase_amount=None,
+            min_purchase_period=None,
+            new_customers_only=False,
+            redemption_limit=3,
+            usage_limit_per_customer=2,
+        )
+
+    def create_order(self, customer=None):
+        return Order.objects.create(
+            user=customer,
+            currency=settings.BASE_CURRENCY,
+            customer_currency=settings.BASE_CURRENCY,
+        )
+
+    def counters(self, customer):
+        total = PromoCode.objects.get(pk=self.promo_code.pk).redemption_count
+        per_customer = PromoCodeRedemption.objects.filter(
+            promo_code=self.promo_code, customer=customer
+        ).values_list('redemption_count', flat=True).first()
+        return total, per_customer
+
+    def test_reserve_increments_counters(self):
+        reserve_promo_code_redemption(self.promo_code, self.customer.id, self.create_order(self.customer))
+        reserve_promo_code_redemption(self.promo_code, self.customer.id, self.create_order(self.customer))
+
+        self.assertEqual(self.counters(self.customer), (2, 2))
+        self.assertEqual(self.promo_code.get_user_redemptions(self.customer), 2)
+        self.assertEqual(PromoCodeUsage.objects.filter(promo_code=self.promo_code).count(), 2)
+
+    def test_global_counter_is_the_last_write(self):
+        with CaptureQueriesContext(connection) as queries:
+            reserve_promo_code_redemption(self.promo_code, self.customer.id, self.create_order(self.customer))
+
+        writes = [query['sql'] for query in queries if query['sql'].startswith(('INSERT', 'UPDATE'))]
+        self.assertTrue(writes[-1].startswith(f'UPDATE "{PromoCode._meta.db_table}"'), writes[-1])
+
+    def test_per_customer_limit_leaves_global_counter_untouched(self):
+        for _ in range(2):
+            reserve_promo_code_redemption(self.promo_code, self.customer.id, self.create_order(self.customer))
+
+        with self.assertRaises(PromoCodeRedemptionError) as ctx:
+            reserve_promo_code_redemption(self.promo_code, self.customer.id, self.create_order(self.customer))
+
+        self.assertEqual(ctx.exception.rule, PromoCodeRule.USAGE_LIMIT_PER_CUSTOMER)
+        self.assertEqual(self.counters(self.customer), (2, 2))
+
+    def test_global_limit(self):
+        for _ in range(2):
+            reserve_promo_code_redemption(self.promo_code, self.customer.id, self.create_order(self.customer))
+        reserve_promo_code_redemption(self.promo_code, None, self.create_order())
+
+        with self.assertRaises(PromoCodeRedemptionError) as ctx:
+            reserve_promo_code_redemption(self.promo_code, self.other_customer.id, self.create_order(self.other_customer))
+
+        self.assertEqual(ctx.exception.rule, PromoCodeRule.REDEMPTION_LIMIT)
+        self.assertEqual(self.counters(self.other_customer), (3, None))
+
+    def test_release_is_idempotent(self):
+        order = self.create_order(self.customer)
+        reserve_promo_code_redemption(self.promo_code, self.customer.id, order)
+
+        self.assertEqual(release_promo_code_redemption(order), 1)
+        self.assertEqual(release_promo_code_redemption(order), 0)
+        self.assertEqual(self.counters(self.customer), (0, 0))
+        self.assertFalse(PromoCodeUsage.objects.filter(order=order).exists())
+
+    def test_limit_checks_do_not_count_usages(self):
+        reserve_promo_code_redemption(self.promo_code, self.customer.id, self.create_order(self.customer))
+
+        with self.assertNumQueries(0):
+            self.assertEqual(self.promo_code.get_total_redemptions(), self.promo_code.redemption_count)
+        with self.assertNumQueries(1):
+            _, failed = check_promo_code(self.promo_code.code, self.customer.id, [])
+        self.assertNotIn(PromoCodeRule.REDEMPTION_LIMIT, failed)
+        self.assertNotIn(PromoCodeRule.USAGE_LIMIT_PER_CUSTOMER, failed)
@@ -0,0 +1,243 @@
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import Count, Exists, F, IntegerField, OuterRef, Q, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from nxtbn.discount.models import (
+    PromoCode,
+    PromoCodeCustomer,
+    PromoCodeProduct,
+    PromoCodeRedemption,
+    PromoCodeUsage,
+)
+from nxtbn.order import OrderStatus
+from nxtbn.users.models import User
+
+
+NEW_CUSTOMER_PERIOD = timedelta(days=30)
+MIN_PURCHASE_ORDER_STATUSES = [OrderStatus.SHIPPED, OrderStatus.DELIVERED]
+
+
+class PromoCodeRule:
+    ACTIVE = 'active'
+    EXPIRED = 'expired'
+    CUSTOMER = 'customer'
+    PRODUCT = 'product'
+    MIN_PURCHASE = 'min_purchase'
+    REDEMPTION_LIMIT = 'redemption_limit'
+    USAGE_LIMIT_PER_CUSTOMER = 'usage_limit_per_customer'
+    NEW_CUSTOMER = 'new_customer'
+
+    MESSAGES = {
+        ACTIVE: "Promo code is not active.",
+        EXPIRED: "Promo code has expired.",
+        CUSTOMER: "This promo code is restricted to specific customers and is not valid for you.",
+        PRODUCT: "Promo code is not valid for one or more of the products in your cart.",
+        MIN_PURCHASE: "Promo code is not valid for your purchase amount.",
+        REDEMPTION_LIMIT: "Promo code has reached its redemption limit.",
+        USAGE_LIMIT_PER_CUSTOMER: "Promo code has reached its usage limit for you.",
+        NEW_CUSTOMER: "Promo code is only valid for new customers.",
+    }
+
+
+def _count_subquery(queryset, group_by, count='id', distinct=False):
+    """Correlated COUNT that evaluates to 0 instead of NULL when no rows match."""
+    subquery = (
+        queryset
+        .order_by()
+        .values(group_by)
+        .annotate(total=Count(count, distinct=distinct))
+        .values('total')
+    )
+    return Coalesce(Subquery(subquery, output_field=IntegerField()), Value(0))
+
+
+def load_promo_code(code, customer_id=None, variant_aliases=()):
+    """
+    Loads the promo code together with everything its rules need about the promo
+    itself and the cart, in one query. Returns None if the code does not exist.
+    """
+    variant_aliases = set(variant_aliases)
+    if customer_id is None:
+        customer_redemptions = Value(0)
+    else:
+        customer_redemptions = Coalesce(
+            Subquery(
+                PromoCodeRedemption.objects
+                .filter(promo_code=OuterRef('pk'), customer_id=customer_id)
+                .values('redemption_count')[:1],
+                output_field=IntegerField(),
+            ),
+            Value(0),
+        )
+
+    return (
+        PromoCode.objects
+        .filter(code=code.upper())
+        .annotate(
+            has_specific_customers=Exists(PromoCodeCustomer.objects.filter(promo_code=OuterRef('pk'))),
+            customer_whitelisted=Exists(
+                PromoCodeCustomer.objects.filter(promo_code=OuterRef('pk'), customer_id=customer_id)
+            ),
+            has_applicable_products=Exists(PromoCodeProduct.objects.filter(promo_code=OuterRef('pk'))),
+            applicable_alias_count=_count_subquery(
+                PromoCodeProduct.objects.filter(
+                    promo_code=OuterRef('pk'),
+                    product__variants__alias__in=variant_aliases,
+                ),
+                'promo_code',
+                count='product__variants__alias',
+                distinct=True,
+            ),
+            customer_redemptions=customer_redemptions,
+        )
+        .first()
+    )
+
+
+def load_customer_stats(promo_code, customer_id):
+    """
+    Loads the shopper's registration date and purchase total of the promo's minimum
+    purchase period, in one query. Skipped entirely if no rule needs them.
+    """
+    needs_purchase_total = bool(promo_code.min_purchase_amount and promo_code.min_purchase_period)
+    if customer_id is None or not (needs_purchase_total or promo_code.new_customers_only):
+        return None
+
+    queryset = User.objects.filter(pk=customer_id).values('date_joined')
+    if needs_purchase_total:
+        queryset = queryset.annotate(
+            purchase_total=Sum(
+                'orders__total_price',
+                filter=Q(
+                    orders__created_at__gte=timezone.now() - promo_code.min_purchase_period,
+                    orders__status__in=MIN_PURCHASE_ORDER_STATUSES,
+                ),
+            )
+        )
+    return next(iter(queryset.order_by()), None)
+
+
+def evaluate_promo_code(promo_code, customer_id=None, variant_aliases=(), customer_stats=None):
+    """
+    Evaluates every rule of a promo code loaded with `load_promo_code` in memory.
+    Returns the list of failed rules, empty if the promo code can be applied.
+    """
+    failed = []
+    now = timezone.now()
+    variant_aliases = set(variant_aliases)
+
+    if not promo_code.is_active:
+        failed.append(PromoCodeRule.ACTIVE)
+
+    if promo_code.expiration_date and promo_code.expiration_date <= now:
+        failed.append(PromoCodeRule.EXPIRED)
+
+    if promo_code.has_specific_customers and not promo_code.customer_whitelisted:
+        failed.append(PromoCodeRule.CUSTOMER)
+
+    if promo_code.has_applicable_products and promo_code.applicable_alias_count < len(variant_aliases):
+        failed.append(PromoCodeRule.PRODUCT)
+
+    if promo_code.min_purchase_amount and promo_code.min_purchase_period:
+        purchase_total = (customer_stats or {}).get('purchase_total') or 0
+        # Order totals are stored in cents
+        if purchase_total < promo_code.min_purchase_amount * 100:
+            failed.append(PromoCodeRule.MIN_PURCHASE)
+
+    if promo_code.redemption_limit is not None and promo_code.redemption_count >= promo_code.redemption_limit:
+        failed.append(PromoCodeRule.REDEMPTION_LIMIT)
+
+    if (
+        promo_code.usage_limit_per_customer is not None
+        and promo_code.customer_redemptions >= promo_code.usage_limit_per_customer
+    ):
+        failed.append(PromoCodeRule.USAGE_LIMIT_PER_CUSTOMER)
+
+    if promo_code.new_customers_only:
+        date_joined = (customer_stats or {}).get('date_joined')
+        if date_joined is None or date_joined < now - NEW_CUSTOMER_PERIOD:
+            failed.append(PromoCodeRule.NEW_CUSTOMER)
+
+    return failed
+
+
+def check_promo_code(code, customer_id=None, variant_aliases=()):
+    """
+    Loads and evaluates a promo code in at most two queries.
+    Returns (promo_code, failed_rules), promo_code is None if the code does not exist.
+    """
+    promo_code = load_promo_code(code, customer_id, variant_aliases)
+    if promo_code is None:
+        return None, []
+    customer_stats = load_customer_stats(promo_code, customer_id)
+    return promo_code, evaluate_promo_code(promo_code, customer_id, variant_aliases, customer_stats)
+
+
+class PromoCodeRedemptionError(Exception):
+    def __init__(self, rule):
+        self.rule = rule
+        super().__init__(PromoCodeRule.MESSAGES[rule])
+
+
+def reserve_promo_code_redemption(promo_code, customer_id, order):
+    """
+    Reserves a redemption for the order. The global and per-customer counters are
+    incremented with conditional UPDATEs that only match while the limit is not
+    reached, so concurrent orders can never oversubscribe a promo code.
+    The global counter, the row every checkout with this code updates, is written last:
+    its lock is held from there to the commit of the caller's transaction only, so
+    call this as the last write of the order creation.
+    Raises PromoCodeRedemptionError, leaving the counters untouched, if a limit is reached.
+    """
+    with transaction.atomic():
+        if customer_id is not None:
+            PromoCodeRedemption.objects.bulk_create(
+                [PromoCodeRedemption(promo_code_id=promo_code.pk, customer_id=customer_id)],
+                ignore_conflicts=True,
+            )
+            redemptions = PromoCodeRedemption.objects.filter(promo_code_id=promo_code.pk, customer_id=customer_id)
+            if promo_code.usage_limit_per_customer is not None:
+                redemptions = redemptions.filter(redemption_count__lt=promo_code.usage_limit_per_customer)
+            if not redemptions.update(redemption_count=F('redemption_count') + 1):
+                raise PromoCodeRedemptionError(PromoCodeRule.USAGE_LIMIT_PER_CUSTOMER)
+
+        usage = PromoCodeUsage.objects.create(promo_code=promo_code, user_id=customer_id, order=order)
+
+        reserved = (
+            PromoCode.objects
+            .filter(pk=promo_code.pk)
+            .filter(Q(redemption_limit__isnull=True) | Q(redemption_count__lt=F('redemption_limit')))
+            .update(redemption_count=F('redemption_count') + 1)
+        )
+        if not reserved:
+            raise PromoCodeRedemptionError(PromoCodeRule.REDEMPTION_LIMIT)
+        return usage
+
+
+def release_promo_code_redemption(order):
+    """
+    Releases the redemptions held by the order, e.g. when it is cancelled.
+    Safe to call more than once, counters are only decremented for usages actually removed.
+    """
+    with transaction.atomic():
+        usages = list(
+            PromoCodeUsage.objects.select_for_update().filter(order=order).values('id', 'promo_code_id', 'user_id')
+        )
+        if not usages:
+            return 0
+        PromoCodeUsage.objects.filter(id__in=[usage['id'] for usage in usages]).delete()
+
+        for usage in usages:
+            PromoCode.objects.filter(pk=usage['promo_code_id'], redemption_count__gt=0).update(
+                redemption_count=F('redemption_count') - 1
+            )
+            if usage['user_id'] is not None:
+                PromoCodeRedemption.objects.filter(
+                    promo_code_id=usage['promo_code_id'],
+                    customer_id=usage['user_id'],
+                    redemption_count__gt=0,
+                ).update(redemption_count=F('redemption_count') - 1)
+        return len(usages)
@@ -14,7 +14,7 @@ logger = logging.getLogger(__name__)
 class ImageSerializer(serializers.ModelSerializer):
     class Meta:
         model = Image
-        fields = "__all__"
+        exclude = ("image_url", "image_xs_url", "url_expires_at")
         read_only_fields = ("id", "created_by", "last_modified_by")
 
     def create(self, validated_data):
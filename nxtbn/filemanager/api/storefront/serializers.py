@@ -1,3 +1,21 @@
 from django.utils.translation import gettext_lazy as _
 from rest_framework import serializers
 from django.db import transaction
+
+from nxtbn.filemanager.models import Image
+
+
+class ImageSerializer(serializers.ModelSerializer):
+    """Read only image serializer, urls are served from the persisted rendition urls."""
+    image = serializers.SerializerMethodField()
+    image_xs = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Image
+        exclude = ('image_url', 'image_xs_url', 'url_expires_at',)
+
+    def get_image(self, obj):
+        return obj.get_image_url(self.context.get('request'))
+
+    def get_image_xs(self, obj):
+        return obj.get_image_xs_url(self.context.get('request'))
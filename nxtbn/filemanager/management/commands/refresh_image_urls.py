@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+from django.utils import timezone
+
+from nxtbn.filemanager.models import Image
+
+
+class Command(BaseCommand):
+    help = 'Resolve and persist the rendition urls of images from the storage backend'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--all',
+            action='store_true',
+            help='Refresh every image, not only the missing or expired ones',
+        )
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        images = Image.objects.all()
+        if not options['all']:
+            images = images.filter(
+                Q(image_url__isnull=True) | Q(image_url='') | Q(url_expires_at__lte=timezone.now())
+            )
+
+        refreshed = 0
+        for image in images.iterator(chunk_size=options['batch_size']):
+            image.refresh_urls()
+            refreshed += 1
+
+        self.stdout.write(self.style.SUCCESS(f"Refreshed urls of {refreshed} images."))
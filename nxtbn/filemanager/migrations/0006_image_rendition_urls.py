@@ -0,0 +1,28 @@
+# Generated by Django 4.2.11 on 2026-10-19 08:32
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('filemanager', '0005_alter_image_image_alter_image_image_xs'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='image',
+            name='image_url',
+            field=models.CharField(blank=True, editable=False, max_length=1024, null=True),
+        ),
+        migrations.AddField(
+            model_name='image',
+            name='image_xs_url',
+            field=models.CharField(blank=True, editable=False, max_length=1024, null=True),
+        ),
+        migrations.AddField(
+            model_name='image',
+            name='url_expires_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+    ]
@@ -1,9 +1,28 @@
+from datetime import timedelta
+
 from django.db import models
+from django.utils import timezone
 
 from nxtbn.core.models import AbstractBaseModel
 from nxtbn.users.admin import User
 
 
+CLOUDINARY_XS_TRANSFORMATION = 'w_200,f_auto,q_auto'
+SIGNED_URL_EXPIRY_MARGIN = 60 # seconds, refresh signed urls a bit before the storage rejects them
+
+
+def absolute_media_url(url, request):
+    """
+    Returns the url as absolute. Storage backends like Cloudinary or S3 already return
+    absolute urls, only the local file storage returns relative ones.
+    """
+    if not url:
+        return None
+    if request is None or url.startswith(('http://', 'https://', '//')):
+        return url
+    return request.build_absolute_uri(url)
+
+
 class Image(AbstractBaseModel):
     created_by = models.ForeignKey(User, on_delete=models.PROTECT, related_name='image_created')
     last_modified_by = models.ForeignKey(User, on_delete=models.PROTECT, related_name='image_modified', null=True, blank=True)
@@ -12,38 +31,90 @@ class Image(AbstractBaseModel):
     image_xs = models.ImageField(upload_to='images/xs/', null=True, blank=True)
     image_alt_text = models.CharField(max_length=255)
 
-    def get_image_url(self, request):
-        if self.image:
-            url = self.image.url
-            # If using Cloudinary, we can return the URL directly (or add transformations)
-            if 'www.cloudinary.com' in url:
-                return url
-            return request.build_absolute_uri(url)
-        return None
+    # Rendition urls resolved from the storage backend, persisted so that serializers
+    # never have to build or sign urls per row. Refreshed on save and when expired.
+    image_url = models.CharField(max_length=1024, blank=True, null=True, editable=False)
+    image_xs_url = models.CharField(max_length=1024, blank=True, null=True, editable=False)
+    url_expires_at = models.DateTimeField(blank=True, null=True, editable=False)
 
-    def get_image_xs_url(self, request):
-        if self.image_xs:
-             url = self.image_xs.url
-             if 'www.cloudinary.com' in url:
-                return url
-             return request.build_absolute_uri(url)
-        
-        if self.image:              
-            url = self.image.url
-            if 'www.cloudinary.com' in url:
-                # Cloudinary on-the-fly transformation for thumbnail
-                # Insert /w_200,f_auto,q_auto/ after /upload/
-                if '/upload/' in url:
-                    return url.replace('/upload/', '/upload/w_200,f_auto,q_auto/')
-                return url
-            return request.build_absolute_uri(url)
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        # The file is only committed to the storage inside super().save()
+        self.refresh_urls()
 
+    @staticmethod
+    def _resolve_storage_url(field_file):
+        if not field_file:
+            return None
+        try:
+            return field_file.url
+        except Exception:
+            return None
+
+    @staticmethod
+    def _signature_ttl(field_file):
+        """Seconds a signed url stays valid, None if the storage returns unsigned urls."""
+        storage = field_file.storage
+        if getattr(storage, 'querystring_auth', False):
+            return getattr(storage, 'querystring_expire', 3600)
         return None
 
+    def refresh_urls(self, commit=True):
+        """
+        Resolves the image and thumbnail urls from the storage backend and persists them.
+        """
+        image_url = self._resolve_storage_url(self.image)
+        image_xs_url = self._resolve_storage_url(self.image_xs)
+
+        if not image_xs_url and image_url:
+            # Cloudinary on-the-fly transformation for thumbnail
+            if 'cloudinary.com' in image_url and '/upload/' in image_url:
+                image_xs_url = image_url.replace('/upload/', f'/upload/{CLOUDINARY_XS_TRANSFORMATION}/')
+            else:
+                image_xs_url = image_url
+
+        ttls = [
+            ttl for ttl in (self._signature_ttl(f) for f in (self.image, self.image_xs) if f)
+            if ttl is not None
+        ]
+        url_expires_at = None
+        if ttls:
+            url_expires_at = timezone.now() + timedelta(seconds=max(min(ttls) - SIGNED_URL_EXPIRY_MARGIN, 0))
+
+        self.image_url = image_url
+        self.image_xs_url = image_xs_url
+        self.url_expires_at = url_expires_at
+
+        if commit and self.pk:
+            Image.objects.filter(pk=self.pk).update(
+                image_url=image_url,
+                image_xs_url=image_xs_url,
+                url_expires_at=url_expires_at,
+            )
+
+    def urls_are_stale(self):
+        if self.image and not self.image_url:
+            return True
+        return self.url_expires_at is not None and self.url_expires_at <= timezone.now()
+
+    def get_image_url(self, request):
+        if not self.image:
+            return None
+        if self.urls_are_stale():
+            self.refresh_urls()
+        return absolute_media_url(self.image_url, request)
+
+    def get_image_xs_url(self, request):
+        if not self.image and not self.image_xs:
+            return None
+        if self.urls_are_stale() or (self.image_xs and not self.image_xs_url):
+            self.refresh_urls()
+        return absolute_media_url(self.image_xs_url, request)
+
 
 class Document(AbstractBaseModel):
     created_by = models.ForeignKey(User, on_delete=models.PROTECT, related_name='document_created')
     last_modified_by = models.ForeignKey(User, on_delete=models.PROTECT, related_name='document_modified', null=True, blank=True)
     name = models.CharField(max_length=255)
     document = models.FileField()
-    image_alt_text = models.CharField(max_length=255)
\ No newline at end of file
+    image_alt_text = models.CharField(max_length=255)
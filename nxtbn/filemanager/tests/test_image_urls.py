@@ -0,0 +1,78 @@
+from datetime import timedelta
+from unittest import mock
+
+from django.core.files.storage import FileSystemStorage
+from django.test import TestCase, RequestFactory
+from django.utils import timezone
+
+from nxtbn.filemanager.models import Image
+from nxtbn.filemanager.tests import ImageFactory
+from nxtbn.product.storefront_types import ImageType as StorefrontImageType
+
+
+class ImageRenditionUrlTestCase(TestCase):
+    def setUp(self):
+        self.request = RequestFactory().get('/')
+        self.image = ImageFactory()
+
+    def test_urls_are_persisted_on_save(self):
+        image = Image.objects.get(pk=self.image.pk)
+        self.assertTrue(image.image_url)
+        self.assertEqual(image.image_url, image.image.url)
+        # without a dedicated thumbnail the main image is used
+        self.assertEqual(image.image_xs_url, image.image.url)
+        self.assertIsNone(image.url_expires_at)
+
+    def test_get_image_url_does_not_touch_storage(self):
+        image = Image.objects.get(pk=self.image.pk)
+        with mock.patch.object(FileSystemStorage, 'url', side_effect=AssertionError('storage hit')):
+            url = image.get_image_url(self.request)
+            xs_url = image.get_image_xs_url(self.request)
+
+        self.assertEqual(url, f"http://testserver{image.image_url}")
+        self.assertEqual(xs_url, f"http://testserver{image.image_xs_url}")
+
+    def test_missing_urls_are_backfilled(self):
+        Image.objects.filter(pk=self.image.pk).update(image_url=None, image_xs_url=None)
+        image = Image.objects.get(pk=self.image.pk)
+
+        self.assertTrue(image.get_image_url(self.request).startswith('http://testserver/'))
+        self.assertTrue(Image.objects.get(pk=self.image.pk).image_url)
+
+    def test_expired_signature_is_refreshed(self):
+        Image.objects.filter(pk=self.image.pk).update(
+            image_url='/media/stale-signature.jpg',
+            url_expires_at=timezone.now() - timedelta(seconds=1),
+        )
+        image = Image.objects.get(pk=self.image.pk)
+
+        with mock.patch.object(FileSystemStorage, 'querystring_auth', True, create=True), \
+                mock.patch.object(FileSystemStorage, 'querystring_expire', 3600, create=True):
+            url = image.get_image_url(self.request)
+
+        image.refresh_from_db()
+        self.assertNotIn('stale-signature', url)
+        self.assertEqual(image.image_url, image.image.url)
+        self.assertGreater(image.url_expires_at, timezone.now() + timedelta(minutes=50))
+
+    def test_absolute_storage_urls_are_returned_untouched(self):
+        Image.objects.filter(pk=self.image.pk).update(
+            image_url='https://res.cloudinary.com/demo/image/upload/v1/sample.jpg',
+        )
+        image = Image.objects.get(pk=self.image.pk)
+
+        self.assertEqual(
+            image.get_image_url(self.request),
+            'https://res.cloudinary.com/demo/image/upload/v1/sample.jpg'
+        )
+
+    def test_storefront_image_type_serves_persisted_urls_only(self):
+        self.assertEqual(
+            set(StorefrontImageType._meta.fields),
+            {'id', 'name', 'image', 'image_xs', 'image_alt_text'},
+        )
+        image = Image.objects.get(pk=self.image.pk)
+        info = mock.Mock(context=self.request)
+        with mock.patch.object(FileSystemStorage, 'url', side_effect=AssertionError('storage hit')):
+            self.assertEqual(StorefrontImageType.resolve_image(image, info), f"http://testserver{image.image_url}")
+            self.assertEqual(StorefrontImageType.resolve_image_xs(image, info), f"http://testserver{image.image_xs_url}")
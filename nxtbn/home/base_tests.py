@@ -14,11 +14,30 @@ from nxtbn.users import UserRole
 from nxtbn.users.tests import UserFactory
 
 from django.contrib.auth.hashers import make_password
+from contextlib import contextmanager
 
+from nxtbn.core.query_tracker import track_queries
 
 
+class QueryBudgetMixin:
+    @contextmanager
+    def assertQueryBudget(self, max_queries, max_repeats=None):
+        """
+        Fails when the block runs more than `max_queries` queries, or repeats one query
+        fingerprint more than `max_repeats` times (an N+1 hidden behind a loose budget).
+        Unlike assertNumQueries the budget is an upper bound, so optimizations don't break the test.
+        """
+        with track_queries() as tracker:
+            yield tracker
+        if tracker.count > max_queries:
+            self.fail(f"Query budget of {max_queries} exceeded: {tracker.report()}")
+        if max_repeats is not None:
+            repeated = [(key, count) for key, count in tracker.duplicates() if count > max_repeats]
+            if repeated:
+                self.fail(f"Query repeated {repeated[0][1]} times (max {max_repeats}): {repeated[0][0]}\n{tracker.report()}")
+
 
-class BaseGraphQLTestCase(TestCase):
+class BaseGraphQLTestCase(QueryBudgetMixin, TestCase):
     graphql_admin_client = GRAPHClient(admin_schema)
     graphql_customer_client = GRAPHClient(storefront_schema)
 
@@ -250,7 +269,7 @@ class BaseGraphQLTestCase(TestCase):
         access_token = response['data']['login']['login']['token']['access']
 
 
-class BaseTestCase(TestCase): # We have to remove this as we are now transforming rest to graphql
+class BaseTestCase(QueryBudgetMixin, TestCase): # We have to remove this as we are now transforming rest to graphql
     client = APIClient()
     auth_client = APIClient()
     graphql_admin_client = GRAPHClient(admin_schema)
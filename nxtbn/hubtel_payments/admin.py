@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import PaymentTransaction
+from .models import HubtelCallback, PaymentTransaction
 
 
 @admin.register(PaymentTransaction)
@@ -7,3 +7,11 @@ class PaymentTransactionAdmin(admin.ModelAdmin):
     list_display = ('client_reference', 'customer_msisdn', 'amount', 'status', 'created_at')
     search_fields = ('client_reference', 'customer_msisdn', 'hubtel_transaction_id')
     readonly_fields = ('raw_initial_response', 'raw_callback_response')
+
+
+@admin.register(HubtelCallback)
+class HubtelCallbackAdmin(admin.ModelAdmin):
+    list_display = ('client_reference', 'received_at', 'processed_at', 'result')
+    list_filter = ('result',)
+    search_fields = ('client_reference',)
+    readonly_fields = ('client_reference', 'payload', 'received_at', 'processed_at', 'result')
@@ -0,0 +1,28 @@
+# Generated by Django 4.2.11 on 2026-10-19 08:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hubtel_payments', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='HubtelCallback',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('client_reference', models.CharField(db_index=True, max_length=128)),
+                ('payload', models.JSONField()),
+                ('received_at', models.DateTimeField(auto_now_add=True)),
+                ('processed_at', models.DateTimeField(blank=True, null=True)),
+                ('result', models.CharField(blank=True, choices=[('applied', 'Applied'), ('duplicate', 'Duplicate'), ('unknown_reference', 'Unknown reference')], max_length=32, null=True)),
+            ],
+            options={
+                'ordering': ['id'],
+                'indexes': [models.Index(condition=models.Q(('processed_at__isnull', True)), fields=['id'], name='hubtel_callback_pending_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 4.2.11 on 2026-10-19 08:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hubtel_payments', '0002_hubtelcallback'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='paymenttransaction',
+            name='next_status_check_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='paymenttransaction',
+            name='status_check_attempts',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='paymenttransaction',
+            index=models.Index(fields=['status', 'created_at'], name='hubtel_paym_status_64a3c8_idx'),
+        ),
+    ]
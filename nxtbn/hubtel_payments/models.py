@@ -38,11 +38,51 @@ class PaymentTransaction(models.Model):
     raw_initial_response = models.JSONField(blank=True, null=True)
     raw_callback_response = models.JSONField(blank=True, null=True)
     payment_date = models.DateTimeField(blank=True, null=True)
+    status_check_attempts = models.PositiveIntegerField(default=0)
+    next_status_check_at = models.DateTimeField(blank=True, null=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['status', 'created_at']),
+        ]
 
     def __str__(self):
         return f"PaymentTransaction({self.client_reference} - {self.status})"
+
+
+class HubtelCallback(models.Model):
+    """
+    Append-only inbox of the callbacks posted by Hubtel. The callback view only stores
+    the payload, the rows are applied to their PaymentTransaction in batches by a worker.
+    """
+    RESULT_APPLIED = 'applied'
+    RESULT_DUPLICATE = 'duplicate'
+    RESULT_UNKNOWN_REFERENCE = 'unknown_reference'
+
+    RESULT_CHOICES = [
+        (RESULT_APPLIED, 'Applied'),
+        (RESULT_DUPLICATE, 'Duplicate'),
+        (RESULT_UNKNOWN_REFERENCE, 'Unknown reference'),
+    ]
+
+    client_reference = models.CharField(max_length=128, db_index=True)
+    payload = models.JSONField()
+    received_at = models.DateTimeField(auto_now_add=True)
+    processed_at = models.DateTimeField(blank=True, null=True)
+    result = models.CharField(max_length=32, choices=RESULT_CHOICES, blank=True, null=True)
+
+    class Meta:
+        ordering = ['id']
+        indexes = [
+            models.Index(
+                fields=['id'],
+                condition=models.Q(processed_at__isnull=True),
+                name='hubtel_callback_pending_idx',
+            ),
+        ]
+
+    def __str__(self):
+        return f"HubtelCallback({self.client_reference} - {self.result or 'pending'})"
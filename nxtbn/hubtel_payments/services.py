@@ -1,5 +1,7 @@
 import json
 import logging
+import threading
+import time
 from typing import Optional
 
 import requests
@@ -10,14 +12,133 @@ from django.conf import settings
 logger = logging.getLogger(__name__)
 
 
+class HubtelUnavailable(RuntimeError):
+    """Raised without calling Hubtel while the circuit breaker of an endpoint is open."""
+
+
+class CircuitBreaker:
+    """
+    Process wide circuit breaker. After `failure_threshold` consecutive failures the circuit
+    opens and calls fail fast for `recovery_timeout` seconds, then a single trial call is let
+    through (half-open): success closes the circuit, failure opens it again.
+    """
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, name, failure_threshold=5, recovery_timeout=30):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self._state = self.CLOSED
+            self._failures = 0
+            self._opened_at = None
+            self._trial_in_flight = False
+
+    @property
+    def state(self):
+        with self._lock:
+            return self._current_state()
+
+    def _current_state(self):
+        if self._state == self.OPEN and time.monotonic() - self._opened_at >= self.recovery_timeout:
+            self._state = self.HALF_OPEN
+        return self._state
+
+    def before_call(self):
+        with self._lock:
+            state = self._current_state()
+            if state == self.OPEN or (state == self.HALF_OPEN and self._trial_in_flight):
+                raise HubtelUnavailable(f'Hubtel {self.name} endpoint is unavailable, circuit is open')
+            if state == self.HALF_OPEN:
+                self._trial_in_flight = True
+
+    def record_success(self):
+        with self._lock:
+            self._state = self.CLOSED
+            self._failures = 0
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            self._trial_in_flight = False
+            if self._state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+                if self._state != self.OPEN:
+                    logger.warning('Hubtel %s circuit opened after %s failures', self.name, self._failures)
+                self._state = self.OPEN
+                self._opened_at = time.monotonic()
+
+
+# One pooled session per process, so connections to Hubtel are kept alive across requests.
+_session = None
+_session_lock = threading.Lock()
+
+_breakers = {
+    'initiate': CircuitBreaker('initiate'),
+    'status': CircuitBreaker('status'),
+}
+
+
+def get_hubtel_session():
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                session = requests.Session()
+                # Only connection errors are retried by the adapter, status retries are per endpoint
+                adapter = HTTPAdapter(
+                    pool_connections=4,
+                    pool_maxsize=getattr(settings, 'HUBTEL_POOL_MAXSIZE', 20),
+                    max_retries=Retry(total=1, read=0, status=0, backoff_factor=0.2),
+                )
+                session.mount('https://', adapter)
+                session.mount('http://', adapter)
+                _session = session
+    return _session
+
+
+def get_circuit_breaker(endpoint):
+    return _breakers[endpoint]
+
+
 class HubtelPaymentService:
+    # (connect, read) timeouts per endpoint, in seconds
+    TIMEOUTS = {
+        'initiate': (3.05, 10),
+        'status': (3.05, 5),
+    }
+    # Status codes that count as Hubtel being degraded
+    FAILURE_STATUS_CODES = (500, 502, 503, 504)
+
     def __init__(self):
         self.basic_key = getattr(settings, 'HUBTEL_BASIC_AUTH_KEY', '')
         self.pos_sales_id = getattr(settings, 'HUBTEL_POS_SALES_ID', '')
         self.callback_url = getattr(settings, 'HUBTEL_CALLBACK_URL', '')
-        self.session = requests.Session()
-        retries = Retry(total=3, backoff_factor=0.3, status_forcelist=(500, 502, 503, 504))
-        self.session.mount('https://', HTTPAdapter(max_retries=retries))
+        self.receive_money_base_url = getattr(settings, 'HUBTEL_RECEIVE_MONEY_BASE_URL', 'https://rmp.hubtel.com')
+        self.status_base_url = getattr(settings, 'HUBTEL_STATUS_BASE_URL', 'https://api-txnstatus.hubtel.com')
+        self.session = get_hubtel_session()
+
+    def _request(self, endpoint, method, url, **kwargs):
+        """Sends the request through the endpoint circuit breaker with the endpoint timeout."""
+        breaker = get_circuit_breaker(endpoint)
+        breaker.before_call()
+        try:
+            resp = self.session.request(method, url, timeout=self.TIMEOUTS[endpoint], **kwargs)
+        except Exception:  # any error ends a half-open trial, or the circuit would stay stuck
+            breaker.record_failure()
+            raise
+
+        if resp.status_code in self.FAILURE_STATUS_CODES:
+            breaker.record_failure()
+        else:
+            breaker.record_success()
+        return resp
 
     def _headers(self):
         headers = {
@@ -34,7 +155,7 @@ class HubtelPaymentService:
         if not self.pos_sales_id:
             raise RuntimeError('HUBTEL_POS_SALES_ID not configured')
 
-        url = f"https://rmp.hubtel.com/merchantaccount/merchants/{self.pos_sales_id}/receive/mobilemoney"
+        url = f"{self.receive_money_base_url}/merchantaccount/merchants/{self.pos_sales_id}/receive/mobilemoney"
 
         # Hubtel docs use fields like CustomerMsisdn and PrimaryCallbackUrl.
         # To be tolerant of variations, send both sets (safe redundancy).
@@ -53,7 +174,7 @@ class HubtelPaymentService:
         if customer_email:
             payload['CustomerEmail'] = customer_email
 
-        resp = self.session.post(url, headers=self._headers(), json=payload, timeout=15)
+        resp = self._request('initiate', 'POST', url, headers=self._headers(), json=payload)
         try:
             resp.raise_for_status()
         except Exception:
@@ -76,12 +197,12 @@ class HubtelPaymentService:
         if not self.pos_sales_id:
             raise RuntimeError('HUBTEL_POS_SALES_ID not configured')
 
-        url = f"https://api-txnstatus.hubtel.com/transactions/{self.pos_sales_id}/status"
+        url = f"{self.status_base_url}/transactions/{self.pos_sales_id}/status"
         params = {'clientReference': client_reference}
         if hubtel_transaction_id:
             params['transactionId'] = hubtel_transaction_id
 
-        resp = self.session.get(url, headers=self._headers(), params=params, timeout=15)
+        resp = self._request('status', 'GET', url, headers=self._headers(), params=params)
         try:
             resp.raise_for_status()
         except Exception:
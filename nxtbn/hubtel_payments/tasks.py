@@ -0,0 +1,13 @@
+from celery import shared_task
+
+from nxtbn.hubtel_payments.utils import drain_callback_inbox, reconcile_pending_transactions
+
+
+@shared_task
+def process_hubtel_callbacks():
+    return drain_callback_inbox()
+
+
+@shared_task
+def reconcile_pending_hubtel_transactions():
+    return reconcile_pending_transactions()
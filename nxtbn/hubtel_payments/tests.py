@@ -1,8 +1,21 @@
-from django.test import TestCase
+import json
+import threading
+from datetime import timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from django.test import TestCase, override_settings
 from django.urls import reverse
+from django.utils import timezone
 from rest_framework.test import APIClient
 from unittest.mock import patch
-from .models import PaymentTransaction
+from .models import HubtelCallback, PaymentTransaction
+from .services import HubtelPaymentService, HubtelUnavailable, get_circuit_breaker, get_hubtel_session
+from .utils import (
+    RECONCILE_MAX_UNKNOWN_ATTEMPTS,
+    claim_stale_transactions,
+    drain_callback_inbox,
+    reconcile_pending_transactions,
+)
 
 
 class HubtelPaymentsTests(TestCase):
@@ -28,15 +41,221 @@ class HubtelPaymentsTests(TestCase):
         payload = {'ClientReference': 'cr-123', 'Status': '0000', 'TransactionId': 'tx-abc'}
         resp = self.client.post(url, payload, format='json')
         self.assertEqual(resp.status_code, 200)
+        tx.refresh_from_db()
+        self.assertEqual(tx.status, PaymentTransaction.STATUS_PENDING)  # only queued in the inbox
+        self.assertEqual(HubtelCallback.objects.filter(client_reference='cr-123', processed_at__isnull=True).count(), 1)
+
+        drain_callback_inbox()
+        tx.refresh_from_db()
+        self.assertEqual(tx.status, PaymentTransaction.STATUS_SUCCESS)
+        self.assertEqual(tx.hubtel_transaction_id, 'tx-abc')
+        self.assertIsNotNone(tx.payment_date)
+
+    def test_form_encoded_callback_is_stored_as_plain_values(self):
+        tx = PaymentTransaction.objects.create(client_reference='cr-form', customer_msisdn='233245000003', channel='mtn-gh', amount='5.00')
+        resp = self.client.post(reverse('hubtel_callback'), {'ClientReference': 'cr-form', 'Status': '0000'})
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(HubtelCallback.objects.get(client_reference='cr-form').payload, {'ClientReference': 'cr-form', 'Status': '0000'})
+
+        drain_callback_inbox()
+        tx.refresh_from_db()
+        self.assertEqual(tx.status, PaymentTransaction.STATUS_SUCCESS)
+
+    def test_duplicate_callbacks_are_applied_once(self):
+        tx = PaymentTransaction.objects.create(client_reference='cr-789', customer_msisdn='233245000002', channel='mtn-gh', amount='5.00')
+        url = reverse('hubtel_callback')
+        success = {'ClientReference': 'cr-789', 'Status': '0000', 'TransactionId': 'tx-1'}
+        late_failure = {'ClientReference': 'cr-789', 'ResponseCode': '4000'}
+        for payload in (success, success, late_failure):
+            self.client.post(url, payload, format='json')
+        self.client.post(url, {'ClientReference': 'cr-missing', 'Status': '0000'}, format='json')
+
+        self.assertEqual(drain_callback_inbox(batch_size=2), 4)
+        self.assertEqual(drain_callback_inbox(), 0)
+
         tx.refresh_from_db()
         self.assertEqual(tx.status, PaymentTransaction.STATUS_SUCCESS)
+        results = list(HubtelCallback.objects.values_list('result', flat=True))
+        self.assertEqual(results, [
+            HubtelCallback.RESULT_APPLIED,
+            HubtelCallback.RESULT_DUPLICATE,
+            HubtelCallback.RESULT_DUPLICATE,
+            HubtelCallback.RESULT_UNKNOWN_REFERENCE,
+        ])
 
     @patch('nxtbn.hubtel_payments.services.HubtelPaymentService.check_status')
     def test_status_check_endpoint(self, mock_check):
         tx = PaymentTransaction.objects.create(client_reference='cr-456', customer_msisdn='233245000001', channel='mtn-gh', amount='7.00')
         mock_check.return_value = {'ResponseCode': '0000'}
         url = reverse('hubtel_status', args=['cr-456'])
+
         resp = self.client.get(url)
         self.assertEqual(resp.status_code, 200)
-        tx.refresh_from_db()
-        self.assertEqual(tx.status, PaymentTransaction.STATUS_SUCCESS)
+        self.assertEqual(resp.json()['status'], PaymentTransaction.STATUS_PENDING)
+        mock_check.assert_not_called()  # the endpoint is a pure read
+
+        PaymentTransaction.objects.filter(pk=tx.pk).update(created_at=timezone.now() - timedelta(minutes=10))
+        self.assertEqual(reconcile_pending_transactions(), 1)
+
+        resp = self.client.get(url)
+        self.assertEqual(resp.json()['status'], PaymentTransaction.STATUS_SUCCESS)
+
+    @patch('nxtbn.hubtel_payments.services.HubtelPaymentService.check_status')
+    def test_reconciliation_backs_off_and_skips_fresh_transactions(self, mock_check):
+        stale = timezone.now() - timedelta(minutes=10)
+        for ref in ('cr-a', 'cr-b', 'cr-fresh'):
+            PaymentTransaction.objects.create(client_reference=ref, customer_msisdn='233245000001', channel='mtn-gh', amount='7.00')
+        PaymentTransaction.objects.exclude(client_reference='cr-fresh').update(created_at=stale)
+        mock_check.return_value = {'ResponseCode': '0001'}
+
+        self.assertEqual(reconcile_pending_transactions(max_workers=2), 2)
+        checked = {call.kwargs['client_reference'] for call in mock_check.call_args_list}
+        self.assertEqual(checked, {'cr-a', 'cr-b'})
+
+        tx = PaymentTransaction.objects.get(client_reference='cr-a')
+        self.assertEqual(tx.status, PaymentTransaction.STATUS_PENDING)
+        self.assertEqual(tx.status_check_attempts, 1)
+        self.assertGreater(tx.next_status_check_at, timezone.now())
+
+        # still pending but backing off, nothing is due
+        self.assertEqual(reconcile_pending_transactions(), 0)
+
+    def test_overlapping_runs_do_not_check_the_same_transactions(self):
+        PaymentTransaction.objects.create(client_reference='cr-a', customer_msisdn='233245000001', channel='mtn-gh', amount='7.00')
+        PaymentTransaction.objects.update(created_at=timezone.now() - timedelta(minutes=10))
+
+        self.assertEqual(claim_stale_transactions(timezone.now()), [('cr-a', None)])
+        self.assertEqual(claim_stale_transactions(timezone.now()), [])
+
+    @patch('nxtbn.hubtel_payments.services.HubtelPaymentService.check_status')
+    def test_unknown_transactions_are_retried_up_to_a_cap(self, mock_check):
+        PaymentTransaction.objects.create(
+            client_reference='cr-unknown', customer_msisdn='233245000001', channel='mtn-gh', amount='7.00',
+            status=PaymentTransaction.STATUS_UNKNOWN,
+        )
+        stale = timezone.now() - timedelta(minutes=10)
+        PaymentTransaction.objects.update(created_at=stale)
+        mock_check.return_value = {'ResponseCode': '0000'}
+
+        self.assertEqual(reconcile_pending_transactions(), 1)
+        self.assertEqual(PaymentTransaction.objects.get().status, PaymentTransaction.STATUS_SUCCESS)
+
+        PaymentTransaction.objects.update(
+            status=PaymentTransaction.STATUS_UNKNOWN, next_status_check_at=None,
+            status_check_attempts=RECONCILE_MAX_UNKNOWN_ATTEMPTS,
+        )
+        self.assertEqual(reconcile_pending_transactions(), 0)
+
+class StubHubtelHandler(BaseHTTPRequestHandler):
+    """Answers every request with the status code and body configured on the server."""
+    def _respond(self):
+        self.server.hits += 1
+        body = json.dumps(self.server.body).encode()
+        self.send_response(self.server.status_code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    do_GET = _respond
+    do_POST = _respond
+
+    def log_message(self, *args):
+        pass
+
+
+class HubtelClientTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server = ThreadingHTTPServer(('127.0.0.1', 0), StubHubtelHandler)
+        cls.server.hits = 0
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        base_url = f"http://127.0.0.1:{cls.server.server_port}"
+        cls.settings_override = override_settings(
+            HUBTEL_RECEIVE_MONEY_BASE_URL=base_url,
+            HUBTEL_STATUS_BASE_URL=base_url,
+            HUBTEL_POS_SALES_ID='pos-1',
+        )
+        cls.settings_override.enable()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.settings_override.disable()
+        cls.server.shutdown()
+        cls.server.server_close()
+        super().tearDownClass()
+
+    def setUp(self):
+        self.server.hits = 0
+        self.server.status_code = 200
+        self.server.body = {'ResponseCode': '0000'}
+        get_circuit_breaker('initiate').reset()
+        get_circuit_breaker('status').reset()
+
+    def tearDown(self):
+        get_circuit_breaker('initiate').reset()
+        get_circuit_breaker('status').reset()
+
+    def test_services_share_one_pooled_session(self):
+        self.assertIs(HubtelPaymentService().session, HubtelPaymentService().session)
+        self.assertIs(HubtelPaymentService().session, get_hubtel_session())
+
+        self.assertEqual(HubtelPaymentService().check_status('cr-1'), {'ResponseCode': '0000'})
+        self.assertEqual(
+            HubtelPaymentService().initiate_payment('cr-1', '233245000000', '5.00', 'mtn-gh'),
+            {'ResponseCode': '0000'}
+        )
+        self.assertEqual(self.server.hits, 2)
+
+    def test_circuit_opens_and_fails_fast(self):
+        self.server.status_code = 503
+        breaker = get_circuit_breaker('status')
+        service = HubtelPaymentService()
+
+        for _ in range(breaker.failure_threshold):
+            with self.assertRaises(Exception):
+                service.check_status('cr-1')
+        hits = self.server.hits
+
+        with self.assertRaises(HubtelUnavailable):
+            service.check_status('cr-1')
+        self.assertEqual(self.server.hits, hits)  # provider not called while open
+
+        # the other endpoint has its own circuit
+        self.server.status_code = 200
+        self.assertEqual(service.initiate_payment('cr-1', '233245000000', '5.00', 'mtn-gh'), {'ResponseCode': '0000'})
+
+    def test_circuit_closes_after_successful_trial(self):
+        breaker = get_circuit_breaker('status')
+        for _ in range(breaker.failure_threshold):
+            breaker.record_failure()
+        self.assertEqual(breaker.state, breaker.OPEN)
+
+        with patch.object(breaker, 'recovery_timeout', 0):
+            self.assertEqual(HubtelPaymentService().check_status('cr-1'), {'ResponseCode': '0000'})
+        self.assertEqual(breaker.state, breaker.CLOSED)
+
+    def test_unexpected_trial_error_reopens_circuit(self):
+        breaker = get_circuit_breaker('status')
+        for _ in range(breaker.failure_threshold):
+            breaker.record_failure()
+        service = HubtelPaymentService()
+
+        with patch.object(breaker, 'recovery_timeout', 0):
+            with patch.object(service.session, 'request', side_effect=ValueError('bad header')):
+                with self.assertRaises(ValueError):
+                    service.check_status('cr-1')
+            # the failed trial doesn't block the next one
+            self.assertEqual(service.check_status('cr-1'), {'ResponseCode': '0000'})
+        self.assertEqual(breaker.state, breaker.CLOSED)
+
+    def test_initiate_view_fails_fast_when_circuit_is_open(self):
+        breaker = get_circuit_breaker('initiate')
+        for _ in range(breaker.failure_threshold):
+            breaker.record_failure()
+
+        resp = APIClient().post(reverse('hubtel_initiate'), {'msisdn': '233245000000', 'amount': '10.00', 'channel': 'mtn-gh'}, format='json')
+        self.assertEqual(resp.status_code, 503)
+        self.assertEqual(self.server.hits, 0)
+        self.assertEqual(PaymentTransaction.objects.get().status, PaymentTransaction.STATUS_FAILED)
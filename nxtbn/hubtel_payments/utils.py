@@ -0,0 +1,271 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import HubtelCallback, PaymentTransaction
+from .services import HubtelPaymentService, HubtelUnavailable
+
+logger = logging.getLogger(__name__)
+
+
+CALLBACK_BATCH_SIZE = 100
+
+RECONCILE_AFTER = timedelta(minutes=5) # pending transactions younger than this are left to the callback
+RECONCILE_BATCH_SIZE = 200
+RECONCILE_MAX_WORKERS = 8
+RECONCILE_BACKOFF_BASE = timedelta(minutes=2)
+RECONCILE_BACKOFF_MAX = timedelta(hours=2)
+RECONCILE_CLAIM_TIMEOUT = timedelta(minutes=5) # claimed transactions are hidden from overlapping runs this long
+RECONCILE_MAX_UNKNOWN_ATTEMPTS = 10 # status checks of an unknown transaction before it is left for manual review
+
+# A transaction may only move forward, a late or replayed callback must not undo a final state.
+ALLOWED_TRANSITIONS = {
+    PaymentTransaction.STATUS_PENDING: {
+        PaymentTransaction.STATUS_SUCCESS,
+        PaymentTransaction.STATUS_FAILED,
+        PaymentTransaction.STATUS_UNKNOWN,
+    },
+    PaymentTransaction.STATUS_UNKNOWN: {
+        PaymentTransaction.STATUS_SUCCESS,
+        PaymentTransaction.STATUS_FAILED,
+        PaymentTransaction.STATUS_PENDING,
+    },
+    PaymentTransaction.STATUS_FAILED: {
+        PaymentTransaction.STATUS_SUCCESS,
+    },
+    PaymentTransaction.STATUS_SUCCESS: set(),
+}
+
+
+def get_client_reference(payload):
+    return payload.get('ClientReference') or payload.get('clientReference') or payload.get('client_reference')
+
+
+def status_from_callback(payload):
+    """Maps the status fields of a Hubtel callback payload to a PaymentTransaction status."""
+    # Hubtel commonly uses fields like 'Status' or 'ResponseCode'
+    status_field = payload.get('Status') or payload.get('status') or payload.get('ResponseCode') or payload.get('responseCode')
+    if status_field in ['0000', '200', 'Success', 'success']:
+        return PaymentTransaction.STATUS_SUCCESS
+    if status_field in ['0001', 'Pending', 'pending']:
+        return PaymentTransaction.STATUS_PENDING
+
+    # map common Hubtel failure codes
+    resp_code = str(payload.get('ResponseCode') or payload.get('responseCode') or '')
+    if resp_code in ['4000', '4101', '4103']:
+        return PaymentTransaction.STATUS_FAILED
+    return PaymentTransaction.STATUS_UNKNOWN
+
+
+def apply_callback(tx, payload, now):
+    """
+    Applies a callback payload to the transaction in memory.
+    Returns the HubtelCallback result, the caller is responsible for saving.
+    """
+    new_status = status_from_callback(payload)
+    if new_status not in ALLOWED_TRANSITIONS[tx.status]:
+        return HubtelCallback.RESULT_DUPLICATE
+
+    tx.status = new_status
+    tx.raw_callback_response = payload
+    tx.hubtel_transaction_id = tx.hubtel_transaction_id or payload.get('TransactionId') or payload.get('transactionId')
+    tx.external_transaction_id = tx.external_transaction_id or payload.get('ExternalId') or payload.get('externalId')
+    if new_status == PaymentTransaction.STATUS_SUCCESS and not tx.payment_date:
+        tx.payment_date = now
+    tx.updated_at = now
+    return HubtelCallback.RESULT_APPLIED
+
+
+def process_callback_batch(batch_size=CALLBACK_BATCH_SIZE):
+    """
+    Applies one batch of unprocessed callbacks. Rows locked by a concurrent worker are
+    skipped, so several workers can drain the inbox at the same time.
+    Returns the number of callbacks processed.
+    """
+    with transaction.atomic():
+        callbacks = list(
+            HubtelCallback.objects.select_for_update(skip_locked=True)
+            .filter(processed_at__isnull=True)
+            .order_by('id')[:batch_size]
+        )
+        if not callbacks:
+            return 0
+
+        references = {callback.client_reference for callback in callbacks}
+        transactions = {
+            tx.client_reference: tx
+            for tx in PaymentTransaction.objects.select_for_update().filter(client_reference__in=references)
+        }
+
+        now = timezone.now()
+        changed = {}
+        for callback in callbacks:  # in arrival order, so the last valid transition wins
+            tx = transactions.get(callback.client_reference)
+            if tx is None:
+                callback.result = HubtelCallback.RESULT_UNKNOWN_REFERENCE
+            else:
+                callback.result = apply_callback(tx, callback.payload, now)
+                if callback.result == HubtelCallback.RESULT_APPLIED:
+                    changed[tx.pk] = tx
+            callback.processed_at = now
+
+        if changed:
+            PaymentTransaction.objects.bulk_update(
+                changed.values(),
+                [
+                    'status', 'raw_callback_response', 'hubtel_transaction_id',
+                    'external_transaction_id', 'payment_date', 'updated_at',
+                ],
+            )
+        HubtelCallback.objects.bulk_update(callbacks, ['processed_at', 'result'])
+
+    return len(callbacks)
+
+
+def drain_callback_inbox(batch_size=CALLBACK_BATCH_SIZE):
+    """Processes callback batches until the inbox is empty. Returns the number processed."""
+    total = 0
+    while True:
+        processed = process_callback_batch(batch_size)
+        total += processed
+        if processed < batch_size:
+            break
+
+    if total:
+        logger.info('Processed %s Hubtel callbacks', total)
+    return total
+
+
+def status_from_status_check(resp):
+    """Maps a Hubtel transaction status response to a PaymentTransaction status."""
+    code = resp.get('ResponseCode') or resp.get('responseCode') or resp.get('Status')
+    if code in ['0000', 'Success', 'success']:
+        return PaymentTransaction.STATUS_SUCCESS
+    if code in ['0001', 'Pending', 'pending']:
+        return PaymentTransaction.STATUS_PENDING
+    return PaymentTransaction.STATUS_UNKNOWN
+
+
+def next_status_check_delay(attempts):
+    """Exponential backoff between two status checks of the same transaction."""
+    return min(RECONCILE_BACKOFF_BASE * (2 ** max(attempts - 1, 0)), RECONCILE_BACKOFF_MAX)
+
+
+def claim_stale_transactions(now, limit=RECONCILE_BATCH_SIZE):
+    """
+    Claims the transactions due for a status check: stale pending ones, and unknown ones
+    (e.g. a failed initiate) until RECONCILE_MAX_UNKNOWN_ATTEMPTS checks. Rows locked by an
+    overlapping run are skipped, and the claimed ones are pushed RECONCILE_CLAIM_TIMEOUT
+    ahead, so two runs never check the same transaction; apply_status_checks then sets
+    the real backoff. Returns (client_reference, hubtel_transaction_id) pairs.
+    """
+    with transaction.atomic():
+        due = list(
+            PaymentTransaction.objects.select_for_update(skip_locked=True)
+            .filter(
+                Q(status=PaymentTransaction.STATUS_PENDING)
+                | Q(status=PaymentTransaction.STATUS_UNKNOWN, status_check_attempts__lt=RECONCILE_MAX_UNKNOWN_ATTEMPTS),
+                created_at__lte=now - RECONCILE_AFTER,
+            )
+            .filter(Q(next_status_check_at__isnull=True) | Q(next_status_check_at__lte=now))
+            .order_by('created_at')
+            .values_list('pk', 'client_reference', 'hubtel_transaction_id')[:limit]
+        )
+        PaymentTransaction.objects.filter(pk__in=[pk for pk, _, _ in due]).update(
+            next_status_check_at=now + RECONCILE_CLAIM_TIMEOUT
+        )
+    return [(client_reference, hubtel_transaction_id) for _, client_reference, hubtel_transaction_id in due]
+
+
+def _check_status(service, client_reference, hubtel_transaction_id):
+    try:
+        return client_reference, service.check_status(
+            client_reference=client_reference, hubtel_transaction_id=hubtel_transaction_id
+        ), None
+    except Exception as e:
+        return client_reference, None, e
+
+
+def apply_status_checks(results, now):
+    """
+    Writes the status check responses back. Transactions which got a callback in the
+    meantime are only touched if the transition is still allowed.
+    """
+    with transaction.atomic():
+        transactions = PaymentTransaction.objects.select_for_update().filter(client_reference__in=results.keys())
+        changed = []
+        for tx in transactions:
+            resp = results[tx.client_reference]
+            tx.status_check_attempts += 1
+            tx.next_status_check_at = now + next_status_check_delay(tx.status_check_attempts)
+            tx.updated_at = now
+            if resp is not None:
+                tx.raw_callback_response = tx.raw_callback_response or {}
+                tx.raw_callback_response.update({'status_check': resp})
+                new_status = status_from_status_check(resp)
+                if new_status in ALLOWED_TRANSITIONS[tx.status]:
+                    tx.status = new_status
+                    if new_status == PaymentTransaction.STATUS_SUCCESS and not tx.payment_date:
+                        tx.payment_date = now
+            changed.append(tx)
+
+        PaymentTransaction.objects.bulk_update(
+            changed,
+            [
+                'status', 'raw_callback_response', 'payment_date', 'status_check_attempts',
+                'next_status_check_at', 'updated_at',
+            ],
+        )
+    return len(changed)
+
+
+def reconcile_pending_transactions(batch_size=RECONCILE_BATCH_SIZE, max_workers=RECONCILE_MAX_WORKERS):
+    """
+    Checks the status of stale pending and unknown transactions against Hubtel, with at most
+    `max_workers` calls in flight. Concurrency is halved whenever most calls of a round fail and
+    grows back one by one on healthy rounds. The run stops as soon as the circuit breaker opens.
+    Returns the number of transactions checked.
+    """
+    now = timezone.now()
+    pending = claim_stale_transactions(now, limit=batch_size)
+    if not pending:
+        return 0
+
+    service = HubtelPaymentService()
+    workers = max_workers
+    checked = 0
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        while pending:
+            chunk, pending = pending[:workers], pending[workers:]
+            outcomes = list(executor.map(lambda args: _check_status(service, *args), chunk))
+
+            results = {}
+            failures = 0
+            circuit_open = False
+            for client_reference, resp, error in outcomes:
+                if isinstance(error, HubtelUnavailable):
+                    circuit_open = True
+                    continue  # never reached Hubtel, not an attempt
+                if error is not None:
+                    failures += 1
+                results[client_reference] = resp
+
+            if results:
+                checked += apply_status_checks(results, timezone.now())
+
+            if circuit_open:
+                logger.warning('Hubtel status reconciliation stopped, circuit is open')
+                break
+
+            if failures * 2 > len(chunk):
+                workers = max(1, workers // 2)
+            elif workers < max_workers:
+                workers += 1
+
+    logger.info('Reconciled %s pending Hubtel transactions', checked)
+    return checked
@@ -1,7 +1,8 @@
 import json
 import logging
 from django.conf import settings
-from django.http import JsonResponse, HttpResponse, HttpResponseBadRequest
+from django.db import transaction
+from django.http import JsonResponse, HttpResponse, HttpResponseBadRequest, QueryDict
 from django.views.decorators.csrf import csrf_exempt
 from rest_framework.views import APIView
 from rest_framework.response import Response
@@ -9,8 +10,10 @@ from rest_framework import status, permissions
 from rest_framework.decorators import api_view, permission_classes
 
 from .serializers import InitiatePaymentSerializer, PaymentTransactionSerializer
-from .models import PaymentTransaction
-from .services import HubtelPaymentService
+from .models import HubtelCallback, PaymentTransaction
+from .services import HubtelPaymentService, HubtelUnavailable
+from .tasks import process_hubtel_callbacks
+from .utils import get_client_reference
 
 logger = logging.getLogger(__name__)
 
@@ -44,6 +47,12 @@ class InitiatePaymentAPIView(APIView):
         service = HubtelPaymentService()
         try:
             resp = service.initiate_payment(client_reference=client_ref, msisdn=data['msisdn'], amount=str(data['amount']), channel=data['channel'], customer_name=data.get('customer_name'), customer_email=data.get('customer_email'))
+        except HubtelUnavailable as e:
+            # Hubtel was never called, nothing can be pending on the provider side
+            tx.status = PaymentTransaction.STATUS_FAILED
+            tx.raw_initial_response = {'error': str(e)}
+            tx.save()
+            return Response({'detail': 'Payment provider is temporarily unavailable, try again later'}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
         except Exception as e:
             logger.exception('Hubtel initiate error')
             tx.status = PaymentTransaction.STATUS_UNKNOWN
@@ -64,53 +73,36 @@ class InitiatePaymentAPIView(APIView):
 @api_view(['POST'])
 @permission_classes([permissions.AllowAny])
 def hubtel_callback(request):
+    """
+    Stores the callback in the inbox and acknowledges it at once, the status
+    transition is applied by the process_hubtel_callbacks worker.
+    """
     try:
         payload = request.data if hasattr(request, 'data') else json.loads(request.body)
     except Exception:
         return HttpResponseBadRequest('Invalid JSON')
+    if isinstance(payload, QueryDict):  # form-encoded callbacks, one value per field
+        payload = payload.dict()
 
     service = HubtelPaymentService()
     if not service.verify_callback(payload):
         return HttpResponseBadRequest('Invalid callback payload')
 
-    client_ref = payload.get('ClientReference') or payload.get('clientReference') or payload.get('client_reference')
+    client_ref = get_client_reference(payload)
     if not client_ref:
         return HttpResponseBadRequest('Missing ClientReference')
 
-    try:
-        tx = PaymentTransaction.objects.get(client_reference=client_ref)
-    except PaymentTransaction.DoesNotExist:
-        return HttpResponseBadRequest('Unknown ClientReference')
-
-    # prevent double-processing
-    if tx.status == PaymentTransaction.STATUS_SUCCESS:
-        return HttpResponse('Already processed', status=200)
-
-    tx.raw_callback_response = payload
-
-    # Hubtel commonly uses fields like 'Status' or 'ResponseCode'
-    status_field = payload.get('Status') or payload.get('status') or payload.get('ResponseCode') or payload.get('responseCode')
-    # interpret
-    if status_field in ['0000', '200', 'Success', 'success']:
-        tx.status = PaymentTransaction.STATUS_SUCCESS
-    elif status_field in ['0001', 'Pending', 'pending']:
-        tx.status = PaymentTransaction.STATUS_PENDING
-    else:
-        # map common Hubtel failure codes
-        resp_code = str(payload.get('ResponseCode') or payload.get('responseCode') or '')
-        if resp_code in ['4000', '4101', '4103']:
-            tx.status = PaymentTransaction.STATUS_FAILED
-        else:
-            tx.status = PaymentTransaction.STATUS_UNKNOWN
-
-    tx.hubtel_transaction_id = tx.hubtel_transaction_id or payload.get('TransactionId') or payload.get('transactionId')
-    tx.external_transaction_id = tx.external_transaction_id or payload.get('ExternalId') or payload.get('externalId')
-    tx.save()
+    HubtelCallback.objects.create(client_reference=client_ref, payload=payload)
+    transaction.on_commit(process_hubtel_callbacks.delay)
 
     return HttpResponse(status=200)
 
 
 class PaymentStatusAPIView(APIView):
+    """
+    Pure database read, stale pending transactions are reconciled with Hubtel
+    by the reconcile_pending_hubtel_transactions beat task.
+    """
     permission_classes = [permissions.AllowAny]
 
     def get(self, request, client_reference):
@@ -119,26 +111,5 @@ class PaymentStatusAPIView(APIView):
         except PaymentTransaction.DoesNotExist:
             return Response({'detail': 'Not found'}, status=status.HTTP_404_NOT_FOUND)
 
-        # If still pending and older than 5 minutes, call status API
-        from django.utils import timezone
-        if tx.status == PaymentTransaction.STATUS_PENDING and (timezone.now() - tx.created_at).total_seconds() > 300:
-            service = HubtelPaymentService()
-            try:
-                resp = service.check_status(client_reference=client_reference, hubtel_transaction_id=tx.hubtel_transaction_id)
-            except Exception:
-                return Response({'detail': 'Failed to reach Hubtel status service'}, status=status.HTTP_502_BAD_GATEWAY)
-
-            tx.raw_callback_response = tx.raw_callback_response or {}
-            tx.raw_callback_response.update({'status_check': resp})
-            # interpret response if possible
-            code = resp.get('ResponseCode') or resp.get('responseCode') or resp.get('Status')
-            if code in ['0000', 'Success', 'success']:
-                tx.status = PaymentTransaction.STATUS_SUCCESS
-            elif code in ['0001', 'Pending', 'pending']:
-                tx.status = PaymentTransaction.STATUS_PENDING
-            else:
-                tx.status = PaymentTransaction.STATUS_UNKNOWN
-            tx.save()
-
         serializer = PaymentTransactionSerializer(tx)
         return Response(serializer.data)
@@ -152,9 +152,11 @@ class OrderStockReservationStatus(models.TextChoices):
         FAILED: Stock reservation has failed due to insufficient stock.
         NOT_REQUIRED: Stock reservation is not required.
         DISPATCHED: Stock has been dispatched for the order.
+        PENDING: The order is queued for the reservation worker.
     """
     RESERVED = 'RESERVED', _('Reserved')
     RELEASED = 'RELEASED', _('Released') # Re-adjust stock after order is cancelled
     FAILED = 'FAILED', _('Failed') # If failed, that is mean stock is insufficient to fulfill the order, have to fixed it before proceed
     NOT_REQUIRED = 'NOT_REQUIRED', _('Not Required') # DO NOTHING IF NOT REQUIRED, NO NEED VALIDATION
-    DISPATCHED = 'DISPATCHED', _('Dispatched')
\ No newline at end of file
+    DISPATCHED = 'DISPATCHED', _('Dispatched')
+    PENDING = 'PENDING', _('Pending') # Queued, see nxtbn.warehouse.utils.reserve_pending_orders
\ No newline at end of file
@@ -5,6 +5,7 @@ from django.db import transaction
 
 
 from nxtbn.discount.api.dashboard.serializers import PromoCodeBasicSerializer
+from nxtbn.discount.utils import release_promo_code_redemption
 from nxtbn.order import AddressType, OrderChargeStatus, OrderStatus, PaymentTerms, ReturnReceiveStatus, ReturnStatus
 from nxtbn.order.api.storefront.serializers import AddressSerializer
 from nxtbn.order.models import Address, Order, OrderDeviceMeta, OrderLineItem, ReturnLineItem, ReturnRequest
@@ -229,6 +230,7 @@ class OrderStatusUpdateSerializer(serializers.ModelSerializer):
     def update(self, instance, validated_data):
         if validated_data.get('status') == OrderStatus.CANCELLED:
             release_stock(instance)
+            release_promo_code_redemption(instance)
 
         if validated_data.get('status') == OrderStatus.PACKED:
             deduct_reservation_on_packed_for_dispatch(instance)
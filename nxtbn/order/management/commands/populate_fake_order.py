@@ -1,86 +1,43 @@
 import random
-from django.core.management.base import BaseCommand
-from faker import Faker
-from django.utils import timezone
-from django.contrib.auth import get_user_model
-from nxtbn.order import OrderStatus
-from nxtbn.payment import PaymentStatus
-from nxtbn.product.models import Product, ProductVariant
-from nxtbn.order.models import Order, OrderLineItem, Address
-from nxtbn.payment.models import Payment, PaymentMethod
 
-fake = Faker()
+from django.core.management.base import BaseCommand, CommandError
 
+from nxtbn.core.seeding import DatasetSeeder
 
-class Command(BaseCommand):
-    help = 'Generate fake orders for selected products'
-    
-    def handle(self, *args, **options):
-        selected_products = Product.objects.filter(variants__isnull=False).distinct().order_by('?')[:5]
-        User = get_user_model()
-
-        for product in selected_products:
-            default_variant = product.variants.first()  
-            if not default_variant:
-                self.stdout.write(self.style.WARNING(f"Skipping product '{product.name}' because it doesn't have any variants defined"))
-                continue
-
-            shipping_address = Address.objects.create(
-                first_name=fake.first_name(),
-                last_name=fake.last_name(),
-                street_address=fake.street_address(),
-                city=fake.city(),
-                country=fake.country(),
-                phone_number=fake.phone_number(),
-                email=fake.email()
-            )
-            billing_address = Address.objects.create(
-                first_name=fake.first_name(),
-                last_name=fake.last_name(),
-                street_address=fake.street_address(),
-                city=fake.city(),
-                country=fake.country(),
-                phone_number=fake.phone_number(),
-                email=fake.email()
-            )
-
-            random_user = User.objects.order_by('?').first()
-
-            payment_status = random.choice(PaymentStatus.values) 
-            paid_at = timezone.now() if payment_status == PaymentStatus.CAPTURED else None
-
-            # Convert price to sub-units (e.g., cents)
-            variant_price_subunit = int(default_variant.price * 100)
 
-            order = Order.objects.create(
-                user=random_user, 
-                supplier=product.supplier,
-                # payment_method=random.choice(PaymentMethod.values),  
-                shipping_address=shipping_address,
-                billing_address=billing_address,
-                total_price=variant_price_subunit,  # Save price in sub-units
-                status=random.choice(OrderStatus.values) 
-            )
-
-            OrderLineItem.objects.create(
-                order=order,
-                variant=default_variant,
-                quantity=random.randint(1, 5),  
-                price_per_unit=variant_price_subunit,  # Price per unit in sub-units
-                total_price=variant_price_subunit  # Total price in sub-units
-            )
-
-            payment_status = random.choice(PaymentStatus.values) 
-            paid_at = timezone.now() if payment_status == PaymentStatus.CAPTURED else None
-
-            payment = Payment.objects.create(
-                order=order,
-                payment_method=random.choice([PaymentMethod.CREDIT_CARD, PaymentMethod.PAYPAL]),  
-                payment_amount=order.total_price,  # Payment amount in sub-units
-                payment_status=payment_status,
-                paid_at=paid_at,
-            )
-
-            self.stdout.write(self.style.SUCCESS(f"Fake order created for product '{product.name}'. Payment {'successful' if payment_status == PaymentStatus.CAPTURED else 'failed'}"))
+class Command(BaseCommand):
+    help = (
+        'Generate fake orders with line items and payments over the existing products, in batches and '
+        'optionally on several processes. The same --seed generates the same orders.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--num_orders', type=int, default=5, help='Number of fake orders to create')
+        parser.add_argument('--num_customers', type=int, default=0, help='Fake customers to create first, orders are placed by all customers')
+        parser.add_argument('--seed', type=int, help='Random seed, a new one is picked and printed when omitted')
+        parser.add_argument('--workers', type=int, default=1, help='Processes inserting the orders')
+        parser.add_argument('--batch-size', type=int, default=2000)
+        parser.add_argument('--no-copy', action='store_true', help='Insert with bulk_create rather than COPY on PostgreSQL')
 
-        self.stdout.write(self.style.SUCCESS('Fake orders generation completed'))
+    def handle(self, *args, **options):
+        seed = options['seed'] if options['seed'] is not None else random.randrange(10 ** 6)
+        self.stdout.write(f'Seed: {seed}')
+
+        seeder = DatasetSeeder(
+            seed=seed,
+            batch_size=options['batch_size'],
+            use_copy=not options['no_copy'],
+            workers=options['workers'],
+            log=self.stdout.write,
+        )
+        if options['num_customers']:
+            seeder.seed_customers(options['num_customers'])
+        try:
+            sizes = seeder.seed_orders(options['num_orders'])
+        except ValueError as e:
+            raise CommandError(f'{e}, run fake_populate_product or pass --num_customers') from e
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Fake orders generation completed: {sizes['orders']} orders, "
+            f"{sizes['line_items']} line items, {sizes['payments']} payments"
+        ))
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.11 on 2026-10-19 09:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('order', '0040_alter_order_reservation_status'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='order',
+            name='reservation_status',
+            field=models.CharField(choices=[('RESERVED', 'Reserved'), ('RELEASED', 'Released'), ('FAILED', 'Failed'), ('NOT_REQUIRED', 'Not Required'), ('DISPATCHED', 'Dispatched'), ('PENDING', 'Pending')], default='NOT_REQUIRED', max_length=20),
+        ),
+    ]
@@ -2,6 +2,7 @@ from rest_framework import serializers
 from rest_framework.exceptions import PermissionDenied
 
 from nxtbn.discount.models import PromoCode
+from nxtbn.payment import PaymentMethod
 from nxtbn.product.models import Product
 from nxtbn.users import UserRole
 
@@ -38,6 +39,7 @@ class OrderEstimateSerializer(serializers.Serializer):
     variants = serializers.ListSerializer(child=VariantQuantitySerializer(), required=True)
     customer_id = serializers.IntegerField(required=False)
     note = serializers.CharField(required=False)
+    preferred_payment_method = serializers.ChoiceField(choices=PaymentMethod.choices, required=False)
 
     def validate_variants(self, value):
         if len(value) == 0:
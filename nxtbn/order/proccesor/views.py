@@ -9,7 +9,13 @@ from nxtbn.core import CurrencyTypes
 from nxtbn.core.utils import apply_exchange_rate, build_currency_amount
 from nxtbn.discount import PromoCodeType
 from nxtbn.discount.models import PromoCode
-from nxtbn.order import AddressType, OrderAuthorizationStatus, OrderChargeStatus, OrderStatus
+from nxtbn.discount.utils import (
+    PromoCodeRedemptionError,
+    PromoCodeRule,
+    check_promo_code,
+    reserve_promo_code_redemption,
+)
+from nxtbn.order import AddressType, OrderAuthorizationStatus, OrderChargeStatus, OrderStatus, OrderStockReservationStatus
 from nxtbn.order.proccesor.serializers import OrderEstimateSerializer
 from nxtbn.order.models import Address, Order, OrderDeviceMeta, OrderLineItem
 from nxtbn.product.models import Product, ProductVariant
@@ -26,7 +32,7 @@ from nxtbn.core.signal_initiators import order_created
 from nxtbn.users import UserRole
 
 from nxtbn.order.utils import parse_user_agent, validate_variant_with_stocks
-from nxtbn.warehouse.tasks import handle_stock_reserve
+from nxtbn.warehouse.tasks import handle_stock_reserve, process_pending_reservations
 
 def get_shipping_rate_instance(shipping_method_id, address, total_weight):
         if not shipping_method_id:
@@ -236,30 +242,23 @@ class DiscountCalculator:
         return promocode
     
     def get_promocode_instance(self, promocode):
-        if promocode:
+        if not promocode:
+            return None
+
+        # Estimation and order creation both ask for the promo code, evaluate it once
+        cached = getattr(self, '_promocode_check', None)
+        if cached and cached[0] == promocode:
+            promocode_instance, failed_rules = cached[1]
+        else:
             variant_aliases = [v['alias'] for v in self.validated_data['variants']]
-            try:
-                promocode = PromoCode.objects.get(code=promocode.upper())
-                if not promocode.is_active:
-                    raise serializers.ValidationError("Promo code is not active.")
-                if not promocode.is_valid_customer(self.customer):
-                    raise serializers.ValidationError("This promo code is restricted to specific customers and is not valid for you.")
-                if not promocode.is_valid_product(variant_aliases):
-                    raise serializers.ValidationError("Promo code is not valid for one or more of the products in your cart.")
-                if not promocode.is_valid_min_purchase(self.customer):
-                    raise serializers.ValidationError("Promo code is not valid for your purchase amount.")
-                if not promocode.is_valid_redemption_limit(self.customer):
-                    raise serializers.ValidationError("Promo code has reached its redemption limit.")
-                if not promocode.is_valid_usage_limit_per_customer(self.customer):
-                    raise serializers.ValidationError("Promo code has reached its usage limit for you.")
-                if not promocode.is_valid_new_customer(self.customer):
-                    raise serializers.ValidationError("Promo code is only valid for new customers.")
-                
-                
-                return promocode
-            except PromoCode.DoesNotExist:
-                raise serializers.ValidationError("Promo code does not exist.")
-        return None
+            promocode_instance, failed_rules = check_promo_code(promocode, self.customer, variant_aliases)
+            self._promocode_check = (promocode, (promocode_instance, failed_rules))
+
+        if promocode_instance is None:
+            raise serializers.ValidationError("Promo code does not exist.")
+        if failed_rules:
+            raise serializers.ValidationError([PromoCodeRule.MESSAGES[rule] for rule in failed_rules])
+        return promocode_instance
 
 
 class OrderCreator:
@@ -324,6 +323,12 @@ class OrderCreator:
                 'order_source': self.order_source,
                 'note': self.validated_data.get('note', ''),
             }
+            if self.validated_data.get('preferred_payment_method'):
+                # chosen at checkout, the model default (cash on delivery) otherwise; decides whether the
+                # stock reservation can expire (see STOCK_RESERVATION_TTL_EXEMPT_PAYMENT_METHODS)
+                order_data['preferred_payment_method'] = self.validated_data['preferred_payment_method']
+            if self.reserve_stock and settings.STOCK_RESERVATION_WORKER:
+                order_data['reservation_status'] = OrderStockReservationStatus.PENDING # queued for the reservation worker
 
             # Create Order instance
             order = Order.objects.create(**order_data)
@@ -349,8 +354,18 @@ class OrderCreator:
                     OrderDeviceMeta.objects.create(order=order, **user_agent_data)
                 except Exception as e:
                     pass
+
+            # Last write before the commit: the promo code row stays locked from here until the
+            # commit only, the redemption is released with the rollback if the order fails
+            if promocode:
+                try:
+                    reserve_promo_code_redemption(promocode, self.customer, order)
+                except PromoCodeRedemptionError as e:
+                    raise serializers.ValidationError(str(e))
             
-            if self.reserve_stock:
+            if self.reserve_stock and settings.STOCK_RESERVATION_WORKER:
+                transaction.on_commit(process_pending_reservations.delay)
+            elif self.reserve_stock:
                 handle_stock_reserve.delay(order.id)
                 
             return order
@@ -0,0 +1,145 @@
+from unittest import mock
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Sum
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.exceptions import ValidationError
+from rest_framework.test import APIClient
+
+from nxtbn.home.base_tests import BaseTestCase
+from nxtbn.order import OrderStockReservationStatus
+from nxtbn.order.models import Order, OrderLineItem
+from nxtbn.product.tests import ProductVariantFactory
+from nxtbn.users import UserRole
+from nxtbn.users.tests import UserFactory
+from nxtbn.warehouse.models import Stock, StockReservation
+from nxtbn.warehouse.tests import StockFactory, WarehouseFactory
+from nxtbn.warehouse.utils import deduct_reservation_on_packed_for_dispatch, release_stock, reserve_stock
+
+
+class OrderReservationBulkReleaseTest(BaseTestCase):
+    """
+    Release and dispatch remove all the reservations of an order at once: every line is
+    reserved over two warehouses here, the small one first (reserve_stock takes the stocks
+    by increasing quantity).
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.small = WarehouseFactory()
+        self.large = WarehouseFactory()
+
+    def create_order(self, lines, quantity=5):
+        order = Order.objects.create(
+            user=UserFactory(),
+            currency=settings.BASE_CURRENCY,
+            customer_currency=settings.BASE_CURRENCY,
+        )
+        for _ in range(lines):
+            variant = ProductVariantFactory(track_inventory=True)
+            StockFactory(warehouse=self.small, product_variant=variant, quantity=3, reserved=0)
+            StockFactory(warehouse=self.large, product_variant=variant, quantity=10, reserved=0)
+            OrderLineItem.objects.create(
+                order=order,
+                variant=variant,
+                quantity=quantity,
+                price_per_unit=variant.price,
+                total_price=100,
+                currency=settings.BASE_CURRENCY,
+                customer_currency=settings.BASE_CURRENCY,
+            )
+        reserve_stock(order)
+        self.assertEqual(order.reservation_status, OrderStockReservationStatus.RESERVED)
+        return order
+
+    def stock_totals(self, order):
+        return Stock.objects.filter(product_variant__orderlineitems__order=order).aggregate(
+            quantity=Sum('quantity'), reserved=Sum('reserved'),
+        )
+
+    def test_release(self):
+        order = self.create_order(4)
+        self.assertEqual(self.stock_totals(order), {'quantity': 52, 'reserved': 20})
+
+        release_stock(order)
+
+        self.assertEqual(self.stock_totals(order), {'quantity': 52, 'reserved': 0})
+        self.assertFalse(StockReservation.objects.filter(order_line__order=order).exists())
+        self.assertEqual(Order.objects.get(pk=order.pk).reservation_status, OrderStockReservationStatus.RELEASED)
+
+    def test_dispatch(self):
+        order = self.create_order(4)
+
+        deduct_reservation_on_packed_for_dispatch(order)
+
+        self.assertEqual(self.stock_totals(order), {'quantity': 32, 'reserved': 0})
+        self.assertFalse(StockReservation.objects.filter(order_line__order=order).exists())
+        self.assertEqual(Order.objects.get(pk=order.pk).reservation_status, OrderStockReservationStatus.DISPATCHED)
+
+    def test_reserved_stock_of_other_purposes_is_kept(self):
+        order = self.create_order(1)
+        stock = Stock.objects.get(warehouse=self.large, product_variant__orderlineitems__order=order)
+        Stock.objects.filter(pk=stock.pk).update(reserved=stock.reserved + 4)  # e.g. blocked for quality control
+
+        release_stock(order)
+
+        self.assertEqual(Stock.objects.get(pk=stock.pk).reserved, 4)
+
+    def test_second_release_of_the_same_order_changes_nothing(self):
+        order = self.create_order(2)
+        stale = Order.objects.get(pk=order.pk)  # e.g. loaded by a concurrent request
+
+        release_stock(order)
+        release_stock(stale)
+
+        self.assertEqual(self.stock_totals(order), {'quantity': 26, 'reserved': 0})
+
+    def test_release_is_rolled_back_when_reservations_vanish(self):
+        order = self.create_order(2)
+
+        with mock.patch('django.db.models.query.QuerySet.delete', return_value=(0, {})):
+            with self.assertRaises(ValidationError):
+                release_stock(order)
+
+        self.assertEqual(self.stock_totals(order), {'quantity': 26, 'reserved': 10})
+        self.assertEqual(Order.objects.get(pk=order.pk).reservation_status, OrderStockReservationStatus.RESERVED)
+
+    def test_dispatch_fails_without_enough_reserved_stock(self):
+        order = self.create_order(2)
+        Stock.objects.filter(warehouse=self.large, product_variant__orderlineitems__order=order).update(reserved=1)
+
+        with self.assertRaises(ValidationError):
+            deduct_reservation_on_packed_for_dispatch(order)
+
+        self.assertEqual(StockReservation.objects.filter(order_line__order=order).count(), 4)
+        self.assertEqual(self.stock_totals(order), {'quantity': 26, 'reserved': 8})
+
+    def test_query_count_does_not_grow_with_lines(self):
+        counts = []
+        for lines in (2, 20):
+            order = self.create_order(lines)
+            with CaptureQueriesContext(connection) as queries:
+                deduct_reservation_on_packed_for_dispatch(order)
+            counts.append(len(queries))
+        self.assertEqual(counts[0], counts[1])
+
+    def test_release_after_merged_reservation(self):
+        order = self.create_order(1)
+        line = order.line_items.get()
+        reservation = StockReservation.objects.get(order_line=line, stock__warehouse=self.small)
+
+        client = APIClient()
+        client.force_authenticate(UserFactory(is_staff=True, is_superuser=True, role=UserRole.ADMIN))
+        response = client.put(
+            reverse('stock-reservation-detail', args=[reservation.pk]), {'destination': self.large.pk}, format='json',
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(StockReservation.objects.get(order_line=line).quantity, 5)
+
+        release_stock(order)
+
+        self.assertEqual(self.stock_totals(order), {'quantity': 13, 'reserved': 0})
+        self.assertFalse(StockReservation.objects.filter(order_line=line).exists())
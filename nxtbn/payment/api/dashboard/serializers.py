@@ -1,12 +1,14 @@
 from django.utils.translation import gettext_lazy as _
 from rest_framework import serializers
+from rest_framework.exceptions import ValidationError
 from django.db import transaction
 
 from nxtbn.core.utils import to_currency_subunit
-from nxtbn.order import OrderAuthorizationStatus, OrderChargeStatus, OrderStatus
+from nxtbn.order import OrderAuthorizationStatus, OrderChargeStatus, OrderStatus, OrderStockReservationStatus
 from nxtbn.order.models import Order
 from nxtbn.payment import PaymentMethod
 from nxtbn.payment.models import Payment
+from nxtbn.warehouse.utils import reserve_stock
 
 class RefundSerializer(serializers.ModelSerializer):
     amount = serializers.DecimalField(write_only=True, max_digits=4, decimal_places=2)
@@ -62,40 +64,53 @@ class PaymentCreateSerializer(serializers.ModelSerializer):
     
     def create(self, validated_data):
         forice_it = validated_data.pop('force_it', False)
-        order = validated_data.get('order')
 
-        if order.status == OrderStatus.CANCELLED:
-            raise serializers.ValidationError(_("Cancelled orders cannot be paid for."))
+        with transaction.atomic():
+            # locked, so the reservation expiry sweep can't release the stock while the payment is recorded
+            order = Order.objects.select_for_update().get(pk=validated_data['order'].pk)
+            validated_data['order'] = order
 
-        if validated_data['payment_method'] == PaymentMethod.CASH_ON_DELIVERY:
-            if order.status != OrderStatus.DELIVERED:
-                raise serializers.ValidationError(_("If cash on delivery payment method is selected, the order must be delivered first."))
+            if order.status == OrderStatus.CANCELLED:
+                raise serializers.ValidationError(_("Cancelled orders cannot be paid for."))
 
-        order_total_subunit = order.total_price
+            if validated_data['payment_method'] == PaymentMethod.CASH_ON_DELIVERY:
+                if order.status != OrderStatus.DELIVERED:
+                    raise serializers.ValidationError(_("If cash on delivery payment method is selected, the order must be delivered first."))
 
-        validated_data['user'] = order.user
-        validated_data['currency'] = order.currency
-        validated_data['payment_amount'] =  to_currency_subunit(validated_data['payment_amount'], order.currency)
-        validated_data['is_successful'] = True
+            order_total_subunit = order.total_price
 
-    
-        if validated_data['payment_amount'] < order_total_subunit:
-            if not forice_it:
-                raise serializers.ValidationError(_("Payment amount is less than the total order price."))
-        
-            order.charge_status = OrderChargeStatus.PARTIAL
-            order.authorization_status = OrderAuthorizationStatus.PARTIAL
+            validated_data['user'] = order.user
+            validated_data['currency'] = order.currency
+            validated_data['payment_amount'] =  to_currency_subunit(validated_data['payment_amount'], order.currency)
+            validated_data['is_successful'] = True
 
-        if validated_data['payment_amount'] > order_total_subunit:
-            if not forice_it:
-                raise serializers.ValidationError(_("Payment amount exceeds the total order price."))
-            order.charge_status = OrderChargeStatus.OVERCHARGED
         
-        if validated_data['payment_amount'] == order_total_subunit:
-            order.charge_status = OrderChargeStatus.FULL
-            order.authorization_status = OrderAuthorizationStatus.FULL
-
-        payment = Payment.objects.create(**validated_data)
-        order.save()
-
-        return payment
\ No newline at end of file
+            if validated_data['payment_amount'] < order_total_subunit:
+                if not forice_it:
+                    raise serializers.ValidationError(_("Payment amount is less than the total order price."))
+            
+                order.charge_status = OrderChargeStatus.PARTIAL
+                order.authorization_status = OrderAuthorizationStatus.PARTIAL
+
+            if validated_data['payment_amount'] > order_total_subunit:
+                if not forice_it:
+                    raise serializers.ValidationError(_("Payment amount exceeds the total order price."))
+                order.charge_status = OrderChargeStatus.OVERCHARGED
+            
+            if validated_data['payment_amount'] == order_total_subunit:
+                order.charge_status = OrderChargeStatus.FULL
+                order.authorization_status = OrderAuthorizationStatus.FULL
+
+            if order.reservation_status == OrderStockReservationStatus.RELEASED:
+                # the unpaid order's hold expired, its stock is taken again or the payment is refused
+                try:
+                    reserve_stock(order)
+                except ValidationError as e:
+                    raise serializers.ValidationError(
+                        _("The stock reservation of this order expired and can't be renewed: %s") % e.detail[0]
+                    )
+
+            payment = Payment.objects.create(**validated_data)
+            order.save()
+
+        return payment
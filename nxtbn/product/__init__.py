@@ -41,3 +41,29 @@ class StockStatus(models.TextChoices):
 
     IN_STOCK = 'IN_STOCK', 'In Stock'
     OUT_OF_STOCK = 'OUT_OF_STOCK', 'Out of Stock'
+
+class JobStatus(models.TextChoices):
+    """Defines the lifecycle of a background job over products.
+
+    - 'PENDING': Queued, not started yet.
+    - 'RUNNING': Being processed by a worker.
+    - 'COMPLETED': Finished, some rows may have failed.
+    - 'FAILED': Stopped by an error.
+    """
+
+    PENDING = 'PENDING', 'Pending'
+    RUNNING = 'RUNNING', 'Running'
+    COMPLETED = 'COMPLETED', 'Completed'
+    FAILED = 'FAILED', 'Failed'
+
+class BulkJobAction(models.TextChoices):
+    DELETE = 'DELETE', 'Delete'
+    STATUS_UPDATE = 'STATUS_UPDATE', 'Status update'
+
+class CatalogJobKind(models.TextChoices):
+    IMPORT = 'IMPORT', 'Import'
+    EXPORT = 'EXPORT', 'Export'
+
+class CatalogFileFormat(models.TextChoices):
+    CSV = 'csv', 'CSV'
+    JSONL = 'jsonl', 'JSON Lines'
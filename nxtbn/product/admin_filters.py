@@ -1,4 +1,5 @@
 import django_filters as filters
+from nxtbn.product.category_tree import CategoryTreeFilter
 from nxtbn.product.models import Category, CategoryTranslation, Collection, CollectionTranslation, Product, ProductTag, ProductTagTranslation, ProductTranslation, Supplier
 from django.db.models import Q
 
@@ -9,6 +10,7 @@ class ProductFilter(filters.FilterSet):
     summary = filters.CharFilter(lookup_expr='icontains')
     description = filters.CharFilter(lookup_expr='icontains')
     category = filters.ModelChoiceFilter(field_name='category', queryset=Category.objects.all())
+    category_tree = CategoryTreeFilter(field_name='category')
     category_name = filters.CharFilter(field_name='category__name', lookup_expr='icontains')
     supplier = filters.ModelChoiceFilter(field_name='supplier', queryset=Supplier.objects.all())
     brand = filters.CharFilter(lookup_expr='icontains')
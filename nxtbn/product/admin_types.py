@@ -1,5 +1,6 @@
 import graphene
 from graphene_django.types import DjangoObjectType
+from nxtbn.product.category_tree import category_tree
 from nxtbn.product.models import Category, CategoryTranslation, Collection, CollectionTranslation, ProductTag, ProductTagTranslation, ProductTranslation, Product, ProductVariant, ProductVariantTranslation, Supplier, SupplierTranslation
 from graphene_django.filter import DjangoFilterConnectionField
 from graphene import relay
@@ -129,7 +130,7 @@ class CategoryType(DjangoObjectType):
         filterset_class = CategoryFilter
 
     def resolve_child_info(self, info):
-        has_child = self.subcategories.exists()
+        has_child = bool(category_tree().get_children(self.pk))
         return CategoryChildInfoType(has_child=has_child)
     
 
@@ -169,7 +170,7 @@ class ProductVariantAdminType(DjangoObjectType):
         return self.humanize_total_price()
     
     def resolve_variant_thumbnail(self, info):
-        return self.variant_thumbnail()
+        return self.variant_thumbnail(info.context)
     class Meta:
         model = ProductVariant
         fields = (
@@ -206,7 +207,7 @@ class CategoryHierarchicalType(DjangoObjectType):
     children = graphene.List(lambda: CategoryHierarchicalType)
     
     def resolve_children(self, info):
-        return self.subcategories.all()
+        return category_tree().get_children(self.pk)
     
     class Meta:
         model = Category
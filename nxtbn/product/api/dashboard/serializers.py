@@ -8,7 +8,9 @@ from rest_framework.exceptions import ValidationError
 from nxtbn.core import PublishableStatus
 from nxtbn.core.utils import normalize_amount_currencywise
 from nxtbn.filemanager.api.dashboard.serializers import ImageSerializer
-from nxtbn.product.models import CategoryTranslation, CollectionTranslation, Color, Product, Category, Collection, ProductTag, ProductTagTranslation, ProductTranslation, ProductType, ProductVariant, Supplier, SupplierTranslation
+from nxtbn.product import CatalogFileFormat
+from nxtbn.product.category_tree import category_tree
+from nxtbn.product.models import BulkJob, CatalogJob, CategoryTranslation, CollectionTranslation, Color, Product, Category, Collection, ProductTag, ProductTagTranslation, ProductTranslation, ProductType, ProductVariant, Supplier, SupplierTranslation
 from nxtbn.tax.models import TaxClass
 from nxtbn.filemanager.models import Image
 
@@ -62,7 +64,7 @@ class RecursiveCategorySerializer(serializers.ModelSerializer):
         fields = ('id', 'name', 'description', 'children')
 
     def get_children(self, obj):
-        children = obj.subcategories.all()
+        children = category_tree().get_children(obj.pk)
         return RecursiveCategorySerializer(children, many=True).data
 
 class CollectionSerializer(serializers.ModelSerializer):
@@ -145,7 +147,7 @@ class ProductSerializer(serializers.ModelSerializer):
         return obj.product_thumbnail(self.context['request'])
     
     def get_total_variant(self, obj):
-        return len(obj.variants.all())
+        return obj.variant_count
     
 
 
@@ -599,4 +601,34 @@ class SupplierNameSerializer(serializers.ModelSerializer):
         )
 
 
+class CatalogJobSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = CatalogJob
+        fields = (
+            'id', 'kind', 'file_format', 'status', 'file', 'processed_rows', 'created_rows', 'updated_rows',
+            'failed_rows', 'errors', 'error_message', 'created_at', 'started_at', 'finished_at',
+        )
+        read_only_fields = fields
 
+
+class BulkJobSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = BulkJob
+        fields = (
+            'id', 'action', 'status', 'params', 'total_items', 'processed_items', 'failed_items', 'failures',
+            'error_message', 'created_at', 'started_at', 'finished_at',
+        )
+        read_only_fields = fields
+
+
+class CatalogImportSerializer(serializers.Serializer):
+    file = serializers.FileField()
+    file_format = serializers.ChoiceField(choices=CatalogFileFormat.choices, required=False)
+
+    def validate(self, attrs):
+        if 'file_format' not in attrs:  # from the extension
+            extension = attrs['file'].name.rsplit('.', 1)[-1].lower()
+            if extension not in CatalogFileFormat.values:
+                raise ValidationError({'file_format': _('Pass file_format or upload a .csv or .jsonl file.')})
+            attrs['file_format'] = extension
+        return attrs
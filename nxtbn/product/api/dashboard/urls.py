@@ -21,9 +21,15 @@ from nxtbn.product.api.dashboard.views import (
     TaxClassView,
     BulkProductStatusUpdateAPIView,
     BulkProductDeleteAPIView,
+    BulkJobListView,
+    BulkJobDetailView,
     ProductVariants,
     InventoryListView,
-    SupplierModelViewSet
+    SupplierModelViewSet,
+    CatalogImportView,
+    CatalogExportView,
+    CatalogJobListView,
+    CatalogJobDetailView,
 )
 
 register_converter(IdOrNoneConverter, 'id_or_none')
@@ -53,8 +59,14 @@ urlpatterns = [
     path('tax-class/', TaxClassView.as_view(), name='tax-class'),
     path('products/update/bulk/', BulkProductStatusUpdateAPIView.as_view(), name='bulk-product-status-update'),
     path('products/delete/bulk/', BulkProductDeleteAPIView.as_view(), name='bulk-product-status-delete'),
+    path('products/bulk-jobs/', BulkJobListView.as_view(), name='bulk-job-list'),
+    path('products/bulk-jobs/<int:pk>/', BulkJobDetailView.as_view(), name='bulk-job-detail'),
     path('products-variants/', ProductVariants.as_view(), name='products-variants'),
     path('inventory/', InventoryListView.as_view(), name='product-inventory'),
+    path('catalog/import/', CatalogImportView.as_view(), name='catalog-import'),
+    path('catalog/export/', CatalogExportView.as_view(), name='catalog-export'),
+    path('catalog/jobs/', CatalogJobListView.as_view(), name='catalog-job-list'),
+    path('catalog/jobs/<int:pk>/', CatalogJobDetailView.as_view(), name='catalog-job-detail'),
 
 ]
 
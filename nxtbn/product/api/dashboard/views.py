@@ -1,13 +1,15 @@
 from django.forms import ValidationError
-from django.db.models import Sum, F, Count
+from django.db.models import Sum, F
 from django.utils.decorators import method_decorator
 from django.views.decorators.cache import cache_page
 from django.shortcuts import get_object_or_404
+from django.db import transaction
+from django.http import StreamingHttpResponse
 from rest_framework import generics, status
 from rest_framework.response import Response
 from django.utils.translation import gettext_lazy as _
 from rest_framework.permissions  import AllowAny
-from rest_framework.exceptions import APIException
+from rest_framework.exceptions import APIException, ParseError
 from rest_framework import viewsets
 
 from rest_framework import filters as drf_filters
@@ -15,12 +17,19 @@ import django_filters
 from django_filters import rest_framework as filters
 
 from nxtbn.core import PublishableStatus
-from nxtbn.core.admin_permissions import CommonPermissions, GranularPermission
+from nxtbn.core.admin_permissions import CommonPermissions, GranularPermission, IsStoreAdmin
 from nxtbn.core.enum_perms import PermissionsEnum
 from nxtbn.core.paginator import NxtbnPagination
-from nxtbn.product.models import CategoryTranslation, CollectionTranslation, Color, Product, Category, Collection, ProductTag, ProductTagTranslation, ProductTranslation, ProductType, ProductVariant, Supplier, SupplierTranslation
+from nxtbn.product import BulkJobAction, CatalogFileFormat, CatalogJobKind
+from nxtbn.product.bulk_jobs import create_bulk_job
+from nxtbn.product.catalog_io import iter_export_lines
+from nxtbn.product.category_tree import CategoryTreeFilter
+from nxtbn.product.models import BulkJob, CatalogJob, CategoryTranslation, CollectionTranslation, Color, Product, Category, Collection, ProductTag, ProductTagTranslation, ProductTranslation, ProductType, ProductVariant, Supplier, SupplierTranslation
 from nxtbn.product.api.dashboard.serializers import (
     BasicCategorySerializer,
+    BulkJobSerializer,
+    CatalogImportSerializer,
+    CatalogJobSerializer,
     ColorSerializer,
     InventorySerializer,
     ProductCreateSerializer,
@@ -40,6 +49,7 @@ from nxtbn.product.api.dashboard.serializers import (
 )
 
 
+from nxtbn.product.tasks import process_bulk_job, process_catalog_job
 from nxtbn.tax.models import TaxClass
 from nxtbn.users import UserRole
 
@@ -52,6 +62,7 @@ class ProductFilter(filters.FilterSet):
     promo_code = filters.CharFilter(field_name='promo_codes__code', lookup_expr='iexact')
     name = filters.CharFilter(field_name='name', lookup_expr='icontains')
     is_multi_variant = filters.BooleanFilter(method='filter_is_multi_variant') 
+    category_tree = CategoryTreeFilter(field_name='category')
 
     class Meta:
         model = Product
@@ -79,9 +90,9 @@ class ProductFilter(filters.FilterSet):
         Filters products based on whether they have multiple variants.
         """
         if value:  # True - filter products with more than one variant
-            return queryset.annotate(variant_count=Count('variants')).filter(variant_count__gt=1)
+            return queryset.filter(variant_count__gt=1)
         else:  # False - filter products with one or no variants
-            return queryset.annotate(variant_count=Count('variants')).filter(variant_count__lte=1)
+            return queryset.filter(variant_count__lte=1)
 
 
 
@@ -104,6 +115,8 @@ class ProductFilterMixin:
         'created_at',
         'status',
         'default_variant__price',
+        'min_price',
+        'max_price',
         'total_sales'
     ]
     filterset_class = ProductFilter
@@ -315,6 +328,7 @@ class TaxClassView(generics.ListCreateAPIView):
 
 
 class BulkProductStatusUpdateAPIView(generics.UpdateAPIView):
+    """Queues the status update of the products, returns the job to poll."""
     permission_classes = (GranularPermission, )
     model = Product
     required_perm = PermissionsEnum.CAN_BULK_PRODUCT_STATUS_UPDATE
@@ -324,14 +338,18 @@ class BulkProductStatusUpdateAPIView(generics.UpdateAPIView):
         serializer = self.get_serializer(data=request.data)
         serializer.is_valid(raise_exception=True)
 
-        product_status = serializer.validated_data['status']
-        product_ids = serializer.validated_data['product_ids']
-
-        Product.objects.filter(id__in=product_ids).update(status=product_status)
-        return Response(status=status.HTTP_204_NO_CONTENT)
+        job = create_bulk_job(
+            BulkJobAction.STATUS_UPDATE,
+            serializer.validated_data['product_ids'],
+            user=request.user,
+            params={'status': serializer.validated_data['status']},
+        )
+        transaction.on_commit(lambda: process_bulk_job.delay(job.pk))
+        return Response(BulkJobSerializer(job).data, status=status.HTTP_202_ACCEPTED)
     
 
 class BulkProductDeleteAPIView(generics.DestroyAPIView):
+    """Queues the deletion of the products given as ?product_ids=1,2,3, returns the job to poll."""
     permission_classes = (GranularPermission, )
     model = Product
     required_perm = PermissionsEnum.CAN_BULK_PRODUCT_DELETE
@@ -342,13 +360,28 @@ class BulkProductDeleteAPIView(generics.DestroyAPIView):
        
         product_ids = request.query_params.get('product_ids')
         product_ids = product_ids.split(',') if product_ids else []
-        Product.objects.filter(id__in=product_ids).delete()
-        return Response(status=status.HTTP_204_NO_CONTENT)
+        try:
+            product_ids = [int(product_id) for product_id in product_ids]
+        except ValueError:
+            raise ParseError(_('product_ids must be a comma separated list of ids.'))
 
+        job = create_bulk_job(BulkJobAction.DELETE, product_ids, user=request.user)
+        transaction.on_commit(lambda: process_bulk_job.delay(job.pk))
+        return Response(BulkJobSerializer(job).data, status=status.HTTP_202_ACCEPTED)
 
 
+class BulkJobListView(generics.ListAPIView):
+    permission_classes = (GranularPermission, )
+    serializer_class = BulkJobSerializer
+    queryset = BulkJob.objects.all()
+    pagination_class = NxtbnPagination
 
 
+class BulkJobDetailView(generics.RetrieveAPIView):
+    permission_classes = (GranularPermission, )
+    serializer_class = BulkJobSerializer
+    queryset = BulkJob.objects.all()
+
 
 class ProductVariantFilter(filters.FilterSet):
     alias = filters.CharFilter(field_name='alias', lookup_expr='iexact')
@@ -416,4 +449,66 @@ class SupplierModelViewSet(viewsets.ModelViewSet):
     model = Supplier
     serializer_class = SupplierSerializer
     queryset = Supplier.objects.all()
-    pagination_class = NxtbnPagination
\ No newline at end of file
+    pagination_class = NxtbnPagination
+
+
+class CatalogImportView(generics.CreateAPIView):
+    """Queues the import of a CSV or JSON Lines catalog file, returns the job to poll."""
+    permission_classes = (IsStoreAdmin, )
+    serializer_class = CatalogImportSerializer
+
+    def create(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        job = CatalogJob.objects.create(
+            kind=CatalogJobKind.IMPORT,
+            file_format=serializer.validated_data['file_format'],
+            file=serializer.validated_data['file'],
+            created_by=request.user,
+        )
+        transaction.on_commit(lambda: process_catalog_job.delay(job.pk))
+        return Response(CatalogJobSerializer(job).data, status=status.HTTP_202_ACCEPTED)
+
+
+class CatalogExportView(generics.GenericAPIView):
+    """
+    GET streams the catalog export (?file_format=csv or jsonl) as it is read from the database,
+    POST queues an export job writing the file to the storage instead.
+    """
+    permission_classes = (IsStoreAdmin, )
+    serializer_class = CatalogJobSerializer
+
+    def get_file_format(self, request):
+        file_format = request.query_params.get('file_format') or request.data.get('file_format') or CatalogFileFormat.CSV
+        if file_format not in CatalogFileFormat.values:
+            raise ParseError(_('file_format must be csv or jsonl.'))
+        return file_format
+
+    def get(self, request, *args, **kwargs):
+        file_format = self.get_file_format(request)
+        response = StreamingHttpResponse(
+            iter_export_lines(file_format),
+            content_type='text/csv' if file_format == CatalogFileFormat.CSV else 'application/x-ndjson',
+        )
+        response['Content-Disposition'] = f'attachment; filename="catalog.{file_format}"'
+        return response
+
+    def post(self, request, *args, **kwargs):
+        job = CatalogJob.objects.create(
+            kind=CatalogJobKind.EXPORT, file_format=self.get_file_format(request), created_by=request.user,
+        )
+        transaction.on_commit(lambda: process_catalog_job.delay(job.pk))
+        return Response(CatalogJobSerializer(job).data, status=status.HTTP_202_ACCEPTED)
+
+
+class CatalogJobListView(generics.ListAPIView):
+    permission_classes = (IsStoreAdmin, )
+    serializer_class = CatalogJobSerializer
+    queryset = CatalogJob.objects.all()
+    pagination_class = NxtbnPagination
+
+
+class CatalogJobDetailView(generics.RetrieveAPIView):
+    permission_classes = (IsStoreAdmin, )
+    serializer_class = CatalogJobSerializer
+    queryset = CatalogJob.objects.all()
@@ -6,7 +6,7 @@ from django.db import transaction
 from nxtbn.core.models import CurrencyExchange
 from nxtbn.core.utils import apply_exchange_rate, get_in_user_currency
 from nxtbn.product.api.dashboard.serializers import RecursiveCategorySerializer
-from nxtbn.filemanager.api.dashboard.serializers import ImageSerializer
+from nxtbn.filemanager.api.storefront.serializers import ImageSerializer
 from nxtbn.product.models import Product, Collection, Category, ProductVariant
 from django.utils.translation import get_language
 
@@ -62,6 +62,7 @@ class ProductWithDefaultVariantSerializer(serializers.ModelSerializer):
     product_thumbnail = serializers.SerializerMethodField()
     default_variant = ProductVariantSerializer(read_only=True)
     texts = serializers.SerializerMethodField()
+    price_range = serializers.SerializerMethodField()
 
     class Meta:
         model = Product
@@ -70,11 +71,23 @@ class ProductWithDefaultVariantSerializer(serializers.ModelSerializer):
             'texts',
             'slug',
             'default_variant',
-            'product_thumbnail'
+            'product_thumbnail',
+            'price_range',
+            'in_stock',
         )
 
     def get_product_thumbnail(self, obj):
         return obj.product_thumbnail(self.context['request'])
+
+    def get_price_range(self, obj):
+        # From the listing columns of the product, no variant is loaded
+        if obj.min_price is None:
+            return None
+        target_currency = self.context['request'].currency
+        return {
+            'min_price': apply_exchange_rate(obj.min_price, self.context['exchange_rate'], target_currency, 'en_US'),
+            'max_price': apply_exchange_rate(obj.max_price, self.context['exchange_rate'], target_currency, 'en_US'),
+        }
     
     def get_texts(self, obj):
         request = self.context.get('request')
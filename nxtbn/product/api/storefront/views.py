@@ -18,7 +18,10 @@ from django.contrib.postgres.search import TrigramSimilarity
 
 from nxtbn.core.paginator import NxtbnPagination
 from nxtbn.product.api.storefront.serializers import CategorySerializer, CollectionSerializer, ProductDetailImageListSerializer, ProductDetailSerializer, ProductDetailWithRelatedLinkImageListMinimalSerializer, ProductWithDefaultVariantImageListSerializer, ProductWithDefaultVariantSerializer, ProductWithVariantSerializer, ProductDetailWithRelatedLinkMinimalSerializer
-from nxtbn.product.models import Category, Collection, Product
+from nxtbn.product.category_tree import CategoryTreeFilter
+from nxtbn.product.facets import PriceBandFilter, product_facets
+from nxtbn.product.models import Category, Collection, Product, ProductTag
+from nxtbn.product.utils import catalog_cache_page
 from nxtbn.product.models import Supplier
 from nxtbn.core.currency.backend import currency_Backend
 
@@ -28,16 +31,22 @@ class ProductFilter(filters.FilterSet):
     summary = filters.CharFilter(lookup_expr='icontains')
     description = filters.CharFilter(lookup_expr='icontains')
     category = filters.ModelChoiceFilter(field_name='category', queryset=Category.objects.all())
+    category_tree = CategoryTreeFilter(field_name='category')
     category_name = filters.CharFilter(field_name='category__name', lookup_expr='icontains')
     supplier = filters.ModelChoiceFilter(field_name='supplier', queryset=Supplier.objects.all())
     brand = filters.CharFilter(lookup_expr='icontains')
     type = filters.CharFilter(field_name='type', lookup_expr='exact')
     related_to = filters.CharFilter(field_name='related_to__name', lookup_expr='icontains')
     collection = filters.ModelChoiceFilter(field_name='collections', queryset=Collection.objects.all())
+    tag = filters.ModelChoiceFilter(field_name='tags', queryset=ProductTag.objects.all())
+    price_band = PriceBandFilter()
+    price_from = filters.NumberFilter(field_name='min_price', lookup_expr='gte')
+    price_to = filters.NumberFilter(field_name='min_price', lookup_expr='lte')
+    in_stock = filters.BooleanFilter()
 
     class Meta:
         model = Product
-        fields = ('name', 'summary', 'description', 'category', 'category_name', 'supplier', 'brand', 'type', 'related_to', 'collection')
+        fields = ('name', 'summary', 'description', 'category', 'category_tree', 'category_name', 'supplier', 'brand', 'type', 'related_to', 'collection', 'tag', 'price_band', 'price_from', 'price_to', 'in_stock')
 
 
 class ProductViewSet(viewsets.ReadOnlyModelViewSet):
@@ -65,17 +74,20 @@ class ProductViewSet(viewsets.ReadOnlyModelViewSet):
     ]
     filterset_class = ProductFilter
     search_fields = ['name', 'summary', 'description', 'category__name', 'brand']
-    ordering_fields = ['name', 'created_at']
+    ordering_fields = ['name', 'created_at', 'min_price', 'max_price']
     lookup_field = 'slug'
 
     def get_queryset(self):
         queryset = self.queryset
         # Defer heavy fields for list views to save memory and I/O
-        if self.action in ['list', 'withvariant', 'with_recommended', 'with_recommended_image_list']:
-            queryset = queryset.defer('description', 'metadata', 'internal_metadata')
+        if self.action in ['list', 'faceted', 'withvariant', 'with_recommended', 'with_recommended_image_list']:
+            queryset = queryset.defer('description', 'description_rendered', 'metadata', 'internal_metadata')
+        else:
+            # Detail views serve the pre-rendered description html, the raw JSON is not needed
+            queryset = queryset.defer('description')
         return queryset
 
-    @method_decorator(cache_page(60 * 15)) # Cache for 15 minutes
+    @method_decorator(catalog_cache_page(60 * 15)) # Cache for 15 minutes
     def list(self, request, *args, **kwargs):
         # We need to manually cache based on currency, as standard cache_page doesn't know about it
         return super().list(request, *args, **kwargs)
@@ -100,7 +112,7 @@ class ProductViewSet(viewsets.ReadOnlyModelViewSet):
         return Response(serializer.data)
     
     def get_serializer_class(self):
-        if self.action == 'list':
+        if self.action in ['list', 'faceted']:
             return  ProductWithDefaultVariantSerializer
         
         if self.action == 'retrieve': # Single product
@@ -124,7 +136,7 @@ class ProductViewSet(viewsets.ReadOnlyModelViewSet):
         return ProductWithVariantSerializer
         
 
-    @method_decorator(cache_page(60 * 15)) # Cache for 15 minutes
+    @method_decorator(catalog_cache_page(60 * 15)) # Cache for 15 minutes
     def retrieve(self, request, *args, **kwargs):
         return super().retrieve(request, *args, **kwargs)
 
@@ -133,15 +145,31 @@ class ProductViewSet(viewsets.ReadOnlyModelViewSet):
         queryset = self.filter_queryset(self.queryset)
         return self.paginate_and_serialize(queryset)
     
+    @action(detail=False, methods=['get'])
+    @method_decorator(catalog_cache_page(60 * 15))
+    def faceted(self, request):
+        """The list page, with the brand, category, collection, tag and price band counts of the filters applied."""
+        response = self.paginate_and_serialize(self.filter_queryset(self.get_queryset()))
+
+        search = drf_filters.SearchFilter()
+        filters_applied = {
+            key: request.query_params[key]
+            for key in [*self.filterset_class.base_filters, search.search_param]
+            if key in request.query_params
+        }
+        products = search.filter_queryset(request, Product.objects.all(), self)
+        response.data['facets'] = product_facets(self.filterset_class, filters_applied, products, 'storefront-rest')
+        return response
+
     @action(detail=True, methods=['get'])
-    @method_decorator(cache_page(60 * 15))
+    @method_decorator(catalog_cache_page(60 * 15))
     def with_related(self, request, slug=None):
         product = self.get_object()
         serializer = self.get_serializer(product)
         return Response(serializer.data)
     
     @action(detail=True, methods=['get'])
-    @method_decorator(cache_page(60 * 15))
+    @method_decorator(catalog_cache_page(60 * 15))
     def with_related_image_list(self, request, slug=None):
         product = self.get_object()
         serializer = self.get_serializer(product)
@@ -174,7 +202,7 @@ class ProductViewSet(viewsets.ReadOnlyModelViewSet):
         return ordered_products
 
     @action(detail=True, methods=['get'])
-    @method_decorator(cache_page(60 * 15))
+    @method_decorator(catalog_cache_page(60 * 15))
     def with_recommended(self, request, slug=None):
         product = self.get_object()
         ordered_products = self._get_recommended_products(product)
@@ -182,14 +210,14 @@ class ProductViewSet(viewsets.ReadOnlyModelViewSet):
         return Response(serializer.data)
     
     @action(detail=True, methods=['get'])
-    @method_decorator(cache_page(60 * 15))
+    @method_decorator(catalog_cache_page(60 * 15))
     def retrive_with_image_list(self, request, slug=None):
         product = self.get_object()
         serializer = self.get_serializer(product)
         return Response(serializer.data)
     
     @action(detail=True, methods=['get'])
-    @method_decorator(cache_page(60 * 15))
+    @method_decorator(catalog_cache_page(60 * 15))
     def with_recommended_image_list(self, request, slug=None):
         product = self.get_object()
         ordered_products = self._get_recommended_products(product)
@@ -209,11 +237,7 @@ class CollectionListView(generics.ListAPIView):
 class CategoryListView(generics.ListAPIView):
     permission_classes = (AllowAny,)
     pagination_class = None
-    # Optimize recursive fetching: prefetch children up to depth 2 (as enforced by model)
-    queryset = Category.objects.all().prefetch_related(
-        'subcategories',
-        'subcategories__subcategories'
-    )
+    queryset = Category.objects.all() # children come from the category tree snapshot
     serializer_class = CategorySerializer
 
     @method_decorator(cache_page(60 * 60))
@@ -0,0 +1,110 @@
+"""
+Bulk operations over products, run by Celery (see nxtbn.product.tasks.process_bulk_job).
+
+The selected ids are processed in increasing order, BULK_JOB_CHUNK_SIZE at a time, each
+chunk in its own short transaction, with a pause of BULK_JOB_THROTTLE seconds between
+chunks so a large delete doesn't hold locks or saturate the database for long. Progress is
+saved after every chunk. A chunk that fails is retried one product at a time, so a product
+that can't be deleted (e.g. one with ordered variants) is recorded as a failure without
+blocking the others. Catalog caches are invalidated once, when the job ends.
+"""
+
+import bisect
+import time
+
+from django.conf import settings
+from django.db import DatabaseError, transaction
+from django.db.models import ProtectedError
+from django.utils import timezone
+
+from nxtbn.product import BulkJobAction, JobStatus
+from nxtbn.product.models import BulkJob, Product
+from nxtbn.product.utils import invalidate_catalog_caches
+
+
+def create_bulk_job(action, product_ids, user=None, params=None):
+    product_ids = sorted(set(product_ids))
+    return BulkJob.objects.create(
+        action=action,
+        product_ids=product_ids,
+        params=params or {},
+        created_by=user,
+        total_items=len(product_ids),
+    )
+
+
+def delete_products(job, ids):
+    Product.objects.filter(id__in=ids).delete()
+
+
+def update_products_status(job, ids):
+    fields = {'status': job.params['status'], 'last_modified': timezone.now()}
+    if job.created_by_id:
+        fields['last_modified_by_id'] = job.created_by_id
+    Product.objects.filter(id__in=ids).update(**fields)
+
+
+ACTIONS = {
+    BulkJobAction.DELETE: delete_products,
+    BulkJobAction.STATUS_UPDATE: update_products_status,
+}
+
+
+def process_chunk(job, ids):
+    """Applies the job action to the ids, returns the failures."""
+    apply = ACTIONS[job.action]
+    try:
+        with transaction.atomic():
+            apply(job, ids)
+        return []
+    except (ProtectedError, DatabaseError):
+        pass
+
+    failures = []
+    for product_id in ids:
+        try:
+            with transaction.atomic():
+                apply(job, [product_id])
+        except (ProtectedError, DatabaseError) as e:
+            failures.append({'id': product_id, 'error': str(e)})
+    return failures
+
+
+def run_bulk_job(job, chunk_size=None, throttle=None):
+    """Runs the job from its last finished chunk, recording its status and progress on it."""
+    chunk_size = chunk_size or settings.BULK_JOB_CHUNK_SIZE
+    throttle = settings.BULK_JOB_THROTTLE if throttle is None else throttle
+
+    job.status = JobStatus.RUNNING
+    job.started_at = job.started_at or timezone.now()
+    BulkJob.objects.filter(pk=job.pk).update(status=job.status, started_at=job.started_at)
+    try:
+        start = bisect.bisect_right(job.product_ids, job.last_processed_id)
+        for offset in range(start, len(job.product_ids), chunk_size):
+            if offset > start and throttle:
+                time.sleep(throttle)
+            ids = job.product_ids[offset:offset + chunk_size]
+            failures = process_chunk(job, ids)
+
+            job.processed_items += len(ids)
+            job.failed_items += len(failures)
+            job.failures.extend(failures[:max(settings.BULK_JOB_MAX_FAILURES - len(job.failures), 0)])
+            job.last_processed_id = ids[-1]
+            BulkJob.objects.filter(pk=job.pk).update(
+                processed_items=job.processed_items,
+                failed_items=job.failed_items,
+                failures=job.failures,
+                last_processed_id=job.last_processed_id,
+            )
+    except Exception as e:
+        BulkJob.objects.filter(pk=job.pk).update(
+            status=JobStatus.FAILED, finished_at=timezone.now(), error_message=str(e),
+        )
+        raise
+    finally:
+        invalidate_catalog_caches()
+
+    job.status = JobStatus.COMPLETED
+    job.finished_at = timezone.now()
+    BulkJob.objects.filter(pk=job.pk).update(status=job.status, finished_at=job.finished_at)
+    return job
@@ -0,0 +1,482 @@
+"""
+Bulk catalog import and export, one row per product variant, as CSV or JSON Lines.
+
+Columns:
+
+    product_slug     the product key, defaults to the slugified product_name
+    product_name, summary, description, brand, status
+    category, product_type                 names of existing rows
+    collections, tags                      names of existing rows ("a|b" in CSV)
+    images                                 ids of existing images ("1|2" in CSV)
+    sku              the variant key
+    variant_name, price, compare_at_price, cost_per_unit, track_inventory,
+    allow_backorder, weight_value
+    stock            quantity per warehouse name ("Main:10|Kumasi:4" in CSV,
+                     an object in JSON Lines)
+
+Files are read as a stream and handled CATALOG_IMPORT_BATCH_SIZE rows at a time:
+the rows of a batch are validated together (one query per referenced table),
+then products, variants and stock are upserted set-based (COPY into a staging
+table merged into the table on PostgreSQL, see nxtbn.core.bulk) and the
+collections, tags and images of the products are replaced. Rows failing
+validation are reported with their row number and skipped, the other rows are
+imported.
+
+Cells left empty (or keys left out) keep the stored values: a file with `sku`
+and `price` only reprices existing variants, product columns are required to
+create new ones only. Description may be the editor JSON or plain text.
+
+Exports iterate the variants with a server-side cursor, CATALOG_EXPORT_CHUNK_SIZE
+rows at a time, so memory stays bounded whatever the catalog size.
+"""
+
+import csv
+import io
+import itertools
+import json
+import tempfile
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.files import File
+from django.db import DatabaseError, transaction
+from django.db.models import OuterRef, Subquery
+from django.utils import timezone
+from django.utils.text import slugify
+from rest_framework import serializers
+
+from nxtbn.core import PublishableStatus
+from nxtbn.core.bulk import bulk_upsert, can_copy, explicit_field_values
+from nxtbn.filemanager.models import Image
+from nxtbn.product import CatalogFileFormat, CatalogJobKind, JobStatus
+from nxtbn.product.models import Category, CatalogJob, Collection, Product, ProductTag, ProductType, ProductVariant
+from nxtbn.product.utils import invalidate_catalog_caches, json_to_html, refresh_product_listings
+from nxtbn.users.models import User
+from nxtbn.warehouse.models import Stock, Warehouse
+
+
+COLUMNS = (
+    'product_slug', 'product_name', 'summary', 'description', 'brand', 'status', 'category', 'product_type',
+    'collections', 'tags', 'images', 'sku', 'variant_name', 'price', 'compare_at_price', 'cost_per_unit',
+    'track_inventory', 'allow_backorder', 'weight_value', 'stock',
+)
+LIST_COLUMNS = ('collections', 'tags', 'images')
+LIST_SEPARATOR = '|'
+
+# file column -> model field, for the columns updating existing rows
+PRODUCT_FIELDS = {
+    'product_name': 'name', 'summary': 'summary', 'description': 'description', 'brand': 'brand',
+    'status': 'status', 'category': 'category', 'product_type': 'product_type',
+}
+VARIANT_FIELDS = {
+    'variant_name': 'name', 'price': 'price', 'compare_at_price': 'compare_at_price',
+    'cost_per_unit': 'cost_per_unit', 'track_inventory': 'track_inventory',
+    'allow_backorder': 'allow_backorder', 'weight_value': 'weight_value',
+}
+PRODUCT_REQUIRED = ('product_name', 'category', 'product_type')
+VARIANT_REQUIRED = ('price', 'cost_per_unit')
+
+
+class CatalogRowSerializer(serializers.Serializer):
+    product_slug = serializers.SlugField(max_length=50, required=False)
+    product_name = serializers.CharField(max_length=255, required=False)
+    summary = serializers.CharField(max_length=500, required=False, allow_blank=True)
+    description = serializers.CharField(max_length=5000, required=False, allow_blank=True)
+    brand = serializers.CharField(max_length=100, required=False, allow_blank=True)
+    status = serializers.ChoiceField(choices=PublishableStatus.choices, required=False)
+    category = serializers.CharField(max_length=255, required=False)
+    product_type = serializers.CharField(max_length=50, required=False)
+    collections = serializers.ListField(child=serializers.CharField(max_length=255), required=False)
+    tags = serializers.ListField(child=serializers.CharField(max_length=50), required=False)
+    images = serializers.ListField(child=serializers.IntegerField(min_value=1), required=False)
+    sku = serializers.CharField(max_length=50)
+    variant_name = serializers.CharField(max_length=255, required=False, allow_blank=True)
+    price = serializers.DecimalField(max_digits=12, decimal_places=3, min_value=Decimal('0.01'), required=False)
+    compare_at_price = serializers.DecimalField(max_digits=12, decimal_places=3, min_value=Decimal('0.01'), required=False, allow_null=True)
+    cost_per_unit = serializers.DecimalField(max_digits=12, decimal_places=3, min_value=Decimal('0.01'), required=False)
+    track_inventory = serializers.BooleanField(required=False)
+    allow_backorder = serializers.BooleanField(required=False)
+    weight_value = serializers.DecimalField(max_digits=5, decimal_places=2, min_value=Decimal('0'), required=False, allow_null=True)
+    stock = serializers.DictField(child=serializers.IntegerField(min_value=0), required=False)
+
+    def validate(self, attrs):
+        if 'product_slug' not in attrs and 'product_name' in attrs:
+            attrs['product_slug'] = slugify(attrs['product_name'])[:50]
+        return attrs
+
+
+def parse_csv_row(row):
+    """CSV cells to the row shape shared with JSON Lines, empty cells are left out."""
+    data = {}
+    for key, value in row.items():
+        if key is None or value is None:
+            continue
+        value = value.strip()
+        if value == '':
+            continue
+        if key in LIST_COLUMNS:
+            value = [item.strip() for item in value.split(LIST_SEPARATOR) if item.strip()]
+        elif key == 'stock':
+            stock = {}
+            for item in value.split(LIST_SEPARATOR):
+                warehouse, _, quantity = item.rpartition(':')
+                stock[warehouse.strip()] = quantity.strip()
+            value = stock
+        data[key] = value
+    return data
+
+
+def read_rows(stream, file_format):
+    """Yields (row number, row) from a binary stream, row numbers start at 1 after the CSV header."""
+    text = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+    if file_format == CatalogFileFormat.CSV:
+        for number, row in enumerate(csv.DictReader(text), start=1):
+            yield number, parse_csv_row(row)
+        return
+    for number, line in enumerate(text, start=1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError:
+            row = None
+        yield number, row if isinstance(row, dict) else {'__invalid__': 'Not a JSON object.'}
+
+
+def to_editor_json(description):
+    """Keeps editor JSON as is, wraps plain text into a paragraph."""
+    try:
+        if isinstance(json.loads(description), list):
+            return description
+    except ValueError:
+        pass
+    return json.dumps([{'type': 'paragraph', 'children': [{'text': description}]}])
+
+
+class CatalogImporter:
+    def __init__(self, user=None, job=None, batch_size=None, use_copy=True):
+        self.user = user or (job.created_by if job is not None else None) or (
+            User.objects.filter(is_superuser=True).order_by('pk').first()
+        )
+        self.job = job
+        self.batch_size = batch_size or settings.CATALOG_IMPORT_BATCH_SIZE
+        self.use_copy = use_copy and can_copy()
+        self.counts = {'processed_rows': 0, 'created_rows': 0, 'updated_rows': 0, 'failed_rows': 0}
+        self.errors = []
+
+    def run(self, stream, file_format):
+        rows = read_rows(stream, file_format)
+        while True:
+            batch = list(itertools.islice(rows, self.batch_size))
+            if not batch:
+                break
+            self.import_batch(batch)
+            self.save_progress()
+        return self.counts
+
+    def add_error(self, number, row, errors):
+        self.counts['failed_rows'] += 1
+        if len(self.errors) < settings.CATALOG_IMPORT_MAX_ERRORS:
+            self.errors.append({'row': number, 'sku': (row or {}).get('sku'), 'errors': errors})
+
+    def save_progress(self):
+        if self.job is not None:
+            CatalogJob.objects.filter(pk=self.job.pk).update(errors=self.errors, **self.counts)
+
+    def import_batch(self, batch):
+        self.counts['processed_rows'] += len(batch)
+        valid = self.validate(batch)
+        if not valid:
+            return
+        try:
+            with transaction.atomic():
+                created = self.write(valid)
+        except DatabaseError as e:
+            for number, row in valid:
+                self.add_error(number, row, {'non_field_errors': [f'Batch not saved: {e}']})
+            return
+        self.counts['created_rows'] += created
+        self.counts['updated_rows'] += len(valid) - created
+        invalidate_catalog_caches()
+
+    def validate(self, batch):
+        """Validates the rows of a batch and resolves their references, returns the valid (number, row)."""
+        checked, seen = [], set()
+        for number, row in batch:
+            if '__invalid__' in row:
+                self.add_error(number, row, {'non_field_errors': [row['__invalid__']]})
+                continue
+            serializer = CatalogRowSerializer(data=row)
+            if not serializer.is_valid():
+                self.add_error(number, row, serializer.errors)
+                continue
+            data = serializer.validated_data
+            if data['sku'] in seen:
+                self.add_error(number, row, {'sku': ['Repeated in the batch.']})
+                continue
+            seen.add(data['sku'])
+            checked.append((number, data))
+
+        def names(column):
+            return {name for _, data in checked for name in (
+                data[column] if isinstance(data.get(column), list) else [data[column]] if column in data else []
+            )}
+
+        lookups = {
+            'category': dict(Category.objects.filter(name__in=names('category')).values_list('name', 'pk')),
+            'product_type': dict(ProductType.objects.filter(name__in=names('product_type')).values_list('name', 'pk')),
+            'collections': dict(Collection.objects.filter(name__in=names('collections')).values_list('name', 'pk')),
+            'tags': dict(ProductTag.objects.filter(name__in=names('tags')).values_list('name', 'pk')),
+            'images': {pk: pk for pk in Image.objects.filter(pk__in=names('images')).values_list('pk', flat=True)},
+        }
+        warehouses = {name for _, data in checked for name in data.get('stock', {})}
+        lookups['stock'] = dict(Warehouse.objects.filter(name__in=warehouses).values_list('name', 'pk'))
+        # the rows of existing variants and products, for the values the rows don't carry
+        self.existing_variants = {
+            row['sku']: row for row in ProductVariant.objects.filter(
+                sku__in=[data['sku'] for _, data in checked]
+            ).values('sku', 'product__slug', *VARIANT_FIELDS.values())
+        }
+        for _, data in checked:  # rows of existing variants may leave the product out
+            if 'product_slug' not in data and data['sku'] in self.existing_variants:
+                data['product_slug'] = self.existing_variants[data['sku']]['product__slug']
+        self.existing_products = {
+            row['slug']: row for row in Product.objects.filter(
+                slug__in={data['product_slug'] for _, data in checked if 'product_slug' in data}
+            ).values('slug', *PRODUCT_FIELDS.values(), 'description_rendered', 'created_by')
+        }
+
+        valid = []
+        for number, data in checked:
+            if 'product_slug' not in data:
+                self.add_error(number, data, {'product_slug': ['product_slug or product_name is required.']})
+                continue
+            errors = {}
+            for column, lookup in lookups.items():
+                values = data.get(column)
+                if values is None:
+                    continue
+                values = values if isinstance(values, (list, dict)) else [values]
+                unknown = [str(value) for value in values if value not in lookup]
+                if unknown:
+                    errors[column] = [f"Unknown: {', '.join(unknown)}."]
+            if data['product_slug'] not in self.existing_products:
+                errors.update({column: ['Required to create a product.'] for column in PRODUCT_REQUIRED if column not in data})
+                if self.user is None:
+                    errors['product_slug'] = ['No user to record as the creator of a new product, create a superuser first.']
+            if data['sku'] not in self.existing_variants:
+                errors.update({column: ['Required to create a variant.'] for column in VARIANT_REQUIRED if column not in data})
+            if errors:
+                self.add_error(number, data, errors)
+                continue
+            for column in ('category', 'product_type'):
+                if column in data:
+                    data[column] = lookups[column][data[column]]
+            valid.append((number, data))
+        self.lookups = lookups
+        return valid
+
+    def write(self, valid):
+        """Upserts the products, variants, relations and stock of the valid rows, returns the created variants."""
+        rows = [data for _, data in valid]
+
+        products = {}
+        for data in rows:  # the product cells of later rows win
+            products[data['product_slug']] = {**products.get(data['product_slug'], {}), **data}
+        product_objs = []
+        for slug, data in products.items():
+            values = dict(self.existing_products.get(slug) or {
+                'name': slug, 'summary': '', 'brand': None, 'status': PublishableStatus.DRAFT,
+                'created_by': self.user.pk if self.user else None,
+            })
+            values.update({field: data[column] for column, field in PRODUCT_FIELDS.items() if column in data})
+            if 'description' in data or 'description_rendered' not in values:
+                values['description'] = to_editor_json(data.get('description', ''))
+                values['description_rendered'] = json_to_html(values['description'])
+            product_objs.append(Product(
+                slug=slug,
+                name=values['name'],
+                summary=values['summary'],
+                description=values['description'],
+                description_rendered=values['description_rendered'],
+                brand=values['brand'] or None,
+                status=values['status'],
+                category_id=values['category'],
+                product_type_id=values['product_type'],
+                created_by_id=values['created_by'],
+                last_modified_by=self.user,
+            ))
+        with explicit_field_values((Product, 'slug')):
+            bulk_upsert(
+                Product, product_objs, unique_fields=['slug'],
+                update_fields=list(PRODUCT_FIELDS.values()) + ['description_rendered', 'last_modified', 'last_modified_by'],
+                batch_size=self.batch_size, use_copy=self.use_copy,
+            )
+        product_ids = dict(Product.objects.filter(slug__in=products).values_list('slug', 'pk'))
+
+        variant_objs = []
+        for data in rows:
+            values = dict(self.existing_variants.get(data['sku']) or {
+                'name': None, 'compare_at_price': None, 'track_inventory': False,
+                'allow_backorder': False, 'weight_value': None,
+            })
+            values.update({field: data[column] for column, field in VARIANT_FIELDS.items() if column in data})
+            variant_objs.append(ProductVariant(
+                product_id=product_ids[data['product_slug']],
+                sku=data['sku'],
+                currency=settings.BASE_CURRENCY,
+                **{field: values[field] for field in VARIANT_FIELDS.values()},
+            ))
+        bulk_upsert(
+            ProductVariant, variant_objs, unique_fields=['sku'], update_fields=['product', *VARIANT_FIELDS.values()],
+            batch_size=self.batch_size, use_copy=self.use_copy,
+        )
+        variant_ids = dict(ProductVariant.objects.filter(sku__in=[data['sku'] for data in rows]).values_list('sku', 'pk'))
+
+        Product.objects.filter(pk__in=product_ids.values(), default_variant__isnull=True).update(
+            default_variant=Subquery(
+                ProductVariant.objects.filter(product=OuterRef('pk')).order_by('pk').values('pk')[:1]
+            )
+        )
+
+        for column, relation, target in (
+            ('collections', Product.collections, 'collection_id'),
+            ('tags', Product.tags, 'producttag_id'),
+            ('images', Product.images, 'image_id'),
+        ):
+            replaced = {product_ids[slug]: data[column] for slug, data in products.items() if column in data}
+            if not replaced:
+                continue
+            through = relation.through
+            through.objects.filter(product_id__in=replaced).delete()
+            through.objects.bulk_create([
+                through(product_id=product_id, **{target: self.lookups[column][value]})
+                for product_id, values in replaced.items()
+                for value in dict.fromkeys(values)
+            ])
+
+        bulk_upsert(
+            Stock,
+            (
+                Stock(
+                    warehouse_id=self.lookups['stock'][warehouse],
+                    product_variant_id=variant_ids[data['sku']],
+                    quantity=quantity,
+                )
+                for data in rows
+                for warehouse, quantity in data.get('stock', {}).items()
+            ),
+            unique_fields=['warehouse', 'product_variant'], update_fields=['quantity', 'last_modified'],
+            batch_size=self.batch_size, use_copy=self.use_copy,
+        )
+        refresh_product_listings(product_ids.values())
+        return sum(1 for data in rows if data['sku'] not in self.existing_variants)
+
+
+def import_catalog(stream, file_format=CatalogFileFormat.CSV, user=None, job=None, batch_size=None, use_copy=True):
+    """Imports a binary stream of rows, returns the row counts and the per-row errors."""
+    importer = CatalogImporter(user=user, job=job, batch_size=batch_size, use_copy=use_copy)
+    counts = importer.run(stream, file_format)
+    return {**counts, 'errors': importer.errors}
+
+
+# Export
+
+def _join(values):
+    return LIST_SEPARATOR.join(str(value) for value in values)
+
+
+def iter_catalog_rows(queryset=None, chunk_size=None):
+    """Yields one row per variant, fetched with a server-side cursor chunk by chunk."""
+    queryset = queryset if queryset is not None else ProductVariant.objects.all()
+    queryset = queryset.select_related(
+        'product__category', 'product__product_type'
+    ).prefetch_related(
+        'product__collections', 'product__tags', 'product__images', 'warehouse_stocks__warehouse',
+    ).order_by('pk')
+
+    for variant in queryset.iterator(chunk_size=chunk_size or settings.CATALOG_EXPORT_CHUNK_SIZE):
+        product = variant.product
+        yield {
+            'product_slug': product.slug,
+            'product_name': product.name,
+            'summary': product.summary,
+            'description': product.description,
+            'brand': product.brand or '',
+            'status': product.status,
+            'category': product.category.name,
+            'product_type': product.product_type.name,
+            'collections': [collection.name for collection in product.collections.all()],
+            'tags': [tag.name for tag in product.tags.all()],
+            'images': [image.pk for image in product.images.all()],
+            'sku': variant.sku or '',
+            'variant_name': variant.name or '',
+            'price': str(variant.price),
+            'compare_at_price': str(variant.compare_at_price) if variant.compare_at_price is not None else None,
+            'cost_per_unit': str(variant.cost_per_unit),
+            'track_inventory': variant.track_inventory,
+            'allow_backorder': variant.allow_backorder,
+            'weight_value': str(variant.weight_value) if variant.weight_value is not None else None,
+            'stock': {stock.warehouse.name: stock.quantity for stock in variant.warehouse_stocks.all()},
+        }
+
+
+class _Echo:
+    def write(self, value):
+        return value
+
+
+def iter_export_lines(file_format=CatalogFileFormat.CSV, queryset=None):
+    """Yields the export file line by line, for a streaming response or a file."""
+    rows = iter_catalog_rows(queryset)
+    if file_format == CatalogFileFormat.JSONL:
+        for row in rows:
+            yield json.dumps(row) + '\n'
+        return
+
+    writer = csv.writer(_Echo())
+    yield writer.writerow(COLUMNS)
+    for row in rows:
+        row['stock'] = _join(f'{warehouse}:{quantity}' for warehouse, quantity in row['stock'].items())
+        for column in LIST_COLUMNS:
+            row[column] = _join(row[column])
+        for column in ('track_inventory', 'allow_backorder'):
+            row[column] = 'true' if row[column] else 'false'
+        yield writer.writerow([row[column] for column in COLUMNS])
+
+
+def export_catalog(stream, file_format=CatalogFileFormat.CSV, queryset=None):
+    """Writes the export to a text stream, returns the number of variants written."""
+    count = -1 if file_format == CatalogFileFormat.CSV else 0  # the CSV header
+    for line in iter_export_lines(file_format, queryset):
+        stream.write(line)
+        count += 1
+    return count
+
+
+# Jobs
+
+def run_catalog_job(job):
+    """Runs an import or export job, recording its status and progress on it."""
+    CatalogJob.objects.filter(pk=job.pk).update(status=JobStatus.RUNNING, started_at=timezone.now())
+    try:
+        fields = {}
+        if job.kind == CatalogJobKind.IMPORT:
+            with job.file.open('rb') as stream:
+                import_catalog(stream, job.file_format, job=job)
+        else:
+            with tempfile.TemporaryFile('w+b') as stream:
+                text = io.TextIOWrapper(stream, encoding='utf-8', newline='')
+                fields['processed_rows'] = export_catalog(text, job.file_format)
+                text.flush()
+                stream.seek(0)
+                job.file.save(f'catalog-export-{job.pk}.{job.file_format}', File(stream), save=False)
+                text.detach()
+            fields['file'] = job.file.name
+    except Exception as e:
+        CatalogJob.objects.filter(pk=job.pk).update(
+            status=JobStatus.FAILED, finished_at=timezone.now(), error_message=str(e),
+        )
+        raise
+    CatalogJob.objects.filter(pk=job.pk).update(status=JobStatus.COMPLETED, finished_at=timezone.now(), **fields)
@@ -0,0 +1,124 @@
+"""
+The category tree, kept as a materialized path on Category: `path` holds the ids from the
+root down to the category itself, e.g. '3/17/40/', and is maintained by Category.save().
+
+Ancestors are the ids of the path and descendants the categories whose path starts with
+it, each fetched in one query on the indexed path. Category menus and the recursive
+serializers read an in-process snapshot of the whole tree instead of walking
+`subcategories` one query per node. The snapshot is rebuilt when the category tree version
+changes (on every category save or delete, see nxtbn.product.utils.invalidate_category_tree),
+and at least every CATEGORY_TREE_SNAPSHOT_TTL seconds, as the other processes don't see the
+version change with a per-process cache backend.
+"""
+
+import time
+from collections import defaultdict
+
+import django_filters
+from django.conf import settings
+from django.core.validators import EMPTY_VALUES
+
+from nxtbn.product.models import Category
+from nxtbn.product.utils import category_tree_version, invalidate_category_tree
+
+
+class CategoryTree:
+    """A read-only snapshot of the categories, the children of every node sorted by name."""
+
+    def __init__(self, categories):
+        self.categories = {category.pk: category for category in categories}
+        self.children = defaultdict(list)
+        for category in sorted(categories, key=lambda category: category.name):
+            self.children[category.parent_id].append(category)
+
+    @property
+    def roots(self):
+        return self.get_children(None)
+
+    def get(self, category_id):
+        return self.categories.get(category_id)
+
+    def get_children(self, category_id):
+        return self.children.get(category_id, [])
+
+    def get_ancestors(self, category_id, include_self=False):
+        category = self.categories.get(category_id)
+        if category is None:
+            return []
+        ancestors = [self.categories.get(int(pk)) for pk in category.path.split('/') if pk]
+        if not include_self:
+            ancestors = ancestors[:-1]
+        return [ancestor for ancestor in ancestors if ancestor is not None]
+
+    def get_descendant_ids(self, category_id, include_self=False):
+        ids = [category_id] if include_self else []
+        stack = [category_id]
+        while stack:
+            children = self.get_children(stack.pop())
+            ids += [child.pk for child in children]
+            stack += [child.pk for child in children]
+        return ids
+
+
+_snapshot = None  # (version, built at, tree)
+
+
+def category_tree():
+    """The snapshot of the category tree of this process, rebuilt when stale."""
+    global _snapshot
+    version = category_tree_version()
+    if (
+        _snapshot is None
+        or _snapshot[0] != version
+        or time.monotonic() - _snapshot[1] > settings.CATEGORY_TREE_SNAPSHOT_TTL
+    ):
+        _snapshot = (version, time.monotonic(), CategoryTree(list(Category.objects.order_by('path'))))
+    return _snapshot[2]
+
+
+def rebuild_category_paths(categories=None):
+    """
+    Recomputes the path and depth of the `categories` (a queryset, every category by default) from
+    the parents, for the changes which don't go through Category.save(): bulk writes and the parents
+    set to null when a category is deleted. A category whose parent is left out keeps the parent's
+    stored path as prefix. Returns the number of categories changed.
+    """
+    categories = list((Category.objects.all() if categories is None else categories).only('pk', 'parent_id', 'path', 'depth'))
+    parents = {category.pk: category.parent_id for category in categories}
+    outside = dict(
+        Category.objects.filter(pk__in=set(parents.values()) - set(parents) - {None}).values_list('pk', 'path')
+    )
+    paths = {}
+
+    def path_of(pk):
+        if pk not in paths:
+            paths[pk] = f'{pk}/'  # stops a cycle
+            parent_id = parents[pk]
+            if parent_id in parents:
+                paths[pk] = f'{path_of(parent_id)}{pk}/'
+            elif parent_id in outside:
+                paths[pk] = f'{outside[parent_id]}{pk}/'
+        return paths[pk]
+
+    changed = []
+    for category in categories:
+        path = path_of(category.pk)
+        if category.path != path:
+            category.path, category.depth = path, path.count('/') - 1
+            changed.append(category)
+    Category.objects.bulk_update(changed, ['path', 'depth'], batch_size=500)
+    invalidate_category_tree()
+    return len(changed)
+
+
+class CategoryTreeFilter(django_filters.ModelChoiceFilter):
+    """Filters on a category and all its subcategories, joined on the indexed category path."""
+
+    def __init__(self, *args, **kwargs):
+        kwargs.setdefault('queryset', Category.objects.all())
+        super().__init__(*args, **kwargs)
+
+    def filter(self, qs, value):
+        if value in EMPTY_VALUES:
+            return qs
+        return qs.filter(**{f'{self.field_name}__path__startswith': value.path})
@@ -0,0 +1,158 @@
+"""
+Facet counts of the storefront product listings: how many of the listed products match each brand,
+category, collection, tag and price band, for the filters currently applied.
+
+Each facet is counted with the filters of the other facets only, so the values of a facet stay
+selectable once one of them is picked (picking a brand doesn't hide the other brands). The five
+grouped counts are sent as one UNION ALL query, and the result is cached per filter set for
+PRODUCT_FACET_CACHE_TIMEOUT seconds, in the catalog cache version (see invalidate_catalog_caches).
+
+Category counts are rolled up to the ancestors with the category tree snapshot, a category counts
+the products of its whole subtree, as the category_tree filter matches them.
+
+Usage:
+    product_facets(ProductFilter, {'brand': 'acme', 'price_band': '25-50'}, Product.objects.all(), 'rest')
+    -> {'brand': [{'value': 'Acme', 'label': 'Acme', 'count': 12}, ...], 'category': [...], ...}
+"""
+
+import hashlib
+import json
+from collections import Counter
+
+import django_filters
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Case, CharField, Count, F, Value, When
+from django.db.models.functions import Cast
+
+from nxtbn.product.category_tree import category_tree
+from nxtbn.product.utils import catalog_cache_version
+
+
+PRICE_FIELD = 'min_price'  # the lowest variant price, the listings show the range from it
+
+# The filters of each facet, left out when the facet itself is counted
+FACET_FILTERS = {
+    'brand': ('brand',),
+    'category': ('category', 'category_tree', 'category_name'),
+    'collection': ('collection',),
+    'tag': ('tag',),
+    'price': ('price_band', 'price_from', 'price_to'),
+}
+
+
+def price_bands():
+    """(value, min, max) of the price bands from PRODUCT_FACET_PRICE_BANDS, the last one has no max."""
+    bounds = [0, *settings.PRODUCT_FACET_PRICE_BANDS]
+    bands = [(f'{low}-{high}', low, high) for low, high in zip(bounds, bounds[1:])]
+    bands.append((f'{bounds[-1]}-', bounds[-1], None))
+    return bands
+
+
+def price_band_lookups(value):
+    """The price lookups of a price band value, None when it isn't one of the bands."""
+    for band, low, high in price_bands():
+        if band == value:
+            lookups = {f'{PRICE_FIELD}__gte': low}
+            if high is not None:
+                lookups[f'{PRICE_FIELD}__lt'] = high
+            return lookups
+    return None
+
+
+class PriceBandFilter(django_filters.CharFilter):
+    """Filters on one of the price bands of the price facet, e.g. '25-50' or '500-'."""
+
+    def filter(self, qs, value):
+        if not value:
+            return qs
+        lookups = price_band_lookups(value)
+        if lookups is None:
+            return qs.none()
+        return qs.filter(**lookups)
+
+
+def _facet_columns():
+    """The (value, label) expressions each facet is grouped on."""
+    price_band = Case(
+        *[
+            When(**price_band_lookups(band), then=Value(band))
+            for band, _, _ in price_bands()
+        ],
+        output_field=CharField(),
+    )
+    return {
+        'brand': (F('brand'), F('brand')),
+        'category': (Cast('category_id', CharField()), F('category__name')),
+        'collection': (Cast('collections__id', CharField()), F('collections__name')),
+        'tag': (Cast('tags__id', CharField()), F('tags__name')),
+        'price': (price_band, price_band),
+    }
+
+
+def _count_facets(filterset_class, data, queryset):
+    branches = []
+    for facet, (value, label) in _facet_columns().items():
+        facet_data = {key: item for key, item in data.items() if key not in FACET_FILTERS[facet]}
+        products = filterset_class(facet_data, queryset=queryset).qs
+        branches.append(
+            products.annotate(
+                facet=Value(facet, output_field=CharField()),
+                facet_value=value,
+                facet_label=label,
+            )
+            .filter(facet_value__isnull=False)
+            .values('facet', 'facet_value', 'facet_label')
+            .annotate(count=Count('pk', distinct=True))
+            .order_by()
+        )
+    return branches[0].union(*branches[1:], all=True)
+
+
+def _roll_up_categories(values):
+    tree = category_tree()
+    counts = Counter()
+    labels = {}
+    for item in values:
+        category_id = int(item['value'])
+        counts[category_id] += item['count']
+        labels[category_id] = item['label']
+        for ancestor in tree.get_ancestors(category_id):
+            counts[ancestor.pk] += item['count']
+            labels.setdefault(ancestor.pk, ancestor.name)
+    return [
+        {'value': str(category_id), 'label': labels[category_id], 'count': count}
+        for category_id, count in counts.items()
+    ]
+
+
+def _build_facets(filterset_class, data, queryset):
+    facets = {facet: [] for facet in FACET_FILTERS}
+    for row in _count_facets(filterset_class, data, queryset):
+        facets[row['facet']].append({'value': row['facet_value'], 'label': row['facet_label'], 'count': row['count']})
+
+    facets['category'] = _roll_up_categories(facets['category'])
+    for facet, values in facets.items():
+        if facet == 'price':
+            band_order = {band: index for index, (band, _, _) in enumerate(price_bands())}
+            values.sort(key=lambda item: band_order[item['value']])
+        else:
+            values.sort(key=lambda item: (-item['count'], item['label'] or ''))
+    return facets
+
+
+def product_facets(filterset_class, data, queryset, scope):
+    """
+    The facet counts of the products of `queryset` filtered by `filterset_class` with `data`.
+    `scope` names the listing in the cache key, the same filters on different querysets (or with
+    filters applied outside the filterset, e.g. a search) need different scopes or data.
+    """
+    data = {key: str(value) for key, value in data.items() if value not in (None, '')}
+    digest = hashlib.md5(json.dumps(data, sort_keys=True).encode()).hexdigest()
+    key = f'product-facets:{catalog_cache_version()}:{scope}:{digest}'
+
+    facets = cache.get(key)
+    if facets is None:
+        facets = _build_facets(filterset_class, data, queryset)
+        cache.set(key, facets, settings.PRODUCT_FACET_CACHE_TIMEOUT)
+    return facets
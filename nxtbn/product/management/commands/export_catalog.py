@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from nxtbn.product import CatalogFileFormat
+from nxtbn.product.catalog_io import export_catalog
+
+
+class Command(BaseCommand):
+    help = 'Export every product variant with its product, prices and stock to a CSV or JSON Lines file'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--format', dest='file_format', choices=CatalogFileFormat.values, help='Defaults to the file extension')
+
+    def handle(self, *args, **options):
+        file_format = options['file_format'] or options['path'].rsplit('.', 1)[-1].lower()
+        if file_format not in CatalogFileFormat.values:
+            raise CommandError('Pass --format or use a .csv or .jsonl file')
+
+        with open(options['path'], 'w', encoding='utf-8', newline='') as stream:
+            count = export_catalog(stream, file_format)
+        self.stdout.write(self.style.SUCCESS(f'Exported {count} variants to {options["path"]}'))
@@ -1,136 +1,66 @@
-import json
 import os
+import random
 import shutil
+
 from django.conf import settings
+from django.core.files import File
 from django.core.management.base import BaseCommand
-import requests
-from nxtbn.core.utils import normalize_amount_currencywise
-from nxtbn.product.models import Category, Collection, Product, ProductType, ProductVariant
-from django.contrib.auth import get_user_model
-from nxtbn.product import StockStatus, WeightUnits
-from faker import Faker
+
+from nxtbn.core.seeding import DatasetSeeder
 from nxtbn.filemanager.models import Image
-from django.core.files.temp import NamedTemporaryFile
-from django.core.files import File
-import random
-from tqdm import tqdm
+from nxtbn.users.models import User
 
-User = get_user_model()
 
 class Command(BaseCommand):
-    help = 'Create fake products with multiple variants'
+    help = (
+        'Create fake products with multiple variants, collections and stock, in batches. '
+        'The same --seed creates the same products.'
+    )
 
     def add_arguments(self, parser):
         parser.add_argument('--num_products', type=int, default=10, help='Number of fake products to create')
+        parser.add_argument('--seed', type=int, help='Random seed, a new one is picked and printed when omitted')
+        parser.add_argument('--batch-size', type=int, default=2000)
+        parser.add_argument('--no-copy', action='store_true', help='Insert with bulk_create rather than COPY on PostgreSQL')
+        parser.add_argument('--no-images', action='store_true', help="Don't attach the sample image to the products")
 
     def handle(self, *args, **options):
-        fake = Faker()
+        seed = options['seed'] if options['seed'] is not None else random.randrange(10 ** 6)
+        self.stdout.write(f'Seed: {seed}')
 
-        static_image_path = os.path.join(settings.STATICFILES_DIRS[0], 'images/tamaade.png')
-        media_image_path = os.path.join(settings.MEDIA_ROOT, 'tamaade.png')
-
-        if not os.path.exists(media_image_path):
-            shutil.copy(static_image_path, media_image_path)
+        superuser = User.objects.filter(is_superuser=True).order_by('pk').first()
+        if not superuser:
+            self.stdout.write(self.style.NOTICE('Creating superuser with username "admin" and password "admin"...'))
+            superuser = User.objects.create_superuser('admin', 'admin@example.com', 'admin')
 
-        
-        num_products = options['num_products']
-        categories = Category.objects.all()
-        collections = Collection.objects.all()
+        images = () if options['no_images'] else (self.sample_image(superuser).pk,)
 
+        seeder = DatasetSeeder(
+            seed=seed,
+            batch_size=options['batch_size'],
+            use_copy=not options['no_copy'],
+            log=self.stdout.write,
+        )
+        sizes = seeder.seed_products(options['num_products'], images=images)
 
-        for _ in tqdm(range(num_products)):
-            category = random.choice(categories)
-            collection = random.choice(collections)
-            product_type, created  = ProductType.objects.get_or_create(name='Automatic Product Type')
-            weight_unit = random.choice(WeightUnits.choices)
+        self.stdout.write(self.style.SUCCESS(
+            f"Created {sizes['products']} fake products with {sizes['variants']} variants"
+        ))
 
-            superuser = User.objects.filter(username='admin').first()
-            if not superuser:
-                self.stdout.write(self.style.NOTICE('Creating superuser with username "admin" and password "admin"...'))
-                superuser = User.objects.create_superuser('admin', 'admin@example.com', 'admin')
+    def sample_image(self, created_by):
+        static_image_path = os.path.join(settings.STATICFILES_DIRS[0], 'images/tamaade.png')
+        media_image_path = os.path.join(settings.MEDIA_ROOT, 'tamaade.png')
+        if not os.path.exists(media_image_path):
+            os.makedirs(settings.MEDIA_ROOT, exist_ok=True)
+            shutil.copy(static_image_path, media_image_path)
 
-         
-            name = fake.word() 
+        image = Image.objects.filter(name='Sample product image').first()
+        if image is None:
             with open(media_image_path, 'rb') as image_file:
                 image = Image.objects.create(
-                    created_by=superuser,
-                    name=name,
+                    created_by=created_by,
+                    name='Sample product image',
                     image=File(image_file, name='tamaade.png'),
-                    image_alt_text=fake.sentence()
-                )
-
-            # Dummy Editor.js one-line content for description
-            description_json = json.dumps([
-                {
-                    "type": "paragraph",
-                    "children": [
-                        {"text": ""}
-                    ]
-                },
-                {
-                    "type": "code",
-                    "children": [
-                        {"text": "This is a code block."}
-                    ]
-                },
-                {
-                    "type": "bulleted-list",
-                    "children": [
-                        {
-                            "type": "list-item",
-                            "children": [
-                                {"text": "This is a bullet item."}
-                            ]
-                        }
-                    ]
-                }
-            ])
-
-            product = Product.objects.create(
-                name=fake.word(),
-                summary=fake.sentence(),
-                description=description_json,
-                brand=fake.company(),
-                category=category,
-                created_by=superuser,
-                last_modified_by=None,
-                product_type=product_type,
-                
-            )
-
-            product.collections.set([collection])
-            product.images.set([image])
-
-            default_variant = ProductVariant.objects.create(
-                product=product,
-                name='Default',
-                currency=settings.BASE_CURRENCY,
-                price=normalize_amount_currencywise(random.uniform(10, 1000), settings.BASE_CURRENCY),
-                cost_per_unit=normalize_amount_currencywise(random.uniform(10, 1000), settings.BASE_CURRENCY),
-                compare_at_price=normalize_amount_currencywise(random.uniform(10, 1000), settings.BASE_CURRENCY),
-                sku=fake.uuid4(),
-                # weight_unit=weight_unit[0],
-                weight_value=random.uniform(1, 1000),
-            )
-
-
-            product.default_variant = default_variant
-
-            for _ in range(random.randint(1, 5)):
-                # weight_unit = random.choice(WeightUnits.choices)
-                variant = ProductVariant.objects.create(
-                    product=product,
-                    name=fake.word(),
-                    currency=settings.BASE_CURRENCY,
-                    price=normalize_amount_currencywise(random.uniform(10, 1000), settings.BASE_CURRENCY),
-                    cost_per_unit=normalize_amount_currencywise(random.uniform(10, 1000), settings.BASE_CURRENCY),
-                    compare_at_price=normalize_amount_currencywise(random.uniform(10, 1000), settings.BASE_CURRENCY),
-                    sku=fake.uuid4(),
-                    # weight_unit=weight_unit[0],
-                    weight_value=random.uniform(1, 1000),
+                    image_alt_text='Sample product image',
                 )
-
-            product.save()
-
-        self.stdout.write(self.style.SUCCESS(f'Created {num_products} fake products with multiple variants'))
-        
\ No newline at end of file
+        return image
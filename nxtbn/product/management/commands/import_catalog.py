@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from nxtbn.product import CatalogFileFormat
+from nxtbn.product.catalog_io import import_catalog
+
+
+class Command(BaseCommand):
+    help = 'Import products, variants, prices and stock from a CSV or JSON Lines file (see nxtbn.product.catalog_io)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--format', dest='file_format', choices=CatalogFileFormat.values, help='Defaults to the file extension')
+        parser.add_argument('--batch-size', type=int)
+        parser.add_argument('--no-copy', action='store_true', help='Upsert with bulk_create rather than COPY on PostgreSQL')
+
+    def handle(self, *args, **options):
+        file_format = options['file_format'] or options['path'].rsplit('.', 1)[-1].lower()
+        if file_format not in CatalogFileFormat.values:
+            raise CommandError('Pass --format or use a .csv or .jsonl file')
+
+        with open(options['path'], 'rb') as stream:
+            result = import_catalog(
+                stream, file_format, batch_size=options['batch_size'], use_copy=not options['no_copy'],
+            )
+
+        for error in result['errors']:
+            self.stdout.write(self.style.WARNING(f"Row {error['row']} ({error['sku']}): {error['errors']}"))
+        self.stdout.write(self.style.SUCCESS(
+            f"{result['processed_rows']} rows: {result['created_rows']} variants created, "
+            f"{result['updated_rows']} updated, {result['failed_rows']} failed"
+        ))
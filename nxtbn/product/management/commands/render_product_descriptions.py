@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand
+from tqdm import tqdm
+
+from nxtbn.product.models import Product, ProductTranslation
+
+
+class Command(BaseCommand):
+    help = 'Render and store the description HTML of products and product translations'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true', help='Re-render every row, not only the ones never rendered')
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        for model in (Product, ProductTranslation):
+            queryset = model.objects.only('id', 'description', 'description_rendered').order_by('id')
+            if not options['all']:
+                queryset = queryset.filter(description_rendered__isnull=True)
+
+            batch = []
+            total = 0
+            for instance in tqdm(queryset.iterator(chunk_size=options['batch_size']), desc=model.__name__):
+                instance.render_description()
+                batch.append(instance)
+                if len(batch) >= options['batch_size']:
+                    model.objects.bulk_update(batch, ['description_rendered'])
+                    total += len(batch)
+                    batch = []
+            if batch:
+                model.objects.bulk_update(batch, ['description_rendered'])
+                total += len(batch)
+
+            self.stdout.write(self.style.SUCCESS(f'Rendered {total} {model._meta.verbose_name_plural} descriptions'))
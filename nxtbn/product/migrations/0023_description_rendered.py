@@ -0,0 +1,23 @@
+# Generated by Django 4.2.11 on 2026-10-19 08:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('product', '0022_install_trigram_extension'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='description_rendered',
+            field=models.TextField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='producttranslation',
+            name='description_rendered',
+            field=models.TextField(blank=True, editable=False, null=True),
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 4.2.11 on 2026-10-19 09:12
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import nxtbn.product.models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('product', '0023_description_rendered'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CatalogJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('last_modified', models.DateTimeField(auto_now=True)),
+                ('kind', models.CharField(choices=[('IMPORT', 'Import'), ('EXPORT', 'Export')], max_length=10)),
+                ('file_format', models.CharField(choices=[('csv', 'CSV'), ('jsonl', 'JSON Lines')], default='csv', max_length=10)),
+                ('status', models.CharField(choices=[('PENDING', 'Pending'), ('RUNNING', 'Running'), ('COMPLETED', 'Completed'), ('FAILED', 'Failed')], default='PENDING', max_length=20)),
+                ('file', models.FileField(blank=True, null=True, storage=nxtbn.product.models.catalog_file_storage, upload_to='catalog/')),
+                ('processed_rows', models.PositiveIntegerField(default=0)),
+                ('created_rows', models.PositiveIntegerField(default=0)),
+                ('updated_rows', models.PositiveIntegerField(default=0)),
+                ('failed_rows', models.PositiveIntegerField(default=0)),
+                ('errors', models.JSONField(blank=True, default=list, help_text='Per-row errors, the first CATALOG_IMPORT_MAX_ERRORS ones.')),
+                ('error_message', models.TextField(blank=True, null=True)),
+                ('started_at', models.DateTimeField(blank=True, null=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('created_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ('-created_at',),
+            },
+        ),
+    ]
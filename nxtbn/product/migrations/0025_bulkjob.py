@@ -0,0 +1,40 @@
+# Generated by Django 4.2.11 on 2026-10-19 09:21
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('product', '0024_catalogjob'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BulkJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('last_modified', models.DateTimeField(auto_now=True)),
+                ('action', models.CharField(choices=[('DELETE', 'Delete'), ('STATUS_UPDATE', 'Status update')], max_length=20)),
+                ('status', models.CharField(choices=[('PENDING', 'Pending'), ('RUNNING', 'Running'), ('COMPLETED', 'Completed'), ('FAILED', 'Failed')], default='PENDING', max_length=20)),
+                ('product_ids', models.JSONField(default=list, help_text='Sorted ids of the selected products.')),
+                ('params', models.JSONField(blank=True, default=dict, help_text='Arguments of the action, e.g. the new status.')),
+                ('total_items', models.PositiveIntegerField(default=0)),
+                ('processed_items', models.PositiveIntegerField(default=0)),
+                ('failed_items', models.PositiveIntegerField(default=0)),
+                ('failures', models.JSONField(blank=True, default=list, help_text='Products that could not be processed, with the reason.')),
+                ('last_processed_id', models.PositiveBigIntegerField(default=0)),
+                ('error_message', models.TextField(blank=True, null=True)),
+                ('started_at', models.DateTimeField(blank=True, null=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('created_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ('-created_at',),
+            },
+        ),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 4.2.11 on 2026-10-19 09:40
+
+from django.db import migrations, models
+
+
+def backfill_category_paths(apps, schema_editor):
+    Category = apps.get_model('product', 'Category')
+
+    categories = list(Category.objects.only('pk', 'parent_id'))
+    parents = {category.pk: category.parent_id for category in categories}
+    for category in categories:
+        ids, current = [], category.pk
+        while current in parents and current not in ids:
+            ids.insert(0, current)
+            current = parents[current]
+        category.path = ''.join(f'{pk}/' for pk in ids)
+        category.depth = len(ids) - 1
+    Category.objects.bulk_update(categories, ['path', 'depth'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('product', '0025_bulkjob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='category',
+            name='depth',
+            field=models.PositiveSmallIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='category',
+            name='path',
+            field=models.CharField(db_index=True, default='', editable=False, help_text="Ids of the ancestors and of the category itself, e.g. '3/17/', maintained on save.", max_length=255),
+        ),
+        migrations.RunPython(backfill_category_paths, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,70 @@
+# Generated by Django 4.2.11 on 2026-10-19 09:48
+
+from django.db import migrations, models
+from django.db.models import Count, Exists, F, Max, Min, OuterRef, Q, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+
+def backfill_product_listings(apps, schema_editor):
+    Product = apps.get_model('product', 'Product')
+    ProductVariant = apps.get_model('product', 'ProductVariant')
+    Stock = apps.get_model('warehouse', 'Stock')
+
+    variants = ProductVariant.objects.filter(product=OuterRef('pk')).order_by().values('product')
+    available = (
+        Stock.objects.filter(product_variant=OuterRef('pk')).order_by().values('product_variant')
+        .annotate(available=Sum(F('quantity') - F('reserved'))).values('available')
+    )
+    sellable = ProductVariant.objects.filter(product=OuterRef('pk')).annotate(available=Subquery(available)).filter(
+        Q(track_inventory=False) | Q(allow_backorder=True) | Q(available__gt=0)
+    )
+    Product.objects.update(
+        min_price=Subquery(variants.annotate(price=Min('price')).values('price')),
+        max_price=Subquery(variants.annotate(price=Max('price')).values('price')),
+        variant_count=Coalesce(Subquery(variants.annotate(count=Count('pk')).values('count')), 0),
+        in_stock=Exists(sellable),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('product', '0026_category_path'),
+        ('warehouse', '0013_stockreservation_created_at_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='in_stock',
+            field=models.BooleanField(default=False, editable=False),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='max_price',
+            field=models.DecimalField(blank=True, decimal_places=3, editable=False, max_digits=12, null=True),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='min_price',
+            field=models.DecimalField(blank=True, decimal_places=3, editable=False, max_digits=12, null=True),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='variant_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['min_price'], name='product_pro_min_pri_51066f_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['max_price'], name='product_pro_max_pri_29dbc5_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['in_stock', 'min_price'], name='product_pro_in_stoc_6e3880_idx'),
+        ),
+        migrations.RunPython(backfill_product_listings, migrations.RunPython.noop),
+    ]
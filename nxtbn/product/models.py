@@ -5,7 +5,9 @@ from decimal import Decimal
 from django.urls import reverse
 from django.utils.translation import gettext_lazy as _
 from django.core.exceptions import ValidationError
-from django.db.models import Sum
+from django.db.models import Sum, Value
+from django.db.models.functions import Concat, Substr
+from django.core.files.storage import storages
 from babel.numbers import get_currency_precision, format_currency
 from django_extensions.db.fields import AutoSlugField
 
@@ -17,11 +19,39 @@ from nxtbn.core import CurrencyTypes, MoneyFieldTypes
 from nxtbn.core.mixin import MonetaryMixin
 from nxtbn.core.models import AbstractMetadata, AbstractSEOModel, AbstractTranslationModel, AbstractUUIDModel, PublishableModel, AbstractBaseUUIDModel, AbstractBaseModel, NameDescriptionAbstract, no_nested_values
 from nxtbn.filemanager.models import Document, Image
-from nxtbn.product import DimensionUnits, StockStatus, WeightUnits
-from nxtbn.product.utils import json_to_html
+from nxtbn.product import BulkJobAction, CatalogFileFormat, CatalogJobKind, DimensionUnits, JobStatus, StockStatus, WeightUnits
+from nxtbn.product.utils import invalidate_category_tree, json_to_html, refresh_product_listings
 from nxtbn.tax.models import TaxClass
 from nxtbn.users.admin import User
 
+class AbstractRenderedDescription(models.Model):
+    """
+    Keeps the HTML rendering of the rich-text JSON `description` next to it, so that
+    reads never have to parse and sanitize the JSON again. Re-rendered on save.
+    """
+    description_rendered = models.TextField(blank=True, null=True, editable=False)
+
+    class Meta:
+        abstract = True
+
+    def render_description(self):
+        self.description_rendered = json_to_html(self.description)
+
+    def description_html(self):
+        if self.description_rendered is None: # not backfilled yet
+            return json_to_html(self.description)
+        return self.description_rendered
+
+    def save(self, *args, **kwargs):
+        update_fields = kwargs.get('update_fields')
+        if update_fields is None:
+            self.render_description()
+        elif 'description' in update_fields:
+            self.render_description()
+            kwargs['update_fields'] = set(update_fields) | {'description_rendered'}
+        super().save(*args, **kwargs)
+
+
 class Supplier(NameDescriptionAbstract, AbstractSEOModel):
     slug = AutoSlugField(populate_from='name', unique=True)
     pass
@@ -46,19 +76,35 @@ class Category(NameDescriptionAbstract, AbstractSEOModel):
         on_delete=models.SET_NULL,
         related_name='subcategories'
     )
+    path = models.CharField(
+        max_length=255, default='', editable=False, db_index=True,
+        help_text="Ids of the ancestors and of the category itself, e.g. '3/17/', maintained on save.",
+    )
+    depth = models.PositiveSmallIntegerField(default=0, editable=False)
 
     def has_sub(self):
-        return self.subcategories.exists()
+        from nxtbn.product.category_tree import category_tree
+        return bool(category_tree().get_children(self.pk))
+
+    def get_ancestors(self, include_self=False):
+        """The ancestors from the root down, in one query."""
+        ids = [int(pk) for pk in self.path.split('/') if pk]
+        if not include_self:
+            ids = ids[:-1]
+        return Category.objects.filter(pk__in=ids).order_by('depth')
+
+    def get_descendants(self, include_self=False):
+        """The whole subtree, in one query on the indexed path."""
+        descendants = Category.objects.filter(path__startswith=self.path)
+        if not include_self:
+            descendants = descendants.exclude(pk=self.pk)
+        return descendants
 
     def get_family_tree(self):
-        family_tree = []
-        current = self
-        depth = 0
-        while current is not None:
-            family_tree.insert(0, {'depth': depth, 'name': current.name})
-            current = current.parent
-            depth += 1
-        return family_tree
+        return [
+            {'depth': self.depth - ancestor.depth, 'name': ancestor.name}
+            for ancestor in self.get_ancestors(include_self=True)
+        ]
 
     class Meta:
         verbose_name = _("Category")
@@ -69,22 +115,40 @@ class Category(NameDescriptionAbstract, AbstractSEOModel):
 
     def clean(self):
         """Validate that category depth does not exceed 2 levels."""
-        if self._get_depth() > 2:
+        parent_path = self._get_parent_path()
+        if self.path and parent_path.startswith(self.path):
+            raise ValidationError("A category can't be moved under itself or one of its subcategories.")
+
+        height = 0
+        if self.path:
+            deepest = self.get_descendants().aggregate(depth=models.Max('depth'))['depth']
+            height = deepest - self.depth if deepest is not None else 0
+        if parent_path.count('/') + height > 2:
             raise ValidationError("Category depth must not exceed 2 levels.")
 
-    def _get_depth(self):
-        """Recursively determine the depth of the category."""
-        depth = 0
-        current = self
-        while current.parent:
-            depth += 1
-            current = current.parent
-        return depth
+    def _get_parent_path(self):
+        if not self.parent_id:
+            return ''
+        return Category.objects.filter(pk=self.parent_id).values_list('path', flat=True).first() or ''
 
     def save(self, *args, **kwargs):
         self.clean()
         super().save(*args, **kwargs)
 
+        # the path includes the id, so it is only known once the category is inserted
+        path = f"{self._get_parent_path()}{self.pk}/"
+        if path != self.path:
+            depth = path.count('/') - 1
+            if self.path:
+                # moved, its subtree follows
+                self.get_descendants().update(
+                    path=Concat(Value(path), Substr('path', len(self.path) + 1)),
+                    depth=models.F('depth') + depth - self.depth,
+                )
+            Category.objects.filter(pk=self.pk).update(path=path, depth=depth)
+            self.path, self.depth = path, depth
+        invalidate_category_tree()
+
 class Collection(NameDescriptionAbstract, AbstractSEOModel):
     slug = AutoSlugField(populate_from='name', unique=True)
     created_by = models.ForeignKey(
@@ -134,7 +198,11 @@ class ProductType(models.Model):
     
     # TO DO: class Meta: # Handle unique together with each field except name
 
-class Product(PublishableModel, AbstractMetadata, AbstractSEOModel):
+
+PRODUCT_LISTING_FIELDS = ('min_price', 'max_price', 'in_stock', 'variant_count')
+
+
+class Product(AbstractRenderedDescription, PublishableModel, AbstractMetadata, AbstractSEOModel):
     slug = AutoSlugField(populate_from='name', unique=True)
     created_by = models.ForeignKey(User, on_delete=models.PROTECT, related_name='products_created')
     last_modified_by = models.ForeignKey(User, on_delete=models.PROTECT, related_name='products_modified', null=True, blank=True)
@@ -182,6 +250,12 @@ class Product(PublishableModel, AbstractMetadata, AbstractSEOModel):
         )
     )
 
+    # Listing columns, kept from the variants and their stock by refresh_product_listings()
+    min_price = models.DecimalField(max_digits=12, decimal_places=3, null=True, blank=True, editable=False)
+    max_price = models.DecimalField(max_digits=12, decimal_places=3, null=True, blank=True, editable=False)
+    in_stock = models.BooleanField(default=False, editable=False)
+    variant_count = models.PositiveIntegerField(default=0, editable=False)
+
     class Meta:
         ordering = ('name',)
         indexes = [
@@ -189,10 +263,20 @@ class Product(PublishableModel, AbstractMetadata, AbstractSEOModel):
             models.Index(fields=['brand']),
             models.Index(fields=['is_live']),
             models.Index(fields=['created_at']),
+            models.Index(fields=['min_price']),
+            models.Index(fields=['max_price']),
+            models.Index(fields=['in_stock', 'min_price']),
         ]
 
-    def description_html(self):
-        return json_to_html(self.description)
+    def save(self, *args, **kwargs):
+        # The listing columns are written by refresh_product_listings() only, a stale instance must not overwrite them
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            deferred = self.get_deferred_fields()  # like Model.save, a deferred field is not loaded to be saved
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in PRODUCT_LISTING_FIELDS and field.attname not in deferred
+            ]
+        super().save(*args, **kwargs)
 
     def get_stock_details(self):
         from nxtbn.warehouse.models import Stock
@@ -216,56 +300,29 @@ class Product(PublishableModel, AbstractMetadata, AbstractSEOModel):
             'available_for_sell': available_for_sell
         }
 
+    def _first_image(self):
+        # Use .all() to leverage prefetch_related cache if available
+        images = self.images.all()
+        return images[0] if images else None
+
     def product_thumbnail(self, request):
         """
         Returns the URL of the first image associated with the product. 
         If no image is available, returns None.
         """
-        images = self.images.all()
-        if images and len(images) > 0:
-            first_image = images[0]
-            if hasattr(first_image, 'image') and first_image.image:
-                try:
-                    image_url = first_image.image.url
-                    if 'cloudinary.com' in image_url:
-                        return image_url
-                    full_url = request.build_absolute_uri(image_url)
-                    return full_url
-                except Exception:
-                    return None
+        first_image = self._first_image()
+        if first_image:
+            return first_image.get_image_url(request)
         return None
     
     def product_thumbnail_xs(self, request):
         """
-        Returns the URL of the first image associated with the product. 
+        Returns the thumbnail URL of the first image associated with the product. 
         If no image is available, returns None.
         """
-        images = self.images.all()
-        if images and len(images) > 0:
-            first_image = images[0]
-            if hasattr(first_image, 'image_xs') and first_image.image_xs:
-                try:
-                    image_url = first_image.image_xs.url
-                    if 'cloudinary.com' in image_url:
-                        return image_url
-                    full_url = request.build_absolute_uri(image_url)
-                    return full_url
-                except Exception:
-                    pass
-            
-            # Fallback to smart thumbnail from main image
-            if hasattr(first_image, 'image') and first_image.image:
-                try:
-                    image_url = first_image.image.url
-                    if 'cloudinary.com' in image_url:
-                         if '/upload/' in image_url:
-                            return image_url.replace('/upload/', '/upload/w_200,f_auto,q_auto/')
-                         return image_url
-                    full_url = request.build_absolute_uri(image_url)
-                    return full_url
-                except Exception:
-                    pass
-
+        first_image = self._first_image()
+        if first_image:
+            return first_image.get_image_xs_url(request)
         return None
 
     
@@ -273,32 +330,18 @@ class Product(PublishableModel, AbstractMetadata, AbstractSEOModel):
         """
         Returns the price range of the product variants.
         """
-        if self.variants.all():
-             prices = [v.price for v in self.variants.all()]
-             if not prices:
-                 return {'min_price': Decimal('0.00'), 'max_price': Decimal('0.00')}
-             return {'min_price': min(prices), 'max_price': max(prices)}
-        
-        # Fallback to DB aggregation if no variants or not prefetched (though .all() always returns list if accessed, 
-        # but if we want to be strict about prefetch we check _result_cache, but .all() is safer for general use here)
-        price_range = self.variants.aggregate(min_price=models.Min('price'), max_price=models.Max('price'))
-        return price_range
+        return {'min_price': self.min_price, 'max_price': self.max_price}
     
     def product_price_range_humanized(self, locale='en_US'):
         """
         Returns the price range of the product variants in a human-readable format.
         """
 
-        if not self.default_variant:
-            return "No variants available."
-
-        if not self.variants.exists():
+        if not self.default_variant_id or not self.variant_count:
             return "No variants available."
-        
 
-        price_range = self.product_price_range()
-        min_price = price_range['min_price']
-        max_price = price_range['max_price']
+        min_price = self.min_price
+        max_price = self.max_price
         
         if min_price == max_price:
             min_price = Decimal('0.00')
@@ -422,61 +465,21 @@ class ProductVariant(MonetaryMixin, AbstractUUIDModel, AbstractMetadata, models.
     
     def variant_thumbnail(self, request):
         """
-        Returns the URL of the first image associated with the product variant. 
+        Returns the URL of the variant image, falling back to the first product image. 
         If no image is available, returns None.
         """
-        if self.image and hasattr(self.image, 'image') and self.image.image:
-            image_url = self.image.image.url
-            if 'cloudinary.com' in image_url:
-                return image_url
-            full_url = request.build_absolute_uri(image_url)
-            return full_url
-        
-        # Use .all() to leverage prefetch_related cache if available
-        images = self.product.images.all()
-        if images:
-            first_image = images[0]
-            if first_image and hasattr(first_image, 'image') and first_image.image:
-                image_url = first_image.image.url
-                if 'cloudinary.com' in image_url:
-                     return image_url
-                full_url = request.build_absolute_uri(image_url)
-                return full_url
-        return None
+        if self.image and self.image.image:
+            return self.image.get_image_url(request)
+        return self.product.product_thumbnail(request)
     
     def variant_thumbnail_xs(self, request):
         """
-        Returns the URL of the first image associated with the product variant. 
+        Returns the thumbnail URL of the variant image, falling back to the first product image. 
         If no image is available, returns None.
         """
-        if self.image and hasattr(self.image, 'image_xs') and self.image.image_xs:
-            image_url = self.image.image_xs.url
-            if 'cloudinary.com' in image_url:
-                return image_url
-            full_url = request.build_absolute_uri(image_url)
-            return full_url
-        
-        # Fallback to main image with Cloudinary transform
-        if self.image and hasattr(self.image, 'image') and self.image.image:
-             image_url = self.image.image.url
-             if 'cloudinary.com' in image_url:
-                 if '/upload/' in image_url:
-                    return image_url.replace('/upload/', '/upload/w_200,f_auto,q_auto/')
-                 return image_url
-        
-        # Use .all() to leverage prefetch_related cache if available
-        images = self.product.images.all()
-        if images:
-            first_image = images[0]
-            if first_image and hasattr(first_image, 'image') and first_image.image:
-                image_url = first_image.image.url
-                if 'cloudinary.com' in image_url:
-                     if '/upload/' in image_url:
-                        return image_url.replace('/upload/', '/upload/w_200,f_auto,q_auto/')
-                     return image_url
-                full_url = request.build_absolute_uri(image_url)
-                return full_url
-        return None
+        if self.image and (self.image.image or self.image.image_xs):
+            return self.image.get_image_xs_url(request)
+        return self.product.product_thumbnail_xs(request)
         
         
     def get_valid_stock(self): # stocks that available for sell
@@ -504,6 +507,7 @@ class ProductVariant(MonetaryMixin, AbstractUUIDModel, AbstractMetadata, models.
     def save(self, *args, **kwargs):
         self.validate_amount()
         super(ProductVariant, self).save(*args, **kwargs)
+        refresh_product_listings([self.product_id])
 
     def __str__(self):
         variant_name = self.name if self.name else 'Default'
@@ -548,7 +552,7 @@ class CollectionTranslation(AbstractTranslationModel, AbstractSEOModel):
         return self.name
     
 
-class ProductTranslation(AbstractTranslationModel, AbstractSEOModel):
+class ProductTranslation(AbstractRenderedDescription, AbstractTranslationModel, AbstractSEOModel):
     product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='translations')
     name = models.CharField(max_length=255)
     name_when_in_relation = models.CharField(max_length=255, blank=True, null=True)
@@ -594,4 +598,60 @@ class ProductTagTranslation(AbstractTranslationModel, AbstractSEOModel):
 
     def __str__(self):
         return self.name
-    
\ No newline at end of file
+    
+
+def catalog_file_storage():
+    return storages['catalog']
+
+
+class CatalogJob(AbstractBaseModel):
+    """
+    A catalog import or export run in the background. `file` is the uploaded file of an
+    import, or the file written by an export. Progress is updated after every batch.
+    """
+    kind = models.CharField(max_length=10, choices=CatalogJobKind.choices)
+    file_format = models.CharField(max_length=10, choices=CatalogFileFormat.choices, default=CatalogFileFormat.CSV)
+    status = models.CharField(max_length=20, choices=JobStatus.choices, default=JobStatus.PENDING)
+    file = models.FileField(upload_to='catalog/', storage=catalog_file_storage, blank=True, null=True)
+    created_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    processed_rows = models.PositiveIntegerField(default=0)
+    created_rows = models.PositiveIntegerField(default=0)
+    updated_rows = models.PositiveIntegerField(default=0)
+    failed_rows = models.PositiveIntegerField(default=0)
+    errors = models.JSONField(default=list, blank=True, help_text="Per-row errors, the first CATALOG_IMPORT_MAX_ERRORS ones.")
+    error_message = models.TextField(blank=True, null=True)
+    started_at = models.DateTimeField(blank=True, null=True)
+    finished_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        ordering = ('-created_at',)
+
+    def __str__(self):
+        return f"{self.get_kind_display()} {self.pk} ({self.status})"
+
+
+class BulkJob(AbstractBaseModel):
+    """
+    A bulk delete or status update over products, run in the background BULK_JOB_CHUNK_SIZE
+    products at a time in increasing id order. `last_processed_id` is the last id of the last
+    finished chunk, a restarted job carries on from there.
+    """
+    action = models.CharField(max_length=20, choices=BulkJobAction.choices)
+    status = models.CharField(max_length=20, choices=JobStatus.choices, default=JobStatus.PENDING)
+    product_ids = models.JSONField(default=list, help_text="Sorted ids of the selected products.")
+    params = models.JSONField(default=dict, blank=True, help_text="Arguments of the action, e.g. the new status.")
+    created_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    total_items = models.PositiveIntegerField(default=0)
+    processed_items = models.PositiveIntegerField(default=0)
+    failed_items = models.PositiveIntegerField(default=0)
+    failures = models.JSONField(default=list, blank=True, help_text="Products that could not be processed, with the reason.")
+    last_processed_id = models.PositiveBigIntegerField(default=0)
+    error_message = models.TextField(blank=True, null=True)
+    started_at = models.DateTimeField(blank=True, null=True)
+    finished_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        ordering = ('-created_at',)
+
+    def __str__(self):
+        return f"{self.get_action_display()} {self.pk} ({self.status})"
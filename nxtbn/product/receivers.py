@@ -0,0 +1,21 @@
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
+
+from nxtbn.product.category_tree import rebuild_category_paths
+from nxtbn.product.models import Category, Product, ProductVariant
+from nxtbn.product.utils import refresh_product_listings_on_commit
+
+
+@receiver(post_delete, sender=Category)
+def handle_category_delete(sender, instance, **kwargs):
+    # the subcategories became roots (on_delete=SET_NULL) without going through save(), only the
+    # subtree of the deleted category has to be rebuilt
+    rebuild_category_paths(Category.objects.filter(path__startswith=instance.path))
+
+
+@receiver(post_delete, sender=ProductVariant)
+def handle_variant_delete(sender, instance, origin=None, **kwargs):
+    # the variants of a deleted product go with it, there is no listing left to refresh
+    if isinstance(origin, Product) or getattr(origin, 'model', None) is Product:
+        return
+    refresh_product_listings_on_commit([instance.product_id])
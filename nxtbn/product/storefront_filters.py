@@ -1,4 +1,6 @@
 import django_filters as filters
+from nxtbn.product.category_tree import CategoryTreeFilter
+from nxtbn.product.facets import PriceBandFilter
 from nxtbn.product.models import Category, Collection, Product, ProductTag, ProductVariant, Supplier
 from django.db.models import Q
 
@@ -9,15 +11,21 @@ class ProductFilter(filters.FilterSet):
     summary = filters.CharFilter(lookup_expr='icontains')
     description = filters.CharFilter(lookup_expr='icontains')
     category = filters.ModelChoiceFilter(field_name='category', queryset=Category.objects.all())
+    category_tree = CategoryTreeFilter(field_name='category')
     category_name = filters.CharFilter(field_name='category__name', lookup_expr='icontains')
     supplier = filters.ModelChoiceFilter(field_name='supplier', queryset=Supplier.objects.all())
     brand = filters.CharFilter(lookup_expr='icontains')
     related_to = filters.CharFilter(field_name='related_to__name', lookup_expr='icontains')
     collection = filters.ModelChoiceFilter(field_name='collections', queryset=Collection.objects.all())
+    tag = filters.ModelChoiceFilter(field_name='tags', queryset=ProductTag.objects.all())
+    price_band = PriceBandFilter()
+    price_from = filters.NumberFilter(field_name='min_price', lookup_expr='gte')
+    price_to = filters.NumberFilter(field_name='min_price', lookup_expr='lte')
+    in_stock = filters.BooleanFilter()
 
     class Meta:
         model = Product
-        fields = ('name', 'summary', 'description', 'category', 'category_name', 'supplier', 'brand','related_to', 'search', 'collection')
+        fields = ('name', 'summary', 'description', 'category', 'category_tree', 'category_name', 'supplier', 'brand','related_to', 'search', 'collection', 'tag', 'price_band', 'price_from', 'price_to', 'in_stock')
 
     def filter_search(self, queryset, name, value):
         """
@@ -1,10 +1,10 @@
 from django.conf import settings
 import graphene
-from nxtbn.cart.utils import get_or_create_cart
 from nxtbn.core import PublishableStatus
 from nxtbn.core.utils import apply_exchange_rate
 from nxtbn.product.storefront_types import (
     CategoryHierarchicalType,
+    ProductFacetsType,
     ProductGraphType,
     ImageType,
     CategoryType,
@@ -16,13 +16,21 @@ from nxtbn.product.storefront_types import (
 )
 from nxtbn.product.models import Product, Image, Category, ProductVariant, Supplier, ProductType, Collection, ProductTag, TaxClass
 from graphene_django.filter import DjangoFilterConnectionField
+from graphene_django.filter.utils import get_filtering_args_from_filterset, get_filterset_class
+from nxtbn.product.facets import product_facets
+from nxtbn.product.storefront_filters import ProductFilter
 from nxtbn.core.currency.backend import currency_Backend
 
 
+PRODUCT_FILTERSET = get_filterset_class(ProductFilter)  # as set up for the products connection
+
 
 class ProductQuery(graphene.ObjectType):
     product = graphene.Field(ProductGraphType, slug=graphene.String())
     products = DjangoFilterConnectionField(ProductGraphType)
+    product_facets = graphene.Field(
+        ProductFacetsType, args=get_filtering_args_from_filterset(PRODUCT_FILTERSET, ProductGraphType),
+    )
 
     categories = DjangoFilterConnectionField(CategoryType)
     categories_hierarchical = DjangoFilterConnectionField(CategoryHierarchicalType)
@@ -51,5 +59,10 @@ class ProductQuery(graphene.ObjectType):
 
         return Product.objects.filter(status=PublishableStatus.PUBLISHED).order_by('-created_at')
     
+    def resolve_product_facets(root, info, **kwargs):
+        # Takes the filters of `products`, query both in one request for a page and its facets
+        products = Product.objects.filter(status=PublishableStatus.PUBLISHED)
+        return product_facets(PRODUCT_FILTERSET, kwargs, products, 'storefront-graphql')
+
     def resolve_categories_hierarchical(root, info, **kwargs):
         return Category.objects.filter(parent=None)
\ No newline at end of file
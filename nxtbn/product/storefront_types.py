@@ -3,15 +3,31 @@ import graphene
 from graphene_django import DjangoObjectType
 from graphene import relay
 from nxtbn.core.utils import apply_exchange_rate
+from nxtbn.product.category_tree import category_tree
 from nxtbn.product.storefront_filters import ProductFilter, CategoryFilter, CollectionFilter, ProductTagsFilter
 from nxtbn.product.models import Product, Image, Category, ProductVariant, Supplier, ProductType, Collection, ProductTag, TaxClass
 from django.utils.translation import get_language
 
 
 class ImageType(DjangoObjectType):
+    image = graphene.String()
+    image_xs = graphene.String()
+
+    def resolve_image(self, info):
+        return self.get_image_url(info.context)
+
+    def resolve_image_xs(self, info):
+        return self.get_image_xs_url(info.context)
+
     class Meta:
         model = Image
-        fields = "__all__"
+        fields = (
+            'id',
+            'name',
+            'image',
+            'image_xs',
+            'image_alt_text',
+        )
 
 class CategoryType(DjangoObjectType):
     name = graphene.String()
@@ -103,7 +119,7 @@ class CategoryHierarchicalType(DjangoObjectType):
     
     def resolve_children(self, info):
         # Return all subcategories of the current category
-        return self.subcategories.all()
+        return category_tree().get_children(self.pk)
     
     class Meta:
         model = Category
@@ -280,4 +296,17 @@ class ProductGraphType(DjangoObjectType):
             "default_variant",
         )
         interfaces = (relay.Node,)
-        filterset_class = ProductFilter
\ No newline at end of file
+        filterset_class = ProductFilter
+
+class FacetValueType(graphene.ObjectType):
+    value = graphene.String()  # the value of the filter, e.g. a category id or a price band
+    label = graphene.String()
+    count = graphene.Int()
+
+
+class ProductFacetsType(graphene.ObjectType):
+    brand = graphene.List(FacetValueType)
+    category = graphene.List(FacetValueType)
+    collection = graphene.List(FacetValueType)
+    tag = graphene.List(FacetValueType)
+    price = graphene.List(FacetValueType)
@@ -0,0 +1,35 @@
+from celery import shared_task
+
+from nxtbn.product import JobStatus
+
+from nxtbn.product.bulk_jobs import run_bulk_job
+from nxtbn.product.catalog_io import run_catalog_job
+from nxtbn.product.models import BulkJob, CatalogJob, Product
+from nxtbn.product.utils import refresh_product_listings
+
+
+@shared_task
+def process_catalog_job(job_id):
+    run_catalog_job(CatalogJob.objects.get(pk=job_id))
+
+
+@shared_task
+def process_bulk_job(job_id):
+    job = BulkJob.objects.get(pk=job_id)
+    if job.status != JobStatus.COMPLETED:  # a redelivered task carries on from the last chunk
+        run_bulk_job(job)
+
+
+@shared_task
+def refresh_all_product_listings(chunk_size=1000):
+    """
+    Recomputes the listing columns of every product, `chunk_size` products per statement, for
+    the writes that bypass the refresh hooks (queryset updates, raw SQL). Returns the number of products.
+    """
+    refreshed, last_pk = 0, 0
+    while True:
+        ids = list(Product.objects.filter(pk__gt=last_pk).order_by('pk').values_list('pk', flat=True)[:chunk_size])
+        if not ids:
+            return refreshed
+        refreshed += refresh_product_listings(ids)
+        last_pk = ids[-1]
@@ -0,0 +1,107 @@
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from nxtbn.core import PublishableStatus
+from nxtbn.product import BulkJobAction, JobStatus
+from nxtbn.product.bulk_jobs import create_bulk_job, run_bulk_job
+from nxtbn.product.models import BulkJob, Product
+from nxtbn.product.tests import ProductFactory, ProductVariantFactory
+from nxtbn.product.utils import catalog_cache_version
+from nxtbn.users import UserRole
+from nxtbn.users.tests import UserFactory
+from nxtbn.warehouse.models import StockTransferItem
+from nxtbn.warehouse.tests import StockTransferFactory
+
+
+@override_settings(BULK_JOB_CHUNK_SIZE=2, BULK_JOB_THROTTLE=0)
+class BulkJobTest(TestCase):
+    def setUp(self):
+        self.user = UserFactory(is_staff=True, is_superuser=True, role=UserRole.ADMIN)
+        self.products = [ProductFactory(status=PublishableStatus.DRAFT) for _ in range(5)]
+        self.ids = [product.id for product in self.products]
+
+    def test_status_update_in_chunks(self):
+        job = create_bulk_job(
+            BulkJobAction.STATUS_UPDATE, reversed(self.ids + [10 ** 9]), user=self.user,
+            params={'status': PublishableStatus.PUBLISHED},
+        )
+        version = catalog_cache_version()
+
+        # start, then per chunk an update in a savepoint and a progress update, then finish
+        with self.assertNumQueries(1 + 3 * 4 + 1):
+            run_bulk_job(job)
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, JobStatus.COMPLETED)
+        self.assertEqual((job.total_items, job.processed_items, job.failed_items), (6, 6, 0))
+        self.assertEqual(job.last_processed_id, 10 ** 9)
+        self.assertEqual(
+            set(Product.objects.values_list('status', flat=True)), {PublishableStatus.PUBLISHED},
+        )
+        self.assertEqual(set(Product.objects.values_list('last_modified_by', flat=True)), {self.user.id})
+        self.assertNotEqual(catalog_cache_version(), version)
+
+    def test_delete_records_failures(self):
+        protected = ProductVariantFactory(product=self.products[1])
+        StockTransferItem.objects.create(
+            stock_transfer=StockTransferFactory(), variant=protected, quantity=1,
+        )
+        job = create_bulk_job(BulkJobAction.DELETE, self.ids)
+
+        run_bulk_job(job)
+
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.processed_items, job.failed_items), (JobStatus.COMPLETED, 5, 1))
+        self.assertEqual(job.failures[0]['id'], self.products[1].id)
+        self.assertEqual(list(Product.objects.values_list('id', flat=True)), [self.products[1].id])
+
+    def test_resumes_after_last_chunk(self):
+        job = create_bulk_job(BulkJobAction.DELETE, self.ids)
+        BulkJob.objects.filter(pk=job.pk).update(
+            status=JobStatus.RUNNING, processed_items=2, last_processed_id=self.ids[1],
+        )
+        job.refresh_from_db()
+
+        run_bulk_job(job)
+
+        job.refresh_from_db()
+        self.assertEqual(job.processed_items, 5)
+        self.assertEqual(sorted(Product.objects.values_list('id', flat=True)), self.ids[:2])
+
+
+@override_settings(BULK_JOB_THROTTLE=0, CELERY_TASK_ALWAYS_EAGER=True)
+class BulkProductAPITest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(UserFactory(is_staff=True, is_superuser=True, role=UserRole.ADMIN))
+        self.products = [ProductFactory(status=PublishableStatus.DRAFT) for _ in range(3)]
+
+    def test_bulk_status_update_returns_job(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.put(reverse('bulk-product-status-update'), {
+                'product_ids': [product.id for product in self.products],
+                'status': PublishableStatus.ARCHIVED,
+            }, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(response.data['status'], JobStatus.PENDING)
+        self.assertEqual(Product.objects.filter(status=PublishableStatus.ARCHIVED).count(), 3)
+
+        response = self.client.get(reverse('bulk-job-detail', args=[response.data['id']]))
+        self.assertEqual((response.data['status'], response.data['processed_items']), (JobStatus.COMPLETED, 3))
+
+    def test_bulk_delete_returns_job(self):
+        ids = ','.join(str(product.id) for product in self.products[:2])
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.delete(f"{reverse('bulk-product-status-delete')}?product_ids={ids}")
+
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(BulkJob.objects.get(pk=response.data['id']).status, JobStatus.COMPLETED)
+        self.assertEqual(list(Product.objects.values_list('id', flat=True)), [self.products[2].id])
+
+        response = self.client.delete(f"{reverse('bulk-product-status-delete')}?product_ids=1,x")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
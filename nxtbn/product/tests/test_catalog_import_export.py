@@ -0,0 +1,189 @@
+import io
+import json
+import shutil
+import tempfile
+from decimal import Decimal
+
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from nxtbn.product import CatalogFileFormat, JobStatus
+from nxtbn.product.catalog_io import export_catalog, import_catalog
+from nxtbn.product.models import CatalogJob, Product, ProductVariant
+from nxtbn.product.utils import catalog_cache_version
+from nxtbn.product.tests import CategoryFactory, CollectionFactory, ProductTagFactory, ProductTypeFactory
+from nxtbn.users import UserRole
+from nxtbn.users.tests import UserFactory
+from nxtbn.warehouse.models import Stock, Warehouse
+
+
+CSV_HEADER = 'product_slug,product_name,category,product_type,collections,tags,sku,variant_name,price,cost_per_unit,stock\n'
+
+
+class CatalogImportExportTest(TestCase):
+    def setUp(self):
+        self.user = UserFactory(is_staff=True, is_superuser=True, role=UserRole.ADMIN)
+        self.category = CategoryFactory(name='Shirts')
+        self.product_type = ProductTypeFactory(name='Apparel')
+        self.collection = CollectionFactory(name='Summer')
+        self.tag = ProductTagFactory(name='cotton')
+        self.warehouse = Warehouse.objects.create(name='Accra', location='Accra')
+
+    def import_csv(self, content, **kwargs):
+        return import_catalog(io.BytesIO(content.encode()), CatalogFileFormat.CSV, user=self.user, **kwargs)
+
+    def test_import_creates_then_updates(self):
+        content = CSV_HEADER + (
+            'linen-shirt,Linen Shirt,Shirts,Apparel,Summer,cotton,LS-S,Small,20.00,12.00,Accra:5\n'
+            'linen-shirt,Linen Shirt,Shirts,Apparel,Summer,cotton,LS-M,Medium,22.00,12.00,Accra:7\n'
+            ',Polo,Shirts,Apparel,,,PO-1,,15.50,9.00,\n'
+        )
+        result = self.import_csv(content, batch_size=2)
+
+        self.assertEqual((result['processed_rows'], result['created_rows'], result['failed_rows']), (3, 3, 0))
+        product = Product.objects.get(slug='linen-shirt')
+        self.assertEqual(product.variants.count(), 2)
+        self.assertEqual(product.default_variant.sku, 'LS-S')
+        self.assertEqual(list(product.collections.values_list('name', flat=True)), ['Summer'])
+        self.assertEqual(list(product.tags.values_list('name', flat=True)), ['cotton'])
+        self.assertIn('<p>', product.description_rendered)
+        self.assertEqual(Stock.objects.get(product_variant__sku='LS-M', warehouse=self.warehouse).quantity, 7)
+        self.assertTrue(Product.objects.filter(slug='polo').exists())
+
+        # only sku, price and stock: the other columns keep their values
+        result = self.import_csv('sku,price,stock\nLS-S,25.00,Accra:9\n')
+
+        self.assertEqual((result['created_rows'], result['updated_rows']), (0, 1))
+        variant = ProductVariant.objects.get(sku='LS-S')
+        self.assertEqual(variant.price, Decimal('25.00'))
+        self.assertEqual(variant.name, 'Small')
+        self.assertEqual(variant.cost_per_unit, Decimal('12.00'))
+        self.assertEqual(Stock.objects.get(product_variant=variant).quantity, 9)
+        self.assertEqual(Product.objects.count(), 2)
+
+    def test_row_errors_are_reported_and_skipped(self):
+        content = CSV_HEADER + (
+            'a,A,Shirts,Apparel,,,A-1,,10.00,5.00,\n'
+            'b,B,Unknown,Apparel,,,B-1,,10.00,5.00,\n'
+            'c,C,Shirts,Apparel,,,C-1,,-3,5.00,\n'
+            'd,D,Shirts,Apparel,,,A-1,,10.00,5.00,\n'
+            'e,E,Shirts,Apparel,,,E-1,,10.00,5.00,Nowhere:4\n'
+            'f,,,,,,F-1,,10.00,5.00,\n'
+        )
+        result = self.import_csv(content)
+
+        self.assertEqual((result['created_rows'], result['failed_rows']), (1, 5))
+        errors = {error['row']: error['errors'] for error in result['errors']}
+        self.assertEqual(set(errors), {2, 3, 4, 5, 6})
+        self.assertIn('category', errors[2])
+        self.assertIn('price', errors[3])
+        self.assertIn('sku', errors[4])
+        self.assertIn('stock', errors[5])
+        self.assertIn('product_name', errors[6])
+        self.assertEqual(list(ProductVariant.objects.values_list('sku', flat=True)), ['A-1'])
+
+    def test_import_invalidates_the_catalog_caches(self):
+        version = catalog_cache_version()
+
+        self.import_csv(CSV_HEADER + 'mug,Mug,Shirts,Apparel,,,MUG-1,,8.50,3.00,\n')
+
+        self.assertNotEqual(catalog_cache_version(), version)
+
+    def test_new_products_need_a_creator(self):
+        self.user.delete()
+        content = CSV_HEADER + 'mug,Mug,Shirts,Apparel,,,MUG-1,,8.50,3.00,\n'
+
+        result = import_catalog(io.BytesIO(content.encode()), CatalogFileFormat.CSV)
+
+        self.assertEqual((result['created_rows'], result['failed_rows']), (0, 1))
+        self.assertIn('product_slug', result['errors'][0]['errors'])
+        self.assertFalse(Product.objects.exists())
+
+    def test_jsonl_round_trip(self):
+        rows = [
+            {'product_name': 'Mug', 'category': 'Shirts', 'product_type': 'Apparel', 'description': 'Holds tea',
+             'sku': 'MUG-1', 'price': '8.50', 'cost_per_unit': '3.00', 'stock': {'Accra': 12}},
+            'not an object',
+        ]
+        content = '\n'.join(json.dumps(row) for row in rows).encode()
+        result = import_catalog(io.BytesIO(content), CatalogFileFormat.JSONL, user=self.user)
+        self.assertEqual((result['created_rows'], result['failed_rows']), (1, 1))
+
+        output = io.StringIO()
+        self.assertEqual(export_catalog(output, CatalogFileFormat.JSONL), 1)
+        exported = json.loads(output.getvalue())
+        self.assertEqual(exported['sku'], 'MUG-1')
+        self.assertEqual(exported['stock'], {'Accra': 12})
+        self.assertIn('Holds tea', exported['description'])
+
+        # the CSV export imports back as updates
+        output = io.StringIO()
+        export_catalog(output, CatalogFileFormat.CSV)
+        result = self.import_csv(output.getvalue())
+        self.assertEqual((result['updated_rows'], result['failed_rows']), (1, 0), result['errors'])
+
+    def test_export_query_count_does_not_grow_with_rows(self):
+        self.import_csv(CSV_HEADER + ''.join(
+            f'p{i},P{i},Shirts,Apparel,Summer,cotton,SKU-{i},,10.00,5.00,Accra:1\n' for i in range(30)
+        ))
+        with self.assertNumQueries(6):  # variants and one query per prefetched relation
+            export_catalog(io.StringIO(), CatalogFileFormat.CSV)
+
+
+@override_settings(CELERY_TASK_ALWAYS_EAGER=True)
+class CatalogJobAPITest(TestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        self.client = APIClient()
+        self.client.force_authenticate(UserFactory(is_staff=True, is_superuser=True, role=UserRole.ADMIN))
+        CategoryFactory(name='Shirts')
+        ProductTypeFactory(name='Apparel')
+
+    def test_import_job(self):
+        upload = SimpleUploadedFile('catalog.csv', (CSV_HEADER + 'tee,Tee,Shirts,Apparel,,,TEE-1,,10.00,5.00,\n').encode())
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse('catalog-import'), {'file': upload}, format='multipart')
+
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        job = CatalogJob.objects.get(pk=response.data['id'])
+        self.assertEqual(job.status, JobStatus.COMPLETED)
+        self.assertEqual((job.processed_rows, job.created_rows), (1, 1))
+
+        response = self.client.get(reverse('catalog-job-detail', args=[job.pk]))
+        self.assertEqual(response.data['status'], JobStatus.COMPLETED)
+
+    def test_export_job(self):
+        import_catalog(io.BytesIO((CSV_HEADER + 'tee,Tee,Shirts,Apparel,,,TEE-1,,10.00,5.00,\n').encode()))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse('catalog-export'), {'file_format': 'jsonl'}, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        job = CatalogJob.objects.get(pk=response.data['id'])
+        self.assertEqual((job.status, job.processed_rows), (JobStatus.COMPLETED, 1))
+        with job.file.open('rb') as f:
+            self.assertEqual(json.loads(f.read())['sku'], 'TEE-1')
+
+    def test_streamed_export(self):
+        import_catalog(io.BytesIO((CSV_HEADER + 'tee,Tee,Shirts,Apparel,,,TEE-1,,10.00,5.00,\n').encode()))
+
+        response = self.client.get(reverse('catalog-export'), {'file_format': 'csv'})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(len(lines), 2)
+        self.assertIn('TEE-1', lines[1])
+
+    def test_requires_store_admin(self):
+        self.client.force_authenticate(UserFactory(is_staff=True, is_superuser=False, role=UserRole.STORE_VIEWER))
+        response = self.client.get(reverse('catalog-export'))
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
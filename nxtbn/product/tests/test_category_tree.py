@@ -0,0 +1,135 @@
+from unittest import mock
+
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.test import TestCase
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from nxtbn.core import PublishableStatus
+from nxtbn.product.category_tree import category_tree, rebuild_category_paths
+from nxtbn.product.models import Category
+from nxtbn.product.tests import CategoryFactory, ProductFactory
+from nxtbn.users import UserRole
+from nxtbn.users.tests import UserFactory
+
+
+class CategoryTreeTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.shoes = CategoryFactory(name='Shoes')
+        self.sneakers = CategoryFactory(name='Sneakers', parent=self.shoes)
+        self.running = CategoryFactory(name='Running', parent=self.sneakers)
+        self.bags = CategoryFactory(name='Bags')
+
+    def refresh(self, *categories):
+        for category in categories:
+            category.refresh_from_db()
+
+    def test_paths_follow_moves(self):
+        self.assertEqual(self.running.path, f'{self.shoes.pk}/{self.sneakers.pk}/{self.running.pk}/')
+        self.assertEqual(self.running.depth, 2)
+
+        self.sneakers.parent = self.bags
+        self.sneakers.save()
+
+        self.refresh(self.running)
+        self.assertEqual(self.running.path, f'{self.bags.pk}/{self.sneakers.pk}/{self.running.pk}/')
+        self.assertEqual(list(self.shoes.get_descendants()), [])
+
+        self.sneakers.parent = None
+        self.sneakers.save()
+        self.refresh(self.running)
+        self.assertEqual((self.running.path, self.running.depth), (f'{self.sneakers.pk}/{self.running.pk}/', 1))
+
+    def test_invalid_moves(self):
+        self.shoes.parent = self.running
+        with self.assertRaises(ValidationError):
+            self.shoes.save()
+
+        self.sneakers.parent = CategoryFactory(parent=self.bags)  # the subtree would be 4 levels deep
+        with self.assertRaises(ValidationError):
+            self.sneakers.save()
+
+        with self.assertRaises(ValidationError):
+            CategoryFactory(parent=self.running)
+
+    def test_ancestors_and_descendants_in_one_query(self):
+        with self.assertNumQueries(1):
+            self.assertEqual(list(self.running.get_ancestors()), [self.shoes, self.sneakers])
+        with self.assertNumQueries(1):
+            self.assertEqual(set(self.shoes.get_descendants()), {self.sneakers, self.running})
+        with self.assertNumQueries(1):
+            self.assertEqual(
+                [item['name'] for item in self.running.get_family_tree()], ['Shoes', 'Sneakers', 'Running'],
+            )
+
+    def test_subcategories_become_roots_when_parent_is_deleted(self):
+        self.sneakers.delete()
+
+        self.refresh(self.running)
+        self.assertEqual((self.running.parent, self.running.path, self.running.depth), (None, f'{self.running.pk}/', 0))
+        self.assertEqual(category_tree().get_children(self.shoes.pk), [])
+
+    def test_queryset_delete_rebuilds_only_the_subtrees(self):
+        boots = CategoryFactory(name='Boots', parent=self.shoes)
+        rebuilt = []
+
+        def rebuild(categories):
+            rebuilt.append({category.pk for category in categories})
+            return rebuild_category_paths(categories)
+
+        with mock.patch('nxtbn.product.receivers.rebuild_category_paths', side_effect=rebuild):
+            Category.objects.filter(pk__in=[self.sneakers.pk, boots.pk]).delete()
+
+        self.assertCountEqual(rebuilt, [{self.running.pk}, set()])
+        self.refresh(self.running, self.shoes)
+        self.assertEqual((self.running.path, self.running.depth), (f'{self.running.pk}/', 0))
+        self.assertEqual(self.shoes.path, f'{self.shoes.pk}/')
+
+    def test_snapshot(self):
+        tree = category_tree()
+        with self.assertNumQueries(0):
+            self.assertEqual(category_tree().roots, [self.bags, self.shoes])
+            self.assertEqual(tree.get_ancestors(self.running.pk), [self.shoes, self.sneakers])
+            self.assertEqual(set(tree.get_descendant_ids(self.shoes.pk)), {self.sneakers.pk, self.running.pk})
+
+        CategoryFactory(name='Boots', parent=self.shoes)
+
+        self.assertEqual([child.name for child in category_tree().get_children(self.shoes.pk)], ['Boots', 'Sneakers'])
+
+
+class CategoryTreeAPITest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.shoes = CategoryFactory(name='Shoes')
+        self.sneakers = CategoryFactory(name='Sneakers', parent=self.shoes)
+        self.running = CategoryFactory(name='Running', parent=self.sneakers)
+        self.bags = CategoryFactory(name='Bags')
+
+    def test_category_tree_filter(self):
+        products = {
+            category.pk: ProductFactory(category=category, status=PublishableStatus.PUBLISHED)
+            for category in (self.shoes, self.running, self.bags)
+        }
+
+        response = self.client.get('/product/storefront/api/products/', {'category_tree': self.shoes.pk})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            {product['id'] for product in response.json()['results']},
+            {products[self.shoes.pk].id, products[self.running.pk].id},
+        )
+
+    def test_recursive_categories(self):
+        client = APIClient()
+        client.force_authenticate(UserFactory(is_staff=True, is_superuser=True, role=UserRole.ADMIN))
+        category_tree()  # built once per process
+
+        with self.assertNumQueries(1):
+            response = client.get(reverse('recursive-category'))
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        shoes = next(category for category in response.data if category['id'] == self.shoes.pk)
+        self.assertEqual(shoes['children'][0]['children'][0]['name'], 'Running')
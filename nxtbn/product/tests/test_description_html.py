@@ -0,0 +1,49 @@
+import json
+from unittest import mock
+
+from django.core.management import call_command
+from django.test import TestCase
+
+from nxtbn.core.seeding import rich_text_description
+from nxtbn.product.models import Product
+from nxtbn.product.tests import ProductFactory
+from nxtbn.product.utils import json_to_html
+
+
+class ProductDescriptionHtmlTestCase(TestCase):
+    def setUp(self):
+        self.description = rich_text_description()
+        self.product = ProductFactory(description=self.description, images=[])
+
+    def test_seeded_description_fits_the_field(self):
+        self.assertLessEqual(len(self.description), Product._meta.get_field('description').max_length)
+
+    def test_html_is_rendered_on_save(self):
+        product = Product.objects.get(pk=self.product.pk)
+        self.assertEqual(product.description_rendered, json_to_html(self.description))
+
+    def test_html_is_rerendered_when_description_changes(self):
+        self.product.description = json.dumps([{"type": "h1", "children": [{"text": "Updated"}]}])
+        self.product.save(update_fields=['description'])
+
+        product = Product.objects.get(pk=self.product.pk)
+        self.assertEqual(product.description_rendered, '<h1>Updated</h1>')
+
+    def test_reads_do_not_render(self):
+        product = Product.objects.get(pk=self.product.pk)
+        with mock.patch('nxtbn.product.models.json_to_html', side_effect=AssertionError('rendered on read')):
+            self.assertEqual(product.description_html(), json_to_html(self.description))
+
+    def test_backfill_command(self):
+        Product.objects.filter(pk=self.product.pk).update(description_rendered=None)
+
+        call_command('render_product_descriptions', stdout=mock.MagicMock())
+
+        product = Product.objects.get(pk=self.product.pk)
+        self.assertEqual(product.description_rendered, json_to_html(self.description))
+
+    def test_stored_html_matches_rendering(self):
+        product = Product.objects.get(pk=self.product.pk)
+        self.assertGreaterEqual(len(product.description), 4500)
+
+        self.assertEqual(product.description_html(), json_to_html(product.description))
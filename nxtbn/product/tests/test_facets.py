@@ -0,0 +1,104 @@
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from graphene.test import Client as GRAPHClient
+from rest_framework import status
+
+from nxtbn.core import PublishableStatus
+from nxtbn.storefront_schema import storefront_schema
+from nxtbn.product.api.storefront.views import ProductFilter
+from nxtbn.product.category_tree import category_tree
+from nxtbn.product.facets import product_facets
+from nxtbn.product.models import Product
+from nxtbn.product.tests import (
+    CategoryFactory,
+    CollectionFactory,
+    ProductFactory,
+    ProductTagFactory,
+    ProductVariantFactory,
+)
+
+
+def counts(values):
+    return [(item['label'], item['count']) for item in values]
+
+
+@override_settings(PRODUCT_FACET_PRICE_BANDS=[25, 50, 100])
+class ProductFacetsTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.shoes = CategoryFactory(name='Shoes')
+        self.sneakers = CategoryFactory(name='Sneakers', parent=self.shoes)
+        self.bags = CategoryFactory(name='Bags')
+        self.summer = CollectionFactory(name='Summer')
+        self.sale = ProductTagFactory(name='Sale')
+
+        self.create_product('Acme', self.sneakers, 20, collections=[self.summer], tags=[self.sale])
+        self.acme_bag = self.create_product('Acme', self.bags, 80, tags=[self.sale])
+        self.create_product('Zen', self.shoes, 30, collections=[self.summer])
+        self.create_product(None, self.bags, None)
+
+    def create_product(self, brand, category, price, collections=(), tags=()):
+        product = ProductFactory(brand=brand, category=category, status=PublishableStatus.PUBLISHED)
+        product.collections.set(collections)
+        product.tags.set(tags)
+        if price is not None:
+            product.default_variant = ProductVariantFactory(product=product, price=price)
+            product.save()
+        return product
+
+    def facets(self, **data):
+        return product_facets(ProductFilter, data, Product.objects.all(), 'test')
+
+    def test_counts(self):
+        category_tree()  # built once per process
+
+        with self.assertNumQueries(1):
+            facets = self.facets()
+
+        self.assertEqual(counts(facets['brand']), [('Acme', 2), ('Zen', 1)])
+        self.assertEqual(counts(facets['category']), [('Bags', 2), ('Shoes', 2), ('Sneakers', 1)])
+        self.assertEqual(counts(facets['collection']), [('Summer', 2)])
+        self.assertEqual(facets['tag'], [{'value': str(self.sale.pk), 'label': 'Sale', 'count': 2}])
+        self.assertEqual(counts(facets['price']), [('0-25', 1), ('25-50', 1), ('50-100', 1)])
+
+        with self.assertNumQueries(0):
+            self.assertEqual(self.facets(), facets)
+
+    def test_facets_ignore_their_own_filter(self):
+        facets = self.facets(brand='acme')
+
+        self.assertEqual(counts(facets['brand']), [('Acme', 2), ('Zen', 1)])
+        self.assertEqual(counts(facets['category']), [('Bags', 1), ('Shoes', 1), ('Sneakers', 1)])
+        self.assertEqual(counts(facets['price']), [('0-25', 1), ('50-100', 1)])
+
+        facets = self.facets(price_band='25-50', category_tree=self.shoes.pk)
+
+        self.assertEqual(counts(facets['brand']), [('Zen', 1)])
+        self.assertEqual(counts(facets['category']), [('Shoes', 1)])
+        self.assertEqual(counts(facets['price']), [('0-25', 1), ('25-50', 1)])
+
+    def test_rest_listing(self):
+        response = self.client.get('/product/storefront/api/products/faceted/', {'price_band': '50-100'})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        data = response.json()
+        self.assertEqual([product['id'] for product in data['results']], [self.acme_bag.id])
+        self.assertEqual(counts(data['facets']['brand']), [('Acme', 1)])
+        self.assertEqual(counts(data['facets']['price']), [('0-25', 1), ('25-50', 1), ('50-100', 1)])
+
+    def test_graphql(self):
+        query = """
+            query {
+                productFacets(brand: "zen") {
+                    brand { label count }
+                    collection { value label count }
+                }
+            }
+        """
+
+        response = GRAPHClient(storefront_schema).execute(query)
+
+        self.assertNotIn('errors', response)
+        facets = response['data']['productFacets']
+        self.assertEqual(facets['brand'], [{'label': 'Acme', 'count': 2}, {'label': 'Zen', 'count': 1}])
+        self.assertEqual(facets['collection'], [{'value': str(self.summer.pk), 'label': 'Summer', 'count': 1}])
@@ -0,0 +1,132 @@
+from decimal import Decimal
+
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from rest_framework import status
+
+from nxtbn.core import PublishableStatus
+from nxtbn.product.models import Product
+from nxtbn.product.tasks import refresh_all_product_listings
+from nxtbn.product.utils import catalog_cache_version
+from nxtbn.product.tests import ProductFactory, ProductVariantFactory
+from nxtbn.warehouse.tests import StockFactory, WarehouseFactory
+from nxtbn.warehouse.utils import apply_stock_deltas, stock_deltas
+
+
+def listing_updates(queries):
+    return [query for query in queries if query['sql'].startswith('UPDATE "product_product" SET "min_price"')]
+
+
+class ProductListingFieldsTest(TestCase):
+    def setUp(self):
+        self.product = ProductFactory(status=PublishableStatus.PUBLISHED)
+
+    def listing(self, product=None):
+        return Product.objects.values_list('min_price', 'max_price', 'variant_count', 'in_stock').get(
+            pk=(product or self.product).pk
+        )
+
+    def test_follows_variants(self):
+        self.assertEqual(self.listing(), (None, None, 0, False))
+
+        cheap = ProductVariantFactory(product=self.product, price=Decimal('10'), track_inventory=False)
+        expensive = ProductVariantFactory(product=self.product, price=Decimal('40'), track_inventory=False)
+        self.assertEqual(self.listing(), (Decimal('10'), Decimal('40'), 2, True))
+
+        expensive.price = Decimal('5')
+        expensive.save()
+        self.assertEqual(self.listing(), (Decimal('5'), Decimal('10'), 2, True))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            cheap.delete()
+        self.assertEqual(self.listing(), (Decimal('5'), Decimal('5'), 1, True))
+
+        # a stale instance doesn't overwrite the listing columns
+        self.product.name = 'Renamed'
+        self.product.save()
+        self.assertEqual(self.listing(), (Decimal('5'), Decimal('5'), 1, True))
+
+    def test_follows_stock(self):
+        variant = ProductVariantFactory(product=self.product, price=Decimal('10'), track_inventory=True)
+        self.assertFalse(self.listing()[3])
+        warehouse = WarehouseFactory()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            StockFactory(warehouse=warehouse, product_variant=variant, quantity=3, reserved=0)
+        self.assertTrue(self.listing()[3])
+
+        deltas = stock_deltas()
+        deltas[warehouse.pk, variant.pk]['reserved'] += 3
+        with self.captureOnCommitCallbacks(execute=True), transaction.atomic():
+            apply_stock_deltas(deltas)
+            self.assertTrue(self.listing()[3])  # refreshed once committed
+        self.assertFalse(self.listing()[3])
+
+        variant.allow_backorder = True
+        variant.save()
+        self.assertTrue(self.listing()[3])
+
+    def test_stock_changes_of_a_transaction_refresh_once(self):
+        variants = [ProductVariantFactory(product=self.product, track_inventory=True) for _ in range(3)]
+        warehouse = WarehouseFactory()
+        version = catalog_cache_version()
+
+        with CaptureQueriesContext(connection) as queries:
+            with self.captureOnCommitCallbacks(execute=True), transaction.atomic():
+                for variant in variants:
+                    StockFactory(warehouse=warehouse, product_variant=variant, quantity=2, reserved=0)
+        self.assertEqual(len(listing_updates(queries)), 1)
+        self.assertTrue(self.listing()[3])
+        self.assertNotEqual(catalog_cache_version(), version)  # in_stock flipped
+
+        version = catalog_cache_version()
+        with self.captureOnCommitCallbacks(execute=True):
+            StockFactory(warehouse=WarehouseFactory(), product_variant=variants[0], quantity=1, reserved=0)
+        self.assertEqual(catalog_cache_version(), version)  # still in stock, the cached pages are kept
+
+    def test_deleting_a_product_does_not_refresh_its_listing(self):
+        ProductVariantFactory.create_batch(3, product=self.product, track_inventory=False)
+
+        with CaptureQueriesContext(connection) as queries:
+            with self.captureOnCommitCallbacks(execute=True):
+                Product.objects.filter(pk=self.product.pk).delete()
+
+        self.assertEqual(listing_updates(queries), [])
+
+    def test_deferred_fields_are_not_saved(self):
+        product = Product.objects.only('name').get(pk=self.product.pk)
+        product.name = 'Renamed'
+
+        with self.assertNumQueries(1):
+            product.save()
+
+        self.assertEqual(Product.objects.get(pk=self.product.pk).name, 'Renamed')
+
+    def test_safety_net_task(self):
+        ProductVariantFactory(product=self.product, price=Decimal('10'), track_inventory=False)
+        Product.objects.update(min_price=None, max_price=None, variant_count=0, in_stock=False)
+
+        self.assertEqual(refresh_all_product_listings(chunk_size=1), Product.objects.count())
+
+        self.assertEqual(self.listing(), (Decimal('10'), Decimal('10'), 1, True))
+
+    def test_storefront_listing(self):
+        cache.clear()
+        ProductVariantFactory(product=self.product, price=Decimal('30'), track_inventory=False)
+        cheaper = ProductFactory(status=PublishableStatus.PUBLISHED)
+        ProductVariantFactory(product=cheaper, price=Decimal('12'), track_inventory=False)
+        ProductVariantFactory(product=cheaper, price=Decimal('20'), track_inventory=False)
+        sold_out = ProductFactory(status=PublishableStatus.PUBLISHED)
+        ProductVariantFactory(product=sold_out, price=Decimal('1'), track_inventory=True)
+
+        response = self.client.get(
+            '/product/storefront/api/products/', {'in_stock': 'true', 'ordering': 'min_price'},
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        results = response.json()['results']
+        self.assertEqual([product['id'] for product in results], [cheaper.pk, self.product.pk])
+        self.assertTrue(results[0]['in_stock'])
+        self.assertIsNotNone(results[0]['price_range'])
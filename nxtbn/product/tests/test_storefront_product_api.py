@@ -43,6 +43,13 @@ class ProductListAPITest(BaseTestCase):
         for product in response.data['results']:
             self.assertNotIn('variants', product) # only default variant should be present, not all variants
 
+    def test_product_list_query_budget(self):
+        url = reverse('product-list')
+        # prefetched, the count must not grow with the 20 listed products
+        with self.assertQueryBudget(10, max_repeats=1):
+            response = self.auth_client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
 
     def get_product_list_api_with_variant_only(self):
         url = reverse('product-withvariant')
@@ -1,4 +1,122 @@
+import functools
 import json
+import threading
+import time
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, Exists, F, Max, Min, OuterRef, Q, Subquery, Sum
+from django.db.models.functions import Coalesce
+from django.views.decorators.cache import cache_page
+
+
+CATALOG_CACHE_VERSION_KEY = 'product:catalog-cache-version'
+CATEGORY_TREE_VERSION_KEY = 'product:category-tree-version'
+
+
+def catalog_cache_version():
+    """Part of the key of every cached catalog response, changed by invalidate_catalog_caches()."""
+    return cache.get_or_set(CATALOG_CACHE_VERSION_KEY, time.time_ns, timeout=None)
+
+
+def invalidate_catalog_caches():
+    """Makes every response cached with catalog_cache_page a miss, in one cache write."""
+    cache.set(CATALOG_CACHE_VERSION_KEY, time.time_ns(), timeout=None)
+
+
+def category_tree_version():
+    """Changed by invalidate_category_tree(), the in-process category tree snapshots are rebuilt when it does."""
+    return cache.get_or_set(CATEGORY_TREE_VERSION_KEY, time.time_ns, timeout=None)
+
+
+def invalidate_category_tree():
+    cache.set(CATEGORY_TREE_VERSION_KEY, time.time_ns(), timeout=None)
+    invalidate_catalog_caches()  # product listings filtered by category_tree
+
+
+def catalog_cache_page(timeout):
+    """Like cache_page, with the entries dropped by invalidate_catalog_caches()."""
+    def decorator(view_func):
+        @functools.wraps(view_func)
+        def wrapper(request, *args, **kwargs):
+            cached_view = cache_page(timeout, key_prefix=f'catalog.{catalog_cache_version()}')(view_func)
+            return cached_view(request, *args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def refresh_product_listings(product_ids):
+    """
+    Recomputes the listing columns of the products (min_price, max_price, variant_count and
+    in_stock) from their variants and stock, with one UPDATE whatever the number of products.
+    `product_ids` can be a queryset of ids. Returns the number of products updated.
+
+    A product is in stock when one of its variants can be sold: it doesn't track inventory,
+    allows backorders, or has stock left once the reservations are taken off.
+    """
+    from nxtbn.product.models import Product, ProductVariant
+    from nxtbn.warehouse.models import Stock
+
+    variants = ProductVariant.objects.filter(product=OuterRef('pk')).order_by().values('product')
+    available = (
+        Stock.objects.filter(product_variant=OuterRef('pk')).order_by().values('product_variant')
+        .annotate(available=Sum(F('quantity') - F('reserved'))).values('available')
+    )
+    sellable = ProductVariant.objects.filter(product=OuterRef('pk')).annotate(available=Subquery(available)).filter(
+        Q(track_inventory=False) | Q(allow_backorder=True) | Q(available__gt=0)
+    )
+    return Product.objects.filter(pk__in=product_ids).update(
+        min_price=Subquery(variants.annotate(price=Min('price')).values('price')),
+        max_price=Subquery(variants.annotate(price=Max('price')).values('price')),
+        variant_count=Coalesce(Subquery(variants.annotate(count=Count('pk')).values('count')), 0),
+        in_stock=Exists(sellable),
+    )
+
+
+_pending_listings = threading.local()
+
+
+def _refresh_pending_listings():
+    """The on_commit callback of the deferred listing refreshes, refreshes every pending product at once."""
+    from nxtbn.product.models import PRODUCT_LISTING_FIELDS, Product, ProductVariant
+
+    variant_ids = getattr(_pending_listings, 'variant_ids', set())
+    product_ids = getattr(_pending_listings, 'product_ids', set())
+    _pending_listings.variant_ids, _pending_listings.product_ids = set(), set()
+    if not variant_ids and not product_ids:  # taken by an earlier callback of the transaction
+        return
+
+    products = Product.objects.filter(
+        Q(pk__in=product_ids) | Q(pk__in=ProductVariant.objects.filter(pk__in=variant_ids).values('product'))
+    )  # deleted products drop out
+    listings = set(products.values_list('pk', *PRODUCT_LISTING_FIELDS))
+    refresh_product_listings([listing[0] for listing in listings])
+    if set(products.values_list('pk', *PRODUCT_LISTING_FIELDS)) != listings:
+        invalidate_catalog_caches()  # the cached listings show these columns
+
+
+def _defer_listing_refresh(variant_ids=(), product_ids=()):
+    if not hasattr(_pending_listings, 'variant_ids'):
+        _pending_listings.variant_ids, _pending_listings.product_ids = set(), set()
+    _pending_listings.variant_ids.update(variant_ids)
+    _pending_listings.product_ids.update(product_ids)
+    # every call registers a callback, so none is lost with a rolled back savepoint; the first
+    # one to run takes all the pending ids, the others find nothing left to do
+    transaction.on_commit(_refresh_pending_listings)
+
+
+def refresh_variant_listings(variant_ids):
+    """
+    refresh_product_listings for the products of the variants, after their stock changed. Runs once
+    the transaction commits, so that a stock reservation doesn't hold the product rows locked; the
+    products of every call in a transaction are refreshed together, with one UPDATE.
+    """
+    _defer_listing_refresh(variant_ids=variant_ids)
+
+
+def refresh_product_listings_on_commit(product_ids):
+    """refresh_product_listings once the transaction commits, together with refresh_variant_listings."""
+    _defer_listing_refresh(product_ids=product_ids)
 
 
 def json_to_html(json_data):
@@ -193,11 +193,13 @@ class PurchaseOrderItemUpdateSerializer(serializers.Serializer):
         rejected_quantity = data['rejected_quantity']
 
     
-        instance = self.context.get('instance')
+        # the items of the purchase order are fetched once for the whole list
+        order_items = self.context.get('order_items')
+        if order_items is None:
+            order_items = self.context['order_items'] = self.context['instance'].items.in_bulk()
 
-        try:
-            order_item = instance.items.get(id=item_id)
-        except PurchaseOrderItem.DoesNotExist:
+        order_item = order_items.get(item_id)
+        if order_item is None:
             raise serializers.ValidationError(
                 f"Item with id {item_id} does not exist in the purchase order."
             )
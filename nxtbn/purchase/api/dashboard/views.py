@@ -5,7 +5,7 @@ from nxtbn.purchase.models import PurchaseOrder, PurchaseOrderItem
 from django.db import transaction
 from nxtbn.core.paginator import NxtbnPagination
 from nxtbn.users import UserRole
-from nxtbn.warehouse.models import Stock   
+from nxtbn.warehouse.utils import apply_stock_deltas, stock_deltas
 from rest_framework import generics, viewsets, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
@@ -71,15 +71,10 @@ class PurchaseViewSet(viewsets.ModelViewSet):
                 purchase_order.save()
 
                 # Update stock levels as incoming stock with associated warehouse
+                deltas = stock_deltas()
                 for item in purchase_order.items.all():
-                    stock, created = Stock.objects.get_or_create(
-                        warehouse=purchase_order.destination,
-                        defaults={'incoming': item.ordered_quantity},
-                        product_variant=item.variant,
-                    )
-                    if not created:
-                        stock.incoming += item.ordered_quantity
-                        stock.save()
+                    deltas[purchase_order.destination_id, item.variant_id]['incoming'] += item.ordered_quantity
+                apply_stock_deltas(deltas, create_missing_in={purchase_order.destination_id})
 
             return Response({
                 "message": "Purchase order marked as ordered successfully.",
@@ -143,16 +138,15 @@ class PurchaseViewSet(viewsets.ModelViewSet):
                 purchase_order.save()
 
                 # Update stock levels as received stock with associated warehouse
+                deltas = stock_deltas()
                 for item in purchase_order.items.all():
                     # validate if received quantity + rejected quantity is equal to ordered quantity
                     if item.ordered_quantity != item.received_quantity + item.rejected_quantity:
-                        raise ValueError(f"Received quantity and rejected quantity should sum to ordered quantity for item {item.variant.id}")
-                    
+                        raise ValueError(f"Received quantity and rejected quantity should sum to ordered quantity for item {item.variant_id}")
 
-                    stock = Stock.objects.get(warehouse=purchase_order.destination, product_variant=item.variant)
-                    stock.incoming -= item.ordered_quantity
-                    stock.quantity += item.received_quantity
-                    stock.save()
+                    deltas[purchase_order.destination_id, item.variant_id]['incoming'] -= item.ordered_quantity
+                    deltas[purchase_order.destination_id, item.variant_id]['quantity'] += item.received_quantity
+                apply_stock_deltas(deltas)
 
             return Response({
                 "message": "Purchase order marked as received successfully.",
@@ -191,19 +185,16 @@ class InventoryReceivingAPI(generics.UpdateAPIView):
         items_data = serializer.validated_data['items']
 
         with transaction.atomic():
+            # the items were checked against the purchase order by the serializer
+            order_items = serializer.context.get('order_items', {})
+            updated = {}
             for item_data in items_data:
-                item_id = item_data['id']
-                received_quantity = item_data['received_quantity']
-                rejected_quantity = item_data['rejected_quantity']
-
-                try:
-                    order_item = instance.items.get(id=item_id)
-                    order_item.received_quantity = received_quantity
-                    order_item.rejected_quantity = rejected_quantity
-                    order_item.save()
-                except PurchaseOrderItem.DoesNotExist:
-                    raise serializers.ValidationError(f"Item with id {item_id} does not exist in the purchase order.")
-                except Stock.DoesNotExist:
-                    raise serializers.ValidationError(f"Stock entry not found for item id {item_id}.")
+                order_item = updated[item_data['id']] = order_items[item_data['id']]
+                order_item.received_quantity = item_data['received_quantity']
+                order_item.rejected_quantity = item_data['rejected_quantity']
+
+            PurchaseOrderItem.objects.bulk_update(
+                updated.values(), ['received_quantity', 'rejected_quantity'],
+            )
 
         return Response({"message": "Inventory receiving updated successfully."}, status=status.HTTP_200_OK)
\ No newline at end of file
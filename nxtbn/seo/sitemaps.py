@@ -0,0 +1,176 @@
+"""
+Sharded sitemaps.
+
+Rows are split into shards by primary key range (shard n holds ids n*limit+1 .. (n+1)*limit),
+so a shard never exceeds the 50k URL limit of the protocol and a row keeps its shard when
+other rows are added or removed. One grouped query returns the row count and max(last_modified)
+of every shard; that pair is the cache key of the rendered shard, so only shards whose rows
+changed are regenerated. Shards are generated from `.values()` projections with `.iterator()`,
+never loading full model instances.
+"""
+
+from django.core.cache import cache
+from django.db.models import Count, ExpressionWrapper, F, IntegerField, Max
+from django.urls import reverse
+from django.utils.html import escape
+
+from nxtbn.core import PublishableStatus
+from nxtbn.product.models import Product
+
+
+SITEMAP_SHARD_SIZE = 50000
+SITEMAP_CACHE_TIMEOUT = 60 * 60 * 24
+SITEMAP_INDEX_CACHE_TIMEOUT = 60 * 15  # the index lastmods trail the shards by at most this
+SITEMAP_ITERATOR_CHUNK_SIZE = 2000
+
+URLSET_OPEN = '<?xml version="1.0" encoding="UTF-8"?>\n<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">\n'
+URLSET_CLOSE = '</urlset>\n'
+
+
+def format_lastmod(value):
+    return value.date().isoformat() if value else None
+
+
+def url_entry(loc, lastmod=None, changefreq=None, priority=None):
+    parts = [f'<url><loc>{escape(loc)}</loc>']
+    if lastmod:
+        parts.append(f'<lastmod>{lastmod}</lastmod>')
+    if changefreq:
+        parts.append(f'<changefreq>{changefreq}</changefreq>')
+    if priority is not None:
+        parts.append(f'<priority>{priority}</priority>')
+    parts.append('</url>\n')
+    return ''.join(parts)
+
+
+class StaticSitemapSection:
+    name = 'static'
+    changefreq = 'monthly'
+    priority = 0.8
+    url_names = ['home']
+
+    def shard_stats(self):
+        return {0: {'count': len(self.url_names), 'lastmod': None}}
+
+    def get_shard_stats(self, shard):
+        return self.shard_stats().get(shard, {'count': 0, 'lastmod': None})
+
+    def cache_key(self, shard, stats):
+        return None  # cheap enough to render on every hit
+
+    def iter_entries(self, shard, build_absolute_uri):
+        for url_name in self.url_names:
+            yield url_entry(build_absolute_uri(reverse(url_name)), changefreq=self.changefreq, priority=self.priority)
+
+
+class ModelSitemapSection:
+    """Base for sections backed by a model, subclasses define the queryset and the location."""
+    name = None
+    changefreq = 'weekly'
+    priority = 0.7
+    fields = ('id', 'last_modified')
+    shard_size = SITEMAP_SHARD_SIZE
+
+    def get_queryset(self):
+        raise NotImplementedError
+
+    def location(self, row):
+        raise NotImplementedError
+
+    def shard_stats(self):
+        """Returns {shard: {'count': ..., 'lastmod': ...}} for every non empty shard, in one query."""
+        shard = ExpressionWrapper((F('id') - 1) / self.shard_size, output_field=IntegerField())
+        rows = (
+            self.get_queryset()
+            .order_by()
+            .annotate(shard=shard)
+            .values('shard')
+            .annotate(count=Count('id'), lastmod=Max('last_modified'))
+            .order_by('shard')
+        )
+        return {row['shard']: {'count': row['count'], 'lastmod': row['lastmod']} for row in rows}
+
+    def get_shard_queryset(self, shard):
+        start = shard * self.shard_size
+        return self.get_queryset().filter(id__gt=start, id__lte=start + self.shard_size)
+
+    def get_shard_stats(self, shard):
+        return self.get_shard_queryset(shard).order_by().aggregate(count=Count('id'), lastmod=Max('last_modified'))
+
+    def cache_key(self, shard, stats):
+        lastmod = stats['lastmod'].timestamp() if stats['lastmod'] else 0
+        return f"sitemap:{self.name}:{self.shard_size}:{shard}:{stats['count']}:{lastmod}"
+
+    def iter_entries(self, shard, build_absolute_uri):
+        rows = (
+            self.get_shard_queryset(shard)
+            .order_by('id')
+            .values(*self.fields)
+            .iterator(chunk_size=SITEMAP_ITERATOR_CHUNK_SIZE)
+        )
+        for row in rows:
+            yield url_entry(
+                build_absolute_uri(self.location(row)),
+                lastmod=format_lastmod(row['last_modified']),
+                changefreq=self.changefreq,
+                priority=self.priority,
+            )
+
+
+class ProductSitemapSection(ModelSitemapSection):
+    name = 'product'
+    fields = ('id', 'slug', 'last_modified')
+
+    def get_queryset(self):
+        return Product.objects.filter(status=PublishableStatus.PUBLISHED)
+
+    def location(self, row):
+        return reverse('product_detail', args=[row['slug']])
+
+
+SITEMAP_SECTIONS = {
+    section.name: section
+    for section in (StaticSitemapSection(), ProductSitemapSection())
+}
+
+
+def iter_shard_xml(section, shard, build_absolute_uri, cache_key=None):
+    """
+    Yields the shard document in chunks. When a cache key is given, the complete
+    document is stored once the last chunk has been produced.
+    """
+    chunks = [URLSET_OPEN]
+    yield URLSET_OPEN
+
+    buffer = []
+    for entry in section.iter_entries(shard, build_absolute_uri):
+        buffer.append(entry)
+        if len(buffer) >= SITEMAP_ITERATOR_CHUNK_SIZE:
+            chunk = ''.join(buffer)
+            chunks.append(chunk)
+            buffer = []
+            yield chunk
+    buffer.append(URLSET_CLOSE)
+    chunk = ''.join(buffer)
+    chunks.append(chunk)
+    yield chunk
+
+    if cache_key:
+        cache.set(cache_key, ''.join(chunks), timeout=SITEMAP_CACHE_TIMEOUT)
+
+
+def render_sitemap_index(build_absolute_uri):
+    parts = [
+        '<?xml version="1.0" encoding="UTF-8"?>\n',
+        '<sitemapindex xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">\n',
+    ]
+    for name, section in SITEMAP_SECTIONS.items():
+        for shard, stats in section.shard_stats().items():
+            loc = build_absolute_uri(reverse('sitemap_section', kwargs={'section': name, 'shard': shard}))
+            parts.append(f'<sitemap><loc>{escape(loc)}</loc>')
+            lastmod = format_lastmod(stats['lastmod'])
+            if lastmod:
+                parts.append(f'<lastmod>{lastmod}</lastmod>')
+            parts.append('</sitemap>\n')
+    parts.append('</sitemapindex>\n')
+    return ''.join(parts)
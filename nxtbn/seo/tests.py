@@ -1,3 +1,62 @@
+from unittest import mock
+
+from django.core.cache import cache
 from django.test import TestCase
+from django.urls import reverse
+
+from nxtbn.core import PublishableStatus
+from nxtbn.product.tests import ProductFactory
+from nxtbn.seo.sitemaps import ProductSitemapSection
+
+
+class SitemapTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.published = ProductFactory(images=[], status=PublishableStatus.PUBLISHED)
+        self.draft = ProductFactory(images=[], status=PublishableStatus.DRAFT)
+
+    def get_shard(self, section, shard):
+        response = self.client.get(reverse('sitemap_section', kwargs={'section': section, 'shard': shard}))
+        content = b''.join(response.streaming_content) if response.streaming else response.content
+        return response, content.decode()
+
+    def test_index_lists_non_empty_shards(self):
+        response = self.client.get(reverse('sitemap_xml'))
+        self.assertEqual(response.status_code, 200)
+        content = response.content.decode()
+        self.assertIn('/sitemap-static-0.xml', content)
+        self.assertIn('/sitemap-product-0.xml', content)
+        self.assertNotIn('/sitemap-product-1.xml', content)
+
+        with self.assertNumQueries(0):  # the grouped shard counts are cached
+            self.assertEqual(self.client.get(reverse('sitemap_xml')).content.decode(), content)
+
+    def test_product_shard_excludes_drafts(self):
+        response, content = self.get_shard('product', 0)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(reverse('product_detail', args=[self.published.slug]), content)
+        self.assertNotIn(reverse('product_detail', args=[self.draft.slug]), content)
+
+    def test_shards_are_split_by_id_range(self):
+        with mock.patch.object(ProductSitemapSection, 'shard_size', 1):
+            stats = ProductSitemapSection().shard_stats()
+            self.assertEqual(list(stats.keys()), [self.published.id - 1])
+            self.assertEqual(self.get_shard('product', self.draft.id - 1)[0].status_code, 404)
+
+    def test_shard_is_cached_until_its_rows_change(self):
+        first, _ = self.get_shard('product', 0)
+        self.assertTrue(first.streaming)
+
+        with self.assertNumQueries(1):  # only the shard stats, the document comes from the cache
+            cached, _ = self.get_shard('product', 0)
+        self.assertFalse(cached.streaming)
+
+        self.draft.status = PublishableStatus.PUBLISHED
+        self.draft.save()
+
+        regenerated, content = self.get_shard('product', 0)
+        self.assertTrue(regenerated.streaming)
+        self.assertIn(reverse('product_detail', args=[self.draft.slug]), content)
 
-# Create your tests here.
+    def test_unknown_section_is_not_found(self):
+        self.assertEqual(self.get_shard('unknown', 0)[0].status_code, 404)
@@ -1,10 +1,11 @@
-from django.http import HttpResponse
+from django.core.cache import cache
+from django.http import Http404, HttpResponse, StreamingHttpResponse
 from django.shortcuts import render
-from django.contrib.sitemaps import Sitemap
 from django.urls import reverse
 from django.contrib.sites.models import Site
-from nxtbn.post.models import Post
-from nxtbn.product.models import Product
+
+from nxtbn.product.utils import catalog_cache_page
+from nxtbn.seo.sitemaps import SITEMAP_INDEX_CACHE_TIMEOUT, SITEMAP_SECTIONS, iter_shard_xml, render_sitemap_index
 
 def robots_txt(request):
     current_site = Site.objects.get_current()  # Gets the current site based on SITE_ID
@@ -26,47 +27,29 @@ def robots_txt(request):
 
 
 
-class StaticViewSitemap(Sitemap): # added for the demonstration only
-    changefreq = "monthly"
-    priority = 0.8
-
-    def items(self):
-        return [
-            'home',
-            # 'about',
-            # 'contact'
-        ]  # Names of views or URL names / doesn't exist yet, just for placeholder
-
-    def location(self, item):
-        return reverse(item)
-
-
-
-class ProductSitemap(Sitemap):
-    changefreq = "weekly" 
-    priority = 0.7
+@catalog_cache_page(SITEMAP_INDEX_CACHE_TIMEOUT)
+def sitemap_index(request):
+    content = render_sitemap_index(request.build_absolute_uri)
+    return HttpResponse(content, content_type="application/xml")
 
-    def items(self):
-        return Product.objects.all().order_by("id")
 
-    def lastmod(self, obj):
-        return obj.last_modified
+def sitemap_section(request, section, shard):
+    sitemap = SITEMAP_SECTIONS.get(section)
+    if sitemap is None:
+        raise Http404("No such sitemap section.")
 
+    stats = sitemap.get_shard_stats(shard)
+    if not stats['count']:
+        raise Http404("Empty sitemap page.")
 
-class PostSitemap(Sitemap):
-    changefreq = "weekly" 
-    priority = 0.7
+    cache_key = sitemap.cache_key(shard, stats)
+    if cache_key:
+        cache_key = f"{cache_key}:{request.get_host()}" # locations are absolute urls
+        content = cache.get(cache_key)
+        if content is not None:
+            return HttpResponse(content, content_type="application/xml")
 
-    def items(self):
-        return Post.objects.all().order_by("id")
-
-    def lastmod(self, obj):
-        return obj.last_modified
-
-
-
-site_maps = {
-    'static': StaticViewSitemap(),
-    'product': ProductSitemap(),
-    'post': PostSitemap(),
-}
\ No newline at end of file
+    return StreamingHttpResponse(
+        iter_shard_xml(sitemap, shard, request.build_absolute_uri, cache_key=cache_key),
+        content_type="application/xml",
+    )
@@ -317,6 +317,10 @@ STORAGES = {
     "staticfiles": {
         "BACKEND": "whitenoise.storage.CompressedManifestStaticFilesStorage",
     },
+    # catalog import/export files, Cloudinary's media storage only takes images
+    "catalog": {
+        "BACKEND": 'cloudinary_storage.storage.RawMediaCloudinaryStorage' if IS_CLOUDINARY else STORAGE_BACKEND,
+    },
 }
 
 
@@ -427,22 +431,26 @@ def _test_redis_connection(redis_url):
 
 REDIS_AVAILABLE = _test_redis_connection(REDIS_URL) if get_env_var("REDIS_URL", default="") else False
 
+# nxtbn.core.cache_backends wrap the Django backends to count hits and misses (see METRICS_* below)
 CACHES = {
     "default": {
-        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        "BACKEND": "nxtbn.core.cache_backends.LocMemCache",
         "LOCATION": "unique-snowflake",
+        "METRICS_NAME": "default",
     },
     "generic": {
-        "BACKEND": "django.core.cache.backends.memcached.PyMemcacheCache",
+        "BACKEND": "nxtbn.core.cache_backends.PyMemcacheCache",
         "LOCATION": get_env_var("MEMCACHE_LOCATION", "127.0.0.1:11211"),
+        "METRICS_NAME": "generic",
     }
 }
 
 # Use Redis if available and configured
 if REDIS_AVAILABLE:
     CACHES["default"] = {
-        "BACKEND": "django.core.cache.backends.redis.RedisCache",
+        "BACKEND": "nxtbn.core.cache_backends.RedisCache",
         "LOCATION": REDIS_URL,
+        "METRICS_NAME": "default",
         "OPTIONS": {
             "socket_connect_timeout": 2,
             "socket_timeout": 2,
@@ -451,7 +459,70 @@ if REDIS_AVAILABLE:
 
 # Fallback for generic cache
 if not get_env_var("MEMCACHE_LOCATION", default=""):
-    CACHES["generic"]["BACKEND"] = "django.core.cache.backends.dummy.DummyCache"
+    CACHES["generic"]["BACKEND"] = "nxtbn.core.cache_backends.DummyCache"
+
+# Request, database, cache and GraphQL metrics exposed at /metrics/ in the Prometheus text format.
+# With several gunicorn workers, set METRICS_MULTIPROC_DIR to a directory shared by the workers
+# (emptied on start), each worker writes its snapshot there every METRICS_FLUSH_INTERVAL seconds.
+METRICS_ENABLED = get_env_var("METRICS_ENABLED", default=True, var_type=bool)
+METRICS_MULTIPROC_DIR = get_env_var("METRICS_MULTIPROC_DIR", default="")
+METRICS_FLUSH_INTERVAL = get_env_var("METRICS_FLUSH_INTERVAL", default=5, var_type=int)
+METRICS_AUTH_TOKEN = get_env_var("METRICS_AUTH_TOKEN", default="")  # /metrics/ requires "Authorization: Bearer <token>", without a token it's only open with DEBUG
+METRICS_MAX_GRAPHQL_OPERATIONS = 200  # distinct operation names tracked, later ones are reported as "other"
+USER_AGENT_CACHE_SIZE = 2048  # user-agent strings whose parse result is kept (nxtbn.core.user_agent)
+
+# Per-request query tracking (nxtbn.core.query_tracker): a query fingerprint repeated QUERY_N_PLUS_ONE_THRESHOLD
+# times in one request is logged as a likely N+1. QUERY_DEBUG_HEADERS adds X-DB-Query-Count, X-DB-Query-Time-Ms
+# and X-DB-N-Plus-One to responses, enable it in debug and staging only.
+QUERY_N_PLUS_ONE_THRESHOLD = get_env_var("QUERY_N_PLUS_ONE_THRESHOLD", default=5, var_type=int)
+QUERY_DEBUG_HEADERS = get_env_var("QUERY_DEBUG_HEADERS", default=DEBUG or DEVELOPMENT_SERVER, var_type=bool)
+
+# Cart storage: carts live in redis when it is reachable, write-through to the Cart tables happens at checkout.
+# Without redis they live in the StoredCart table, shared by the worker processes, in every environment: the
+# process-local LocMemCartStorage loses carts across workers and restarts, it is only for tests and single process setups.
+CART_REDIS_URL = get_env_var("CART_REDIS_URL", default=REDIS_URL)
+if REDIS_AVAILABLE:
+    _DEFAULT_CART_STORAGE_BACKEND = "nxtbn.cart.storage.RedisCartStorage"
+else:
+    _DEFAULT_CART_STORAGE_BACKEND = "nxtbn.cart.storage.DatabaseCartStorage"
+CART_STORAGE_BACKEND = get_env_var("CART_STORAGE_BACKEND", default=_DEFAULT_CART_STORAGE_BACKEND)
+CART_TTL = get_env_var("CART_TTL", default=60 * 60 * 24 * 30, var_type=int)  # seconds since the last change
+
+# Catalog import/export (nxtbn.product.catalog_io): rows are validated and written CATALOG_IMPORT_BATCH_SIZE at a time
+CATALOG_IMPORT_BATCH_SIZE = get_env_var("CATALOG_IMPORT_BATCH_SIZE", default=1000, var_type=int)
+CATALOG_IMPORT_MAX_ERRORS = 1000  # per-row errors kept on the job, the failed rows are still counted
+CATALOG_EXPORT_CHUNK_SIZE = 2000  # variants fetched per round trip of the server-side cursor
+
+# Bulk product jobs (nxtbn.product.bulk_jobs): products processed per transaction, and the pause between two
+BULK_JOB_CHUNK_SIZE = get_env_var("BULK_JOB_CHUNK_SIZE", default=200, var_type=int)
+BULK_JOB_THROTTLE = float(get_env_var("BULK_JOB_THROTTLE", default=0.5))  # seconds
+BULK_JOB_MAX_FAILURES = 1000  # failed products kept on the job, the rest are only counted
+
+# Bulk stock levels (nxtbn.warehouse.utils.upsert_stock_levels): one upsert statement per STOCK_UPSERT_BATCH_SIZE rows
+STOCK_UPSERT_BATCH_SIZE = get_env_var("STOCK_UPSERT_BATCH_SIZE", default=2000, var_type=int)
+STOCK_UPSERT_MAX_ROWS = 50000  # rows accepted by one request of the bulk stock endpoint
+
+# In-process category tree snapshots (nxtbn.product.category_tree) are rebuilt on category changes, and at least
+# every CATEGORY_TREE_SNAPSHOT_TTL seconds for the changes made by other processes with a per-process cache
+CATEGORY_TREE_SNAPSHOT_TTL = get_env_var("CATEGORY_TREE_SNAPSHOT_TTL", default=60, var_type=int)
+
+# Storefront product facets (nxtbn.product.facets): upper bounds of the price bands, in the base currency (the last
+# band is open ended), and seconds the facet counts of a filter set are cached
+PRODUCT_FACET_PRICE_BANDS = [25, 50, 100, 250, 500]
+PRODUCT_FACET_CACHE_TIMEOUT = get_env_var("PRODUCT_FACET_CACHE_TIMEOUT", default=900, var_type=int)
+
+# Stock holds of unpaid pending orders, released by the reservation sweeper (nxtbn.warehouse.tasks, every 5 minutes)
+# after the hold TTL of their order source, in minutes. Sources without an entry use 'default', None or 0 never expires.
+# Off by default: set e.g. STOCK_RESERVATION_TTL_STOREFRONT=60 to release the holds of unpaid storefront orders.
+STOCK_RESERVATION_TTL = {
+    'storefront': get_env_var("STOCK_RESERVATION_TTL_STOREFRONT", default=0, var_type=int),
+    'store': get_env_var("STOCK_RESERVATION_TTL_STORE", default=0, var_type=int),
+    'admin': None,
+    'default': None,
+}
+STOCK_RESERVATION_TTL_EXEMPT_PAYMENT_METHODS = ['CASH_ON_DELIVERY', 'CASH_IN_STORE']  # paid on delivery, never expire
+STOCK_RESERVATION_SWEEP_BATCH_SIZE = get_env_var("STOCK_RESERVATION_SWEEP_BATCH_SIZE", default=100, var_type=int)
+STOCK_RESERVATION_SWEEP_MAX_BATCHES = 50  # per run, the next run continues
 
 # ============================
 # NXTBN Specific Configuration
@@ -473,6 +544,11 @@ HUBTEL_POS_SALES_ID = get_env_var('HUBTEL_POS_SALES_ID', default='')
 HUBTEL_CALLBACK_URL = get_env_var('HUBTEL_CALLBACK_URL', default='')
 # Optional comma-separated list of allowed Hubtel callback source IPs (for extra safety)
 HUBTEL_ALLOWED_IPS = get_env_var('HUBTEL_ALLOWED_IPS', default='', var_type=list)
+# Hubtel API hosts, override to point the client at a sandbox or a local stub server
+HUBTEL_RECEIVE_MONEY_BASE_URL = get_env_var('HUBTEL_RECEIVE_MONEY_BASE_URL', default='https://rmp.hubtel.com')
+HUBTEL_STATUS_BASE_URL = get_env_var('HUBTEL_STATUS_BASE_URL', default='https://api-txnstatus.hubtel.com')
+# Max keep-alive connections kept open to each Hubtel host per process
+HUBTEL_POOL_MAXSIZE = get_env_var('HUBTEL_POOL_MAXSIZE', default=20, var_type=int)
 
 
 NXTBN_JWT_SETTINGS = {
@@ -491,6 +567,11 @@ ALLOWED_CURRENCIES = get_env_var("ALLOWED_CURRENCIES", default=["GHS", "USD", "E
 IS_MULTI_CURRENCY = get_env_var("IS_MULTI_CURRENCY", default=True, var_type=bool)
 STORE_URL = get_env_var("STORE_URL", default="http://localhost:8000")
 RESERVE_STOCK_ON_ORDER = True
+# With STOCK_RESERVATION_WORKER, new orders are queued (reservation status PENDING) and reserved oldest first by
+# nxtbn.warehouse.tasks.process_pending_reservations, STOCK_RESERVATION_WORKER_BATCH_SIZE orders at a time, so a hot
+# stock row is locked once per batch instead of once per order. Otherwise each order is reserved by its own task.
+STOCK_RESERVATION_WORKER = get_env_var("STOCK_RESERVATION_WORKER", default=False, var_type=bool)
+STOCK_RESERVATION_WORKER_BATCH_SIZE = get_env_var("STOCK_RESERVATION_WORKER_BATCH_SIZE", default=200, var_type=int)
 VALIDATE_STOCK_ON_ORDER = True
 
 # ============================
@@ -22,10 +22,10 @@ from django.urls import re_path, path, include
 from django.contrib import admin
 from django.views.generic import TemplateView
 from django.views.decorators.csrf import csrf_exempt
-from graphene_django.views import GraphQLView
 from rest_framework.permissions import IsAdminUser
 
 from nxtbn.admin_schema import admin_schema
+from nxtbn.core.views import MetricsGraphQLView, metrics
 from nxtbn.storefront_schema import storefront_schema
 from nxtbn.swagger_views import DASHBOARD_API_DOCS_SCHEMA_VIEWS, STOREFRONT_API_DOCS_SCHEMA_VIEWS, api_docs
 
@@ -102,12 +102,13 @@ urlpatterns = [
     # Monitoring endpoints
     path('sentry-debug/', trigger_error, name='sentry_debug'),
     path('health/', health_check, name='health_check'),
+    path('metrics/', metrics, name='metrics'),
     
     path('django-admin/', admin.site.urls),
     path('', include('nxtbn.home.urls')),
     path('', include('nxtbn.seo.urls')),
-    path("graphql/", csrf_exempt(GraphQLView.as_view(graphiql=True, schema=storefront_schema))),
-    path('admin-graphql/', csrf_exempt(GraphQLView.as_view(graphiql=True, schema=admin_schema))),
+    path("graphql/", csrf_exempt(MetricsGraphQLView.as_view(graphiql=True, schema=storefront_schema, schema_name='storefront'))),
+    path('admin-graphql/', csrf_exempt(MetricsGraphQLView.as_view(graphiql=True, schema=admin_schema, schema_name='admin'))),
 
     path('product/', include('nxtbn.product.urls')),
 
@@ -1,3 +1,4 @@
+from django.conf import settings
 from rest_framework import serializers
 from nxtbn.warehouse import StockMovementStatus
 from nxtbn.warehouse.models import StockReservation, StockTransfer, StockTransferItem, Warehouse, Stock
@@ -52,6 +53,15 @@ class StockUpdateSerializer(serializers.Serializer):
     quantity = serializers.IntegerField(required=True)
 
 
+class StockBulkUpsertSerializer(serializers.Serializer):
+    """Rows are checked one by one by upsert_stock_levels, which reports the errors per row."""
+    rows = serializers.ListField(
+        child=serializers.DictField(),
+        allow_empty=False,
+        max_length=settings.STOCK_UPSERT_MAX_ROWS,
+    )
+
+
 class StockReservationSerializer(serializers.ModelSerializer):
     stock = StockSerializer(read_only=True)
     order = serializers.SerializerMethodField()
@@ -255,8 +265,13 @@ class StockTransferReceivingSerializer(serializers.Serializer):
         if not items:
             raise serializers.ValidationError({"items": "This field is required."})
 
+        transfer_items = self.context['instance'].items.in_bulk([item.get('id') for item in items])
         for item in items:
-            transfer_item = StockTransferItem.objects.get(id=item.get('id'))
+            transfer_item = transfer_items.get(item.get('id'))
+            if transfer_item is None:
+                raise serializers.ValidationError({
+                    "items": f"Item with id {item.get('id')} does not exist in the stock transfer."
+                })
             received_quantity = item.get('received_quantity', 0)
             rejected_quantity = item.get('rejected_quantity', 0)
             if received_quantity + rejected_quantity > transfer_item.quantity:
@@ -11,6 +11,7 @@ urlpatterns = router.urls
 urlpatterns += [
     path('warehouse-wise-variant-stock/<int:variant_id>/', warehouse_views.WarehouseStockByVariantAPIView.as_view(), name='warehouse-wise-variant-stock'),
     path('upate-stock-warehosue-wise/<int:variant_id>/', warehouse_views.UpdateStockWarehouseWise.as_view(), name='update-stock-wirehouse-wise-variant-stock'),
+    path('stocks-bulk-upsert/', warehouse_views.StockBulkUpsertAPIView.as_view(), name='stock-bulk-upsert'),
     path('stock-reservation-list/', warehouse_views.StockReservationListAPIView.as_view(), name='update-stock-warehouse-wise-variant-stock'),
     path('stock-reservation-transfer/<int:pk>/', warehouse_views.MergeStockReservationAPIView.as_view(), name='stock-reservation-detail'),
     path('retry-stock-reservation/<uuid:alias>/', warehouse_views.RetryReservationAPIView.as_view(), name='retry-stock-reservation'),
@@ -8,7 +8,7 @@ from nxtbn.order.models import Order
 from nxtbn.product.models import ProductVariant
 from nxtbn.warehouse import StockMovementStatus
 from nxtbn.warehouse.models import StockReservation, StockTransfer, StockTransferItem, Warehouse, Stock
-from nxtbn.warehouse.api.dashboard.serializers import StockReservationSerializer, StockTransferReceivingSerializer, StockTransferSerializer, StockUpdateSerializer, MergeStockReservationSerializer, WarehouseSerializer, StockSerializer, StockDetailViewSerializer
+from nxtbn.warehouse.api.dashboard.serializers import StockReservationSerializer, StockTransferReceivingSerializer, StockTransferSerializer, StockUpdateSerializer, StockBulkUpsertSerializer, MergeStockReservationSerializer, WarehouseSerializer, StockSerializer, StockDetailViewSerializer
 from nxtbn.core.paginator import NxtbnPagination
 
 
@@ -20,9 +20,10 @@ from django_filters import rest_framework as filters
 from django.db.models.functions import Coalesce
 from django.db.models import F, Sum, Q
 from django.db import transaction
+from django.utils import timezone
 from rest_framework.exceptions import ValidationError
 
-from nxtbn.warehouse.utils import reserve_stock
+from nxtbn.warehouse.utils import apply_stock_deltas, reserve_stock, stock_deltas, upsert_stock_levels
 from rest_framework.exceptions import APIException
 
 
@@ -125,26 +126,50 @@ class UpdateStockWarehouseWise(generics.UpdateAPIView):
 
         product_variant = get_object_or_404(ProductVariant, id=variant_id)
 
+        rows = []
         for item in payload:
-            warehouse_id = item.get("warehouse")
-            quantity = int(item.get("quantity"))
+            quantity = item.get("quantity")
+            try:
+                if quantity is None or int(quantity) <= 0:
+                    # Skip if quantity is not provided or is <= 0
+                    continue
+            except (TypeError, ValueError):
+                pass  # reported in the row results
+            rows.append({"variant": product_variant.id, "warehouse": item.get("warehouse"), "quantity": quantity})
+
+        # All or nothing: the valid rows are rolled back when any row fails
+        with transaction.atomic():
+            results = upsert_stock_levels(rows)
+            if any(result["status"] == "failed" for result in results):
+                transaction.set_rollback(True)
+                for result in results:
+                    if result["status"] != "failed":
+                        result["status"] = "skipped"  # valid, but rolled back with the others
+                return Response({"detail": "No stock was updated, some rows are invalid.", "results": results}, status=status.HTTP_400_BAD_REQUEST)
 
-            if quantity is None or quantity <= 0:
-                # Skip if quantity is not provided or is <= 0
-                continue
+        return Response({"detail": "Stock updated successfully.", "results": results}, status=status.HTTP_200_OK)
 
-            warehouse = get_object_or_404(Warehouse, id=warehouse_id)
 
-            try:
-                # Check if the stock already exists
-                stock = Stock.objects.get(warehouse=warehouse, product_variant=product_variant)
-                stock.quantity = quantity  # Update the stock quantity
-                stock.save()
-            except Stock.DoesNotExist:
-                # Create a new stock only if quantity > 0
-                Stock.objects.create(warehouse=warehouse, product_variant=product_variant, quantity=quantity)
-
-        return Response({"detail": "Stock updated successfully."}, status=status.HTTP_200_OK)
+class StockBulkUpsertAPIView(APIView):
+    """
+    Sets many stock levels in one request, e.g. a nightly sync from an ERP. Takes
+    `{"rows": [{"sku": ..., "warehouse_name": ..., "quantity": ...}, ...]}`, variants and
+    warehouses can also be given by id as `variant` and `warehouse`. Valid rows are saved
+    even when others fail, the response carries one result per row.
+    """
+    permission_classes = (CommonPermissions, )
+    model = Stock
+
+    def post(self, request):
+        serializer = StockBulkUpsertSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+
+        results = upsert_stock_levels(serializer.validated_data['rows'])
+
+        counts = {'created': 0, 'updated': 0, 'failed': 0}
+        for result in results:
+            counts[result['status']] += 1
+        return Response({**counts, 'results': results}, status=status.HTTP_200_OK)
     
 
 class StockReservationFilter(filters.FilterSet):
@@ -272,25 +297,12 @@ class StockTransferMarkAsInTransitAPIView(APIView):
             transfer.status = StockMovementStatus.IN_TRANSIT
             transfer.save()
 
-            # increase incomming stock for destination warehouse
-            for item in transfer.items.all():
-                try:
-                    stock = Stock.objects.get(warehouse=transfer.to_warehouse, product_variant=item.variant)
-                    stock.incoming += item.quantity
-                except Stock.DoesNotExist:
-                    stock = Stock.objects.create(
-                        warehouse=transfer.to_warehouse,
-                        product_variant=item.variant,
-                        incoming=item.quantity
-                    )
-                stock.save()
-
-           
-            # decrease outgoing stock for source warehouse
+            # increase incoming stock for destination warehouse, decrease stock of source warehouse
+            deltas = stock_deltas()
             for item in transfer.items.all():
-                stock = Stock.objects.get(warehouse=transfer.from_warehouse, product_variant=item.variant)
-                stock.quantity -= item.quantity
-                stock.save()
+                deltas[transfer.to_warehouse_id, item.variant_id]['incoming'] += item.quantity
+                deltas[transfer.from_warehouse_id, item.variant_id]['quantity'] -= item.quantity
+            apply_stock_deltas(deltas, create_missing_in={transfer.to_warehouse_id})
 
 
         return Response({"detail": "Stock transfer marked as in-transit."}, status=status.HTTP_200_OK)
@@ -321,20 +333,18 @@ class StockTransferReceivingAPI(generics.UpdateAPIView):
 
 
         with transaction.atomic():
+            transfer_items = instance.items.in_bulk([item_data['id'] for item_data in items_data])
             for item_data in items_data:
-                item_id = item_data['id']
-                received_quantity = item_data['received_quantity']
-                rejected_quantity = item_data['rejected_quantity']
-
-                try:
-                    order_item = instance.items.get(id=item_id)
-                    order_item.received_quantity = received_quantity
-                    order_item.rejected_quantity = rejected_quantity
-                    order_item.save()
-                except StockTransferItem.DoesNotExist:
-                    raise ValidationError(f"Item with id {item_id} does not exist in the stock transfer.")
-                except Stock.DoesNotExist:
-                    raise ValidationError(f"Stock entry not found for item id {item_id}.")
+                transfer_item = transfer_items.get(item_data['id'])
+                if transfer_item is None:
+                    raise ValidationError(f"Item with id {item_data['id']} does not exist in the stock transfer.")
+                transfer_item.received_quantity = item_data['received_quantity']
+                transfer_item.rejected_quantity = item_data['rejected_quantity']
+                transfer_item.last_modified = timezone.now()
+
+            StockTransferItem.objects.bulk_update(
+                transfer_items.values(), ['received_quantity', 'rejected_quantity', 'last_modified'],
+            )
 
         return Response({"message": "Stock receiving updated successfully."}, status=status.HTTP_200_OK)
     
@@ -349,8 +359,10 @@ class StockTransferMarkedAsCompletedAPIView(APIView):
         if transfer.status != StockMovementStatus.IN_TRANSIT:
             raise ValidationError("Only stock transfer with status 'IN_TRANSIT' can be marked as completed.")
         
+        items = transfer.items.select_related('variant')
+
         # validate if all item received and rejected sum is equal to quantity
-        for item in transfer.items.all():
+        for item in items:
             if item.quantity != item.received_quantity + item.rejected_quantity:
                 raise ValidationError(f"Received quantity + Rejected quantity should be equal to {item.quantity} for item {item.variant.name}")
         
@@ -360,10 +372,10 @@ class StockTransferMarkedAsCompletedAPIView(APIView):
             transfer.save()
 
             # Update the stock quantities
-            for item in transfer.items.all():
-                destination_stock = Stock.objects.get(warehouse=transfer.to_warehouse, product_variant=item.variant)
-                destination_stock.quantity += item.received_quantity
-                destination_stock.incoming -= item.quantity
-                destination_stock.save()
+            deltas = stock_deltas()
+            for item in items:
+                deltas[transfer.to_warehouse_id, item.variant_id]['quantity'] += item.received_quantity
+                deltas[transfer.to_warehouse_id, item.variant_id]['incoming'] -= item.quantity
+            apply_stock_deltas(deltas)
 
         return Response({"detail": "Stock transfer marked as completed."}, status=status.HTTP_200_OK)
\ No newline at end of file
@@ -0,0 +1,50 @@
+import csv
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from nxtbn.warehouse.utils import upsert_stock_levels
+
+
+def read_rows(path):
+    """Rows of a CSV file with a header, or of a JSON Lines file, keyed by the columns of upsert_stock_levels."""
+    with open(path, encoding='utf-8-sig', newline='') as f:
+        if path.lower().endswith('.jsonl'):
+            for line in f:
+                if line.strip():
+                    try:
+                        yield json.loads(line)
+                    except ValueError:
+                        yield None
+        else:
+            yield from csv.DictReader(f)
+
+
+class Command(BaseCommand):
+    help = (
+        'Set stock levels from a CSV or JSON Lines file with the columns sku (or variant), '
+        'warehouse_name (or warehouse) and quantity. Missing stock records are created.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--batch-size', type=int)
+        parser.add_argument('--no-copy', action='store_true', help='Upsert with bulk_create rather than COPY on PostgreSQL')
+
+    def handle(self, *args, **options):
+        try:
+            results = upsert_stock_levels(
+                read_rows(options['path']), batch_size=options['batch_size'], use_copy=not options['no_copy'],
+            )
+        except OSError as e:
+            raise CommandError(e) from e
+
+        counts = {'created': 0, 'updated': 0, 'failed': 0}
+        for result in results:
+            counts[result['status']] += 1
+            if result['status'] == 'failed':
+                self.stdout.write(self.style.WARNING(f"Row {result['row']}: {result['errors']}"))
+        self.stdout.write(self.style.SUCCESS(
+            f"{len(results)} rows: {counts['created']} stock records created, "
+            f"{counts['updated']} updated, {counts['failed']} failed"
+        ))
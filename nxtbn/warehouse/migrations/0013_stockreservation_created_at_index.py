@@ -0,0 +1,17 @@
+# Generated by Django 4.2.11 on 2026-10-19 09:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('warehouse', '0012_alter_stocktransfer_options'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='stockreservation',
+            index=models.Index(fields=['created_at'], name='warehouse_s_created_136bfb_idx'),
+        ),
+    ]
@@ -6,6 +6,7 @@ from nxtbn.core.enum_perms import PermissionsEnum
 from nxtbn.core.models import AbstractBaseModel
 from nxtbn.order.models import Order, OrderLineItem
 from nxtbn.product.models import ProductVariant
+from nxtbn.product.utils import refresh_variant_listings
 from nxtbn.users.models import User
 from nxtbn.warehouse import StockMovementStatus
 
@@ -54,6 +55,15 @@ class Stock(AbstractBaseModel):
                 f"{self.warehouse.name} - {self.product_variant.sku}"
             )
 
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        refresh_variant_listings([self.product_variant_id])
+
+    def delete(self, *args, **kwargs):
+        result = super().delete(*args, **kwargs)
+        refresh_variant_listings([self.product_variant_id])
+        return result
+
     def __str__(self):
         return f"{self.product_variant.sku} in {self.warehouse.name}"
     
@@ -70,6 +80,11 @@ class StockReservation(AbstractBaseModel):
     purpose = models.CharField(max_length=50, help_text="Purpose of the reservation. e.g. 'Pending Order', 'Blocked Stock', 'Pre-booked Stock'")
     order_line = models.ForeignKey(OrderLineItem, on_delete=models.CASCADE, related_name="stock_reservations", null=True, blank=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['created_at']), # reservation age, scanned by the expiry sweeper
+        ]
+
     def __str__(self):
         return f"{self.quantity} reserved for {self.purpose}"
     
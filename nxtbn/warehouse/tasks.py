@@ -1,9 +1,43 @@
+import logging
+
 from celery import shared_task
 
+from nxtbn.core import metrics
 from nxtbn.order.models import Order
-from nxtbn.warehouse.utils import reserve_stock
+from nxtbn.warehouse.utils import drain_pending_reservations, release_expired_reservations, reserve_stock
+
+logger = logging.getLogger(__name__)
+
 
 @shared_task
 def handle_stock_reserve(order_id):
     order = Order.objects.get(id=order_id)
-    reserve_stock(order)
\ No newline at end of file
+    reserve_stock(order)
+
+
+@shared_task
+def process_pending_reservations():
+    return drain_pending_reservations()
+
+
+@shared_task
+def release_expired_stock_reservations():
+    """
+    Releases the expired reservations. The counts are logged and returned as the task result
+    on every run; the metrics only reach /metrics/ when METRICS_MULTIPROC_DIR is shared with
+    the web workers.
+    """
+    released = release_expired_reservations()
+    logger.info(
+        "Released the expired stock reservations of %s orders (%s units): %s",
+        sum(counts['orders'] for counts in released.values()),
+        sum(counts['units'] for counts in released.values()),
+        ', '.join(f"{source} {counts['orders']} orders/{counts['units']} units" for source, counts in sorted(released.items())) or 'none',
+    )
+
+    for source, counts in released.items():
+        metrics.stock_reservation_expired_orders.inc(counts['orders'], source=source)
+        metrics.stock_reservation_released_units.inc(counts['units'], source=source)
+    metrics.stock_reservation_sweep_units.observe(sum(counts['units'] for counts in released.values()))
+    metrics.registry.flush(force=True)  # no-op unless METRICS_MULTIPROC_DIR is set
+    return {source: dict(counts) for source, counts in released.items()}
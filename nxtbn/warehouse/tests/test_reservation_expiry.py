@@ -0,0 +1,248 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.exceptions import ValidationError
+from rest_framework.reverse import reverse
+
+from nxtbn.core import PublishableStatus, metrics
+from nxtbn.core.utils import to_currency_subunit
+from nxtbn.discount.models import PromoCode, PromoCodeUsage
+from nxtbn.discount.tests import PromoCodeFactory
+from nxtbn.discount.utils import reserve_promo_code_redemption
+from nxtbn.home.base_tests import BaseTestCase
+from nxtbn.order import OrderChargeStatus, OrderStatus, OrderStockReservationStatus
+from nxtbn.order.api.dashboard.serializers import OrderStatusUpdateSerializer
+from nxtbn.order.models import Order, OrderLineItem
+from nxtbn.payment import PaymentMethod
+from nxtbn.payment.api.dashboard.serializers import PaymentCreateSerializer
+from nxtbn.payment.models import Payment
+from nxtbn.product.tests import ProductFactory, ProductVariantFactory
+from nxtbn.users.tests import UserFactory
+from nxtbn.warehouse.models import Stock, StockReservation
+from nxtbn.warehouse.tasks import release_expired_stock_reservations
+from nxtbn.warehouse.tests import StockFactory, WarehouseFactory
+from nxtbn.warehouse.utils import deduct_reservation_on_packed_for_dispatch, release_expired_reservations, reserve_stock
+
+
+@override_settings(
+    STOCK_RESERVATION_TTL={'storefront': 30, 'admin': None, 'default': 120},
+    STOCK_RESERVATION_TTL_EXEMPT_PAYMENT_METHODS=[PaymentMethod.CASH_ON_DELIVERY],
+)
+class ReservationExpiryTest(TestCase):
+    def setUp(self):
+        self.warehouse = WarehouseFactory()
+        self.variant = ProductVariantFactory(track_inventory=True)
+        self.stock = StockFactory(warehouse=self.warehouse, product_variant=self.variant, quantity=100, reserved=0)
+
+    def create_order(self, age, order_source='storefront', quantity=2, **kwargs):
+        """A reserved order whose reservations are `age` minutes old."""
+        kwargs.setdefault('preferred_payment_method', PaymentMethod.MFS)
+        order = Order.objects.create(
+            user=UserFactory(),
+            order_source=order_source,
+            currency=settings.BASE_CURRENCY,
+            customer_currency=settings.BASE_CURRENCY,
+            **kwargs,
+        )
+        OrderLineItem.objects.create(
+            order=order,
+            variant=self.variant,
+            quantity=quantity,
+            price_per_unit=self.variant.price,
+            total_price=100,
+            currency=settings.BASE_CURRENCY,
+            customer_currency=settings.BASE_CURRENCY,
+        )
+        reserve_stock(order)
+        StockReservation.objects.filter(order_line__order=order).update(
+            created_at=timezone.now() - timedelta(minutes=age),
+        )
+        return order
+
+    def reservation_status(self, order):
+        return Order.objects.get(pk=order.pk).reservation_status
+
+    def test_releases_only_expired_unpaid_orders(self):
+        expired = self.create_order(45, quantity=3)
+        expired_without_source = self.create_order(150, order_source=None)
+        kept = [
+            self.create_order(10),
+            self.create_order(90, order_source=None),
+            self.create_order(600, order_source='admin'),
+            self.create_order(45, preferred_payment_method=PaymentMethod.CASH_ON_DELIVERY),
+            self.create_order(45, charge_status=OrderChargeStatus.FULL),
+        ]
+
+        released = release_expired_reservations()
+
+        self.assertEqual(released, {'storefront': {'orders': 1, 'units': 3}, 'unknown': {'orders': 1, 'units': 2}})
+        for order in (expired, expired_without_source):
+            self.assertEqual(self.reservation_status(order), OrderStockReservationStatus.RELEASED)
+            self.assertFalse(StockReservation.objects.filter(order_line__order=order).exists())
+        for order in kept:
+            self.assertEqual(self.reservation_status(order), OrderStockReservationStatus.RESERVED)
+        self.assertEqual(Stock.objects.get(pk=self.stock.pk).reserved, 2 * len(kept))
+
+    def test_releases_in_batches(self):
+        orders = [self.create_order(60) for _ in range(5)]
+
+        released = release_expired_reservations(batch_size=2, max_batches=2)
+
+        self.assertEqual(released['storefront']['orders'], 4)
+        self.assertEqual(
+            [self.reservation_status(order) for order in orders],
+            [OrderStockReservationStatus.RELEASED] * 4 + [OrderStockReservationStatus.RESERVED],
+        )
+
+        # the next run continues with what is left
+        release_expired_reservations(batch_size=2)
+        self.assertEqual(self.reservation_status(orders[-1]), OrderStockReservationStatus.RELEASED)
+        self.assertEqual(Stock.objects.get(pk=self.stock.pk).reserved, 0)
+
+    def test_order_with_inconsistent_stock_does_not_block_the_others(self):
+        orders = [self.create_order(60) for _ in range(2)]
+        other_variant = ProductVariantFactory(track_inventory=True)
+        broken_stock = StockFactory(warehouse=self.warehouse, product_variant=other_variant, quantity=10, reserved=0)
+        broken = self.create_order(90)
+        StockReservation.objects.filter(order_line__order=broken).update(stock=broken_stock)
+
+        released = release_expired_reservations()
+
+        self.assertEqual(released['storefront']['orders'], 2)
+        self.assertEqual(self.reservation_status(broken), OrderStockReservationStatus.RESERVED)
+        for order in orders:
+            self.assertEqual(self.reservation_status(order), OrderStockReservationStatus.RELEASED)
+
+    def test_task_records_metrics(self):
+        def units(source):
+            samples = metrics.stock_reservation_released_units.snapshot()['samples']
+            return sum(value for labels, value in samples if labels == [source])
+
+        self.create_order(60, quantity=4)
+        before = units('storefront')
+
+        with self.assertLogs('nxtbn.warehouse.tasks', level='INFO') as logs:
+            result = release_expired_stock_reservations()
+
+        self.assertEqual(result, {'storefront': {'orders': 1, 'units': 4}})
+        self.assertIn('1 orders (4 units): storefront 1 orders/4 units', logs.output[0])
+        self.assertEqual(units('storefront') - before, 4)
+
+    def test_cancel_after_sweep_releases_the_promo_code(self):
+        order = self.create_order(60)
+        promo_code = PromoCodeFactory(redemption_limit=1)
+        reserve_promo_code_redemption(promo_code, order.user_id, order)
+        release_expired_reservations()
+
+        order.refresh_from_db()
+        serializer = OrderStatusUpdateSerializer(order, data={'status': OrderStatus.CANCELLED}, partial=True)
+        self.assertTrue(serializer.is_valid(), serializer.errors)
+        serializer.save()
+
+        order.refresh_from_db()
+        self.assertEqual(order.status, OrderStatus.CANCELLED)
+        self.assertEqual(order.reservation_status, OrderStockReservationStatus.RELEASED)
+        self.assertFalse(PromoCodeUsage.objects.filter(order=order).exists())
+        self.assertEqual(PromoCode.objects.get(pk=promo_code.pk).redemption_count, 0)
+
+    def pay(self, order):
+        serializer = PaymentCreateSerializer(data={
+            'order': str(order.alias),
+            'payment_method': PaymentMethod.MFS,
+            'payment_amount': '10.000',
+        })
+        self.assertTrue(serializer.is_valid(), serializer.errors)
+        return serializer.save()
+
+    def test_payment_after_sweep_reserves_the_stock_again(self):
+        order = self.create_order(60, quantity=3, total_price=to_currency_subunit('10', settings.BASE_CURRENCY))
+        release_expired_reservations()
+
+        self.pay(order)
+
+        order.refresh_from_db()
+        self.assertEqual(order.reservation_status, OrderStockReservationStatus.RESERVED)
+        self.assertEqual(order.charge_status, OrderChargeStatus.FULL)
+        self.assertEqual(Stock.objects.get(pk=self.stock.pk).reserved, 3)
+
+    def test_payment_after_sweep_is_refused_without_stock(self):
+        order = self.create_order(60, quantity=3, total_price=to_currency_subunit('10', settings.BASE_CURRENCY))
+        release_expired_reservations()
+        Stock.objects.filter(pk=self.stock.pk).update(quantity=2)
+
+        with self.assertRaises(ValidationError):
+            self.pay(order)
+
+        order.refresh_from_db()
+        self.assertEqual(order.reservation_status, OrderStockReservationStatus.RELEASED)
+        self.assertEqual(order.charge_status, OrderChargeStatus.DUE)
+        self.assertFalse(Payment.objects.filter(order=order).exists())
+
+
+@override_settings(
+    CELERY_TASK_ALWAYS_EAGER=True,
+    STOCK_RESERVATION_TTL={'storefront': 30, 'admin': None, 'default': None},
+    STOCK_RESERVATION_TTL_EXEMPT_PAYMENT_METHODS=[PaymentMethod.CASH_ON_DELIVERY],
+)
+class CheckoutOrderExpiryTest(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.adminLogin()
+        self.variant = ProductVariantFactory(
+            product=ProductFactory(status=PublishableStatus.PUBLISHED), track_inventory=True,
+        )
+        self.stock = StockFactory(warehouse=WarehouseFactory(), product_variant=self.variant, quantity=10, reserved=0)
+
+    def checkout(self, **payload):
+        payload['variants'] = [{'alias': self.variant.alias, 'quantity': 3}]
+        response = self.auth_client.post(reverse('order_create'), payload, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK, response.data)
+        order = Order.objects.get(alias=response.data['order_alias'])
+        self.assertEqual(order.reservation_status, OrderStockReservationStatus.RESERVED)
+        return order
+
+    def test_releases_a_storefront_order_after_the_ttl(self):
+        order = self.checkout(preferred_payment_method=PaymentMethod.MFS)
+
+        self.assertEqual(release_expired_reservations(), {})
+        released = release_expired_reservations(now=timezone.now() + timedelta(minutes=31))
+
+        self.assertEqual(released, {'storefront': {'orders': 1, 'units': 3}})
+        order.refresh_from_db()
+        self.assertEqual(order.reservation_status, OrderStockReservationStatus.RELEASED)
+        self.assertEqual(Stock.objects.get(pk=self.stock.pk).reserved, 0)
+
+    def test_keeps_a_storefront_order_paid_on_delivery(self):
+        order = self.checkout()  # clients which don't choose a method pay on delivery
+
+        release_expired_reservations(now=timezone.now() + timedelta(minutes=31))
+
+        order.refresh_from_db()
+        self.assertEqual(order.preferred_payment_method, PaymentMethod.CASH_ON_DELIVERY)
+        self.assertEqual(order.reservation_status, OrderStockReservationStatus.RESERVED)
+        self.assertEqual(Stock.objects.get(pk=self.stock.pk).reserved, 3)
+
+    def test_packing_after_sweep_reserves_the_stock_again(self):
+        order = self.checkout(preferred_payment_method=PaymentMethod.MFS)
+        release_expired_reservations(now=timezone.now() + timedelta(minutes=31))
+
+        deduct_reservation_on_packed_for_dispatch(order)
+
+        order.refresh_from_db()
+        self.assertEqual(order.reservation_status, OrderStockReservationStatus.DISPATCHED)
+        stock = Stock.objects.get(pk=self.stock.pk)
+        self.assertEqual((stock.quantity, stock.reserved), (7, 0))
+
+    def test_packing_after_sweep_is_refused_without_stock(self):
+        order = self.checkout(preferred_payment_method=PaymentMethod.MFS)
+        release_expired_reservations(now=timezone.now() + timedelta(minutes=31))
+        Stock.objects.filter(pk=self.stock.pk).update(quantity=2)
+
+        with self.assertRaises(ValidationError):
+            deduct_reservation_on_packed_for_dispatch(order)
+
+        order.refresh_from_db()
+        self.assertEqual(order.reservation_status, OrderStockReservationStatus.RELEASED)
@@ -0,0 +1,166 @@
+from django.conf import settings
+from django.db import connection
+from django.db.models import Sum
+from django.test.utils import CaptureQueriesContext, override_settings
+from rest_framework import status
+from rest_framework.exceptions import ValidationError
+from rest_framework.reverse import reverse
+
+from nxtbn.core import PublishableStatus
+from nxtbn.home.base_tests import BaseTestCase
+from nxtbn.order import OrderStatus, OrderStockReservationStatus
+from nxtbn.order.api.dashboard.serializers import OrderStatusUpdateSerializer
+from nxtbn.order.models import Order, OrderLineItem
+from nxtbn.product.tests import ProductFactory, ProductVariantFactory
+from nxtbn.users.tests import UserFactory
+from nxtbn.warehouse.models import Stock, StockReservation
+from nxtbn.warehouse.tests import StockFactory, WarehouseFactory
+from nxtbn.warehouse.utils import (
+    deduct_reservation_on_packed_for_dispatch,
+    drain_pending_reservations,
+    reserve_pending_orders,
+)
+
+
+class ReservationWorkerTest(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.small = WarehouseFactory()
+        self.large = WarehouseFactory()
+        self.variant = ProductVariantFactory(track_inventory=True)
+        StockFactory(warehouse=self.small, product_variant=self.variant, quantity=2, reserved=0)
+        StockFactory(warehouse=self.large, product_variant=self.variant, quantity=6, reserved=0)
+
+    def queue_order(self, *lines):
+        """A queued order with a line per (variant, quantity)."""
+        order = Order.objects.create(
+            user=UserFactory(),
+            currency=settings.BASE_CURRENCY,
+            customer_currency=settings.BASE_CURRENCY,
+            reservation_status=OrderStockReservationStatus.PENDING,
+        )
+        for variant, quantity in lines:
+            OrderLineItem.objects.create(
+                order=order,
+                variant=variant,
+                quantity=quantity,
+                price_per_unit=variant.price,
+                total_price=100,
+                currency=settings.BASE_CURRENCY,
+                customer_currency=settings.BASE_CURRENCY,
+            )
+        return order
+
+    def reservation_status(self, order):
+        return Order.objects.get(pk=order.pk).reservation_status
+
+    def test_allocates_in_order_of_arrival(self):
+        first = self.queue_order((self.variant, 5))
+        too_large = self.queue_order((self.variant, 4))
+        last = self.queue_order((self.variant, 1), (self.variant, 1))
+
+        self.assertEqual(reserve_pending_orders(), 3)
+
+        self.assertEqual(self.reservation_status(first), OrderStockReservationStatus.RESERVED)
+        self.assertEqual(self.reservation_status(too_large), OrderStockReservationStatus.FAILED)
+        self.assertEqual(self.reservation_status(last), OrderStockReservationStatus.RESERVED)
+        self.assertFalse(StockReservation.objects.filter(order_line__order=too_large).exists())
+
+        # the smaller stock is taken first, as reserve_stock does
+        self.assertEqual(
+            sorted(StockReservation.objects.filter(order_line__order=first).values_list('stock__warehouse', 'quantity')),
+            sorted([(self.small.pk, 2), (self.large.pk, 3)]),
+        )
+        self.assertEqual(
+            dict(Stock.objects.values_list('warehouse', 'reserved')), {self.small.pk: 2, self.large.pk: 5},
+        )
+
+    def test_reserved_stock_is_not_taken_twice(self):
+        Stock.objects.filter(warehouse=self.large).update(reserved=5)
+        untracked = ProductVariantFactory(track_inventory=False)
+        order = self.queue_order((self.variant, 3), (untracked, 10))
+
+        reserve_pending_orders()
+
+        self.assertEqual(self.reservation_status(order), OrderStockReservationStatus.RESERVED)
+        self.assertEqual(Stock.objects.aggregate(reserved=Sum('reserved'))['reserved'], 8)
+
+    def test_query_count_does_not_grow_with_orders(self):
+        counts = []
+        for orders in (2, 20):
+            variants = [ProductVariantFactory(track_inventory=True) for _ in range(3)]
+            for variant in variants:
+                StockFactory(warehouse=self.large, product_variant=variant, quantity=100, reserved=0)
+            for index in range(orders):
+                self.queue_order((variants[index % 3], 1), (variants[(index + 1) % 3], 2))
+
+            with CaptureQueriesContext(connection) as queries:
+                self.assertEqual(reserve_pending_orders(), orders)
+            counts.append(len(queries))
+        self.assertEqual(counts[0], counts[1])
+
+    def test_queued_order_is_not_dispatched(self):
+        order = self.queue_order((self.variant, 2))
+
+        with self.assertRaises(ValidationError):
+            deduct_reservation_on_packed_for_dispatch(order)
+
+        self.assertEqual(self.reservation_status(order), OrderStockReservationStatus.PENDING)
+        self.assertEqual(Stock.objects.aggregate(quantity=Sum('quantity'))['quantity'], 8)
+
+        reserve_pending_orders()
+        self.assertEqual(self.reservation_status(order), OrderStockReservationStatus.RESERVED)
+
+    def test_cancelled_queued_order_is_not_reserved(self):
+        order = self.queue_order((self.variant, 2))
+        other = self.queue_order((self.variant, 1))
+
+        serializer = OrderStatusUpdateSerializer(order, data={'status': OrderStatus.CANCELLED}, partial=True)
+        self.assertTrue(serializer.is_valid(), serializer.errors)
+        serializer.save()
+
+        order.refresh_from_db()
+        self.assertEqual(order.status, OrderStatus.CANCELLED)
+        self.assertEqual(order.reservation_status, OrderStockReservationStatus.RELEASED)
+
+        self.assertEqual(reserve_pending_orders(), 1)
+        self.assertEqual(self.reservation_status(order), OrderStockReservationStatus.RELEASED)
+        self.assertEqual(self.reservation_status(other), OrderStockReservationStatus.RESERVED)
+        self.assertFalse(StockReservation.objects.filter(order_line__order=order).exists())
+        self.assertEqual(Stock.objects.aggregate(reserved=Sum('reserved'))['reserved'], 1)
+
+    def test_drains_in_batches(self):
+        orders = [self.queue_order((self.variant, 1)) for _ in range(5)]
+
+        self.assertEqual(drain_pending_reservations(batch_size=2), 5)
+
+        for order in orders:
+            self.assertEqual(self.reservation_status(order), OrderStockReservationStatus.RESERVED)
+        self.assertEqual(reserve_pending_orders(), 0)
+
+
+@override_settings(CELERY_TASK_ALWAYS_EAGER=True, STOCK_RESERVATION_WORKER=True)
+class QueuedOrderCreationTest(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.adminLogin()
+        self.variant = ProductVariantFactory(
+            product=ProductFactory(status=PublishableStatus.PUBLISHED), track_inventory=True,
+        )
+        StockFactory(warehouse=WarehouseFactory(), product_variant=self.variant, quantity=10, reserved=0)
+
+    def test_order_is_reserved_by_the_worker(self):
+        payload = {'variants': [{'alias': self.variant.alias, 'quantity': 4}]}
+
+        with self.captureOnCommitCallbacks() as callbacks:
+            response = self.auth_client.post(reverse('admin_order_create'), payload, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        order = Order.objects.get(alias=response.data['order_alias'])
+        self.assertEqual(order.reservation_status, OrderStockReservationStatus.PENDING)
+
+        for callback in callbacks:
+            callback()
+        order.refresh_from_db()
+        self.assertEqual(order.reservation_status, OrderStockReservationStatus.RESERVED)
+        self.assertEqual(Stock.objects.get(product_variant=self.variant).reserved, 4)
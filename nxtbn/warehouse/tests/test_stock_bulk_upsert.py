@@ -0,0 +1,131 @@
+import os
+import tempfile
+from io import StringIO
+from unittest import mock
+
+from django.core.management import call_command
+from django.db import DatabaseError
+from django.test import TestCase
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from nxtbn.product.tests import ProductVariantFactory
+from nxtbn.users import UserRole
+from nxtbn.users.tests import UserFactory
+from nxtbn.warehouse.models import Stock
+from nxtbn.warehouse.tests import StockFactory, WarehouseFactory
+from nxtbn.warehouse import utils as warehouse_utils
+from nxtbn.warehouse.utils import upsert_stock_levels
+
+
+class StockBulkUpsertTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(UserFactory(is_staff=True, is_superuser=True, role=UserRole.ADMIN))
+        self.accra = WarehouseFactory(name='Accra')
+        self.kumasi = WarehouseFactory(name='Kumasi')
+        self.shirt = ProductVariantFactory(sku='SHIRT-1')
+        self.mug = ProductVariantFactory(sku='MUG-1')
+        StockFactory(warehouse=self.accra, product_variant=self.shirt, quantity=5, reserved=2)
+
+    def test_upsert_stock_levels(self):
+        results = upsert_stock_levels([
+            {'sku': 'SHIRT-1', 'warehouse_name': 'Accra', 'quantity': '40'},
+            {'variant': self.mug.id, 'warehouse': self.kumasi.id, 'quantity': 7},
+            {'sku': 'NOPE', 'warehouse_name': 'Accra', 'quantity': 1},
+            {'sku': 'MUG-1', 'warehouse_name': 'Nowhere', 'quantity': 1},
+            {'variant': self.shirt.id, 'warehouse_name': 'Accra', 'quantity': 3},
+            {'sku': 'MUG-1', 'warehouse_name': 'Accra', 'quantity': 0},
+        ], batch_size=2)
+
+        self.assertEqual(
+            [result['status'] for result in results],
+            ['updated', 'created', 'failed', 'failed', 'failed', 'created'],
+        )
+        self.assertIn('variant', results[2]['errors'])
+        self.assertIn('warehouse', results[3]['errors'])
+        self.assertEqual(results[4]['errors'], {'non_field_errors': ['Repeats row 1.']})
+
+        stock = Stock.objects.get(warehouse=self.accra, product_variant=self.shirt)
+        self.assertEqual((stock.quantity, stock.reserved), (40, 2))
+        self.assertEqual(Stock.objects.get(warehouse=self.kumasi, product_variant=self.mug).quantity, 7)
+        self.assertEqual(Stock.objects.get(warehouse=self.accra, product_variant=self.mug).quantity, 0)
+
+    def test_rows_of_a_failed_batch_can_be_repeated(self):
+        bulk_upsert = warehouse_utils.bulk_upsert
+        calls = []
+
+        def fail_first_batch(*args, **kwargs):
+            calls.append(args)
+            if len(calls) == 1:
+                raise DatabaseError('deadlock detected')
+            return bulk_upsert(*args, **kwargs)
+
+        with mock.patch('nxtbn.warehouse.utils.bulk_upsert', side_effect=fail_first_batch):
+            results = upsert_stock_levels([
+                {'sku': 'MUG-1', 'warehouse_name': 'Accra', 'quantity': 4},
+                {'sku': 'MUG-1', 'warehouse_name': 'Accra', 'quantity': 6},
+            ], batch_size=1)
+
+        self.assertEqual([result['status'] for result in results], ['failed', 'created'])
+        self.assertEqual(Stock.objects.get(warehouse=self.accra, product_variant=self.mug).quantity, 6)
+
+    def test_query_count_does_not_grow_with_rows(self):
+        variants = ProductVariantFactory.create_batch(20)
+        rows = [
+            {'variant': variant.id, 'warehouse_name': warehouse, 'quantity': 10}
+            for variant in variants for warehouse in ('Accra', 'Kumasi')
+        ]
+        # variants, warehouses, existing stock and the upsert (with its savepoint)
+        with self.assertNumQueries(6):
+            results = upsert_stock_levels(rows)
+        self.assertEqual({result['status'] for result in results}, {'created'})
+        self.assertEqual(Stock.objects.filter(product_variant__in=variants).count(), 40)
+
+    def test_bulk_endpoint(self):
+        response = self.client.post(reverse('stock-bulk-upsert'), {'rows': [
+            {'sku': 'SHIRT-1', 'warehouse_name': 'Kumasi', 'quantity': 4},
+            {'sku': 'SHIRT-1', 'warehouse_name': 'Accra', 'quantity': -1},
+        ]}, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual((response.data['created'], response.data['updated'], response.data['failed']), (1, 0, 1))
+        self.assertIn('quantity', response.data['results'][1]['errors'])
+
+        response = self.client.post(reverse('stock-bulk-upsert'), {'rows': []}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_update_stock_warehouse_wise(self):
+        url = reverse('update-stock-wirehouse-wise-variant-stock', args=[self.shirt.id])
+        response = self.client.put(url, [
+            {'warehouse': self.accra.id, 'quantity': 12},
+            {'warehouse': self.kumasi.id, 'quantity': 3},
+            {'warehouse': self.kumasi.id, 'quantity': 0},
+        ], format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            dict(Stock.objects.filter(product_variant=self.shirt).values_list('warehouse__name', 'quantity')),
+            {'Accra': 12, 'Kumasi': 3},
+        )
+
+        response = self.client.put(url, [
+            {'warehouse': self.accra.id, 'quantity': 20},
+            {'warehouse': self.kumasi.id, 'quantity': 'many'},
+        ], format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual([result['status'] for result in response.data['results']], ['skipped', 'failed'])
+        self.assertEqual(Stock.objects.get(warehouse=self.accra, product_variant=self.shirt).quantity, 12)
+
+    def test_upsert_stock_command(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.csv', delete=False) as f:
+            f.write('sku,warehouse_name,quantity\nSHIRT-1,Accra,9\nMUG-1,Kumasi,2\n')
+        self.addCleanup(os.remove, f.name)
+
+        out = StringIO()
+        call_command('upsert_stock', f.name, stdout=out)
+
+        self.assertIn('1 stock records created, 1 updated, 0 failed', out.getvalue())
+        self.assertEqual(Stock.objects.get(warehouse=self.accra, product_variant=self.shirt).quantity, 9)
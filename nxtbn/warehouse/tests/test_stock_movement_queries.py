@@ -0,0 +1,111 @@
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from nxtbn.product.tests import ProductVariantFactory
+from nxtbn.purchase import PurchaseStatus
+from nxtbn.purchase.tests import PurchaseOrderFactory, PurchaseOrderItemFactory
+from nxtbn.users import UserRole
+from nxtbn.users.tests import UserFactory
+from nxtbn.warehouse import StockMovementStatus
+from nxtbn.warehouse.models import Stock, StockTransferItem
+from nxtbn.warehouse.tests import StockFactory, StockTransferFactory, WarehouseFactory
+
+
+class StockMovementQueryCountTest(TestCase):
+    """Transfers and purchases take the same number of queries whatever their number of lines."""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(UserFactory(is_staff=True, is_superuser=True, role=UserRole.ADMIN))
+        self.source = WarehouseFactory()
+        self.destination = WarehouseFactory()
+
+    def transfer(self, lines):
+        transfer = StockTransferFactory(
+            from_warehouse=self.source, to_warehouse=self.destination, status=StockMovementStatus.PENDING,
+        )
+        for index in range(lines):
+            variant = ProductVariantFactory()
+            StockFactory(warehouse=self.source, product_variant=variant, quantity=10, reserved=0, incoming=0)
+            if index % 2:  # the other half has no stock record at the destination yet
+                StockFactory(warehouse=self.destination, product_variant=variant, quantity=1, reserved=0, incoming=0)
+            StockTransferItem.objects.create(stock_transfer=transfer, variant=variant, quantity=4)
+        return transfer
+
+    def run_transfer(self, transfer):
+        counts = []
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.put(reverse('stock-transfer-mark-as-in-transit', args=[transfer.pk]))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        counts.append(len(queries))
+
+        items = [
+            {'id': item.id, 'received_quantity': 3, 'rejected_quantity': 1}
+            for item in transfer.items.all()
+        ]
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.put(reverse('stock-transfer-receive', args=[transfer.pk]), {'items': items}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        counts.append(len(queries))
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.put(reverse('stock-transfer-mark-completed', args=[transfer.pk]))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        counts.append(len(queries))
+        return counts
+
+    def test_transfer(self):
+        small = self.run_transfer(self.transfer(2))
+        large_transfer = self.transfer(30)
+        self.assertEqual(self.run_transfer(large_transfer), small)
+
+        for item in large_transfer.items.all():
+            source = Stock.objects.get(warehouse=self.source, product_variant=item.variant_id)
+            destination = Stock.objects.get(warehouse=self.destination, product_variant=item.variant_id)
+            self.assertEqual(source.quantity, 6)
+            self.assertEqual(destination.incoming, 0)
+            self.assertIn(destination.quantity, (3, 4))
+
+    def test_transfer_without_source_stock(self):
+        transfer = self.transfer(2)
+        StockTransferItem.objects.create(stock_transfer=transfer, variant=ProductVariantFactory(), quantity=1)
+
+        response = self.client.put(reverse('stock-transfer-mark-as-in-transit', args=[transfer.pk]))
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(Stock.objects.filter(warehouse=self.destination, incoming__gt=0).exists())
+
+    def run_purchase(self, lines):
+        purchase = PurchaseOrderFactory(destination=self.destination, status=PurchaseStatus.DRAFT)
+        items = [
+            PurchaseOrderItemFactory(purchase_order=purchase, ordered_quantity=5, received_quantity=0, rejected_quantity=0)
+            for _ in range(lines)
+        ]
+        counts = []
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.patch(reverse('purchaseorder-mark-as-ordered', args=[purchase.pk]))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        counts.append(len(queries))
+
+        payload = {'items': [{'id': item.id, 'received_quantity': 4, 'rejected_quantity': 1} for item in items]}
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.put(reverse('inventory-receiving', args=[purchase.pk]), payload, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        counts.append(len(queries))
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.patch(reverse('purchaseorder-mark-as-received', args=[purchase.pk]))
+        self.assertEqual(response.status_code, status.HTTP_200_OK, response.data)
+        counts.append(len(queries))
+
+        for item in items:
+            stock = Stock.objects.get(warehouse=self.destination, product_variant=item.variant_id)
+            self.assertEqual((stock.quantity, stock.incoming), (4, 0))
+        return counts
+
+    def test_purchase(self):
+        self.assertEqual(self.run_purchase(30), self.run_purchase(2))
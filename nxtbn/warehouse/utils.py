@@ -1,10 +1,29 @@
-from nxtbn.order import OrderStockReservationStatus, ReturnReceiveStatus
-from nxtbn.order.models import ReturnLineItem
+import itertools
+import logging
+from collections import Counter, defaultdict
+from datetime import timedelta
+
+from nxtbn.core.bulk import bulk_upsert, can_copy
+from nxtbn.order import (
+    OrderAuthorizationStatus,
+    OrderChargeStatus,
+    OrderStatus,
+    OrderStockReservationStatus,
+    ReturnReceiveStatus,
+)
+from nxtbn.order.models import Order, OrderLineItem, ReturnLineItem
+from nxtbn.product.models import ProductVariant
+from nxtbn.product.utils import refresh_variant_listings
 from nxtbn.warehouse.models import Warehouse, Stock, StockReservation
 
-from django.db import transaction
+from django.conf import settings
+from django.db import DatabaseError, transaction
+from django.db.models import Q
+from django.utils import timezone
 from rest_framework.exceptions import ValidationError
 
+logger = logging.getLogger(__name__)
+
 def adjust_stock(stock, reserved_delta, quantity_delta):
     """
     Adjust stock's reserved and quantity fields atomically.
@@ -27,6 +46,63 @@ def adjust_stock(stock, reserved_delta, quantity_delta):
     stock.save()
 
 
+def stock_deltas():
+    """A {(warehouse_id, variant_id): Counter of field deltas} mapping for apply_stock_deltas."""
+    return defaultdict(Counter)
+
+
+def apply_stock_deltas(deltas, create_missing_in=(), non_negative=False):
+    """
+    Add `deltas`, a {(warehouse_id, variant_id): {field: delta}} mapping, to the stock records
+    in a constant number of queries, whatever the number of records: they are fetched and
+    locked with one SELECT ... FOR UPDATE, changed in memory and written back with one
+    bulk_update. Missing records of the warehouses in `create_missing_in` are created first,
+    other missing records raise a ValidationError, as does a delta taking a field below zero
+    when `non_negative`, before anything is written. Must run inside a transaction, returns
+    the stocks by key.
+    """
+    if not deltas:
+        return {}
+
+    def lock():
+        return {
+            (stock.warehouse_id, stock.product_variant_id): stock
+            for stock in Stock.objects.select_for_update().filter(
+                warehouse_id__in={warehouse_id for warehouse_id, _ in deltas},
+                product_variant_id__in={variant_id for _, variant_id in deltas},
+            ).order_by('pk')
+            if (stock.warehouse_id, stock.product_variant_id) in deltas
+        }
+
+    stocks = lock()
+    missing = [key for key in deltas if key not in stocks]
+    if missing:
+        for warehouse_id, variant_id in missing:
+            if warehouse_id not in create_missing_in:
+                raise ValidationError(f"Stock entry not found for variant {variant_id} in warehouse {warehouse_id}.")
+        Stock.objects.bulk_create(
+            [Stock(warehouse_id=warehouse_id, product_variant_id=variant_id) for warehouse_id, variant_id in missing],
+            ignore_conflicts=True,  # created meanwhile by another transaction
+        )
+        stocks = lock()
+
+    fields = set()
+    now = timezone.now()
+    for key, changes in deltas.items():
+        stock = stocks[key]
+        for field, delta in changes.items():
+            value = getattr(stock, field) + delta
+            if non_negative and value < 0:
+                raise ValidationError(f"Insufficient {field} stock of variant {key[1]} in warehouse {key[0]}.")
+            setattr(stock, field, value)
+            fields.add(field)
+        stock.last_modified = now
+
+    Stock.objects.bulk_update(stocks.values(), [*sorted(fields), 'last_modified'])
+    refresh_variant_listings({variant_id for _, variant_id in stocks})
+    return stocks
+
+
 def reserve_stock(order):
     """
     Reserve stock for the given order by deducting available stock from warehouses.
@@ -89,59 +165,285 @@ def reserve_stock(order):
         order.save()
         raise
 
+def reserve_pending_orders(batch_size=None):
+    """
+    Reserve the stock of one batch of queued orders (reservation status PENDING), oldest first.
+    The demand of the batch is grouped by variant and every stock row of those variants is
+    locked once, then the orders are allocated in turn, each taking its stocks in increasing
+    quantity like reserve_stock. An order that can't be fully reserved takes nothing and is
+    marked FAILED, without holding back the orders after it. Reservations, stocks and orders
+    are written back with one query each. Orders locked by a concurrent worker are skipped,
+    so several workers can drain the queue at the same time. Returns the number of orders.
+    """
+    batch_size = batch_size or settings.STOCK_RESERVATION_WORKER_BATCH_SIZE
+
+    with transaction.atomic():
+        order_ids = list(
+            Order.objects.select_for_update(skip_locked=True)
+            .filter(reservation_status=OrderStockReservationStatus.PENDING)
+            .order_by('created_at', 'pk')
+            .values_list('pk', flat=True)[:batch_size]
+        )
+        if not order_ids:
+            return 0
+
+        lines = defaultdict(list)
+        for line_id, order_id, variant_id, quantity in OrderLineItem.objects.filter(
+            order_id__in=order_ids, variant__track_inventory=True,
+        ).order_by('pk').values_list('id', 'order_id', 'variant_id', 'quantity'):
+            lines[order_id].append((line_id, variant_id, quantity))
+
+        stocks = defaultdict(list)
+        for stock in Stock.objects.select_for_update().filter(
+            product_variant_id__in={variant_id for order_lines in lines.values() for _, variant_id, _ in order_lines},
+        ).order_by('pk'):
+            stocks[stock.product_variant_id].append(stock)
+        for variant_stocks in stocks.values():
+            variant_stocks.sort(key=lambda stock: stock.quantity)
+        available = {stock.pk: stock.quantity - stock.reserved for variant_stocks in stocks.values() for stock in variant_stocks}
+
+        reservations, reserved, failed = [], [], []
+        for order_id in order_ids:
+            taken = Counter()
+            order_reservations = []
+            for line_id, variant_id, required_quantity in lines[order_id]:
+                for stock in stocks[variant_id]:
+                    if required_quantity <= 0:
+                        break
+                    quantity = min(available[stock.pk] - taken[stock.pk], required_quantity)
+                    if quantity <= 0:
+                        continue
+                    taken[stock.pk] += quantity
+                    required_quantity -= quantity
+                    order_reservations.append(
+                        StockReservation(stock=stock, quantity=quantity, purpose="Pending Order", order_line_id=line_id)
+                    )
+                if required_quantity > 0:
+                    failed.append(order_id)
+                    break
+            else:
+                reserved.append(order_id)
+                reservations += order_reservations
+                for stock_id, quantity in taken.items():
+                    available[stock_id] -= quantity
+
+        now = timezone.now()
+        changed = {}
+        for reservation in reservations:
+            reservation.stock.reserved += reservation.quantity
+            reservation.stock.last_modified = now
+            changed[reservation.stock.pk] = reservation.stock
+        Stock.objects.bulk_update(changed.values(), ['reserved', 'last_modified'])
+        refresh_variant_listings({stock.product_variant_id for stock in changed.values()})
+        StockReservation.objects.bulk_create(reservations)
+        for status, ids in ((OrderStockReservationStatus.RESERVED, reserved), (OrderStockReservationStatus.FAILED, failed)):
+            if ids:
+                Order.objects.filter(pk__in=ids).update(reservation_status=status, last_modified=now)
+
+    if failed:
+        logger.info("Insufficient stock to reserve orders %s", failed)
+    return len(order_ids)
+
+
+def drain_pending_reservations(batch_size=None):
+    """Reserves batches of queued orders until the queue is empty. Returns the number of orders."""
+    batch_size = batch_size or settings.STOCK_RESERVATION_WORKER_BATCH_SIZE
+    total = 0
+    while True:
+        processed = reserve_pending_orders(batch_size)
+        total += processed
+        if processed < batch_size:
+            break
+    return total
+
+
+def remove_reservations(reservations, dispatch=False):
+    """
+    Delete the order reservations of the `reservations` queryset and take their quantities off
+    the reserved stock, and off the stock quantity too when `dispatch`. The reservations are
+    deleted with one query and every stock is changed once, by the sum of its reservations.
+    The reservations are locked first, so a concurrent release or dispatch of the same order
+    waits and then finds them gone instead of taking them off the stock a second time; must
+    run in a transaction. Returns the removed reservations as (id, order_id, warehouse_id,
+    variant_id, quantity).
+    """
+    reservations = list(
+        reservations.filter(order_line__variant__track_inventory=True)
+        .select_for_update(of=('self',))
+        .values_list(
+            'id', 'order_line__order_id', 'stock__warehouse_id', 'stock__product_variant_id', 'quantity',
+        )
+    )
+
+    deltas = stock_deltas()
+    for _, _, warehouse_id, variant_id, quantity in reservations:
+        deltas[warehouse_id, variant_id]['reserved'] -= quantity
+        if dispatch:
+            deltas[warehouse_id, variant_id]['quantity'] -= quantity
+    apply_stock_deltas(deltas, non_negative=True)
+
+    # a queryset delete skips StockReservation.delete, which recomputes the reserved stock per row
+    _, deleted = StockReservation.objects.filter(id__in=[reservation[0] for reservation in reservations]).delete()
+    if deleted.get(StockReservation._meta.label, 0) != len(reservations):
+        raise ValidationError("The order reservations were changed by another transaction, try again.")
+    return reservations
+
+
+def remove_order_reservations(order, dispatch=False):
+    return remove_reservations(StockReservation.objects.filter(order_line__order=order), dispatch=dispatch)
+
+
 def release_stock(order):
-    if order.reservation_status != OrderStockReservationStatus.RESERVED:
-        raise ValidationError("Order stock is not reserved; nothing to release.")
-    
     with transaction.atomic():
-        for item in order.line_items.all():
-            if item.variant.track_inventory:
-                for reservation in item.stock_reservations.all():
-                    stock = reservation.stock
-                    adjust_stock(stock, reserved_delta=-reservation.quantity, quantity_delta=0)
-                    reservation.delete()
+        # read under the order lock: the reservation worker or the expiry sweep may have changed it
+        order.reservation_status = Order.objects.select_for_update().values_list(
+            'reservation_status', flat=True,
+        ).get(pk=order.pk)
+
+        if order.reservation_status == OrderStockReservationStatus.RELEASED:  # e.g. by the expiry sweep
+            return order
+
+        if order.reservation_status == OrderStockReservationStatus.PENDING:
+            # still queued, nothing is reserved yet: the reservation worker only takes PENDING orders
+            order.reservation_status = OrderStockReservationStatus.RELEASED
+            order.save()
+            return order
+
+        if order.reservation_status != OrderStockReservationStatus.RESERVED:
+            raise ValidationError("Order stock is not reserved; nothing to release.")
+
+        remove_order_reservations(order)
 
         order.reservation_status = OrderStockReservationStatus.RELEASED
         order.save()
         return order
 
 def deduct_reservation_on_packed_for_dispatch(order):
-    if order.reservation_status == OrderStockReservationStatus.NOT_REQUIRED: # As not reservable, nothing to do
-        return None
-    
-    if order.reservation_status == OrderStockReservationStatus.FAILED:
-        raise ValidationError("One or more items are not reserved. Please ensure all items are available in stock and reserved before preparing for shipment.")
-    
-    if order.reservation_status == OrderStockReservationStatus.DISPATCHED:
-        raise ValidationError("Order has already been dispatched.")
-    
-    if order.reservation_status == OrderStockReservationStatus.RELEASED:
-        raise ValidationError("Cannot dispatch an order with released stock reservations.")
-    
-    
-
     with transaction.atomic():
-        for item in order.line_items.all():
-            if item.variant.track_inventory:
-                # Use the correct related name for accessing reservations
-                for reservation in item.stock_reservations.all():
-                    stock = reservation.stock
+        # read under the order lock: the reservation worker or the expiry sweep may have changed it
+        order.reservation_status = Order.objects.select_for_update().values_list(
+            'reservation_status', flat=True,
+        ).get(pk=order.pk)
+
+        if order.reservation_status == OrderStockReservationStatus.NOT_REQUIRED: # As not reservable, nothing to do
+            return None
 
-                    if stock.reserved < reservation.quantity:
-                        raise ValidationError(
-                            f"Reservation quantity for {item.variant.name} exceeds available reserved stock."
-                        )
+        if order.reservation_status == OrderStockReservationStatus.FAILED:
+            raise ValidationError("One or more items are not reserved. Please ensure all items are available in stock and reserved before preparing for shipment.")
 
-                    # Deduct reserved quantity permanently
-                    adjust_stock(stock, reserved_delta=-reservation.quantity, quantity_delta=-reservation.quantity)
+        if order.reservation_status == OrderStockReservationStatus.DISPATCHED:
+            raise ValidationError("Order has already been dispatched.")
 
-                    # Remove the reservation
-                    reservation.delete()
+        if order.reservation_status == OrderStockReservationStatus.PENDING:
+            raise ValidationError("Order stock reservation is still queued. Please wait for the stock to be reserved before preparing for shipment.")
+
+        if order.reservation_status == OrderStockReservationStatus.RELEASED:
+            # the unpaid order's hold expired, its stock is taken again or the packing is refused
+            try:
+                reserve_stock(order)
+            except ValidationError as e:
+                raise ValidationError(f"The stock reservation of this order expired and can't be renewed: {e.detail[0]}")
+
+        # Deduct reserved quantity permanently and remove the reservations
+        remove_order_reservations(order, dispatch=True)
 
         order.reservation_status = OrderStockReservationStatus.DISPATCHED
         order.save()
         return order
-    
+
+
+def expired_reservation_orders(now=None):
+    """
+    Unpaid pending orders holding stock reservations older than the hold TTL of their order
+    source: STOCK_RESERVATION_TTL maps order sources to minutes, sources without an entry use
+    its 'default' and a None TTL never expires. Orders paid on delivery or in store
+    (STOCK_RESERVATION_TTL_EXEMPT_PAYMENT_METHODS) keep their reservations.
+    """
+    now = now or timezone.now()
+    ttls = settings.STOCK_RESERVATION_TTL
+    named_sources = [source for source in ttls if source != 'default']
+
+    expired = Q()
+    for source, minutes in ttls.items():
+        if not minutes:
+            continue
+        if source == 'default':
+            of_source = Q(order_line__order__order_source__isnull=True) | ~Q(order_line__order__order_source__in=named_sources)
+        else:
+            of_source = Q(order_line__order__order_source=source)
+        expired |= of_source & Q(created_at__lt=now - timedelta(minutes=minutes))
+    if not expired:
+        return Order.objects.none()
+
+    return Order.objects.filter(
+        pk__in=StockReservation.objects.filter(expired).values('order_line__order_id'),
+        status=OrderStatus.PENDING,
+        reservation_status=OrderStockReservationStatus.RESERVED,
+        charge_status=OrderChargeStatus.DUE,
+        authorize_status=OrderAuthorizationStatus.NONE,
+    ).exclude(preferred_payment_method__in=settings.STOCK_RESERVATION_TTL_EXEMPT_PAYMENT_METHODS)
+
+
+def _release_orders(order_ids):
+    reservations = remove_reservations(StockReservation.objects.filter(order_line__order_id__in=order_ids))
+    Order.objects.filter(pk__in=order_ids).update(
+        reservation_status=OrderStockReservationStatus.RELEASED, last_modified=timezone.now(),
+    )
+    return reservations
+
+
+def release_expired_reservations(batch_size=None, max_batches=None, now=None):
+    """
+    Release the reservations of the orders returned by expired_reservation_orders, oldest
+    orders first, `batch_size` orders per transaction and at most `max_batches` batches per
+    call. The orders are locked with SKIP LOCKED: an order locked by another transaction (e.g.
+    one taking its payment) is left to the next run instead of blocking the sweep. Released
+    orders stay pending and can be reserved again (see RetryReservationAPIView); packing them
+    or recording a payment reserves them again first (see deduct_reservation_on_packed_for_dispatch
+    and PaymentCreateSerializer). Their promo code redemptions are kept until the order is cancelled.
+
+    Returns the released orders and units per order source, {source: Counter(orders, units)}.
+    """
+    batch_size = batch_size or settings.STOCK_RESERVATION_SWEEP_BATCH_SIZE
+    max_batches = max_batches or settings.STOCK_RESERVATION_SWEEP_MAX_BATCHES
+
+    released = defaultdict(Counter)
+    failed = set()
+    for _ in range(max_batches):
+        with transaction.atomic():
+            orders = dict(
+                expired_reservation_orders(now)
+                .exclude(pk__in=failed)
+                .select_for_update(skip_locked=True)
+                .order_by('created_at', 'pk')
+                .values_list('pk', 'order_source')[:batch_size]
+            )
+            if not orders:
+                break
+
+            try:
+                with transaction.atomic():
+                    reservations = _release_orders(list(orders))
+            except ValidationError:
+                # some stock has less reserved than its reservations, release the others one by one
+                reservations = []
+                for order_id in orders:
+                    try:
+                        with transaction.atomic():
+                            reservations += _release_orders([order_id])
+                    except ValidationError as e:
+                        logger.warning("Could not release the expired reservations of order %s: %s", order_id, e)
+                        failed.add(order_id)
+
+        for order_id, source in orders.items():
+            if order_id not in failed:
+                released[source or 'unknown']['orders'] += 1
+        for _, order_id, _, _, quantity in reservations:
+            released[orders[order_id] or 'unknown']['units'] += quantity
+
+        if len(orders) < batch_size:
+            break
+    return released
 
 
 def adjust_stocks_returned_items(line_items_instances):
@@ -166,3 +468,141 @@ def adjust_stocks_returned_items(line_items_instances):
             # Mark the receiving status as received for the return line item
             return_line_item.receiving_status = ReturnReceiveStatus.RECEIVED
             return_line_item.save()
+
+
+
+def _to_int(value):
+    if isinstance(value, bool):
+        return None
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _parse_stock_row(row):
+    """Checks the shape of one stock level row, returns (row, errors)."""
+    if not isinstance(row, dict):
+        return None, {'non_field_errors': ['Expected an object.']}
+
+    errors = {}
+    parsed = {}
+    if row.get('variant') not in (None, ''):
+        parsed['variant'] = _to_int(row['variant'])
+        if parsed['variant'] is None:
+            errors['variant'] = ['A valid integer is required.']
+    elif row.get('sku') not in (None, ''):
+        parsed['sku'] = str(row['sku']).strip()
+    else:
+        errors['variant'] = ['Pass the variant id as `variant` or its `sku`.']
+
+    if row.get('warehouse') not in (None, ''):
+        parsed['warehouse'] = _to_int(row['warehouse'])
+        if parsed['warehouse'] is None:
+            errors['warehouse'] = ['A valid integer is required.']
+    elif row.get('warehouse_name') not in (None, ''):
+        parsed['warehouse_name'] = str(row['warehouse_name']).strip()
+    else:
+        errors['warehouse'] = ['Pass the warehouse id as `warehouse` or its `warehouse_name`.']
+
+    parsed['quantity'] = _to_int(row.get('quantity'))
+    if parsed['quantity'] is None:
+        errors['quantity'] = ['A valid integer is required.']
+    elif parsed['quantity'] < 0:
+        errors['quantity'] = ['Ensure this value is greater than or equal to 0.']
+
+    return parsed, errors
+
+
+def _upsert_stock_batch(batch, seen, use_copy):
+    parsed = [(number, *_parse_stock_row(row)) for number, row in batch]
+    ok = [row for _, row, errors in parsed if not errors]
+
+    variant_ids = {row['variant'] for row in ok if 'variant' in row}
+    skus = {row['sku'] for row in ok if 'sku' in row}
+    variants = ProductVariant.objects.filter(Q(id__in=variant_ids) | Q(sku__in=skus)).values_list('id', 'sku')
+    known_variants = {pk for pk, _ in variants}
+    variant_by_sku = {sku: pk for pk, sku in variants}
+
+    warehouse_ids = {row['warehouse'] for row in ok if 'warehouse' in row}
+    names = {row['warehouse_name'] for row in ok if 'warehouse_name' in row}
+    warehouses = Warehouse.objects.filter(Q(id__in=warehouse_ids) | Q(name__in=names)).values_list('id', 'name')
+    known_warehouses = {pk for pk, _ in warehouses}
+    warehouse_by_name = {name: pk for pk, name in warehouses}
+
+    results = []
+    valid = []
+    for number, row, errors in parsed:
+        if not errors:
+            variant_id = row['variant'] if 'variant' in row else variant_by_sku.get(row['sku'])
+            if variant_id not in known_variants:
+                errors['variant'] = ['Variant not found.']
+            warehouse_id = row['warehouse'] if 'warehouse' in row else warehouse_by_name.get(row['warehouse_name'])
+            if warehouse_id not in known_warehouses:
+                errors['warehouse'] = ['Warehouse not found.']
+            if not errors and (warehouse_id, variant_id) in seen:
+                errors['non_field_errors'] = [f'Repeats row {seen[warehouse_id, variant_id]}.']
+        if errors:
+            results.append({'row': number, 'status': 'failed', 'errors': errors})
+            continue
+        seen[warehouse_id, variant_id] = number
+        result = {'row': number, 'variant': variant_id, 'warehouse': warehouse_id, 'quantity': row['quantity']}
+        results.append(result)
+        valid.append(result)
+
+    if not valid:
+        return results
+
+    existing = set(
+        Stock.objects.filter(
+            warehouse_id__in={result['warehouse'] for result in valid},
+            product_variant_id__in={result['variant'] for result in valid},
+        ).values_list('warehouse_id', 'product_variant_id')
+    )
+    try:
+        with transaction.atomic():
+            bulk_upsert(
+                Stock,
+                [
+                    Stock(warehouse_id=result['warehouse'], product_variant_id=result['variant'], quantity=result['quantity'])
+                    for result in valid
+                ],
+                unique_fields=['warehouse', 'product_variant'], update_fields=['quantity', 'last_modified'],
+                batch_size=len(valid), use_copy=use_copy,
+            )
+            refresh_variant_listings({result['variant'] for result in valid})
+    except DatabaseError as e:
+        for result in valid:
+            result['status'] = 'failed'
+            result['errors'] = {'non_field_errors': [f'Batch not saved: {e}']}
+            del seen[result['warehouse'], result['variant']]  # not written, a later row may set it
+        return results
+
+    for result in valid:
+        result['status'] = 'updated' if (result['warehouse'], result['variant']) in existing else 'created'
+    return results
+
+
+def upsert_stock_levels(rows, batch_size=None, use_copy=False):
+    """
+    Set the quantity of many stock records, creating the missing ones.
+
+    Each row names the variant by id (`variant`) or `sku`, the warehouse by id (`warehouse`)
+    or `warehouse_name`, and gives the new `quantity`. Rows are checked and written
+    STOCK_UPSERT_BATCH_SIZE at a time, with a few lookup queries and one upsert statement
+    per batch; reserved and incoming quantities of existing records are kept.
+
+    Returns one result per row, in order: `{'row', 'variant', 'warehouse', 'quantity', 'status'}`
+    with status 'created' or 'updated', or `{'row', 'status': 'failed', 'errors'}`. Row numbers
+    start at 1. A row repeating the variant and warehouse of an earlier row fails.
+    """
+    batch_size = batch_size or settings.STOCK_UPSERT_BATCH_SIZE
+    use_copy = use_copy and can_copy()
+    rows = enumerate(rows, start=1)
+    seen = {}
+    results = []
+    while True:
+        batch = list(itertools.islice(rows, batch_size))
+        if not batch:
+            return results
+        results.extend(_upsert_stock_batch(batch, seen, use_copy))
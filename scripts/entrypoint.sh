@@ -18,6 +18,10 @@ echo "Collecting static files..."
 python manage.py collectstatic --noinput --clear
 
 
+# Gunicorn workers share their metrics through snapshot files, start from an empty directory
+export METRICS_MULTIPROC_DIR="${METRICS_MULTIPROC_DIR:-/tmp/nxtbn-metrics}"
+rm -rf "$METRICS_MULTIPROC_DIR" && mkdir -p "$METRICS_MULTIPROC_DIR"
+
 # Start Gunicorn
 echo "Starting Gunicorn..."
 exec gunicorn nxtbn.wsgi:application --bind :8000 --timeout 120 --workers 3